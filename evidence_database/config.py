@@ -51,3 +51,7 @@ WIKIPEDIA_PARA_MAX_LENGTH = 1000        # 段落最大字符数（超过此值
 WIKIPEDIA_PARA_SIM_THRESHOLD = 0.25     # 段落 embedding 与观点相似度阈值（调参入口）
 WIKIPEDIA_REQUEST_TIMEOUT = (5, 15)     # (connect_timeout, read_timeout) 秒
 WIKIPEDIA_INTER_QUERY_DELAY = 0.2       # 每条 query 请求后的节流间隔（秒）
+
+## FAISS rebuild configuration
+EMBEDDING_REBUILD_BATCH_SIZE = 64       # 每次 embedding 请求的文本数
+EMBEDDING_REBUILD_MAX_CONCURRENCY = 4   # 同时进行的 embedding 请求数
@@ -0,0 +1,159 @@
+"""
+Append-only, hash-keyed embedding cache.
+
+Texts are keyed by a 16-byte BLAKE2b digest, so a lookup is one dict probe plus
+a row read instead of a scan over every cached text. Each insert appends one
+vector row and one key record to disk; nothing is ever rewritten.
+
+Files in the cache directory:
+    embedding_cache.meta.json   {"dimension": d, "version": 1}
+    embedding_cache.vectors     float32 rows of d values, in insertion order
+    embedding_cache.keys        16-byte text digests, same order as the vectors
+
+The key is written after its vector, so a torn write at the tail (crash
+mid-append) is detected on load by comparing row counts and truncated away.
+
+With cache_dir=None the store is memory-only and never touches the disk.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+META_FILE = "embedding_cache.meta.json"
+VECTORS_FILE = "embedding_cache.vectors"
+KEYS_FILE = "embedding_cache.keys"
+
+_FORMAT_VERSION = 1
+_KEY_SIZE = 16
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=_KEY_SIZE).digest()
+
+
+def stored_dimension(cache_dir: str) -> Optional[int]:
+    """Dimension recorded by an existing cache in `cache_dir`, or None."""
+    meta_path = os.path.join(cache_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("dimension", 0)) or None
+    except (OSError, ValueError, TypeError, AttributeError):
+        return None
+
+
+class EmbeddingCacheStore:
+    def __init__(self, cache_dir: Optional[str], d: int):
+        self.cache_dir = cache_dir
+        self.d = int(d)
+        self._row_bytes = self.d * 4
+        self._rows: Dict[bytes, int] = {}
+        self._vectors = np.empty((0, self.d), dtype=np.float32)
+        self._count = 0
+        self._vectors_file = None
+        self._keys_file = None
+        if cache_dir is None:
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+        self._vectors_file = open(self._path(VECTORS_FILE), "ab")
+        self._keys_file = open(self._path(KEYS_FILE), "ab")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    @property
+    def ntotal(self) -> int:
+        return self._count
+
+    @property
+    def persistent(self) -> bool:
+        return self.cache_dir is not None
+
+    def _load(self) -> None:
+        meta_path = self._path(META_FILE)
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta is None or int(meta.get("dimension", 0)) != self.d:
+            if meta is not None:
+                print(f"⚠️ Embedding cache dimension mismatch: cache.d={meta.get('dimension')} vs current={self.d}; starting a new cache")
+            for name in (VECTORS_FILE, KEYS_FILE):
+                open(self._path(name), "wb").close()
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dimension": self.d, "version": _FORMAT_VERSION}, f)
+            return
+
+        vectors_size = os.path.getsize(self._path(VECTORS_FILE)) if os.path.exists(self._path(VECTORS_FILE)) else 0
+        keys_size = os.path.getsize(self._path(KEYS_FILE)) if os.path.exists(self._path(KEYS_FILE)) else 0
+        count = min(vectors_size // self._row_bytes, keys_size // _KEY_SIZE)
+
+        # Drop a partially written tail
+        for name, size in ((VECTORS_FILE, count * self._row_bytes), (KEYS_FILE, count * _KEY_SIZE)):
+            path = self._path(name)
+            if not os.path.exists(path):
+                open(path, "wb").close()
+            elif os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+        if count == 0:
+            return
+        vectors = np.fromfile(self._path(VECTORS_FILE), dtype=np.float32, count=count * self.d)
+        with open(self._path(KEYS_FILE), "rb") as f:
+            keys = f.read(count * _KEY_SIZE)
+
+        self._vectors = vectors.reshape(count, self.d).copy()
+        self._count = count
+        for row in range(count):
+            # A re-added text keeps its first row
+            self._rows.setdefault(keys[row * _KEY_SIZE:(row + 1) * _KEY_SIZE], row)
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        row = self._rows.get(text_key(text))
+        if row is None:
+            return None
+        return self._vectors[row].copy()
+
+    def __contains__(self, text: str) -> bool:
+        return text_key(text) in self._rows
+
+    def add(self, text: str, vector: np.ndarray) -> int:
+        """Append a vector for `text` (no-op if already cached); returns its row."""
+        key = text_key(text)
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.d:
+            raise ValueError(f"Vector dimension mismatch: expected {self.d}, got {vector.shape[0]}")
+
+        if self._count == self._vectors.shape[0]:
+            grown = np.empty((max(64, self._count * 2), self.d), dtype=np.float32)
+            grown[:self._count] = self._vectors[:self._count]
+            self._vectors = grown
+        row = self._count
+        self._vectors[row] = vector
+        self._count += 1
+        self._rows[key] = row
+
+        if self._vectors_file is not None:
+            self._vectors_file.write(vector.tobytes())
+            self._vectors_file.flush()
+            self._keys_file.write(key)
+            self._keys_file.flush()
+        return row
+
+    def close(self) -> None:
+        for f in (self._vectors_file, self._keys_file):
+            if f is not None and not f.closed:
+                f.close()
@@ -12,6 +12,7 @@ from typing import Dict, List, Tuple, Optional, Any
 from datetime import datetime
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Import configuration
 try:
@@ -31,6 +32,8 @@ try:
         WIKIPEDIA_PARA_SIM_THRESHOLD,
         WIKIPEDIA_REQUEST_TIMEOUT,
         WIKIPEDIA_INTER_QUERY_DELAY,
+        EMBEDDING_REBUILD_BATCH_SIZE,
+        EMBEDDING_REBUILD_MAX_CONCURRENCY,
     )
 except ImportError:
     from config import (
@@ -49,6 +52,8 @@ except ImportError:
         WIKIPEDIA_PARA_SIM_THRESHOLD,
         WIKIPEDIA_REQUEST_TIMEOUT,
         WIKIPEDIA_INTER_QUERY_DELAY,
+        EMBEDDING_REBUILD_BATCH_SIZE,
+        EMBEDDING_REBUILD_MAX_CONCURRENCY,
     )
 
 
@@ -268,6 +273,11 @@ except ModuleNotFoundError:
     except ImportError:
         import faiss_fallback as faiss  # type: ignore
 
+try:
+    from .embedding_cache_store import EmbeddingCacheStore, stored_dimension
+except ImportError:
+    from embedding_cache_store import EmbeddingCacheStore, stored_dimension
+
 # Wikipedia API
 import wikipediaapi
 
@@ -344,9 +354,8 @@ class EnhancedOpinionSystem:
         self.faiss_keyword_index = None
         self.faiss_viewpoint_index = None
         
-        # Use FAISS as embedding cache
+        # Hash-keyed, append-only embedding cache (text digest -> vector row)
         self.embedding_cache_index = None
-        self.embedding_cache_metadata = {}
         
         # Configure network environment
         print("🔧 Configuring network environment...")
@@ -363,24 +372,20 @@ class EnhancedOpinionSystem:
         
     
     def _get_embedding(self, text: str) -> np.ndarray:
-        """Retrieve embedding vector for text using FAISS cache."""
-        # Initialize embedding cache index if missing
+        """Retrieve embedding vector for text using the hash-keyed cache."""
+        # Initialize embedding cache if missing
         if self.embedding_cache_index is None:
             self._init_embedding_cache()  # auto-detects dimensions
         
-        # Check whether text already exists in FAISS index
-        if self.embedding_cache_index.ntotal > 0:
-            # First check for exact matches to skip extra API calls
-            for idx, metadata in self.embedding_cache_metadata.items():
-                if metadata.get('text') == text:
-                    # Grab embeddings from cache
-                    cached_embedding = self.embedding_cache_index.reconstruct(int(idx))
-                    return cached_embedding
+        # Exact-text hit skips the API call
+        cached_embedding = self.embedding_cache_index.get(text)
+        if cached_embedding is not None:
+            return cached_embedding
         
         # Generate a new embedding if cache miss
         embedding = self._get_embedding_from_api(text)
         
-        # Add to FAISS cache
+        # Add to cache
         self._add_to_embedding_cache(text, embedding)
         
         return embedding
@@ -394,8 +399,71 @@ class EnhancedOpinionSystem:
         # Keep dtype stable; faiss expects float32 vectors.
         return np.asarray(response.data[0].embedding, dtype='float32')
 
+    def _get_embeddings_from_api(self, texts: List[str]) -> List[np.ndarray]:
+        """Fetch embedding vectors for several texts in one API request."""
+        response = self.embedding_client.embeddings.create(
+            input=texts,
+            model=self.embedding_model_name
+        )
+        data = sorted(response.data, key=lambda item: item.index)
+        if len(data) != len(texts):
+            raise ValueError(f"Embedding API returned {len(data)} vectors for {len(texts)} texts")
+        return [np.asarray(item.embedding, dtype='float32') for item in data]
+
+    def _embed_texts_batched(
+        self,
+        texts: List[str],
+        batch_size: int = EMBEDDING_REBUILD_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_REBUILD_MAX_CONCURRENCY,
+        on_batch=None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Embed many texts: dedupe, serve cache hits, send misses in concurrent batches.
+
+        Every finished batch is appended to the embedding cache before the next
+        one is consumed, so an interrupted run resumes from the cache.
+        on_batch(embeddings) is called after the cache hits and after each batch.
+        """
+        if self.embedding_cache_index is None:
+            self._init_embedding_cache()
+
+        embeddings: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        for text in dict.fromkeys(texts):
+            cached = self.embedding_cache_index.get(text)
+            if cached is not None:
+                embeddings[text] = cached
+            else:
+                missing.append(text)
+        print(f"🔢 Embedding {len(embeddings) + len(missing)} unique texts: {len(embeddings)} cached, {len(missing)} to request")
+        if on_batch:
+            on_batch(embeddings)
+
+        batch_size = max(1, int(batch_size))
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, int(max_concurrency))) as executor:
+            futures = {executor.submit(self._get_embeddings_from_api, batch): batch for batch in batches}
+            try:
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    for text, embedding in zip(batch, future.result()):
+                        self._add_to_embedding_cache(text, embedding)
+                        embeddings[text] = embedding
+                    done += len(batch)
+                    print(f"   Embedded {done}/{len(missing)}")
+                    if on_batch:
+                        on_batch(embeddings)
+            except BaseException:
+                # Don't start batches that were still queued; finished ones are already cached
+                for future in futures:
+                    future.cancel()
+                raise
+        return embeddings
+
     def _init_embedding_cache(self, dimension: int = None):
-        """Initialize the embedding cache index."""
+        """Initialize (or reopen) the embedding cache store."""
+        cache_dir = os.path.dirname(self.db_path)
         try:
             # If no dimension provided, generate an embedding to detect it
             if dimension is None:
@@ -404,35 +472,50 @@ class EnhancedOpinionSystem:
                 print(f"🔍 Auto-detected embedding dimension: {dimension}")
             self.embedding_dim = int(dimension)
             
-            # Create FAISS index (inner product)
-            self.embedding_cache_index = faiss.IndexFlatIP(dimension)
-            
-            # Try to load an existing cache
-            cache_path = os.path.join(os.path.dirname(self.db_path), "embedding_cache.faiss")
-            metadata_path = os.path.join(os.path.dirname(self.db_path), "embedding_cache_metadata.json")
-            
-            if os.path.exists(cache_path) and os.path.exists(metadata_path):
-                loaded_index = faiss.read_index(cache_path)
-                # If the embedding model changed (dimension changed), the old cache is invalid.
-                if int(loaded_index.d) != int(dimension):
-                    print(f"⚠️ Embedding cache dimension mismatch: cache.d={int(loaded_index.d)} vs current={int(dimension)}; ignoring old cache")
-                    self.embedding_cache_index = faiss.IndexFlatIP(dimension)
-                    self.embedding_cache_metadata = {}
-                else:
-                    self.embedding_cache_index = loaded_index
-                    with open(metadata_path, 'r', encoding='utf-8') as f:
-                        self.embedding_cache_metadata = json.load(f)
-                    print(f"✅ Loaded embedding cache: {self.embedding_cache_index.ntotal} vectors")
+            if self.embedding_cache_index is not None:
+                self.embedding_cache_index.close()
+            # A different dimension (embedding model changed) starts a new cache
+            self.embedding_cache_index = EmbeddingCacheStore(cache_dir, dimension)
+            if self.embedding_cache_index.ntotal == 0:
+                self._import_legacy_embedding_cache()
+            if self.embedding_cache_index.ntotal > 0:
+                print(f"✅ Loaded embedding cache: {self.embedding_cache_index.ntotal} vectors")
             else:
-                print("📝 Creating a new embedding cache index")
+                print("📝 Creating a new embedding cache")
                 
         except Exception as e:
             print(f"❌ Failed to initialize the embedding cache: {e}")
-            # Fall back to default dimension on failure
-            default_dimension = 768  # common embedding dimension
-            self.embedding_cache_index = faiss.IndexFlatIP(default_dimension)
-            self.embedding_cache_metadata = {}
-            self.embedding_dim = int(default_dimension)
+            stored = stored_dimension(cache_dir)
+            if stored is not None:
+                # The cache on disk knows its own dimension; reopen it as-is
+                self.embedding_cache_index = EmbeddingCacheStore(cache_dir, stored)
+                self.embedding_dim = stored
+                print(f"📂 Reopened embedding cache with its stored dimension: {stored}")
+            else:
+                # Never create the on-disk cache from a guessed dimension: stay memory-only until
+                # the first real embedding opens it (_add_to_embedding_cache)
+                default_dimension = 768  # common embedding dimension
+                self.embedding_cache_index = EmbeddingCacheStore(None, default_dimension)
+
+    def _import_legacy_embedding_cache(self):
+        """One-time import of the old FAISS + JSON metadata cache files."""
+        cache_path = os.path.join(os.path.dirname(self.db_path), "embedding_cache.faiss")
+        metadata_path = os.path.join(os.path.dirname(self.db_path), "embedding_cache_metadata.json")
+        if not (os.path.exists(cache_path) and os.path.exists(metadata_path)):
+            return
+        try:
+            loaded_index = faiss.read_index(cache_path)
+            if int(loaded_index.d) != int(self.embedding_cache_index.d):
+                print(f"⚠️ Legacy embedding cache dimension mismatch: cache.d={int(loaded_index.d)} vs current={int(self.embedding_cache_index.d)}; not importing")
+                return
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            for idx, entry in sorted(metadata.items(), key=lambda item: int(item[0])):
+                if int(idx) < loaded_index.ntotal and entry.get('text') is not None:
+                    self.embedding_cache_index.add(entry['text'], loaded_index.reconstruct(int(idx)))
+            print(f"📦 Imported legacy embedding cache: {self.embedding_cache_index.ntotal} vectors")
+        except Exception as e:
+            print(f"⚠️ Failed to import legacy embedding cache: {e}")
 
     def _ensure_embedding_dim(self) -> int:
         """Ensure we know the active embedding dimension (may trigger a single API call)."""
@@ -444,8 +527,19 @@ class EnhancedOpinionSystem:
         self._init_embedding_cache()
         return int(self.embedding_dim) if self.embedding_dim is not None else int(self.embedding_cache_index.d)
 
-    def _rebuild_faiss_indexes_from_db(self):
-        """Rebuild viewpoint/keyword FAISS indexes from the DB using the current embedding model."""
+    def _rebuild_faiss_indexes_from_db(
+        self,
+        batch_size: int = EMBEDDING_REBUILD_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_REBUILD_MAX_CONCURRENCY,
+    ):
+        """
+        Rebuild viewpoint/keyword FAISS indexes from the DB using the current embedding model.
+
+        Texts are embedded in deduplicated, concurrent batches (see _embed_texts_batched)
+        and rows are streamed into the indexes in id order as soon as both of their
+        vectors are available. Embeddings land in the on-disk cache batch by batch,
+        so re-running after an interruption only requests what is still missing.
+        """
         try:
             dim = self._ensure_embedding_dim()
 
@@ -462,40 +556,39 @@ class EnhancedOpinionSystem:
                 print("📝 No viewpoints in DB; cleared FAISS indexes")
                 return
 
-            viewpoint_vectors = []
-            keyword_vectors = []
+            viewpoint_index = faiss.IndexFlatIP(dim)
+            keyword_index = faiss.IndexFlatIP(dim)
             viewpoint_ids = []
 
-            for viewpoint_id, viewpoint, keywords in rows:
-                v = self._get_embedding(viewpoint)
-                k = self._get_embedding(keywords)
-
-                if int(v.shape[0]) != dim or int(k.shape[0]) != dim:
-                    raise ValueError(f"Embedding dim mismatch while rebuilding: expected {dim}, got v={int(v.shape[0])}, k={int(k.shape[0])}")
-
-                v = np.asarray(v, dtype='float32')
-                k = np.asarray(k, dtype='float32')
-
-                v_norm = np.linalg.norm(v)
-                k_norm = np.linalg.norm(k)
-                if not np.isfinite(v_norm) or v_norm <= 0:
-                    raise ValueError(f"Invalid viewpoint embedding norm during rebuild: {v_norm}")
-                if not np.isfinite(k_norm) or k_norm <= 0:
-                    raise ValueError(f"Invalid keyword embedding norm during rebuild: {k_norm}")
-
-                viewpoint_vectors.append(v / v_norm)
-                keyword_vectors.append(k / k_norm)
-                viewpoint_ids.append(int(viewpoint_id))
-
-            viewpoint_arr = np.stack(viewpoint_vectors, axis=0).astype('float32')
-            keyword_arr = np.stack(keyword_vectors, axis=0).astype('float32')
-
-            self.faiss_viewpoint_index = faiss.IndexFlatIP(dim)
-            self.faiss_viewpoint_index.add(viewpoint_arr)
-
-            self.faiss_keyword_index = faiss.IndexFlatIP(dim)
-            self.faiss_keyword_index.add(keyword_arr)
-
+            def normalized(vector: np.ndarray, kind: str) -> np.ndarray:
+                vector = np.asarray(vector, dtype='float32')
+                if int(vector.shape[0]) != dim:
+                    raise ValueError(f"Embedding dim mismatch while rebuilding: expected {dim}, got {kind}={int(vector.shape[0])}")
+                norm = np.linalg.norm(vector)
+                if not np.isfinite(norm) or norm <= 0:
+                    raise ValueError(f"Invalid {kind} embedding norm during rebuild: {norm}")
+                return vector / norm
+
+            def stream_ready_rows(embeddings: Dict[str, np.ndarray]):
+                # Add the longest ready prefix of rows, keeping index order == id order
+                start = len(viewpoint_ids)
+                end = start
+                while end < len(rows) and rows[end][1] in embeddings and rows[end][2] in embeddings:
+                    end += 1
+                if end == start:
+                    return
+                chunk = rows[start:end]
+                viewpoint_index.add(np.stack([normalized(embeddings[r[1]], "viewpoint") for r in chunk]))
+                keyword_index.add(np.stack([normalized(embeddings[r[2]], "keyword") for r in chunk]))
+                viewpoint_ids.extend(int(r[0]) for r in chunk)
+
+            texts = [text for _, viewpoint, keywords in rows for text in (viewpoint, keywords)]
+            self._embed_texts_batched(texts, batch_size, max_concurrency, on_batch=stream_ready_rows)
+            if len(viewpoint_ids) != len(rows):
+                raise ValueError(f"Rebuild incomplete: {len(viewpoint_ids)}/{len(rows)} viewpoints embedded")
+
+            self.faiss_viewpoint_index = viewpoint_index
+            self.faiss_keyword_index = keyword_index
             self.viewpoint_ids = viewpoint_ids
 
             # Persist indexes + mapping.
@@ -513,65 +606,37 @@ class EnhancedOpinionSystem:
             traceback.print_exc()
     
     def _add_to_embedding_cache(self, text: str, embedding: np.ndarray):
-        """Add embeddings to the cache."""
+        """Add embeddings to the cache (persisted immediately by appending)."""
         try:
-            # Ensure the embedding cache index exists and matches dimensions
+            # Ensure the embedding cache exists and matches dimensions
             if self.embedding_cache_index is None:
                 # Initialize using current embedding dimension
                 self._init_embedding_cache(embedding.shape[0])
             
             # Check dimension compatibility
             if self.embedding_cache_index.d != embedding.shape[0]:
-                print(f"⚠️ Dimension mismatch, reinitializing FAISS index: {self.embedding_cache_index.d} -> {embedding.shape[0]}")
+                print(f"⚠️ Dimension mismatch, reinitializing embedding cache: {self.embedding_cache_index.d} -> {embedding.shape[0]}")
                 # Reinitialize with current embedding dimension
                 self._init_embedding_cache(embedding.shape[0])
+            elif not self.embedding_cache_index.persistent:
+                # Memory-only fallback: the real dimension is known now, open the on-disk cache
+                self._init_embedding_cache(embedding.shape[0])
             
             # Normalize the vector
             normalized_embedding = embedding / np.linalg.norm(embedding)
             
-            # Add to the FAISS index
-            self.embedding_cache_index.add(normalized_embedding.reshape(1, -1))
-            
-            # Save metadata
-            index_id = self.embedding_cache_index.ntotal - 1
-            self.embedding_cache_metadata[str(index_id)] = {
-                'text': text,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # Periodically persist cache to disk (every 100 vectors)
-            if self.embedding_cache_index.ntotal % 100 == 0:
-                self._save_embedding_cache()
+            self.embedding_cache_index.add(text, normalized_embedding)
                 
         except Exception as e:
             print(f"❌ Failed to add embedding to cache: {e}")
     
-    def _save_embedding_cache(self):
-        """Persist the embedding cache to disk."""
-        try:
-            cache_path = os.path.join(os.path.dirname(self.db_path), "embedding_cache.faiss")
-            metadata_path = os.path.join(os.path.dirname(self.db_path), "embedding_cache_metadata.json")
-            
-            # Save FAISS index
-            faiss.write_index(self.embedding_cache_index, cache_path)
-            
-            # Save metadata
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(self.embedding_cache_metadata, f, ensure_ascii=False, indent=2)
-                
-            print(f"💾 Embedding cache saved: {self.embedding_cache_index.ntotal} vectors")
-            
-        except Exception as e:
-            print(f"❌ Failed to save embedding cache: {e}")
-    
     def close(self):
-        """Save cache when closing the system."""
+        """Close the embedding cache files."""
         try:
-            if self.embedding_cache_index and self.embedding_cache_index.ntotal > 0:
-                self._save_embedding_cache()
-                print("💾 Saved embedding cache while closing the system")
+            if self.embedding_cache_index is not None:
+                self.embedding_cache_index.close()
         except Exception as e:
-            print(f"❌ Failed to save cache on close: {e}")
+            print(f"❌ Failed to close embedding cache: {e}")
     
     def set_api_key(self, api_key: str):
         """Set the API key."""
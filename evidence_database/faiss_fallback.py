@@ -3,27 +3,62 @@ Minimal FAISS compatibility shim.
 
 Used when `faiss`/`faiss-cpu` isn't available (common on Python 3.13).
 Implements the small subset this project uses: IndexFlatIP + read/write.
+
+Vectors live in a preallocated float32 buffer whose capacity doubles when it
+fills up, so single-vector adds are amortized O(1) instead of copying the whole
+matrix each time. Searches are done in query chunks with argpartition top-k.
+
+Index files are a fixed header followed by the raw float32 rows, so
+read_index memory-maps them instead of decompressing everything into RAM; the
+rows are copied into an owned buffer only on the first add. Files written by
+the previous compressed .npz format are still readable.
 """
 
 from __future__ import annotations
 
 import os
+import struct
 from dataclasses import dataclass
 from typing import Tuple
 
 import numpy as np
 
+_MAGIC = b"FFIP0001"
+# magic, dimension, row count
+_HEADER = struct.Struct("<8sqq")
+
+_MIN_CAPACITY = 64
+# Upper bound on the (queries x ntotal) similarity block computed at once
+_SEARCH_BLOCK_ELEMENTS = 1 << 24
+
 
 @dataclass
 class IndexFlatIP:
     d: int
 
     def __post_init__(self) -> None:
-        self._vectors = np.empty((0, self.d), dtype=np.float32)
+        self.d = int(self.d)
+        self._buffer = np.empty((0, self.d), dtype=np.float32)
+        self._count = 0
 
     @property
     def ntotal(self) -> int:
-        return int(self._vectors.shape[0])
+        return self._count
+
+    @property
+    def _vectors(self) -> np.ndarray:
+        return self._buffer[:self._count]
+
+    def _reserve(self, n: int) -> None:
+        """Ensure room for n rows in an owned (not memory-mapped) buffer."""
+        if n <= self._buffer.shape[0] and not isinstance(self._buffer, np.memmap):
+            return
+        capacity = max(_MIN_CAPACITY, self._buffer.shape[0])
+        while capacity < n:
+            capacity *= 2
+        grown = np.empty((capacity, self.d), dtype=np.float32)
+        grown[:self._count] = self._buffer[:self._count]
+        self._buffer = grown
 
     def add(self, vectors: np.ndarray) -> None:
         vectors = np.asarray(vectors, dtype=np.float32)
@@ -31,46 +66,97 @@ class IndexFlatIP:
             vectors = vectors.reshape(1, -1)
         if vectors.shape[1] != self.d:
             raise ValueError(f"Vector dimension mismatch: expected {self.d}, got {vectors.shape[1]}")
-        self._vectors = np.concatenate([self._vectors, vectors], axis=0)
+        n = vectors.shape[0]
+        self._reserve(self._count + n)
+        self._buffer[self._count:self._count + n] = vectors
+        self._count += n
+
+    def reset(self) -> None:
+        self.__post_init__()
 
     def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k inner-product search.
+
+        Like faiss, results always have k columns; when the index holds fewer
+        than k vectors the remaining slots are -1 labels with -inf-like scores.
+        """
         queries = np.asarray(queries, dtype=np.float32)
         if queries.ndim == 1:
             queries = queries.reshape(1, -1)
         if queries.shape[1] != self.d:
             raise ValueError(f"Query dimension mismatch: expected {self.d}, got {queries.shape[1]}")
 
-        if self.ntotal == 0 or k <= 0:
-            sims = np.zeros((queries.shape[0], max(k, 0)), dtype=np.float32)
-            idx = -np.ones((queries.shape[0], max(k, 0)), dtype=np.int64)
-            return sims, idx
-
-        sims = queries @ self._vectors.T
-        k = min(k, self.ntotal)
-        topk_idx = np.argpartition(-sims, kth=k - 1, axis=1)[:, :k]
-        topk_sims = np.take_along_axis(sims, topk_idx, axis=1)
-        order = np.argsort(-topk_sims, axis=1)
-        sorted_idx = np.take_along_axis(topk_idx, order, axis=1).astype(np.int64)
-        sorted_sims = np.take_along_axis(topk_sims, order, axis=1).astype(np.float32)
-        return sorted_sims, sorted_idx
+        k = max(int(k), 0)
+        nq = queries.shape[0]
+        sims_out = np.full((nq, k), -np.finfo(np.float32).max, dtype=np.float32)
+        idx_out = -np.ones((nq, k), dtype=np.int64)
+        if self._count == 0 or k == 0 or nq == 0:
+            return sims_out, idx_out
+
+        vectors = self._vectors
+        kk = min(k, self._count)
+        chunk = max(1, _SEARCH_BLOCK_ELEMENTS // self._count)
+        for start in range(0, nq, chunk):
+            block = queries[start:start + chunk]
+            sims = block @ vectors.T
+            if kk < self._count:
+                topk_idx = np.argpartition(-sims, kth=kk - 1, axis=1)[:, :kk]
+                topk_sims = np.take_along_axis(sims, topk_idx, axis=1)
+            else:
+                topk_idx = np.broadcast_to(np.arange(self._count), sims.shape)
+                topk_sims = sims
+            order = np.argsort(-topk_sims, axis=1, kind="stable")
+            end = start + block.shape[0]
+            idx_out[start:end, :kk] = np.take_along_axis(topk_idx, order, axis=1)
+            sims_out[start:end, :kk] = np.take_along_axis(topk_sims, order, axis=1)
+        return sims_out, idx_out
 
     def reconstruct(self, i: int) -> np.ndarray:
-        return np.asarray(self._vectors[int(i)], dtype=np.float32)
+        i = int(i)
+        if not 0 <= i < self._count:
+            raise IndexError(f"Vector id {i} out of range [0, {self._count})")
+        return np.array(self._buffer[i], dtype=np.float32)
+
+    def reconstruct_n(self, i0: int, ni: int) -> np.ndarray:
+        i0, ni = int(i0), int(ni)
+        if i0 < 0 or ni < 0 or i0 + ni > self._count:
+            raise IndexError(f"Vector range [{i0}, {i0 + ni}) out of range [0, {self._count})")
+        return np.array(self._buffer[i0:i0 + ni], dtype=np.float32)
 
 
 def write_index(index: IndexFlatIP, path: str) -> None:
-    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
-    with open(path, "wb") as f:
-        np.savez_compressed(f, d=np.array([index.d], dtype=np.int32), vectors=index._vectors)
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    buffer = index._buffer
+    if isinstance(buffer, np.memmap) and buffer.filename and os.path.abspath(buffer.filename) == path:
+        # Still mapped from this very file: nothing was added since read_index
+        return
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, index.d, index.ntotal))
+        f.write(np.ascontiguousarray(index._vectors).tobytes())
+    os.replace(tmp_path, path)
 
 
 def read_index(path: str) -> IndexFlatIP:
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+    if len(header) == _HEADER.size and header[:len(_MAGIC)] == _MAGIC:
+        _, d, count = _HEADER.unpack(header)
+        index = IndexFlatIP(d)
+        if count:
+            index._buffer = np.memmap(path, dtype=np.float32, mode="r", offset=_HEADER.size, shape=(count, d))
+            index._count = int(count)
+        return index
+
+    # Legacy compressed .npz format
     with open(path, "rb") as f:
         data = np.load(f, allow_pickle=False)
-    d = int(np.asarray(data["d"]).reshape(-1)[0])
+        d = int(np.asarray(data["d"]).reshape(-1)[0])
+        vectors = np.asarray(data["vectors"], dtype=np.float32)
     index = IndexFlatIP(d)
-    vectors = np.asarray(data["vectors"], dtype=np.float32)
     if vectors.size:
         index.add(vectors)
     return index
-
@@ -24,6 +24,8 @@ import signal
 import psutil
 import json
 import time
+import heapq
+import threading
 
 # 添加src目录到路径以导入项目模块
 src_path = os.path.join(os.path.dirname(__file__), 'src')
@@ -3858,6 +3860,8 @@ class HeatScoreCalculator:
                   - num_comments: 评论数
                   - num_shares: 分享数
                   - num_likes: 点赞数
+                  可选包含 time_step（已联表查出的创建时间步），
+                  提供时不再逐帖查询 post_timesteps
             current_time_step: 当前时间步
             
         Returns:
@@ -3870,8 +3874,11 @@ class HeatScoreCalculator:
             (post.get('num_likes') or 0)
         )
         
-        # 获取帖子的创建时间步
-        post_time_step = self.get_post_time_step(post['post_id'])
+        # 获取帖子的创建时间步（优先使用联表查询的结果，避免 N+1 连接）
+        if 'time_step' in post:
+            post_time_step = post['time_step']
+        else:
+            post_time_step = self.get_post_time_step(post['post_id'])
         
         # 计算年龄（如果 post_time_step 为 None，则 age = 0）
         if post_time_step is not None:
@@ -3918,6 +3925,301 @@ class HeatScoreCalculator:
         return fingerprint
 
 
+# ============================================================================
+# 帖子热度榜物化服务（所有请求与 SSE 连接共享）
+# ============================================================================
+
+LEADERBOARD_MAX_LIMIT = 100         # 物化的榜单长度（limit 参数上限）
+LEADERBOARD_POLL_INTERVAL = 1.0     # 后台检测数据库变化的间隔（秒）
+LEADERBOARD_HEARTBEAT_INTERVAL = 15.0  # SSE 无更新时发送心跳注释的间隔（秒）
+
+# 与 GET /api/leaderboard 原查询一致（含已下架帖子，用于增量维护；打分时过滤）
+_LEADERBOARD_POSTS_QUERY = """
+    SELECT
+        p.post_id,
+        p.summary,
+        p.content,
+        p.author_id,
+        p.created_at,
+        p.num_likes,
+        p.num_shares,
+        p.num_comments,
+        p.status,
+        pt.time_step
+    FROM posts p
+    LEFT JOIN post_timesteps pt
+        ON pt.post_id = p.post_id
+"""
+
+# post_changes 变更日志（由模拟端 DatabaseManager 的触发器维护）；
+# 始终带回最新一条日志，用于发现数据库被重置（序号回退）
+_LEADERBOARD_CHANGES_QUERY = """
+    SELECT
+        c.seq,
+        c.post_id,
+        p.post_id,
+        p.summary,
+        p.content,
+        p.author_id,
+        p.created_at,
+        p.num_likes,
+        p.num_shares,
+        p.num_comments,
+        p.status,
+        pt.time_step
+    FROM post_changes c
+    LEFT JOIN posts p ON p.post_id = c.post_id
+    LEFT JOIN post_timesteps pt ON pt.post_id = c.post_id
+    WHERE c.seq > ? OR c.seq = (SELECT MAX(seq) FROM post_changes)
+    ORDER BY c.seq
+"""
+
+
+class LeaderboardMaterializer:
+    """热度榜物化器 - 每个数据库一个实例，所有客户端共享
+    
+    - 通过 PRAGMA data_version 检测其他连接的提交，数据库无变化时不做任何查询
+    - 有变化时优先按 post_changes 日志只读取变更的帖子，否则一次联表查询全量重载
+    - 在内存中重新打分并物化 Top LEADERBOARD_MAX_LIMIT，按 limit 切片并缓存 fingerprint
+    - 有 SSE 订阅者时由后台线程轮询，通过条件变量把新快照广播给所有订阅者，
+      每个连接的开销与帖子数量无关
+    """
+    
+    def __init__(self, db_path: str, poll_interval: float = LEADERBOARD_POLL_INTERVAL):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.calculator = HeatScoreCalculator(db_path)
+        
+        self._conn: Optional[sqlite3.Connection] = None
+        self._file_id = None
+        self._data_version = None
+        self._change_seq = 0
+        self._change_log = True
+        self._posts: Dict[str, tuple] = {}
+        
+        self._refresh_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._snapshot = None
+        self._version = 0
+        self._subscribers = 0
+        self._poller: Optional[threading.Thread] = None
+    
+    # ========== 数据库变化检测 ==========
+    
+    def _connect(self):
+        """打开（或在数据库文件被替换后重新打开）只读用途的长连接"""
+        stat = os.stat(self.db_path)
+        file_id = (stat.st_dev, stat.st_ino)
+        if self._conn is not None and file_id == self._file_id:
+            return
+        self._close()
+        self._conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        self._file_id = file_id
+        self._data_version = None
+        self._change_seq = 0
+        self._change_log = True
+        self._posts = {}
+    
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+        self._file_id = None
+    
+    def _full_load(self, cursor):
+        try:
+            # 先读日志位置：与加载并发的变更会在下次增量时重新应用
+            cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM post_changes')
+            self._change_seq = cursor.fetchone()[0]
+            self._change_log = True
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                raise
+            self._change_log = False
+            self._change_seq = 0
+        
+        cursor.execute(_LEADERBOARD_POSTS_QUERY)
+        self._posts = {row[0]: row for row in cursor.fetchall()}
+    
+    def _load_changes(self, cursor):
+        """应用 post_changes 中的增量；日志缺失或序号回退时全量重载"""
+        if not self._posts or not self._change_log:
+            self._full_load(cursor)
+            return
+        try:
+            cursor.execute(_LEADERBOARD_CHANGES_QUERY, (self._change_seq,))
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                raise
+            self._full_load(cursor)
+            return
+        
+        latest = rows[-1][0] if rows else 0
+        if latest < self._change_seq:
+            self._full_load(cursor)
+            return
+        for row in rows:
+            seq, post_id, post = row[0], row[1], row[2:]
+            if seq <= self._change_seq:
+                continue
+            self._change_seq = seq
+            if post[0] is None:
+                self._posts.pop(post_id, None)
+            else:
+                self._posts[post_id] = post
+    
+    # ========== 物化 ==========
+    
+    def _rank(self, current_time_step: int) -> List[dict]:
+        """在内存中打分，返回 Top LEADERBOARD_MAX_LIMIT（排序规则与原接口一致）"""
+        calculator = self.calculator
+        scored = []
+        for row in self._posts.values():
+            post_id, summary, content, author_id, created_at, likes, shares, comments, status, time_step = row
+            if status == 'taken_down':
+                continue
+            post = {
+                'post_id': post_id,
+                'num_likes': likes or 0,
+                'num_shares': shares or 0,
+                'num_comments': comments or 0,
+                'time_step': time_step,
+            }
+            scored.append((calculator.calculate_score(post, current_time_step), created_at or '', row))
+        
+        # 先按 (score, createdAt) 取前 N，再把与边界并列的帖子补进来，保证 postId 次序正确
+        top = heapq.nlargest(LEADERBOARD_MAX_LIMIT, scored, key=lambda x: (x[0], x[1]))
+        if len(top) == LEADERBOARD_MAX_LIMIT:
+            boundary = (top[-1][0], top[-1][1])
+            top = [x for x in scored if (x[0], x[1]) >= boundary]
+        
+        # 排序：主排序 score 降序，次排序 createdAt 降序，三级排序 postId 升序
+        top.sort(key=lambda x: x[2][0])
+        top.sort(key=lambda x: x[1], reverse=True)
+        top.sort(key=lambda x: x[0], reverse=True)
+        
+        items = []
+        for score, _, row in top[:LEADERBOARD_MAX_LIMIT]:
+            post_id, summary, content, author_id, created_at, likes, shares, comments = row[:8]
+            # 处理 excerpt 字段（优先使用 summary，否则截断 content）
+            if summary:
+                excerpt = summary
+            else:
+                content = content or ''
+                excerpt = content[:100] + ('...' if len(content) > 100 else '')
+            items.append({
+                'postId': post_id,
+                'excerpt': excerpt,
+                'score': score,
+                'authorId': author_id,
+                'createdAt': created_at,
+                'likeCount': likes or 0,
+                'shareCount': shares or 0,
+                'commentCount': comments or 0
+            })
+        return items
+    
+    def _publish(self, snapshot: dict):
+        with self._condition:
+            self._version += 1
+            snapshot['version'] = self._version
+            self._snapshot = snapshot
+            self._condition.notify_all()
+    
+    def refresh(self) -> dict:
+        """数据库有变化时重新物化并广播，返回当前快照"""
+        with self._refresh_lock:
+            if not os.path.exists(self.db_path):
+                self._close()
+                if self._snapshot is None or not self._snapshot.get('missing'):
+                    self._publish({'missing': True, 'items': [], 'timeStep': 0, 'fingerprints': {}})
+                return self._snapshot
+            
+            self._connect()
+            cursor = self._conn.cursor()
+            cursor.execute('PRAGMA data_version')
+            data_version = cursor.fetchone()[0]
+            if data_version == self._data_version and self._snapshot is not None:
+                return self._snapshot
+            
+            self._load_changes(cursor)
+            cursor.execute('SELECT COALESCE(MAX(time_step), 0) FROM post_timesteps')
+            current_time_step = cursor.fetchone()[0]
+            self._data_version = data_version
+            
+            items = self._rank(current_time_step)
+            previous = self._snapshot
+            if previous is not None and not previous.get('missing') \
+                    and previous['timeStep'] == current_time_step and previous['items'] == items:
+                return previous
+            self._publish({'missing': False, 'items': items, 'timeStep': current_time_step, 'fingerprints': {}})
+            return self._snapshot
+    
+    @staticmethod
+    def view(snapshot: dict, limit: int):
+        """快照的前 limit 项及其 fingerprint（按 limit 缓存，所有客户端共享）"""
+        items = snapshot['items'][:limit]
+        fingerprint = snapshot['fingerprints'].get(limit)
+        if fingerprint is None:
+            fingerprint = HeatScoreCalculator.calculate_fingerprint(items)
+            snapshot['fingerprints'][limit] = fingerprint
+        return items, fingerprint
+    
+    # ========== 订阅（扇出广播） ==========
+    
+    def subscribe(self):
+        with self._condition:
+            self._subscribers += 1
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll_loop, name='leaderboard-materializer', daemon=True)
+                self._poller.start()
+    
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers = max(0, self._subscribers - 1)
+    
+    def wait_for_update(self, last_version: int, timeout: float) -> dict:
+        """阻塞直到有比 last_version 更新的快照或超时，返回当前快照"""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._snapshot is not None and self._snapshot['version'] > last_version,
+                timeout=timeout
+            )
+            return self._snapshot
+    
+    def _poll_loop(self):
+        while True:
+            with self._condition:
+                if self._subscribers == 0:
+                    self._poller = None
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                # 短暂的锁冲突等错误：保留上一份快照，下个周期重试
+                print(f'⚠️ 热度榜物化失败 ({self.db_path}): {e}')
+            time.sleep(self.poll_interval)
+
+
+_leaderboard_materializers: Dict[str, LeaderboardMaterializer] = {}
+_leaderboard_materializers_lock = threading.Lock()
+
+
+def get_leaderboard_materializer(db_path: str) -> LeaderboardMaterializer:
+    """获取数据库对应的共享热度榜物化器"""
+    key = os.path.abspath(db_path)
+    with _leaderboard_materializers_lock:
+        materializer = _leaderboard_materializers.get(key)
+        if materializer is None:
+            materializer = LeaderboardMaterializer(db_path)
+            _leaderboard_materializers[key] = materializer
+        return materializer
+
+
 # ============================================================================
 # 帖子热度榜 API
 # ============================================================================
@@ -3926,7 +4228,7 @@ class HeatScoreCalculator:
 def get_leaderboard():
     """获取热度排行榜
     
-    查询所有符合条件的帖子，计算热度评分，返回 Top N 个帖子。
+    从共享的热度榜物化器（LeaderboardMaterializer）读取 Top N 个帖子。
     
     查询参数:
         limit: 返回数量，默认 20，最大 100
@@ -3962,92 +4264,13 @@ def get_leaderboard():
         if not os.path.exists(db_path):
             return jsonify({'error': 'Database not found'}), 404
         
-        # 创建热度评分计算器
-        calculator = HeatScoreCalculator(db_path)
-        
-        # 获取当前时间步
-        current_time_step = calculator.get_current_time_step()
-        
-        # 查询所有符合条件的帖子 + 一次性取出 post_time_step（避免 N+1 查询导致 API 卡死）
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                p.post_id,
-                p.summary,
-                p.content,
-                p.author_id,
-                p.created_at,
-                p.num_likes,
-                p.num_shares,
-                p.num_comments,
-                pt.time_step
-            FROM posts p
-            LEFT JOIN post_timesteps pt
-                ON pt.post_id = p.post_id
-            WHERE p.status IS NULL OR p.status != 'taken_down'
-        """)
-        
-        # 计算每个帖子的热度评分
-        posts_with_scores = []
-        for row in cursor.fetchall():
-            post = {
-                'post_id': row[0],
-                'summary': row[1],
-                'content': row[2],
-                'author_id': row[3],
-                'created_at': row[4],
-                'num_likes': row[5] or 0,
-                'num_shares': row[6] or 0,
-                'num_comments': row[7] or 0,
-                'time_step': row[8]
-            }
-            
-            # 计算热度评分（与 agent_user.py 保持一致）
-            engagement = post['num_comments'] + post['num_shares'] + post['num_likes']
-            post_time_step = post.get('time_step')
-            age = max(0, current_time_step - post_time_step) if post_time_step is not None else 0
-            freshness = max(calculator.MIN_FRESHNESS, 1.0 - calculator.LAMBDA_DECAY * age)
-            score = (engagement + calculator.BETA_BIAS) * freshness
-            
-            # 处理 excerpt 字段（优先使用 summary，否则截断 content）
-            if post['summary']:
-                excerpt = post['summary']
-            else:
-                content = post['content'] or ''
-                excerpt = content[:100] + ('...' if len(content) > 100 else '')
-            
-            posts_with_scores.append({
-                'postId': post['post_id'],
-                'excerpt': excerpt,
-                'score': score,
-                'authorId': post['author_id'],
-                'createdAt': post['created_at'],
-                'likeCount': post['num_likes'],
-                'shareCount': post['num_shares'],
-                'commentCount': post['num_comments']
-            })
-        
-        conn.close()
-        
-        # 排序：主排序 score 降序，次排序 createdAt 降序，三级排序 postId 升序
-        # 使用稳定排序的特性，从最低优先级到最高优先级依次排序
-        
-        # 第一步：按 postId 升序排序（最低优先级）
-        posts_with_scores.sort(key=lambda x: x['postId'])
-        
-        # 第二步：按 createdAt 降序排序（次优先级，稳定排序保持 postId 顺序）
-        posts_with_scores.sort(key=lambda x: x['createdAt'] or '', reverse=True)
-        
-        # 第三步：按 score 降序排序（最高优先级，稳定排序保持前两级顺序）
-        posts_with_scores.sort(key=lambda x: x['score'], reverse=True)
-        
-        # 返回前 N 个结果
-        top_posts = posts_with_scores[:limit]
+        # 从共享物化器读取（数据库无变化时不查询，只做一次 PRAGMA data_version）
+        snapshot = get_leaderboard_materializer(db_path).refresh()
+        if snapshot.get('missing'):
+            return jsonify({'error': 'Database not found'}), 404
         
-        # 计算 fingerprint
-        fingerprint = HeatScoreCalculator.calculate_fingerprint(top_posts)
+        top_posts, fingerprint = LeaderboardMaterializer.view(snapshot, limit)
+        current_time_step = snapshot['timeStep']
         
         return jsonify({
             'items': top_posts,
@@ -4247,7 +4470,9 @@ def get_post_comments_by_id(post_id: str):
 def event_stream():
     """SSE 事件流，推送热度榜更新
     
-    建立 Server-Sent Events 连接，每 1 秒推送一次热度榜更新。
+    建立 Server-Sent Events 连接，订阅共享的热度榜物化器。
+    物化器的后台线程每 1 秒检测一次数据库变化，并把新榜单广播给所有连接；
+    每个连接只切片和比较 fingerprint，不再各自查询数据库。
     使用 fingerprint 机制避免无效推送：只在榜单内容发生变化时才推送数据。
     
     事件格式:
@@ -4259,8 +4484,9 @@ def event_stream():
             "timestamp": str  # ISO 8601 格式
         }
         
-    推送间隔: 1 秒
-    推送策略: 仅当 fingerprint 变化时推送（避免无效更新）
+    检测间隔: 1 秒（LEADERBOARD_POLL_INTERVAL）
+    推送策略: 仅当 fingerprint 变化时推送（避免无效更新）；
+              长时间无更新时发送心跳注释，以便及时发现断开的连接
     """
     # 在生成器外部获取请求参数（避免上下文问题）
     db_name = request.args.get('db', default='simulation.db', type=str)
@@ -4270,137 +4496,59 @@ def event_stream():
     def generate():
         """生成器函数，持续推送热度榜更新"""
         last_fingerprint = None  # 记录上次的 fingerprint
+        last_version = 0
+        
+        # 获取数据库路径（使用外部变量）
+        db_path = os.path.join(DATABASE_DIR, db_name)
+        if not os.path.exists(db_path):
+            # 数据库不存在，发送错误事件
+            yield f'event: error\ndata: {{"error": "Database not found"}}\n\n'
+            return
         
+        materializer = get_leaderboard_materializer(db_path)
+        materializer.subscribe()
         try:
             while True:
-                try:
-                    # 获取数据库路径（使用外部变量）
-                    db_path = os.path.join(DATABASE_DIR, db_name)
-                    
-                    if not os.path.exists(db_path):
-                        # 数据库不存在，发送错误事件
-                        yield f'event: error\ndata: {{"error": "Database not found"}}\n\n'
-                        break
-                    
-                    # 创建热度评分计算器
-                    calculator = HeatScoreCalculator(db_path)
-                    
-                    # 获取当前时间步
-                    current_time_step = calculator.get_current_time_step()
-                    
-                    # 查询所有符合条件的帖子
-                    conn = sqlite3.connect(db_path)
-                    cursor = conn.cursor()
-                    
-                    # 只查询必需字段，过滤条件：status IS NULL OR status != 'taken_down'
-                    cursor.execute("""
-                        SELECT 
-                            post_id,
-                            summary,
-                            content,
-                            author_id,
-                            created_at,
-                            num_likes,
-                            num_shares,
-                            num_comments
-                        FROM posts
-                        WHERE status IS NULL OR status != 'taken_down'
-                    """)
-                    
-                    # 计算每个帖子的热度评分
-                    posts_with_scores = []
-                    for row in cursor.fetchall():
-                        post = {
-                            'post_id': row[0],
-                            'summary': row[1],
-                            'content': row[2],
-                            'author_id': row[3],
-                            'created_at': row[4],
-                            'num_likes': row[5] or 0,
-                            'num_shares': row[6] or 0,
-                            'num_comments': row[7] or 0
-                        }
-                        
-                        # 计算热度评分
-                        score = calculator.calculate_score(post, current_time_step)
-                        
-                        # 处理 excerpt 字段（优先使用 summary，否则截断 content）
-                        if post['summary']:
-                            excerpt = post['summary']
-                        else:
-                            content = post['content'] or ''
-                            excerpt = content[:100] + ('...' if len(content) > 100 else '')
-                        
-                        posts_with_scores.append({
-                            'postId': post['post_id'],
-                            'excerpt': excerpt,
-                            'score': score,
-                            'authorId': post['author_id'],
-                            'createdAt': post['created_at'],
-                            'likeCount': post['num_likes'],
-                            'shareCount': post['num_shares'],
-                            'commentCount': post['num_comments']
-                        })
-                    
-                    conn.close()
-                    
-                    # 排序：主排序 score 降序，次排序 createdAt 降序，三级排序 postId 升序
-                    # 使用稳定排序的特性，从最低优先级到最高优先级依次排序
-                    
-                    # 第一步：按 postId 升序排序（最低优先级）
-                    posts_with_scores.sort(key=lambda x: x['postId'])
-                    
-                    # 第二步：按 createdAt 降序排序（次优先级，稳定排序保持 postId 顺序）
-                    posts_with_scores.sort(key=lambda x: x['createdAt'] or '', reverse=True)
-                    
-                    # 第三步：按 score 降序排序（最高优先级，稳定排序保持前两级顺序）
-                    posts_with_scores.sort(key=lambda x: x['score'], reverse=True)
-                    
-                    # 返回前 N 个结果
-                    top_posts = posts_with_scores[:limit]
-                    
-                    # 计算 fingerprint
-                    current_fingerprint = HeatScoreCalculator.calculate_fingerprint(top_posts)
-                    
-                    # 只在 fingerprint 变化时推送
-                    if current_fingerprint != last_fingerprint:
-                        # 构造事件数据
-                        event_data = {
-                            'items': top_posts,
-                            'timeStep': current_time_step,
-                            'fingerprint': current_fingerprint,
-                            'timestamp': datetime.datetime.now().isoformat()
-                        }
-                        
-                        # 格式化为 SSE 格式
-                        import json
-                        data_json = json.dumps(event_data, ensure_ascii=False)
-                        yield f'event: leaderboard-update\ndata: {data_json}\n\n'
-                        
-                        # 更新 last_fingerprint
-                        last_fingerprint = current_fingerprint
+                snapshot = materializer.wait_for_update(last_version, timeout=LEADERBOARD_HEARTBEAT_INTERVAL)
+                if snapshot is None or snapshot['version'] == last_version:
+                    # 无更新：发送心跳注释（客户端忽略），断开的连接会在写入时被发现
+                    yield ': keepalive\n\n'
+                    continue
+                last_version = snapshot['version']
+                
+                if snapshot.get('missing'):
+                    yield f'event: error\ndata: {{"error": "Database not found"}}\n\n'
+                    break
+                
+                top_posts, current_fingerprint = LeaderboardMaterializer.view(snapshot, limit)
+                
+                # 只在 fingerprint 变化时推送
+                if current_fingerprint != last_fingerprint:
+                    # 构造事件数据
+                    event_data = {
+                        'items': top_posts,
+                        'timeStep': snapshot['timeStep'],
+                        'fingerprint': current_fingerprint,
+                        'timestamp': datetime.datetime.now().isoformat()
+                    }
                     
-                    # 等待 1 秒
-                    time.sleep(1)
+                    # 格式化为 SSE 格式
+                    data_json = json.dumps(event_data, ensure_ascii=False)
+                    yield f'event: leaderboard-update\ndata: {data_json}\n\n'
                     
-                except GeneratorExit:
-                    # 客户端断开连接
-                    print('✅ SSE 客户端断开连接，清理资源')
-                    break
-                except Exception as e:
-                    # 发生错误，记录日志并发送错误事件
-                    import traceback
-                    traceback.print_exc()
-                    yield f'event: error\ndata: {{"error": "{str(e)}"}}\n\n'
-                    break
+                    # 更新 last_fingerprint
+                    last_fingerprint = current_fingerprint
                     
         except GeneratorExit:
             # 客户端断开连接
-            print('✅ SSE 客户端断开连接（外层），清理资源')
+            print('✅ SSE 客户端断开连接，清理资源')
         except Exception as e:
-            # 发生错误，记录日志
+            # 发生错误，记录日志并发送错误事件
             import traceback
             traceback.print_exc()
+            yield f'event: error\ndata: {json.dumps({"error": str(e)}, ensure_ascii=False)}\n\n'
+        finally:
+            materializer.unsubscribe()
     
     # 返回流式响应
     from flask import Response
@@ -4505,7 +4653,7 @@ def get_all_users_bubble_metrics():
         from src.filter_bubble_analyzer import FilterBubbleAnalyzer
 
         analyzer = FilterBubbleAnalyzer(db_path)
-        all_metrics = analyzer.get_all_user_metrics()
+        all_metrics = analyzer.get_all_user_metrics(limit=limit)
 
         # 使用to_dict方法返回完整的指标
         return jsonify([m.to_dict() for m in all_metrics])
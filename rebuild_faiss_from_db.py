@@ -1,10 +1,11 @@
 """
 Rebuilds the FAISS indexes in evidence_database so they stay synchronized with the current SQLite database.
 Ensure the network is available and the API configuration in evidence_database/config.py is valid before running.
+
+Usage: python rebuild_faiss_from_db.py [batch_size] [max_concurrency]
 """
 
 import os
-import sqlite3
 import importlib.util
 import sys
 
@@ -32,19 +33,13 @@ EnhancedOpinionSystem = module.EnhancedOpinionSystem
 
 system = EnhancedOpinionSystem()
 
-# Fetch viewpoints from the database
-conn = sqlite3.connect(os.path.join(BASE, "opinion_database.db"))
-cur = conn.cursor()
-rows = cur.execute("SELECT id, viewpoint, key_words FROM viewpoints ORDER BY id").fetchall()
-conn.close()
-
-print("rebuilding", len(rows), "viewpoints")
+# Embeddings are requested in deduplicated concurrent batches and cached on disk
+# batch by batch, so re-running after an interruption resumes where it stopped.
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else module.EMBEDDING_REBUILD_BATCH_SIZE
+max_concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else module.EMBEDDING_REBUILD_MAX_CONCURRENCY
+print(f"rebuilding with batch_size={batch_size}, max_concurrency={max_concurrency}")
 
-for vid, vp, kw in rows:
-    try:
-        system._add_vector_to_faiss(vid, vp, kw)
-    except Exception as e:
-        print("fail", vid, e)
+system._rebuild_faiss_indexes_from_db(batch_size=batch_size, max_concurrency=max_concurrency)
 
 print("done", system.get_cache_stats())
-
+system.close()
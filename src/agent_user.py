@@ -4,15 +4,19 @@ import json
 import logging
 import time
 from pydantic import BaseModel
-from typing import List, Literal, Optional, TYPE_CHECKING
+from dataclasses import dataclass
+from typing import List, Literal, Optional, Tuple, Type, TYPE_CHECKING
 import sys
 import os
 # Import from the database subdirectory
-from database.database_manager import get_db_manager, execute_query, fetch_one, fetch_all
+from database.database_manager import get_db_manager, execute_query, execute_deferred, fetch_one, fetch_all
+from database.engagement_buffer import get_engagement_buffer
+from llm_gateway import PRIORITY_AGENT, get_llm_gateway
+from post_index import NEWS, NON_NEWS, get_post_index
 
 # Import X-Algorithm recommender system
 try:
-    from recommender import FeedPipeline, FeedRequest, RecommenderConfig
+    from recommender import FeedRequest, RecommenderConfig, get_feed_service
     RECOMMENDER_AVAILABLE = True
 except ImportError:
     RECOMMENDER_AVAILABLE = False
@@ -20,6 +24,18 @@ except ImportError:
 if TYPE_CHECKING:
     from openai import OpenAI
 
+# Post columns the rule-based feed has always handed to Post.from_row
+_FEED_COLUMNS = (
+    'post_id', 'content', 'summary', 'author_id', 'created_at',
+    'num_likes', 'num_shares', 'num_flags', 'num_comments', 'original_post_id',
+    'is_agent_response', 'agent_role', 'agent_response_type', 'intervention_id',
+)
+
+
+def _feed_row(row: dict) -> dict:
+    """Project a PostIndex row onto the feed columns."""
+    return {column: row.get(column) for column in _FEED_COLUMNS}
+
 
 def try_parse_post_generation_json(raw_output: str) -> Optional[dict]:
     """
@@ -106,6 +122,28 @@ class FeedReaction(BaseModel):
     actions: List[FeedAction]
 
 
+class FeedActionWithReasoning(FeedAction):
+    """FeedAction with the agent's reasoning (used when include_reasoning is enabled)."""
+    reasoning: Optional[str] = None
+
+
+class FeedReactionWithReasoning(BaseModel):
+    actions: List[FeedActionWithReasoning]
+
+
+@dataclass
+class FeedReactionPlan:
+    """
+    Everything needed to ask the LLM for one user's feed reaction.
+    Built by AgentUser.prepare_feed_reaction so reactions can be generated per user or batched.
+    """
+    engine: str
+    temperature: float
+    system_prompt: str
+    response_model: Type[BaseModel]
+    segments: List[Tuple[int, list, str]]  # (segment index, segment feed, prompt)
+
+
 def build_comment_moderation_feedback(
     violation_count: int,
     ban_threshold: int = 3
@@ -291,7 +329,8 @@ class AgentUser:
 
         try:
             config = RecommenderConfig.from_dict(recommender_config)
-            self._feed_pipeline = FeedPipeline(config)
+            # One feed service per simulation; per-tick candidate work is shared by all agents
+            self._feed_pipeline = get_feed_service(config)
             logging.info(f"X-Algorithm recommender initialized for user {self.user_id}")
         except Exception as e:
             logging.warning(f"Failed to initialize recommender: {e}")
@@ -434,30 +473,27 @@ class AgentUser:
         Like a post.
         """
         # if an user has already liked this post, don't like it again
-        result = fetch_one('''
-            SELECT COUNT(*) as count FROM user_actions
-            WHERE user_id = ? AND action_type = 'like' AND target_id = ?
-        ''', (self.user_id, post_id))
-        if result and result['count'] > 0:
+        if self._already_engaged(('like_post', 'like'), post_id):
             logging.info(f"👍 User {self.user_id} already liked post {post_id}")
             return
 
-        # Update post likes count
-        execute_query('UPDATE posts SET num_likes = num_likes + 1 WHERE post_id = ?', (post_id,))
-
-        # Update author's total likes received
-        execute_query('''
-            UPDATE users
-            SET total_likes_received = total_likes_received + 1
-            WHERE user_id = (
-                SELECT author_id
-                FROM posts
-                WHERE post_id = ?
-            )
-        ''', (post_id,))
+        # Update post likes count and author's total likes received (buffered during reactions)
+        get_engagement_buffer().add_post_like(self.user_id, post_id)
         model_info = getattr(self, 'selected_model', 'unknown')
         # Logging moved to _process_reaction method
 
+    def _already_engaged(self, action_types: tuple, target_id: str) -> bool:
+        """Whether this user already performed one of the actions on the target (buffered or stored)."""
+        buffer = get_engagement_buffer()
+        if any(buffer.has_action(self.user_id, action_type, target_id) for action_type in action_types):
+            return True
+        placeholders = ','.join('?' * len(action_types))
+        result = fetch_one(f'''
+            SELECT COUNT(*) as count FROM user_actions
+            WHERE user_id = ? AND action_type IN ({placeholders}) AND target_id = ?
+        ''', (self.user_id, *action_types, target_id))
+        return bool(result and result['count'] > 0)
+
     def create_comment(self, post_id: str, content: str) -> str:
         """
         Create a comment on a post and update the post's comment count.
@@ -755,9 +791,11 @@ Your Comment:"""
             # Fetch system prompt asynchronously (concurrent)
             system_prompt = await self._create_personalized_system_prompt()
             
-            # Use asyncio.to_thread to run sync OpenAI call asynchronously
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
+            # Issue the request through the async LLM gateway
+            response = await get_llm_gateway().chat_completion(
+                client,
+                priority=PRIORITY_AGENT,
+                caller=self.user_id,
                 model=self.selected_model,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -801,10 +839,12 @@ Your comment:"""
             # Fetch system prompt asynchronously (concurrent)
             system_prompt = await self._create_personalized_system_prompt()
             
-            # Use asyncio.to_thread to run sync OpenAI call asynchronously
+            # Issue the request through the async LLM gateway
             import asyncio
-            completion = await asyncio.to_thread(
-                client.chat.completions.create,
+            completion = await get_llm_gateway().chat_completion(
+                client,
+                priority=PRIORITY_AGENT,
+                caller=self.user_id,
                 model=engine,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -828,31 +868,15 @@ Your comment:"""
 
     def like_comment(self, comment_id: str) -> None:
         """
-        Like a comment and track the action.
+        Like a comment.
         """
         try:
             # Check if user already liked this comment
-            result = fetch_one('''
-                SELECT COUNT(*) as count FROM user_actions
-                WHERE user_id = ? AND action_type = 'like_comment'
-                AND target_id = ?
-            ''', (self.user_id, comment_id))
-            if result and result['count'] > 0:
+            if self._already_engaged(('like_comment',), comment_id):
                 return
 
-            # Update comment likes count
-            execute_query('''
-                UPDATE comments
-                SET num_likes = num_likes + 1
-                WHERE comment_id = ?
-            ''', (comment_id,))
-
-            # Record the action
-            execute_query('''
-                INSERT INTO user_actions (user_id, action_type, target_id)
-                VALUES (?, 'like_comment', ?)
-            ''', (self.user_id, comment_id))
-            model_info = getattr(self, 'selected_model', 'unknown')
+            # Update comment likes count and author's total likes received (buffered during reactions)
+            get_engagement_buffer().add_comment_like(self.user_id, comment_id)
             # Logging moved to _process_reaction method
 
         except Exception as e:
@@ -863,11 +887,7 @@ Your comment:"""
         Share a post (repost it to user's own feed).
         """
         # Check if user already shared this post
-        result = fetch_one('''
-            SELECT COUNT(*) as count FROM user_actions
-            WHERE user_id = ? AND action_type = 'share' AND target_id = ?
-        ''', (self.user_id, post_id))
-        if result and result['count'] > 0:
+        if self._already_engaged(('share_post', 'share'), post_id):
             return
 
         # Get the original post content
@@ -914,15 +934,8 @@ Your comment:"""
                 VALUES (?, ?, ?, ?)
             ''', (new_post_id, shared_content, self.user_id, post_id))
 
-        # Increment share count on original post
-        execute_query('UPDATE posts SET num_shares = num_shares + 1 WHERE post_id = ?', (post_id,))
-
-        # Update total shares received for original author
-        execute_query('''
-            UPDATE users
-            SET total_shares_received = total_shares_received + 1
-            WHERE user_id = ?
-        ''', (original_author,))
+        # Increment share count on original post and shares received by its author
+        get_engagement_buffer().add_post_share(self.user_id, post_id, original_author)
         # Logging moved to _process_reaction method
 
         # Trigger scenario class export (sharing also creates a new post)
@@ -945,26 +958,11 @@ Your comment:"""
         """
         try:
             # First check if already following
-            result = fetch_one('''
-                SELECT 1 FROM follows
-                WHERE follower_id = ? AND followed_id = ?
-            ''', (self.user_id, target_user_id))
-
-            if result is not None:
+            if self._is_following(target_user_id):
                 return
 
-            # If not already following, create the relationship
-            execute_query('''
-                INSERT INTO follows (follower_id, followed_id)
-                VALUES (?, ?)
-            ''', (self.user_id, target_user_id))
-
-            # Update follower count for target user
-            execute_query('''
-                UPDATE users
-                SET follower_count = follower_count + 1
-                WHERE user_id = ?
-            ''', (target_user_id,))
+            # If not already following, create the relationship and update follower count
+            get_engagement_buffer().set_following(self.user_id, target_user_id, True)
             # Removed verbose individual follow logging
 
         except Exception as e:
@@ -976,34 +974,29 @@ Your comment:"""
             else:
                 raise e
 
-    def unfollow_user(self, target_user_id: str) -> None:
-        """
-        Unfollow a user.
-        """
-        # First check if actually following
+    def _is_following(self, target_user_id: str) -> bool:
+        """Current follow state, including follows buffered this phase."""
+        buffered = get_engagement_buffer().is_following(self.user_id, target_user_id)
+        if buffered is not None:
+            return buffered
         result = fetch_one('''
             SELECT 1 FROM follows
             WHERE follower_id = ? AND followed_id = ?
         ''', (self.user_id, target_user_id))
+        return result is not None
 
-        if result is None:
+    def unfollow_user(self, target_user_id: str) -> None:
+        """
+        Unfollow a user.
+        """
+        # First check if actually following
+        if not self._is_following(target_user_id):
             return
 
-        # delete the follow from the database
-        execute_query('''
-            DELETE FROM follows
-            WHERE follower_id = ? AND followed_id = ?
-        ''', (self.user_id, target_user_id))
-
-        # Update follower count for target user
-        execute_query('''
-            UPDATE users
-            SET follower_count = follower_count - 1
-            WHERE user_id = ?
-        ''', (target_user_id,))
+        # delete the follow and update follower count for target user
+        get_engagement_buffer().set_following(self.user_id, target_user_id, False)
         logging.info(f"User {self.user_id} unfollowed user {target_user_id}")
 
-
     def ignore(self) -> None:
         """
         Record that the agent chose to ignore their feed.
@@ -1043,10 +1036,12 @@ Your comment:"""
 
         for attempt in range(max_retries):
             try:
-                # Use asyncio.to_thread to run sync OpenAI calls asynchronously
+                # Issue the request through the async LLM gateway
                 import asyncio
-                completion = await asyncio.to_thread(
-                    openai_client.chat.completions.create,
+                completion = await get_llm_gateway().chat_completion(
+                    openai_client,
+                    priority=PRIORITY_AGENT,
+                    caller=self.user_id,
                     model=actual_engine,
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -1316,8 +1311,10 @@ Format your response as a single, updated memory that replaces and integrates mu
 
             async def _do_call():
                 logging.info(f"User {self.user_id}: Making LLM call with prompt length: {len(integration_prompt)}")
-                return await asyncio.to_thread(
-                    client.chat.completions.create,
+                return await get_llm_gateway().chat_completion(
+                    client,
+                    priority=PRIORITY_AGENT,
+                    caller=self.user_id,
                     model=model,
                     messages=[
                         {"role": "system", "content": "You are helping an AI agent integrate their memories to form coherent insights about their behavior, preferences, and identity. Focus on creating comprehensive memory summaries that capture patterns and preferences."},
@@ -1385,8 +1382,10 @@ Format your response as a single, comprehensive memory entry that can replace mu
                 client, model = selector.create_openai_client(role="memory")
 
             async def _do_call2():
-                return await asyncio.to_thread(
-                    client.chat.completions.create,
+                return await get_llm_gateway().chat_completion(
+                    client,
+                    priority=PRIORITY_AGENT,
+                    caller=self.user_id,
                     model=model,
                     messages=[
                         {"role": "system", "content": "You are helping an AI agent integrate and summarize their memories to form coherent insights about their behavior and preferences."},
@@ -1552,8 +1551,10 @@ Task:
                 logging.warning("MultiModelSelector unavailable; using selector fallback for memory integration.")
                 selector = MultiModelSelector()
                 client, model = selector.create_openai_client(role="memory")
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
+            response = await get_llm_gateway().chat_completion(
+                client,
+                priority=PRIORITY_AGENT,
+                caller=self.user_id,
                 model=model,
                 messages=[
                     {"role": "system", "content": "You update and maintain a user's integrated memory as one concise paragraph."},
@@ -1797,67 +1798,71 @@ Task:
         if not posts:
             return posts
 
-        for post in posts:
-            results = fetch_all('''
+        # Two pipelined round-trips: independent per-post reads first, then the
+        # recency query that depends on the hot comment ids plus exposure writes.
+        db_manager = get_db_manager()
+        with db_manager.pipeline() as pipe:
+            hot_results = [pipe.fetch_all('''
                 SELECT c.comment_id, c.content, c.post_id, c.author_id,
                        c.created_at, c.num_likes
                 FROM comments c
                 WHERE c.post_id = ?
                 ORDER BY c.num_likes DESC, c.created_at DESC
                 LIMIT 2
-            ''', (post.post_id,))
-            hot_comments = [Comment(*list(row.values())) for row in results]
-
-            hot_comment_ids = [c.comment_id for c in hot_comments]
-            if hot_comment_ids:
-                placeholders = ','.join('?' * len(hot_comment_ids))
-                results = fetch_all(f'''
-                    SELECT c.comment_id, c.content, c.post_id, c.author_id,
-                           c.created_at, c.num_likes
-                    FROM comments c
-                    WHERE c.post_id = ? AND c.comment_id NOT IN ({placeholders})
-                    ORDER BY c.created_at DESC
-                    LIMIT 2
-                ''', [post.post_id] + hot_comment_ids)
-            else:
-                results = fetch_all('''
-                    SELECT c.comment_id, c.content, c.post_id, c.author_id,
-                           c.created_at, c.num_likes
-                    FROM comments c
-                    WHERE c.post_id = ?
-                    ORDER BY c.created_at DESC
-                    LIMIT 2
-                ''', (post.post_id,))
-            recent_comments = [Comment(*list(row.values())) for row in results]
-            post.comments = hot_comments + recent_comments
-
-        for post in posts:
-            results = fetch_all('''
+            ''', (post.post_id,)) for post in posts]
+            note_results = [pipe.fetch_all('''
                 SELECT note_id, content, author_id, helpful_ratings, not_helpful_ratings
                 FROM community_notes
                 WHERE post_id = ?
                 ORDER BY helpful_ratings DESC
-            ''', (post.post_id,))
-            post.community_notes = [CommunityNote(*row.values()) for row in results]
-
-        for post in posts:
-            fact_check = fetch_one('''
+            ''', (post.post_id,)) for post in posts]
+            fact_check_results = [pipe.fetch_one('''
                 SELECT verdict, explanation, confidence
                 FROM fact_checks
                 WHERE post_id = ?
-            ''', (post.post_id,))
+            ''', (post.post_id,)) for post in posts]
+
+        with db_manager.pipeline() as pipe:
+            recent_results = []
+            for post, hot_result in zip(posts, hot_results):
+                post.comments = [Comment(*list(row.values())) for row in hot_result.result()]
+                hot_comment_ids = [c.comment_id for c in post.comments]
+                if hot_comment_ids:
+                    placeholders = ','.join('?' * len(hot_comment_ids))
+                    recent_results.append(pipe.fetch_all(f'''
+                        SELECT c.comment_id, c.content, c.post_id, c.author_id,
+                               c.created_at, c.num_likes
+                        FROM comments c
+                        WHERE c.post_id = ? AND c.comment_id NOT IN ({placeholders})
+                        ORDER BY c.created_at DESC
+                        LIMIT 2
+                    ''', [post.post_id] + hot_comment_ids))
+                else:
+                    recent_results.append(pipe.fetch_all('''
+                        SELECT c.comment_id, c.content, c.post_id, c.author_id,
+                               c.created_at, c.num_likes
+                        FROM comments c
+                        WHERE c.post_id = ?
+                        ORDER BY c.created_at DESC
+                        LIMIT 2
+                    ''', (post.post_id,)))
+
+            if time_step is not None:
+                pipe.executemany('''
+                    INSERT OR IGNORE INTO feed_exposures (user_id, post_id, time_step)
+                    VALUES (?, ?, ?)
+                ''', [(self.user_id, post.post_id, time_step) for post in posts])
+
+        for post, recent_result, note_result, fact_check_result in zip(
+                posts, recent_results, note_results, fact_check_results):
+            post.comments += [Comment(*list(row.values())) for row in recent_result.result()]
+            post.community_notes = [CommunityNote(*row.values()) for row in note_result.result()]
+            fact_check = fact_check_result.result()
             if fact_check:
                 post.fact_check_verdict = fact_check['verdict']
                 post.fact_check_explanation = fact_check['explanation']
                 post.fact_check_confidence = fact_check['confidence']
 
-        if time_step is not None:
-            for post in posts:
-                execute_query('''
-                    INSERT OR IGNORE INTO feed_exposures (user_id, post_id, time_step)
-                    VALUES (?, ?, ?)
-                ''', (self.user_id, post.post_id, time_step))
-
         return posts
 
     def get_feed(self, experiment_config: dict, time_step=None):
@@ -1907,123 +1912,49 @@ Task:
                     raise e
             return self._enrich_feed_posts(snapshot, time_step)
 
-        # Scoring parameters
-        lambda_decay = 0.1 
-        beta_bias = 180   
-
-        # Get post->timestep mapping (age=0 if missing)
+        # Ranked windows come from the shared post index (synced with the database per feed)
         try:
-            pt_rows = fetch_all('SELECT post_id, time_step FROM post_timesteps')
-            post_step_map = {r['post_id']: r['time_step'] for r in pt_rows}
+            post_index = get_post_index()
+            post_index.sync()
         except Exception as e:
             if "unable to open database file" in str(e):
-                post_step_map = {}
-            else:
-                raise e
+                return self._enrich_feed_posts([], time_step)
+            raise e
 
-        def compute_score(row):
-            # Engagement uses comment count only
-            eng = (row.get('num_comments') or 0)
-            pstep = post_step_map.get(row['post_id'])
-            age = max(0, (time_step - pstep)) if (pstep is not None) else 0
-            freshness = max(0.1, 1.0 - lambda_decay * age)
-            return (eng + beta_bias) * freshness
-
-        # Override engagement as comments + shares + likes
-        def compute_score(row):
-            eng = (row.get('num_comments') or 0) + (row.get('num_shares') or 0) + (row.get('num_likes') or 0)
-            pstep = post_step_map.get(row['post_id'])
-            age = max(0, (time_step - pstep)) if (pstep is not None) else 0
-            freshness = max(0.1, 1.0 - lambda_decay * age)
-            return (eng + beta_bias) * freshness
-
-        def rank_and_sample(query_sql, params, pick_n, top_k=10, offset=0, include_ties=True):
-            try:
-                rows = fetch_all(query_sql, params)
-            except Exception as e:
-                if "unable to open database file" in str(e):
-                    return []
-                else:
-                    raise e
-            # Convert to list of dicts
-            dict_rows = [dict(r) if not isinstance(r, dict) else r for r in rows]
-            for r in dict_rows:
-                r['__score'] = compute_score(r)
-            # Sort by score desc, created_at desc
-            dict_rows.sort(key=lambda r: (r['__score'], r.get('created_at')), reverse=True)
-            if not dict_rows:
-                return []
-            # Take window [offset, offset+top_k)
-            start = max(0, int(offset))
-            end = max(start, start + int(top_k))
-            top_pool = dict_rows[start:end]
-            # Include boundary ties in pool (optional)
-            if include_ties and end < len(dict_rows) and top_pool:
-                last_score = top_pool[-1]['__score']
-                i = end
-                while i < len(dict_rows) and dict_rows[i]['__score'] == last_score:
-                    top_pool.append(dict_rows[i])
-                    i += 1
+        def rank_and_sample(kind, pick_n, top_k=10, offset=0, include_ties=True):
+            top_pool = post_index.score_view(kind, time_step).window(offset, top_k, include_ties)
             # Randomly sample pick_n
             if len(top_pool) <= pick_n:
                 chosen = top_pool
             else:
                 chosen = random.sample(top_pool, pick_n)
-            return [Post.from_row(r) for r in chosen]
+            return [Post.from_row(_feed_row(r)) for r in chosen]
 
         # News pool: active news
-        news_sql = '''
-            SELECT p.post_id, p.content, p.summary, p.author_id, p.created_at,
-                   p.num_likes, p.num_shares, p.num_flags, p.num_comments, p.original_post_id,
-                   p.is_agent_response, p.agent_role, p.agent_response_type, p.intervention_id
-            FROM posts p
-            WHERE p.is_news = TRUE AND (p.status IS NULL OR p.status != 'taken_down')
-        '''
-        news_top10 = rank_and_sample(news_sql, (), pick_n=5, top_k=10, offset=0, include_ties=False)
-        news_11_20 = rank_and_sample(news_sql, (), pick_n=3, top_k=10, offset=10, include_ties=False)
+        news_top10 = rank_and_sample(NEWS, pick_n=5, top_k=10, offset=0, include_ties=False)
+        news_11_20 = rank_and_sample(NEWS, pick_n=3, top_k=10, offset=10, include_ties=False)
 
         # Add 1 extra negative news item (news_type='fake'), no duplicates; score-weighted sampling
         negative_selected = []
-        try:
-            # Base candidate set: all valid negative news
-            neg_rows = fetch_all('''
-                SELECT p.post_id, p.content, p.summary, p.author_id, p.created_at,
-                       p.num_likes, p.num_shares, p.num_flags, p.num_comments, p.original_post_id,
-                       p.is_agent_response, p.agent_role, p.agent_response_type, p.intervention_id
-                FROM posts p
-                WHERE p.is_news = TRUE AND p.news_type = 'fake' AND (p.status IS NULL OR p.status != 'taken_down')
-            ''')
-            # Compute scores and exclude already selected news
-            neg_candidates = []
-            selected_ids = {p.post_id for p in (news_top10 + news_11_20)}
-            for r in neg_rows:
-                rdict = dict(r) if not isinstance(r, dict) else r
-                if rdict['post_id'] in selected_ids:
-                    continue
-                rdict['__score'] = compute_score(rdict)
-                neg_candidates.append(rdict)
-
-            if neg_candidates:
-                # Score-weighted random sampling (higher score more likely)
-                import random
-                weights = [max(0.0001, c['__score']) for c in neg_candidates]
-                choice = random.choices(neg_candidates, weights=weights, k=1)[0]
-                negative_selected = [Post.from_row(choice)]
-        except Exception as e:
-            if "unable to open database file" in str(e):
-                negative_selected = []
-            else:
-                raise e
+        # Base candidate set: all valid negative news
+        neg_rows = [r for r in post_index.active_posts(NEWS) if r.get('news_type') == 'fake']
+        # Compute scores and exclude already selected news
+        neg_candidates = []
+        news_view = post_index.score_view(NEWS, time_step)
+        selected_ids = {p.post_id for p in (news_top10 + news_11_20)}
+        for r in neg_rows:
+            if r['post_id'] in selected_ids:
+                continue
+            neg_candidates.append((r, news_view.score(r)))
+
+        if neg_candidates:
+            # Score-weighted random sampling (higher score more likely)
+            weights = [max(0.0001, score) for _, score in neg_candidates]
+            choice = random.choices(neg_candidates, weights=weights, k=1)[0][0]
+            negative_selected = [Post.from_row(_feed_row(choice))]
 
         # Non-news pool: active non-news
-        non_news_sql = '''
-            SELECT p.post_id, p.content, p.summary, p.author_id, p.created_at,
-                   p.num_likes, p.num_shares, p.num_flags, p.num_comments, p.original_post_id,
-                   p.is_agent_response, p.agent_role, p.agent_response_type, p.intervention_id
-            FROM posts p
-            WHERE (p.is_news IS NULL OR p.is_news != TRUE) AND (p.status IS NULL OR p.status != 'taken_down')
-        '''
-        non_news_selected = rank_and_sample(non_news_sql, (), pick_n=2, top_k=10, offset=0, include_ties=True)
+        non_news_selected = rank_and_sample(NON_NEWS, pick_n=2, top_k=10, offset=0, include_ties=True)
 
         # Merge and dedupe
         final_feed = []
@@ -2095,74 +2026,27 @@ Task:
         """Original get_feed logic as fallback"""
         import random
 
-        # Scoring parameters
-        lambda_decay = 0.1
-        beta_bias = 180
-
-        # Get post->timestep mapping
+        # Get post->timestep mapping and ranked windows from the shared post index
         try:
-            pt_rows = fetch_all('SELECT post_id, time_step FROM post_timesteps')
-            post_step_map = {r['post_id']: r['time_step'] for r in pt_rows}
+            post_index = get_post_index()
+            post_index.sync()
         except Exception as e:
             if "unable to open database file" in str(e):
-                post_step_map = {}
-            else:
-                raise e
-
-        def compute_score(row):
-            eng = (row.get('num_comments') or 0) + (row.get('num_shares') or 0) + (row.get('num_likes') or 0)
-            pstep = post_step_map.get(row['post_id'])
-            age = max(0, (time_step - pstep)) if (pstep is not None) else 0
-            freshness = max(0.1, 1.0 - lambda_decay * age)
-            return (eng + beta_bias) * freshness
+                return self._enrich_feed_posts([], time_step)
+            raise e
 
-        def rank_and_sample(query_sql, params, pick_n, top_k=10, offset=0, include_ties=True):
-            try:
-                rows = fetch_all(query_sql, params)
-            except Exception as e:
-                if "unable to open database file" in str(e):
-                    return []
-                else:
-                    raise e
-            dict_rows = [dict(r) if not isinstance(r, dict) else r for r in rows]
-            for r in dict_rows:
-                r['__score'] = compute_score(r)
-            dict_rows.sort(key=lambda r: (r['__score'], r.get('created_at')), reverse=True)
-            if not dict_rows:
-                return []
-            start = max(0, int(offset))
-            end = max(start, start + int(top_k))
-            top_pool = dict_rows[start:end]
-            if include_ties and end < len(dict_rows) and top_pool:
-                last_score = top_pool[-1]['__score']
-                i = end
-                while i < len(dict_rows) and dict_rows[i]['__score'] == last_score:
-                    top_pool.append(dict_rows[i])
-                    i += 1
+        def rank_and_sample(kind, pick_n, top_k=10, offset=0, include_ties=True):
+            top_pool = post_index.score_view(kind, time_step).window(offset, top_k, include_ties)
             if len(top_pool) <= pick_n:
                 chosen = top_pool
             else:
                 chosen = random.sample(top_pool, pick_n)
-            return [Post.from_row(r) for r in chosen]
+            return [Post.from_row(_feed_row(r)) for r in chosen]
 
-        news_sql = '''
-            SELECT p.post_id, p.content, p.summary, p.author_id, p.created_at,
-                   p.num_likes, p.num_shares, p.num_flags, p.num_comments, p.original_post_id,
-                   p.is_agent_response, p.agent_role, p.agent_response_type, p.intervention_id
-            FROM posts p
-            WHERE p.is_news = TRUE AND (p.status IS NULL OR p.status != 'taken_down')
-        '''
-        news_top10 = rank_and_sample(news_sql, (), pick_n=5, top_k=10, offset=0, include_ties=False)
-        news_11_20 = rank_and_sample(news_sql, (), pick_n=3, top_k=10, offset=10, include_ties=False)
+        news_top10 = rank_and_sample(NEWS, pick_n=5, top_k=10, offset=0, include_ties=False)
+        news_11_20 = rank_and_sample(NEWS, pick_n=3, top_k=10, offset=10, include_ties=False)
 
-        non_news_sql = '''
-            SELECT p.post_id, p.content, p.summary, p.author_id, p.created_at,
-                   p.num_likes, p.num_shares, p.num_flags, p.num_comments, p.original_post_id,
-                   p.is_agent_response, p.agent_role, p.agent_response_type, p.intervention_id
-            FROM posts p
-            WHERE (p.is_news IS NULL OR p.is_news != TRUE) AND (p.status IS NULL OR p.status != 'taken_down')
-        '''
-        non_news_selected = rank_and_sample(non_news_sql, (), pick_n=2, top_k=10, offset=0, include_ties=True)
+        non_news_selected = rank_and_sample(NON_NEWS, pick_n=2, top_k=10, offset=0, include_ties=True)
 
         final_feed = []
         seen = set()
@@ -2269,10 +2153,10 @@ Task:
                 post.fact_check_explanation = fact_check['explanation']
                 post.fact_check_confidence = fact_check['confidence']
 
-        # Track exposures for all posts in the final feed
+        # Track exposures for all posts in the final feed (sent with the next batch)
         if time_step is not None:
             for post in final_feed:
-                execute_query('''
+                execute_deferred('''
                     INSERT OR IGNORE INTO feed_exposures (user_id, post_id, time_step)
                     VALUES (?, ?, ?)
                 ''', (self.user_id, post.post_id, time_step))
@@ -2678,154 +2562,163 @@ Task:
                 engine: The engine to use for generation.
                 feed: A list of Post objects representing the user's feed.
             """
-            # Skip feed reactions for news agents or if comment limit is reached
-            if self.is_news_agent or self.comment_count >= self.comment_limit:
+            plan = await self.prepare_feed_reaction(engine, feed)
+            if plan is None:
+                return
+
+            # Use LLM to generate reactions for each feed segment sequentially
+            for segment_index, segment_feed, prompt in plan.segments:
                 if self.comment_count >= self.comment_limit:
                     logging.info(f"User {self.user_id} has reached their comment limit of {self.comment_limit}.")
-                return
+                    break
 
-            feed_segments = self._split_feed_segments(feed)
-            if not feed_segments:
-                return
-    
-            # Get the reasoning configuration
-            include_reasoning = self.experiment_config.get('experiment', {}).get('settings', {}).get('include_reasoning', False)
-    
-            system_prompt = await self._create_personalized_system_prompt()
-    
-                # Create a dynamic FeedAction class based on whether reasoning is included
-            if include_reasoning:
-                class FeedActionWithReasoning(BaseModel):
-                    action: Literal[
-                        "like-post", "share-post", "flag-post", "follow-user",
-                        "unfollow-user", "comment-post", "like-comment", "ignore",
-                        "add-note", "rate-note"
-                    ]
-                    target: Optional[str] = None
-                    content: Optional[str] = None
-                    reasoning: Optional[str] = None
-                    note_rating: Optional[Literal["helpful", "not-helpful"]] = None
+                try:
+                    reaction = await self.generate_segment_reaction(openai_client, plan, prompt)
+                    self.apply_feed_reaction(reaction, plan, segment_index, segment_feed, prompt)
+                except Exception as e:
+                    self._log_feed_reaction_error(e)
+                    return
 
-                class FeedReactionWithReasoning(BaseModel):
-                    actions: List[FeedActionWithReasoning]
+            self.finish_feed_reaction(openai_client, engine)
 
-                response_model = FeedReactionWithReasoning
-            else:
-                response_model = FeedReaction
+    async def prepare_feed_reaction(self, engine: str, feed) -> Optional[FeedReactionPlan]:
+        """
+        Build the prompts for a feed reaction without calling the LLM.
 
-            import asyncio
-            actual_engine = self.get_dynamic_model() if hasattr(self, 'get_dynamic_model') else (self.selected_model if hasattr(self, 'selected_model') else engine)
+        Returns:
+            FeedReactionPlan, or None if the user does not react this step
+        """
+        # Skip feed reactions for news agents or if comment limit is reached
+        if self.is_news_agent or self.comment_count >= self.comment_limit:
+            if self.comment_count >= self.comment_limit:
+                logging.info(f"User {self.user_id} has reached their comment limit of {self.comment_limit}.")
+            return None
 
-            # Use LLM to generate reactions for each feed segment sequentially
-            for segment_index, segment_feed in enumerate(feed_segments, start=1):
-                if not segment_feed:
-                    continue
+        feed_segments = [segment for segment in self._split_feed_segments(feed) if segment]
+        if not feed_segments:
+            return None
 
-                if self.comment_count >= self.comment_limit:
-                    logging.info(f"User {self.user_id} has reached their comment limit of {self.comment_limit}.")
-                    break
+        # Get the reasoning configuration
+        include_reasoning = self.experiment_config.get('experiment', {}).get('settings', {}).get('include_reasoning', False)
 
-                prompt = self._create_feed_reaction_prompt(segment_feed)
+        system_prompt = await self._create_personalized_system_prompt()
+        actual_engine = self.get_dynamic_model() if hasattr(self, 'get_dynamic_model') else (self.selected_model if hasattr(self, 'selected_model') else engine)
 
-                try:
-                    reaction = await asyncio.to_thread(
-                        Utils.generate_llm_response,
-                        openai_client=openai_client,
-                        engine=actual_engine,
-                        prompt=prompt,
-                        system_message=system_prompt,
-                        response_model=response_model,
-                        temperature=self.temperature
-                    )
+        return FeedReactionPlan(
+            engine=actual_engine,
+            temperature=self.temperature,
+            system_prompt=system_prompt,
+            response_model=FeedReactionWithReasoning if include_reasoning else FeedReaction,
+            segments=[
+                (segment_index, segment_feed, self._create_feed_reaction_prompt(segment_feed))
+                for segment_index, segment_feed in enumerate(feed_segments, start=1)
+            ],
+        )
 
-                    if reaction and reaction.actions:
+    async def generate_segment_reaction(self, openai_client: OpenAI, plan: FeedReactionPlan, prompt: str):
+        """Generate the reaction to one feed segment with a dedicated LLM call."""
+        return await Utils.agenerate_llm_response(
+            openai_client=openai_client,
+            engine=plan.engine,
+            prompt=prompt,
+            system_message=plan.system_prompt,
+            response_model=plan.response_model,
+            temperature=plan.temperature,
+            priority=PRIORITY_AGENT,
+            caller=self.user_id
+        )
 
-                        # <<< Logging prompt & actions to JSONL >>>
-                        import json
-                        import datetime
+    def apply_feed_reaction(self, reaction, plan: FeedReactionPlan, segment_index: int, segment_feed, prompt: str):
+        """Log and execute the actions generated for one feed segment."""
+        system_prompt = plan.system_prompt
+        if not (reaction and reaction.actions):
+            logging.warning(f"User {self.user_id} generated empty reaction for segment {segment_index}")
+            return
 
-                        EXPORT_FILE_NAME = "temp_reaction_log.jsonl"
+        # <<< Logging prompt & actions to JSONL >>>
+        import json
+        import datetime
 
-                        try:
-                            try:
-                                actions_list = [action.model_dump() for action in reaction.actions]
-                            except AttributeError:
-                                actions_list = [action.dict() for action in reaction.actions]
-
-                            feed_content = "\n".join([
-                                f"post_id: {post.post_id} | content: {(post.summary or post.content)} "
-                                f"(by User {str(post.author_id)}) "
-                                f"[Likes: {post.num_likes or 0}, Shares: {post.num_shares or 0}, Comments: {post.num_comments or 0}]"
-                                + (f" {post.agent_response_display}" if hasattr(post, 'is_agent_response') and post.is_agent_response else "")
-                                + (f"\nFACT CHECK: {post.fact_check_verdict.upper()} "
-                                   f"(Confidence: {post.fact_check_confidence:.0%})"
-                                   if hasattr(post, 'fact_check_verdict') else "")
-                                + f"\nComments:\n" + "\n".join([
-                                    f"- comment_id: {comment.comment_id} | content: {comment.content} (by User {str(comment.author_id)}) [Likes: {comment.num_likes or 0}]"
-                                    for comment in post.comments[:3]
-                                ])
-                                + (f"\n  Community Notes:\n" + "\n".join([
-                                    f"  ? note_id: {note.note_id} | content: {note.content} (Helpful: {str(note.helpful_ratings)}, Not Helpful: {str(note.not_helpful_ratings)})"
-                                    for note in post.community_notes[:3] if note.is_visible
-                                ]) if any(note.is_visible for note in post.community_notes[:3]) else "")
-                                for _, post in enumerate(segment_feed)
-                            ])
-
-                            spacing = " " * 50
-                            log_pairs = [
-                                ("timestamp", datetime.datetime.now().isoformat()),
-                                ("user_id", self.user_id),
-                                ("feed_segment_index", segment_index),
-                                ("system prompt", system_prompt),
-                                ("prompt", prompt),
-                                ("feed_content", feed_content),
-                                ("actions", actions_list)
-                            ]
-                            serialized = spacing.join(
-                                f"\"{key}\":{json.dumps(value, ensure_ascii=False)}"
-                                for key, value in log_pairs
-                            )
-
-                            with open(EXPORT_FILE_NAME, 'a', encoding='utf-8') as f:
-                                f.write("{" + serialized + "}\n")
-
-                        except Exception as log_e:
-                            logging.warning(f"User {self.user_id} - Failed to write to reaction log: {log_e}")
-
-                        # <<< Process reactions >>>
-
-                        self._process_reaction(reaction, segment_feed)
-                    else:
-                        logging.warning(f"User {self.user_id} generated empty reaction for segment {segment_index}")
+        EXPORT_FILE_NAME = "temp_reaction_log.jsonl"
 
-                except Exception as e:
-                    # Special handling for Pydantic validation errors
-                    if "ValidationError" in str(type(e)) or "validation error" in str(e).lower():
-                        logging.error(f"Validation error for user {self.user_id}: {e}")
-                        logging.error("This might be due to invalid actions in LLM response. The error has been logged for debugging.")
-                    else:
-                        logging.error(f"Error generating reaction for user {self.user_id}: {e}")
+        try:
+            try:
+                actions_list = [action.model_dump() for action in reaction.actions]
+            except AttributeError:
+                actions_list = [action.dict() for action in reaction.actions]
 
-                    # Add detailed traceback for debugging
-                    import traceback
-                    logging.error(f"Full traceback for user {self.user_id}:")
-                    logging.error(traceback.format_exc())
+            feed_content = "\n".join([
+                f"post_id: {post.post_id} | content: {(post.summary or post.content)} "
+                f"(by User {str(post.author_id)}) "
+                f"[Likes: {post.num_likes or 0}, Shares: {post.num_shares or 0}, Comments: {post.num_comments or 0}]"
+                + (f" {post.agent_response_display}" if hasattr(post, 'is_agent_response') and post.is_agent_response else "")
+                + (f"\nFACT CHECK: {post.fact_check_verdict.upper()} "
+                   f"(Confidence: {post.fact_check_confidence:.0%})"
+                   if hasattr(post, 'fact_check_verdict') else "")
+                + f"\nComments:\n" + "\n".join([
+                    f"- comment_id: {comment.comment_id} | content: {comment.content} (by User {str(comment.author_id)}) [Likes: {comment.num_likes or 0}]"
+                    for comment in post.comments[:3]
+                ])
+                + (f"\n  Community Notes:\n" + "\n".join([
+                    f"  ? note_id: {note.note_id} | content: {note.content} (Helpful: {str(note.helpful_ratings)}, Not Helpful: {str(note.not_helpful_ratings)})"
+                    for note in post.community_notes[:3] if note.is_visible
+                ]) if any(note.is_visible for note in post.community_notes[:3]) else "")
+                for _, post in enumerate(segment_feed)
+            ])
 
-                    return
-            # Check for reflection after processing reactions
-            try:
-                result = fetch_one('''
-                    SELECT COUNT(*) as count FROM agent_memories
-                    WHERE user_id = ? AND memory_type = 'interaction'
-                ''', (self.user_id,))
+            spacing = " " * 50
+            log_pairs = [
+                ("timestamp", datetime.datetime.now().isoformat()),
+                ("user_id", self.user_id),
+                ("feed_segment_index", segment_index),
+                ("system prompt", system_prompt),
+                ("prompt", prompt),
+                ("feed_content", feed_content),
+                ("actions", actions_list)
+            ]
+            serialized = spacing.join(
+                f"\"{key}\":{json.dumps(value, ensure_ascii=False)}"
+                for key, value in log_pairs
+            )
 
-                if result and result['count'] % 2 == 0:  # every 2 interactions
-                    self.memory.reflect(openai_client, engine, self.temperature)
-            except Exception as e:
-                if "unable to open database file" in str(e):
-                    logging.warning(f"Database connection error in react_to_feed reflection check, skipping reflection")
-                else:
-                    raise e
+            with open(EXPORT_FILE_NAME, 'a', encoding='utf-8') as f:
+                f.write("{" + serialized + "}\n")
+
+        except Exception as log_e:
+            logging.warning(f"User {self.user_id} - Failed to write to reaction log: {log_e}")
+
+        # <<< Process reactions >>>
+
+        self._process_reaction(reaction, segment_feed)
+
+    def _log_feed_reaction_error(self, e: Exception):
+        # Special handling for Pydantic validation errors
+        if "ValidationError" in str(type(e)) or "validation error" in str(e).lower():
+            logging.error(f"Validation error for user {self.user_id}: {e}")
+            logging.error("This might be due to invalid actions in LLM response. The error has been logged for debugging.")
+        else:
+            logging.error(f"Error generating reaction for user {self.user_id}: {e}")
+
+        # Add detailed traceback for debugging
+        import traceback
+        logging.error(f"Full traceback for user {self.user_id}:")
+        logging.error(traceback.format_exc())
+
+    def finish_feed_reaction(self, openai_client: OpenAI, engine: str):
+        """Check for reflection after processing reactions."""
+        try:
+            result = fetch_one('''
+                SELECT COUNT(*) as count FROM agent_memories
+                WHERE user_id = ? AND memory_type = 'interaction'
+            ''', (self.user_id,))
+
+            if result and result['count'] % 2 == 0:  # every 2 interactions
+                self.memory.reflect(openai_client, engine, self.temperature)
+        except Exception as e:
+            if "unable to open database file" in str(e):
+                logging.warning(f"Database connection error in react_to_feed reflection check, skipping reflection")
+            else:
+                raise e
 
     def _create_feed_reaction_prompt(self, feed) -> str:
         """
@@ -2998,6 +2891,7 @@ Task:
             }
 
             processed_actions = set()
+            buffer = get_engagement_buffer()
             include_reasoning = self.experiment_config.get('experiment', {}).get('settings', {}).get('include_reasoning', False)
 
             for action_data in reaction.actions:
@@ -3021,41 +2915,6 @@ Task:
                 model_info = getattr(self, 'selected_model', 'unknown')
                 
                 try:
-                    # Record to database
-                    if action == 'comment-post' or action == 'add-note':
-                        if include_reasoning and action_reasoning:
-                            execute_query('''
-                                INSERT INTO user_actions (user_id, action_type, target_id, content, reasoning)
-                                VALUES (?, ?, ?, ?, ?)
-                            ''', (self.user_id, action.replace('-', '_'), target, content, action_reasoning))
-                        else:
-                            execute_query('''
-                                INSERT INTO user_actions (user_id, action_type, target_id, content)
-                                VALUES (?, ?, ?, ?)
-                            ''', (self.user_id, action.replace('-', '_'), target, content))
-                    elif action == 'ignore':
-                        if include_reasoning and action_reasoning:
-                            execute_query('''
-                                INSERT INTO user_actions (user_id, action_type, reasoning)
-                                VALUES (?, 'ignore', ?)
-                            ''', (self.user_id, action_reasoning))
-                        else:
-                            execute_query('''
-                                INSERT INTO user_actions (user_id, action_type)
-                                VALUES (?, 'ignore')
-                            ''', (self.user_id,))
-                    else:
-                        if include_reasoning and action_reasoning:
-                            execute_query('''
-                                INSERT INTO user_actions (user_id, action_type, target_id, reasoning)
-                                VALUES (?, ?, ?, ?)
-                            ''', (self.user_id, action.replace('-', '_'), target, action_reasoning))
-                        else:
-                            execute_query('''
-                                INSERT INTO user_actions (user_id, action_type, target_id)
-                                VALUES (?, ?, ?)
-                            ''', (self.user_id, action.replace('-', '_'), target))
-
                     # Execute the actual action
                     if action == 'comment-post':
                         if self.comment_count < self.comment_limit:
@@ -3078,65 +2937,10 @@ Task:
                         self.rate_community_note(target, is_helpful)
                         logging.info(f"⭐ User {self.user_id} rated note {target} as {action_data.note_rating}")
                     elif action == 'like-comment':
-                        # Record the action to user_actions table (INSERT OR IGNORE to handle duplicates)
-                        execute_query('''
-                            INSERT OR IGNORE INTO user_actions (user_id, action_type, target_id)
-                            VALUES (?, 'like_comment', ?)
-                        ''', (self.user_id, target))
-                        
-                        # Update comment likes count only if the action was actually inserted
-                        # Use a subquery to check if the action exists and update accordingly
-                        execute_query('''
-                            UPDATE comments 
-                            SET num_likes = num_likes + 1 
-                            WHERE comment_id = ? 
-                            AND EXISTS (
-                                SELECT 1 FROM user_actions 
-                                WHERE user_id = ? AND action_type = 'like_comment' AND target_id = ?
-                            )
-                        ''', (target, self.user_id, target))
-                        
-                        # Update author's total likes received
-                        execute_query('''
-                            UPDATE users
-                            SET total_likes_received = total_likes_received + 1
-                            WHERE user_id = (
-                                SELECT author_id
-                                FROM comments
-                                WHERE comment_id = ?
-                            )
-                            AND EXISTS (
-                                SELECT 1 FROM user_actions 
-                                WHERE user_id = ? AND action_type = 'like_comment' AND target_id = ?
-                            )
-                        ''', (target, self.user_id, target))
-                        
+                        self.like_comment(target)
                         logging.info(f"👍 User {self.user_id} liked comment {target}")
                     elif action == 'like-post':
-                        # Record the action to user_actions table (INSERT OR IGNORE to handle duplicates)
-                        execute_query('''
-                            INSERT OR IGNORE INTO user_actions (user_id, action_type, target_id)
-                            VALUES (?, 'like', ?)
-                        ''', (self.user_id, target))
-                        
-                        # Update post likes count (only if post exists)
-                        execute_query('''
-                            UPDATE posts 
-                            SET num_likes = num_likes + 1 
-                            WHERE post_id = ?
-                        ''', (target,))
-                        
-                        # Update author's total likes received (only if post exists)
-                        execute_query('''
-                            UPDATE users
-                            SET total_likes_received = total_likes_received + 1
-                            WHERE user_id = (
-                                SELECT author_id
-                                FROM posts
-                                WHERE post_id = ?
-                            )
-                        ''', (target,))
-                        
+                        self.like_post(target)
                         logging.info(f"👍 User {self.user_id} liked post {target} (post_id: {target})")
                     elif action == 'share-post':
                         self.share_post(target)
@@ -3163,6 +2967,19 @@ Task:
                             # For unknown actions, just log and continue
                             logging.debug(f"❓ Unknown action method '{method_name}' for action '{action}' - skipping execution")
 
+                    # Record to database after executing, so duplicate checks above only
+                    # see earlier actions (buffered until the end of the reaction phase)
+                    action_type = action.replace('-', '_')
+                    if action == 'comment-post' or action == 'add-note':
+                        buffer.record_action(self.user_id, action_type, target, content,
+                                             action_reasoning if include_reasoning else None)
+                    elif action == 'ignore':
+                        buffer.record_action(self.user_id, 'ignore', None, None,
+                                             action_reasoning if include_reasoning else None)
+                    else:
+                        buffer.record_action(self.user_id, action_type, target, None,
+                                             action_reasoning if include_reasoning else None)
+
                     # Stop writing interaction memories; integrate into a single memory after post/comment
                     
                     # Remove periodic integration every 5 actions (now update at end of post/comment)
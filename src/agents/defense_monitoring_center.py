@@ -7,7 +7,14 @@ from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 from collections import defaultdict
+import heapq
 import json
+import logging
+
+try:
+    from src.database_manager import account_role_select
+except ImportError:
+    from database_manager import account_role_select
 
 
 @dataclass
@@ -383,6 +390,283 @@ class AlgorithmicBiasCalculator:
         return snapshot
 
 
+# Roles source when the user_roles side table is missing (databases created before it existed)
+_ROLES_FROM_PERSONA = f"({account_role_select('users')} FROM users)"
+
+_SYNC_TABLES_QUERY = """
+    SELECT name FROM sqlite_master
+    WHERE type = 'table' AND name IN ('user_roles', 'post_changes', 'comment_changes')
+"""
+
+_LOG_POSITION = "(SELECT COALESCE(MAX(seq), 0) FROM {log})"
+
+_SYNC_POSITIONS_QUERY = """
+    SELECT
+        {post_seq},
+        {comment_seq},
+        (SELECT COALESCE(MAX(id), 0) FROM malicious_comments),
+        (SELECT COALESCE(MAX(id), 0) FROM opinion_monitoring)
+"""
+
+# Per-post contribution to its topic; role flags come from user_roles, so no persona LIKE here
+_POST_COLUMNS = """
+    p.post_id,
+    COALESCE(p.original_post_id, p.post_id),
+    p.content,
+    p.author_id,
+    CASE WHEN p.status IS NULL OR p.status = 'active' THEN 1 ELSE 0 END,
+    p.num_likes + p.num_comments + p.num_shares,
+    CASE WHEN r.malicious
+              OR p.agent_type = 'malicious_agent'
+              OR (p.is_news = 1 AND p.news_type = 'fake')
+         THEN 1 ELSE 0 END,
+    CASE WHEN r.defense
+              OR p.agent_type = 'amplifier_agent'
+              OR p.agent_type = 'leader_agent'
+              OR COALESCE(p.is_agent_response, 0) = 1
+         THEN 1 ELSE 0 END,
+    CASE WHEN NOT (r.malicious
+                   OR p.agent_type = 'malicious_agent'
+                   OR (p.is_news = 1 AND p.news_type = 'fake'))
+          AND NOT (r.defense
+                   OR p.agent_type = 'amplifier_agent'
+                   OR COALESCE(p.is_agent_response, 0) = 1)
+         THEN 1 ELSE 0 END,
+    p.num_likes,
+    p.num_comments
+"""
+
+_COMMENT_COLUMNS = """
+    c.comment_id,
+    COALESCE(pp.original_post_id, c.post_id),
+    c.author_id,
+    c.num_likes,
+    CASE WHEN r.malicious OR c.agent_type = 'malicious_agent' THEN 1 ELSE 0 END,
+    CASE WHEN r.defense
+              OR c.agent_type = 'amplifier_agent'
+              OR c.agent_type = 'leader_agent'
+         THEN 1 ELSE 0 END,
+    CASE WHEN NOT (r.malicious OR c.agent_type = 'malicious_agent')
+          AND NOT (r.defense OR c.agent_type = 'amplifier_agent' OR c.agent_type = 'leader_agent')
+         THEN 1 ELSE 0 END,
+    CASE WHEN c.agent_type = 'malicious' THEN 1 ELSE 0 END
+"""
+
+_POSTS_QUERY = f"""
+    SELECT p.post_id, {_POST_COLUMNS}
+    FROM posts p
+    LEFT JOIN {{roles}} r ON r.user_id = p.author_id
+    WHERE {{where}}
+"""
+
+_POST_CHANGES_QUERY = f"""
+    SELECT l.post_id, {_POST_COLUMNS}
+    FROM post_changes l
+    LEFT JOIN posts p ON p.post_id = l.post_id
+    LEFT JOIN {{roles}} r ON r.user_id = p.author_id
+    WHERE l.seq > ? AND l.seq <= ?
+    ORDER BY l.seq
+"""
+
+_COMMENTS_QUERY = f"""
+    SELECT c.comment_id, {_COMMENT_COLUMNS}
+    FROM comments c
+    LEFT JOIN {{roles}} r  ON r.user_id = c.author_id
+    LEFT JOIN posts pp ON pp.post_id = c.post_id
+    WHERE {{where}}
+"""
+
+_COMMENT_CHANGES_QUERY = f"""
+    SELECT l.comment_id, {_COMMENT_COLUMNS}
+    FROM comment_changes l
+    LEFT JOIN comments c ON c.comment_id = l.comment_id
+    LEFT JOIN {{roles}} r  ON r.user_id = c.author_id
+    LEFT JOIN posts pp ON pp.post_id = c.post_id
+    WHERE l.seq > ? AND l.seq <= ?
+    ORDER BY l.seq
+"""
+
+_USERS_QUERY = """
+    SELECT u.user_id, u.total_likes_received, u.total_comments_received, u.follower_count,
+           r.role, r.malicious, r.defense
+    FROM users u
+    LEFT JOIN {roles} r ON r.user_id = u.user_id
+"""
+
+# Keep IN (...) lists below SQLite's default bound-parameter limit
+_MAX_IN_PARAMS = 500
+
+
+class _DefenseSyncState:
+    """
+    Topic and account aggregates kept in memory between sync_from_db calls.
+
+    Every post and comment is stored with its contribution to its topic, so a
+    changed row is applied by subtracting its old contribution and adding the
+    new one. Comment authors flagged in malicious_comments and per-author
+    opinion_monitoring extremism are maintained the same way.
+    """
+
+    def __init__(self):
+        # post_id -> (topic_id, content, author_id, active, engagement, mal, def, neu, likes, comments)
+        self.posts: Dict[str, Tuple] = {}
+        # comment_id -> (topic_id, author_id, likes, mal, def, neu, malicious_agent_type)
+        self.comments: Dict[str, Tuple] = {}
+        # topic_id -> [rows, engagement, mal, def, neu, likes, comments, comment_rows]
+        self.topics: Dict[str, List[int]] = {}
+        self.topic_posts: Dict[str, set] = defaultdict(set)
+        self.author_posts: Dict[str, set] = defaultdict(set)
+        self.author_comments: Dict[str, set] = defaultdict(set)
+        self.author_post_likes: Dict[str, int] = defaultdict(int)
+        # author_id -> [likes, count, likes of agent_type 'malicious', count of agent_type 'malicious']
+        self.author_comment_totals: Dict[str, List[int]] = {}
+        self.flagged_comments: set = set()
+        self.author_flagged: Dict[str, int] = defaultdict(int)
+        self.post_opinions: Dict[str, List[float]] = {}
+        self.author_opinions: Dict[str, List[float]] = {}
+        # user_id -> (malicious, defense) flags the stored contributions were computed with
+        self.user_flags: Dict[str, Tuple] = {}
+        # post_changes seq, comment_changes seq, malicious_comments id, opinion_monitoring id
+        self.positions: Tuple[int, int, int, int] = (0, 0, 0, 0)
+        self.loaded = False
+
+    # ========== posts ==========
+
+    def apply_post(self, post_id: str, row: Optional[Tuple]):
+        """Replace a post's contribution (row None removes the post)."""
+        old = self.posts.pop(post_id, None)
+        if old is not None:
+            self._post_contribution(post_id, old, -1)
+        if row is not None:
+            self.posts[post_id] = row
+            self._post_contribution(post_id, row, 1)
+
+    def _post_contribution(self, post_id: str, row: Tuple, sign: int):
+        topic_id, _, author_id, active, engagement, mal, dfn, neu, likes, comments = row
+        if sign > 0:
+            self.author_posts[author_id].add(post_id)
+        else:
+            self._discard(self.author_posts, author_id, post_id)
+
+        opinions = self.post_opinions.get(post_id)
+        if opinions is not None:
+            self._add_opinion(author_id, opinions[0] * sign, opinions[1] * sign)
+
+        if not active:
+            return
+        self.author_post_likes[author_id] += sign * (likes or 0)
+        if sign > 0:
+            self.topic_posts[topic_id].add(post_id)
+        else:
+            self._discard(self.topic_posts, topic_id, post_id)
+        self._add_topic(topic_id, sign, engagement, mal, dfn, neu, likes, comments, 0)
+
+    # ========== comments ==========
+
+    def apply_comment(self, comment_id: str, row: Optional[Tuple]):
+        """Replace a comment's contribution (row None removes the comment)."""
+        old = self.comments.pop(comment_id, None)
+        if old is not None:
+            self._comment_contribution(comment_id, old, -1)
+        if row is not None:
+            self.comments[comment_id] = row
+            self._comment_contribution(comment_id, row, 1)
+
+    def _comment_contribution(self, comment_id: str, row: Tuple, sign: int):
+        topic_id, author_id, likes, mal, dfn, neu, malicious_type = row
+        if sign > 0:
+            self.author_comments[author_id].add(comment_id)
+        else:
+            self._discard(self.author_comments, author_id, comment_id)
+
+        totals = self.author_comment_totals.setdefault(author_id, [0, 0, 0, 0])
+        totals[0] += sign * (likes or 0)
+        totals[1] += sign
+        if malicious_type:
+            totals[2] += sign * (likes or 0)
+            totals[3] += sign
+        if not totals[1]:
+            del self.author_comment_totals[author_id]
+
+        if comment_id in self.flagged_comments:
+            self.author_flagged[author_id] += sign
+        self._add_topic(topic_id, sign, likes, mal, dfn, neu, likes, 0, 1)
+
+    def flag_comment(self, comment_id: str):
+        """Record a malicious_comments entry."""
+        if comment_id in self.flagged_comments:
+            return
+        self.flagged_comments.add(comment_id)
+        row = self.comments.get(comment_id)
+        if row is not None:
+            self.author_flagged[row[1]] += 1
+
+    # ========== opinion monitoring ==========
+
+    def add_post_opinion(self, post_id: str, extremism: Optional[float]):
+        if extremism is None:
+            return
+        opinions = self.post_opinions.setdefault(post_id, [0.0, 0])
+        opinions[0] += extremism
+        opinions[1] += 1
+        row = self.posts.get(post_id)
+        if row is not None:
+            self._add_opinion(row[2], extremism, 1)
+
+    def _add_opinion(self, author_id: str, total: float, count: int):
+        opinions = self.author_opinions.setdefault(author_id, [0.0, 0])
+        opinions[0] += total
+        opinions[1] += count
+        if not opinions[1]:
+            del self.author_opinions[author_id]
+
+    # ========== helpers ==========
+
+    def _add_topic(self, topic_id: str, sign: int, engagement, mal, dfn, neu, likes, comments, comment_rows: int):
+        topic = self.topics.setdefault(topic_id, [0, 0, 0, 0, 0, 0, 0, 0])
+        topic[0] += sign
+        topic[1] += sign * (engagement or 0)
+        topic[2] += sign * mal
+        topic[3] += sign * dfn
+        topic[4] += sign * neu
+        topic[5] += sign * (likes or 0)
+        topic[6] += sign * (comments or 0)
+        topic[7] += sign * comment_rows
+        if not topic[0]:
+            del self.topics[topic_id]
+
+    @staticmethod
+    def _discard(index: Dict[str, set], key: str, member: str):
+        members = index.get(key)
+        if members is not None:
+            members.discard(member)
+            if not members:
+                del index[key]
+
+    def topic_name(self, topic_id: str) -> str:
+        # Comments contribute '' to MIN(COALESCE(topic_name, ''))
+        if self.topics[topic_id][7]:
+            return ""
+        contents = [self.posts[post_id][1] or "" for post_id in self.topic_posts.get(topic_id, ())]
+        return min(contents)[:60] if contents else ""
+
+    def top_topics(self, n: int) -> List[TopicData]:
+        top = heapq.nsmallest(n, self.topics.items(), key=lambda item: (-item[1][1], item[0]))
+        return [
+            TopicData(
+                topic_id=topic_id or "",
+                topic_name=self.topic_name(topic_id),
+                engagement_count=topic[1],
+                malicious_posts=topic[2],
+                defense_posts=topic[3],
+                neutral_posts=topic[4],
+                total_likes=topic[5],
+                total_comments=topic[6],
+            )
+            for topic_id, topic in top
+        ]
+
+
 class DefenseMonitoringCenter:
     """
     Central monitoring hub for EvoCorps defense system
@@ -394,6 +678,8 @@ class DefenseMonitoringCenter:
         self.bias_calculator = AlgorithmicBiasCalculator()
         self.dashboard_history: List[Dict[str, Any]] = []
         self.alerts: List[Dict[str, Any]] = []
+        self._sync_state = _DefenseSyncState()
+        self._warned_no_change_log = False
     
     def update_topic_data(self, topic_data: TopicData):
         """Update topic data"""
@@ -573,131 +859,143 @@ class DefenseMonitoringCenter:
         """
         Pull live data from the simulation SQLite connection and refresh all metrics.
 
-        Topic classification (based on author persona JSON):
-          malicious  = persona type contains 'negative'/'malicious' OR fake news post
-          defense    = persona type contains 'amplifier'/'defense', OR posts.is_agent_response=1
-                       Defense agents save COMMENTS (not posts), so we UNION the comments table.
+        Topic classification (posts and comments grouped by root post):
+          malicious  = author role flag 'malicious' OR malicious agent_type OR fake news post
+          defense    = author role flag 'defense' OR amplifier/leader agent_type,
+                       OR posts.is_agent_response=1 (defense agents mostly save COMMENTS)
           neutral    = everything else
 
-        Account classification follows the same persona logic.
+        Author roles are read from the user_roles side table that DatabaseManager
+        materializes from the persona JSON when a user is created. The aggregates
+        are kept between calls and only rows listed in the post_changes /
+        comment_changes logs since the previous call are applied, so the cost of
+        a sync follows the activity of the tick rather than the whole history.
+        Without those logs (older databases) every call reloads everything.
+
         extreme_score = 0.85 for malicious users (opinion_monitoring may be empty).
         """
         cursor = conn.cursor()
 
-        # Helper macro: is_malicious expression for a persona column alias
-        _MAL_PERSONA = (
-            "(u.persona LIKE '%\"type\": \"negative\"%'"
-            " OR u.persona LIKE '%''type'': ''negative''%'"
-            " OR u.persona LIKE '%\"type\": \"malicious\"%'"
-            " OR u.persona LIKE '%''type'': ''malicious''%')"
-        )
-        _DEF_PERSONA = (
-            "(u.persona LIKE '%amplifier%'"
-            " OR u.persona LIKE '%defense%')"
-        )
+        cursor.execute(_SYNC_TABLES_QUERY)
+        tables = {row[0] for row in cursor.fetchall()}
+        roles = "user_roles" if "user_roles" in tables else _ROLES_FROM_PERSONA
+        change_log = {"post_changes", "comment_changes"} <= tables
+        if not change_log and not self._warned_no_change_log:
+            logging.warning("⚠️ post/comment change logs missing; defense monitoring will reload fully on every sync")
+            self._warned_no_change_log = True
 
-        # --- Topics: UNION posts + defense comments, grouped by root post ---
-        cursor.execute(f"""
-            SELECT
-                topic_id,
-                SUBSTR(MIN(COALESCE(topic_name, '')), 1, 60) AS topic_name,
-                SUM(engagement)    AS engagement_count,
-                SUM(mal_cnt)       AS malicious_posts,
-                SUM(def_cnt)       AS defense_posts,
-                SUM(neu_cnt)       AS neutral_posts,
-                SUM(likes)         AS total_likes,
-                SUM(coms)          AS total_comments
-            FROM (
-                -- Posts
-                SELECT
-                    COALESCE(p.original_post_id, p.post_id)     AS topic_id,
-                    p.content                                    AS topic_name,
-                    p.num_likes + p.num_comments + p.num_shares  AS engagement,
-                    CASE WHEN {_MAL_PERSONA}
-                              OR p.agent_type = 'malicious_agent'
-                              OR (p.is_news = 1 AND p.news_type = 'fake')
-                         THEN 1 ELSE 0 END                       AS mal_cnt,
-                    CASE WHEN {_DEF_PERSONA}
-                              OR p.agent_type = 'amplifier_agent'
-                              OR p.agent_type = 'leader_agent'
-                              OR COALESCE(p.is_agent_response, 0) = 1
-                         THEN 1 ELSE 0 END                       AS def_cnt,
-                    CASE WHEN NOT ({_MAL_PERSONA}
-                                   OR p.agent_type = 'malicious_agent'
-                                   OR (p.is_news = 1 AND p.news_type = 'fake'))
-                          AND NOT ({_DEF_PERSONA}
-                                   OR p.agent_type = 'amplifier_agent'
-                                   OR COALESCE(p.is_agent_response, 0) = 1)
-                         THEN 1 ELSE 0 END                       AS neu_cnt,
-                    p.num_likes                                  AS likes,
-                    p.num_comments                               AS coms
-                FROM posts p
-                LEFT JOIN users u ON p.author_id = u.user_id
-                WHERE p.status IS NULL OR p.status = 'active'
-
-                UNION ALL
-
-                -- Comments (all roles: malicious, defense, neutral)
-                SELECT
-                    COALESCE(pp.original_post_id, c.post_id)    AS topic_id,
-                    NULL                                         AS topic_name,
-                    c.num_likes                                  AS engagement,
-                    CASE WHEN {_MAL_PERSONA}
-                              OR c.agent_type = 'malicious_agent'
-                         THEN 1 ELSE 0 END                       AS mal_cnt,
-                    CASE WHEN {_DEF_PERSONA}
-                              OR c.agent_type = 'amplifier_agent'
-                              OR c.agent_type = 'leader_agent'
-                         THEN 1 ELSE 0 END                       AS def_cnt,
-                    CASE WHEN NOT ({_MAL_PERSONA} OR c.agent_type = 'malicious_agent')
-                          AND NOT ({_DEF_PERSONA} OR c.agent_type = 'amplifier_agent' OR c.agent_type = 'leader_agent')
-                         THEN 1 ELSE 0 END                       AS neu_cnt,
-                    c.num_likes                                  AS likes,
-                    0                                            AS coms
-                FROM comments c
-                LEFT JOIN users u  ON c.author_id  = u.user_id
-                LEFT JOIN posts pp ON c.post_id     = pp.post_id
-            )
-            GROUP BY topic_id
-            ORDER BY engagement_count DESC
-            LIMIT ?
-        """, (self.niche_tracker.top_n_topics,))
+        cursor.execute(_SYNC_POSITIONS_QUERY.format(
+            post_seq=_LOG_POSITION.format(log="post_changes") if change_log else "0",
+            comment_seq=_LOG_POSITION.format(log="comment_changes") if change_log else "0",
+        ))
+        positions = tuple(value or 0 for value in cursor.fetchall()[0])
+
+        # Users first: a role changing after this read is caught by the next sync
+        cursor.execute(_USERS_QUERY.format(roles=roles))
+        users = cursor.fetchall()
+        user_flags = {row[0]: (row[5], row[6]) for row in users}
+
+        state = self._sync_state
+        if (not state.loaded or not change_log
+                or any(new < old for new, old in zip(positions, state.positions))):
+            # First sync, no change logs, or the database was reset
+            state = self._sync_state = _DefenseSyncState()
+            self._load_all(cursor, state, roles, positions)
+        else:
+            self._load_changes(cursor, state, roles, positions)
+            self._refresh_authors(cursor, state, roles, user_flags)
+        state.user_flags = user_flags
+        state.loaded = True
 
         self.niche_tracker.topics.clear()
-        for row in cursor.fetchall():
-            td = TopicData(
-                topic_id=row[0] or "",
-                topic_name=row[1] or "",
-                engagement_count=row[2] or 0,
-                malicious_posts=row[3] or 0,
-                defense_posts=row[4] or 0,
-                neutral_posts=row[5] or 0,
-                total_likes=row[6] or 0,
-                total_comments=row[7] or 0,
-            )
+        for td in state.top_topics(self.niche_tracker.top_n_topics):
             self.niche_tracker.topics[td.topic_id] = td
         self.niche_tracker._recalculate_rankings()
 
-        # --- Accounts: per user (including malicious bots from comments) ---
-        # First, get all users with their basic metrics
-        cursor.execute(f"""
-            SELECT
-                u.user_id,
-                u.total_likes_received,
-                u.total_comments_received,
-                u.follower_count,
-                CASE
-                    WHEN {_MAL_PERSONA} THEN 'malicious'
-                    WHEN {_DEF_PERSONA} THEN 'defense'
-                    ELSE 'neutral'
-                END AS account_type
-            FROM users u
-            WHERE u.persona NOT LIKE '%"type": "news_org"%'
-              AND u.persona NOT LIKE '%''type'': ''news_org''%'
-        """)
-        
-        users_data = {}
+        self._rebuild_accounts(state, users, user_flags)
+
+    def _load_all(self, cursor, state: "_DefenseSyncState", roles: str, positions: Tuple[int, ...]):
+        """Build the aggregates from every post, comment and monitoring row."""
+        cursor.execute(_POSTS_QUERY.format(roles=roles, where="1 = 1"))
+        for row in cursor.fetchall():
+            state.apply_post(row[0], tuple(row[2:]))
+        cursor.execute(_COMMENTS_QUERY.format(roles=roles, where="1 = 1"))
+        for row in cursor.fetchall():
+            state.apply_comment(row[0], tuple(row[2:]))
+        self._load_flags_and_opinions(cursor, state, (0, 0, 0, 0), positions)
+        state.positions = positions
+
+    def _load_changes(self, cursor, state: "_DefenseSyncState", roles: str, positions: Tuple[int, ...]):
+        """Apply posts and comments changed, and monitoring rows added, since the last sync."""
+        # Bounded by the positions read up front; later writes are picked up by the next sync
+        cursor.execute(_POST_CHANGES_QUERY.format(roles=roles), (state.positions[0], positions[0]))
+        retopiced = []
+        for row in cursor.fetchall():
+            post_id, new = row[0], tuple(row[2:]) if row[1] is not None else None
+            old = state.posts.get(post_id)
+            state.apply_post(post_id, new)
+            # A comment's topic is its parent's root post (the post itself once the parent is gone)
+            if (old[0] if old else post_id) != (new[0] if new else post_id):
+                retopiced.append(post_id)
+
+        cursor.execute(_COMMENT_CHANGES_QUERY.format(roles=roles), (state.positions[1], positions[1]))
+        for row in cursor.fetchall():
+            state.apply_comment(row[0], tuple(row[2:]) if row[1] is not None else None)
+
+        # Comments are not logged when only their parent post changes
+        for start in range(0, len(retopiced), _MAX_IN_PARAMS):
+            chunk = retopiced[start:start + _MAX_IN_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(_COMMENTS_QUERY.format(roles=roles, where=f"c.post_id IN ({placeholders})"), chunk)
+            for row in cursor.fetchall():
+                state.apply_comment(row[0], tuple(row[2:]))
+
+        self._load_flags_and_opinions(cursor, state, state.positions, positions)
+        state.positions = positions
+
+    @staticmethod
+    def _load_flags_and_opinions(cursor, state: "_DefenseSyncState",
+                                 start: Tuple[int, ...], end: Tuple[int, ...]):
+        # Bounded by the positions read up front: these rows are added, not replaced
+        cursor.execute(
+            "SELECT comment_id FROM malicious_comments WHERE id > ? AND id <= ?",
+            (start[2], end[2])
+        )
         for row in cursor.fetchall():
+            state.flag_comment(row[0])
+        cursor.execute(
+            "SELECT CAST(post_id AS TEXT), CAST(extremism_level AS FLOAT) "
+            "FROM opinion_monitoring WHERE id > ? AND id <= ?",
+            (start[3], end[3])
+        )
+        for row in cursor.fetchall():
+            state.add_post_opinion(row[0], row[1])
+
+    @staticmethod
+    def _refresh_authors(cursor, state: "_DefenseSyncState", roles: str, user_flags: Dict[str, Tuple]):
+        """Recompute the posts and comments of authors whose role flags changed."""
+        changed = [
+            user_id for user_id in set(user_flags) | set(state.user_flags)
+            if user_flags.get(user_id) != state.user_flags.get(user_id)
+            and (user_id in state.author_posts or user_id in state.author_comments)
+        ]
+        for start in range(0, len(changed), _MAX_IN_PARAMS):
+            chunk = changed[start:start + _MAX_IN_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(_POSTS_QUERY.format(roles=roles, where=f"p.author_id IN ({placeholders})"), chunk)
+            for row in cursor.fetchall():
+                state.apply_post(row[0], tuple(row[2:]))
+            cursor.execute(_COMMENTS_QUERY.format(roles=roles, where=f"c.author_id IN ({placeholders})"), chunk)
+            for row in cursor.fetchall():
+                state.apply_comment(row[0], tuple(row[2:]))
+
+    def _rebuild_accounts(self, state: "_DefenseSyncState", users: List[Tuple], user_flags: Dict[str, Tuple]):
+        """Rebuild account metrics from the users table and the aggregates."""
+        # News organisations (and users without a persona) are not ranked
+        users_data = {}
+        for row in users:
+            if row[4] is None or row[4] == "news_org":
+                continue
             users_data[row[0]] = {
                 'user_id': row[0] or "",
                 'total_likes': row[1] or 0,
@@ -705,29 +1003,24 @@ class DefenseMonitoringCenter:
                 'followers': row[3] or 0,
                 'account_type': row[4] or "neutral"
             }
-        
-        # Also include malicious bot accounts from comments table
-        # These may have been created with persona type "negative" but stored differently
-        cursor.execute("""
-            SELECT DISTINCT 
-                c.author_id,
-                SUM(c.num_likes) as total_likes,
-                COUNT(*) as total_comments
-            FROM comments c
-            WHERE c.agent_type = 'malicious'
-               OR c.author_id IN (SELECT user_id FROM users WHERE persona LIKE '%"type": "negative"%')
-               OR c.author_id IN (SELECT author_id FROM malicious_comments mc JOIN comments cc ON mc.comment_id = cc.comment_id)
-            GROUP BY c.author_id
-        """)
-        
-        malicious_commenters = {}
-        for row in cursor.fetchall():
-            author_id = row[0]
+
+        # Also include malicious bot accounts from comments: malicious authors and
+        # authors with comments in malicious_comments count all their comments,
+        # others only their agent_type 'malicious' comments
+        for author_id in sorted(state.author_comment_totals):
+            totals = state.author_comment_totals[author_id]
+            if (user_flags.get(author_id) or (None, None))[0] or state.author_flagged.get(author_id, 0) > 0:
+                likes, count = totals[0], totals[1]
+            elif totals[3]:
+                likes, count = totals[2], totals[3]
+            else:
+                continue
+
             if author_id not in users_data:
                 users_data[author_id] = {
                     'user_id': author_id,
-                    'total_likes': row[1] or 0,
-                    'total_comments': row[2] or 0,
+                    'total_likes': likes,
+                    'total_comments': count,
                     'followers': 0,
                     'account_type': 'malicious'
                 }
@@ -736,35 +1029,15 @@ class DefenseMonitoringCenter:
                 users_data[author_id]['account_type'] = 'malicious'
                 # Also update engagement from comments if not already tracked
                 if users_data[author_id]['total_likes'] == 0:
-                    users_data[author_id]['total_likes'] = row[1] or 0
+                    users_data[author_id]['total_likes'] = likes
                 if users_data[author_id]['total_comments'] == 0:
-                    users_data[author_id]['total_comments'] = row[2] or 0
-        
-        # Get engagement from posts for all users
-        cursor.execute("""
-            SELECT author_id, SUM(num_likes) as post_likes, COUNT(*) as post_count
-            FROM posts
-            WHERE (status IS NULL OR status = 'active')
-            GROUP BY author_id
-        """)
-        
-        for row in cursor.fetchall():
-            author_id = row[0]
+                    users_data[author_id]['total_comments'] = count
+
+        # Engagement from active posts
+        for author_id, likes in state.author_post_likes.items():
             if author_id in users_data:
-                users_data[author_id]['total_likes'] = (users_data[author_id]['total_likes'] or 0) + (row[1] or 0)
-        
-        # Get extreme scores from opinion_monitoring for non-malicious users
-        cursor.execute("""
-            SELECT p2.author_id, AVG(CAST(om.extremism_level AS FLOAT)) / 4.0 as avg_extreme
-            FROM opinion_monitoring om
-            JOIN posts p2 ON CAST(om.post_id AS TEXT) = p2.post_id
-            GROUP BY p2.author_id
-        """)
-        
-        extreme_scores = {}
-        for row in cursor.fetchall():
-            extreme_scores[row[0]] = row[1]
-        
+                users_data[author_id]['total_likes'] = (users_data[author_id]['total_likes'] or 0) + likes
+
         # Clear and rebuild accounts
         self.bias_calculator.accounts.clear()
         for user_id, data in users_data.items():
@@ -772,8 +1045,9 @@ class DefenseMonitoringCenter:
             if data['account_type'] == 'malicious':
                 extreme_score = 0.85  # Malicious bots are always extreme
             else:
-                extreme_score = extreme_scores.get(user_id, 0.0)
-            
+                opinions = state.author_opinions.get(user_id)
+                extreme_score = opinions[0] / opinions[1] / 4.0 if opinions else 0.0
+
             am = AccountMetrics(
                 account_id=data['user_id'],
                 account_type=data['account_type'],
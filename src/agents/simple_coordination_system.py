@@ -123,6 +123,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from enhanced_leader_agent import EnhancedLeaderAgent, ArgumentDatabase
+from llm_gateway import PRIORITY_COORDINATION, get_llm_gateway
 
 
 
@@ -410,7 +411,9 @@ class SimpleAnalystAgent:
             # Clean input text to avoid encoding issues
             cleaned_content = self._clean_text(analysis_text)
 
-            response = self.client.chat.completions.create(
+            response = await get_llm_gateway().chat_completion(
+                self.client,
+                priority=PRIORITY_COORDINATION,
                 model=self.model,
                 messages=[
                     {
@@ -820,7 +823,9 @@ class SimpleStrategistAgent:
             workflow_logger.info("  📋 Step 4: Format as agent instructions")
             agent_instructions = await self._format_agent_instructions(tot_plan)
             
-            response = self.client.chat.completions.create(
+            response = await get_llm_gateway().chat_completion(
+                self.client,
+                priority=PRIORITY_COORDINATION,
                 model=self.model,
                 messages=[
                     {
@@ -1048,7 +1053,9 @@ class SimpleStrategistAgent:
 
     async def _evaluate_feedback_directly(self, prompt: str) -> Dict[str, Any]:
         """Direct feedback evaluation without mock alert"""
-        response = self.client.chat.completions.create(
+        response = await get_llm_gateway().chat_completion(
+            self.client,
+            priority=PRIORITY_COORDINATION,
             model=self.model,
             messages=[
                 {
@@ -1072,7 +1079,9 @@ class SimpleStrategistAgent:
 
     async def _evaluate_effectiveness_directly(self, prompt: str) -> Dict[str, Any]:
         """Direct effectiveness evaluation without mock alert"""
-        response = self.client.chat.completions.create(
+        response = await get_llm_gateway().chat_completion(
+            self.client,
+            priority=PRIORITY_COORDINATION,
             model=self.model,
             messages=[
                 {
@@ -1098,7 +1107,9 @@ class SimpleStrategistAgent:
         """Develop general strategy based on real instruction data"""
         task_type = instruction.get("task", "general_strategy")
 
-        response = self.client.chat.completions.create(
+        response = await get_llm_gateway().chat_completion(
+            self.client,
+            priority=PRIORITY_COORDINATION,
             model=self.model,
             messages=[
                 {
@@ -1759,7 +1770,9 @@ Develop an appropriate strategy for this context. Return a JSON response with re
             engagement_intensity = trigger_content.get("engagement_metrics", {}).get("intensity_level", "MODERATE") if isinstance(trigger_content, dict) else "MODERATE"
             
             # Use LLM to generate strategy options
-            response = self.client.chat.completions.create(
+            response = await get_llm_gateway().chat_completion(
+                self.client,
+                priority=PRIORITY_COORDINATION,
                 model=self.model,
                 messages=[
                     {
@@ -2823,7 +2836,9 @@ class SimpleLeaderAgent:
             # Clean target content
             cleaned_target = self._clean_text(target_content)
 
-            response = self.client.chat.completions.create(
+            response = await get_llm_gateway().chat_completion(
+                self.client,
+                priority=PRIORITY_COORDINATION,
                 model=self.model,
                 messages=[
                     {
@@ -3275,7 +3290,9 @@ class SimpleamplifierAgent:
 
             for attempt in range(max_retries):
                 try:
-                    response = self.client.chat.completions.create(
+                    response = await get_llm_gateway().chat_completion(
+                        self.client,
+                        priority=PRIORITY_COORDINATION,
                         model=current_model,
                 messages=[
                     {
@@ -8127,8 +8144,9 @@ Your ratings:"""
                         workflow_logger.info(f"    ℹ️  Using LLM client for viewpoint extremism scoring: {content}")
                     
                     try:
-                        response = await asyncio.to_thread(
-                            self.analyst.client.chat.completions.create,
+                        response = await get_llm_gateway().chat_completion(
+                            self.analyst.client,
+                            priority=PRIORITY_COORDINATION,
                             model=getattr(self.analyst, 'model', default_model),  # Use analyst model
                             messages=[
                                 {"role": "system", "content": "You are an expert at analyzing viewpoint extremism. Respond only with a numeric rating."},
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Batched feed-reaction prompting.
+
+Instead of one LLM completion per agent per feed segment, agents that share a
+model and (bucketed) temperature are packed into one structured-output request.
+The parsed per-agent reactions are validated and scattered back to each agent;
+any agent whose reaction is missing, duplicated or refers to content outside its
+own feed falls back to a regular per-agent call, and so does the whole batch if
+the response cannot be parsed.
+
+Config (`batched_reactions` section):
+
+    {"enabled": false, "max_agents_per_request": 4, "max_prompt_chars": 60000,
+     "temperature_bucket": 0.1, "max_tokens": 8192}
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from agent_user import FeedAction, FeedActionWithReasoning, FeedReactionPlan, FeedReactionWithReasoning
+from llm_gateway import PRIORITY_AGENT
+from utils import Utils
+
+
+class AgentFeedReaction(BaseModel):
+    agent_id: str
+    actions: List[FeedAction]
+
+
+class BatchedFeedReaction(BaseModel):
+    reactions: List[AgentFeedReaction]
+
+
+class AgentFeedReactionWithReasoning(BaseModel):
+    agent_id: str
+    actions: List[FeedActionWithReasoning]
+
+
+class BatchedFeedReactionWithReasoning(BaseModel):
+    reactions: List[AgentFeedReactionWithReasoning]
+
+
+BATCH_SYSTEM_PROMPT = """You are simulating several independent social media users at the same time.
+Each user block below contains that user's own persona, memories and feed.
+Decide each user's actions exactly as that user would, using ONLY that user's persona and feed.
+Users do not know about each other: never let one user's persona, memories or feed influence another user's actions."""
+
+# Actions whose target must come from the acting user's own feed segment
+_POST_ACTIONS = {"like-post", "share-post", "flag-post", "comment-post", "add-note"}
+_COMMENT_ACTIONS = {"like-comment"}
+_NOTE_ACTIONS = {"rate-note"}
+
+
+@dataclass
+class BatchedReactionConfig:
+    enabled: bool = False
+    max_agents_per_request: int = 4
+    # Upper bound on the packed prompt size (the local server's context window)
+    max_prompt_chars: int = 60000
+    # Agents whose temperatures fall in the same bucket share a request
+    temperature_bucket: float = 0.1
+    max_tokens: int = 8192
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "BatchedReactionConfig":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in (data or {}).items() if k in known})
+
+
+@dataclass
+class _SegmentJob:
+    user: Any
+    plan: FeedReactionPlan
+    segment_index: int
+    segment_feed: list
+    prompt: str
+
+    @property
+    def agent_id(self) -> str:
+        return str(self.user.user_id)
+
+
+class BatchedFeedReactor:
+    """Runs the feed-reaction phase for many agents with packed LLM requests."""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = BatchedReactionConfig.from_dict(config)
+        self.stats = {"requests": 0, "batched_agents": 0, "fallbacks": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    async def run(self, users_and_feeds: List[Tuple[Any, list]], openai_client, engine: str):
+        """
+        React to every user's feed, segment by segment.
+
+        Args:
+            users_and_feeds: (AgentUser, feed) pairs
+            openai_client: client used for the batched and fallback requests
+            engine: default engine (agents may pick their own model per plan)
+        """
+        active: List[Tuple[Any, FeedReactionPlan]] = []
+        for user, feed in users_and_feeds:
+            try:
+                plan = await user.prepare_feed_reaction(engine, feed)
+            except Exception as e:
+                logging.error(f"User {user.user_id} failed to prepare feed reaction: {e}")
+                continue
+            if plan is not None:
+                active.append((user, plan))
+
+        max_segments = max((len(plan.segments) for _, plan in active), default=0)
+        for position in range(max_segments):
+            jobs = []
+            for user, plan in active:
+                if position >= len(plan.segments):
+                    continue
+                if user.comment_count >= user.comment_limit:
+                    logging.info(f"User {user.user_id} has reached their comment limit of {user.comment_limit}.")
+                    continue
+                segment_index, segment_feed, prompt = plan.segments[position]
+                jobs.append(_SegmentJob(user, plan, segment_index, segment_feed, prompt))
+
+            results = await asyncio.gather(
+                *(self._run_batch(batch, openai_client) for batch in self._make_batches(jobs))
+            )
+            # A user whose segment failed stops reacting this step (same as the per-user path)
+            failed = {agent_id for batch_failed in results for agent_id in batch_failed}
+            active = [(user, plan) for user, plan in active if str(user.user_id) not in failed]
+
+        for user, _ in active:
+            try:
+                user.finish_feed_reaction(openai_client, engine)
+            except Exception as e:
+                logging.error(f"User {user.user_id} reflection after feed reaction failed: {e}")
+
+        logging.info(
+            f"📦 Batched reactions: {self.stats['requests']} requests for {self.stats['batched_agents']} agent segments, "
+            f"{self.stats['fallbacks']} per-agent fallbacks"
+        )
+
+    # ========== batching ==========
+
+    def _group_key(self, job: _SegmentJob) -> Tuple[str, float, type]:
+        bucket = self.config.temperature_bucket or 0.0
+        temperature = round(round(job.plan.temperature / bucket) * bucket, 3) if bucket else job.plan.temperature
+        return job.plan.engine, temperature, job.plan.response_model
+
+    def _make_batches(self, jobs: List[_SegmentJob]) -> List[List[_SegmentJob]]:
+        groups: Dict[Tuple[str, float, type], List[_SegmentJob]] = {}
+        for job in jobs:
+            groups.setdefault(self._group_key(job), []).append(job)
+
+        batches = []
+        for group in groups.values():
+            batch, batch_chars = [], 0
+            for job in group:
+                job_chars = len(job.plan.system_prompt) + len(job.prompt)
+                if batch and (len(batch) >= self.config.max_agents_per_request
+                              or batch_chars + job_chars > self.config.max_prompt_chars):
+                    batches.append(batch)
+                    batch, batch_chars = [], 0
+                batch.append(job)
+                batch_chars += job_chars
+            if batch:
+                batches.append(batch)
+        return batches
+
+    @staticmethod
+    def _build_batch_prompt(batch: List[_SegmentJob]) -> str:
+        blocks = []
+        for job in batch:
+            blocks.append(
+                f"===== USER {job.agent_id} =====\n"
+                f"[PERSONA AND INSTRUCTIONS]\n{job.plan.system_prompt}\n\n"
+                f"[TASK]\n{job.prompt}\n"
+                f"===== END USER {job.agent_id} ====="
+            )
+        agent_ids = ", ".join(job.agent_id for job in batch)
+        return (
+            "\n\n".join(blocks)
+            + "\n\nIgnore the per-user response format above. Respond with ONE JSON object:\n"
+            '{"reactions": [{"agent_id": "<user id>", "actions": [{"action": "...", "target": "...", "content": "..."}]}]}\n'
+            f"Include exactly one entry for each of these users: {agent_ids}.\n"
+            "Each user's actions must only use IDs from that user's own feed."
+        )
+
+    # ========== requests ==========
+
+    async def _run_batch(self, batch: List[_SegmentJob], openai_client) -> List[str]:
+        """Run one packed request; returns the agent ids whose segment failed."""
+        if len(batch) == 1:
+            return await self._run_single(batch, openai_client)
+
+        plan = batch[0].plan
+        batch_model = (
+            BatchedFeedReactionWithReasoning if plan.response_model is FeedReactionWithReasoning else BatchedFeedReaction
+        )
+        temperature = sum(job.plan.temperature for job in batch) / len(batch)
+        self.stats["requests"] += 1
+        self.stats["batched_agents"] += len(batch)
+
+        try:
+            response = await Utils.agenerate_llm_response(
+                openai_client=openai_client,
+                engine=plan.engine,
+                prompt=self._build_batch_prompt(batch),
+                system_message=BATCH_SYSTEM_PROMPT,
+                response_model=batch_model,
+                temperature=temperature,
+                max_tokens=self.config.max_tokens,
+                priority=PRIORITY_AGENT,
+                caller=batch[0].agent_id,
+            )
+        except Exception as e:
+            logging.warning(f"⚠️ Batched reaction for {len(batch)} agents failed to parse, falling back: {e}")
+            return await self._run_fallback(batch, openai_client)
+
+        reactions = self._scatter(batch, response)
+        failed, fallback = [], []
+        for job in batch:
+            reaction = reactions.get(job.agent_id)
+            if reaction is None:
+                fallback.append(job)
+                continue
+            try:
+                job.user.apply_feed_reaction(reaction, job.plan, job.segment_index, job.segment_feed, job.prompt)
+            except Exception as e:
+                job.user._log_feed_reaction_error(e)
+                failed.append(job.agent_id)
+
+        if fallback:
+            logging.info(f"↩️ {len(fallback)}/{len(batch)} agents in batch need a per-agent reaction")
+            failed += await self._run_fallback(fallback, openai_client)
+        return failed
+
+    def _scatter(self, batch: List[_SegmentJob], response) -> Dict[str, BaseModel]:
+        """Map validated per-agent reactions back to agent ids."""
+        jobs = {job.agent_id: job for job in batch}
+        entries: Dict[str, List[Any]] = {}
+        for entry in getattr(response, "reactions", None) or []:
+            agent_id = str(entry.agent_id).strip()
+            if agent_id in jobs:
+                entries.setdefault(agent_id, []).append(entry)
+
+        reactions = {}
+        for agent_id, job in jobs.items():
+            candidates = entries.get(agent_id, [])
+            if len(candidates) != 1:
+                continue
+            actions = candidates[0].actions
+            if not self._targets_in_feed(actions, job.segment_feed):
+                logging.warning(f"⚠️ Batched reaction for user {agent_id} references content outside its feed")
+                continue
+            response_model = job.plan.response_model
+            reactions[agent_id] = response_model(actions=actions)
+        return reactions
+
+    @staticmethod
+    def _targets_in_feed(actions, feed) -> bool:
+        post_ids = {str(post.post_id) for post in feed}
+        comment_ids = {str(comment.comment_id) for post in feed for comment in post.comments}
+        note_ids = {str(note.note_id) for post in feed for note in post.community_notes}
+        for action in actions:
+            target = str(action.target) if action.target is not None else None
+            if action.action in _POST_ACTIONS and target not in post_ids:
+                return False
+            if action.action in _COMMENT_ACTIONS and target not in comment_ids:
+                return False
+            if action.action in _NOTE_ACTIONS and target not in note_ids:
+                return False
+        return True
+
+    async def _run_fallback(self, jobs: List[_SegmentJob], openai_client) -> List[str]:
+        self.stats["fallbacks"] += len(jobs)
+        return await self._run_single(jobs, openai_client)
+
+    async def _run_single(self, jobs: List[_SegmentJob], openai_client) -> List[str]:
+        """Generate the reactions one agent at a time."""
+        async def react(job: _SegmentJob) -> Optional[str]:
+            try:
+                reaction = await job.user.generate_segment_reaction(openai_client, job.plan, job.prompt)
+                job.user.apply_feed_reaction(reaction, job.plan, job.segment_index, job.segment_feed, job.prompt)
+                return None
+            except Exception as e:
+                job.user._log_feed_reaction_error(e)
+                return job.agent_id
+
+        results = await asyncio.gather(*(react(job) for job in jobs))
+        return [agent_id for agent_id in results if agent_id is not None]
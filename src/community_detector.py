@@ -9,7 +9,10 @@
 - 影响向量（传播路径、反应时间）
 """
 
+import hashlib
+import os
 import sqlite3
+import threading
 from typing import Dict, List, Tuple, Optional, Set, Any
 from collections import defaultdict
 from dataclasses import dataclass, field
@@ -84,6 +87,73 @@ class PostStanceAnalysis:
     is_hottest: bool = False
 
 
+# 立场在批量统计中的列序号（与 stance_bias 的前三维一致）
+_STANCE_CODES = {'support': 0, 'oppose': 1, 'neutral': 2}
+
+# comment_stances 缓存的规则版本：修改 _analyze_stance_with_intensity 的规则后递增，
+# 旧版本的缓存结果会被自动忽略并重新计算
+_STANCE_RULES_VERSION = 1
+
+
+@dataclass
+class _PostStanceCounts:
+    """批量立场引擎对单个帖子的汇总（尚未计算 embedding 相关指标）"""
+    post_id: str
+    content: str
+    # (评论者ID, 调整后立场, 情绪强度)，按评论时间排序
+    comments: List[Tuple[str, str, float]]
+    support_count: int = 0
+    neutral_count: int = 0
+    oppose_count: int = 0
+    total_interactions: int = 0
+
+    @property
+    def support_ratio(self) -> float:
+        return self.support_count / len(self.comments)
+
+    @property
+    def neutral_ratio(self) -> float:
+        return self.neutral_count / len(self.comments)
+
+    @property
+    def oppose_ratio(self) -> float:
+        return self.oppose_count / len(self.comments)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """按行 L2 归一化（零向量保持不变）"""
+    norms = np.linalg.norm(matrix, axis=1)
+    nonzero = norms > 0
+    matrix[nonzero] /= norms[nonzero, None]
+    return matrix
+
+
+@dataclass
+class _UserVectorCache:
+    """单个数据库的用户向量缓存（跨 CommunityDetector 实例共享）"""
+    tick: Optional[int] = None
+    # user_id -> 生成向量时的活动签名
+    signatures: Dict[str, tuple] = field(default_factory=dict)
+    vectors: Dict[str, UserVector] = field(default_factory=dict)
+    # 本 tick 内的文本向量（随 tick 一起清空；评论立场持久化在 comment_stances 表中）
+    text_vectors: Dict[str, np.ndarray] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_user_vector_caches: Dict[Tuple[str, int], _UserVectorCache] = {}
+_user_vector_caches_lock = threading.Lock()
+
+
+def _get_user_vector_cache(db_path: str, vector_dim: int) -> _UserVectorCache:
+    key = (os.path.abspath(db_path), vector_dim)
+    with _user_vector_caches_lock:
+        cache = _user_vector_caches.get(key)
+        if cache is None:
+            cache = _UserVectorCache()
+            _user_vector_caches[key] = cache
+        return cache
+
+
 class CommunityDetector:
     """社区发现与派系分析器"""
 
@@ -145,248 +215,268 @@ class CommunityDetector:
 
         return vector
 
-    def _generate_content_preference_vector(
-        self,
-        user_id: str,
-        conn: sqlite3.Connection
-    ) -> np.ndarray:
-        """生成用户内容偏好向量
+    # ==================== 批量向量生成 ====================
+    #
+    # 所有用户的特征通过少量整表分组查询一次取出，再用 NumPy 组装成矩阵；
+    # 结果缓存在模块级 _UserVectorCache 中（按数据库），同一 tick 内只为
+    # 活动签名发生变化的用户重新计算，tick 变化时整体失效（包括文本向量）。
+
+    def _text_vector_matrix(self, texts: List[str], cache: "_UserVectorCache") -> np.ndarray:
+        """批量获取文本向量（按文本缓存）"""
+        matrix = np.zeros((len(texts), self.vector_dim))
+        for i, text in enumerate(texts):
+            vector = cache.text_vectors.get(text)
+            if vector is None:
+                vector = self._get_text_vector(text)
+                cache.text_vectors[text] = vector
+            matrix[i] = vector
+        return matrix
+
+    @staticmethod
+    def _current_tick(cursor) -> int:
+        try:
+            cursor.execute("SELECT COALESCE(MAX(time_step), 0) FROM post_timesteps")
+            return cursor.fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
 
-        基于用户交互的帖子内容
-        """
-        cursor = conn.cursor()
+    @staticmethod
+    def _activity_signatures(cursor) -> Dict[str, tuple]:
+        """每个用户的活动签名（发帖/评论/关注/被关注/获赞），用于判断缓存向量是否失效"""
+        signatures = defaultdict(lambda: [0, None, 0, 0, None, 0, 0])
 
-        # 获取用户发布的帖子
         cursor.execute("""
-            SELECT content FROM posts
-            WHERE author_id = ?
-            LIMIT 20
-        """, (user_id,))
-        posts = [row[0] for row in cursor.fetchall()]
+            SELECT author_id, COUNT(*), MAX(rowid), COALESCE(SUM(num_likes), 0)
+            FROM posts GROUP BY author_id
+        """)
+        for user_id, count, last_rowid, likes in cursor.fetchall():
+            signatures[user_id][0:3] = [count, last_rowid, likes]
 
-        # 获取用户评论的帖子
-        cursor.execute("""
-            SELECT p.content FROM posts p
-            JOIN comments c ON p.post_id = c.post_id
-            WHERE c.author_id = ?
-            LIMIT 20
-        """, (user_id,))
-        commented_posts = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT author_id, COUNT(*), MAX(rowid) FROM comments GROUP BY author_id")
+        for user_id, count, last_rowid in cursor.fetchall():
+            signatures[user_id][3:5] = [count, last_rowid]
 
-        # 获取用户点赞的帖子（如果有likes表）
-        all_texts = posts + commented_posts
+        cursor.execute("SELECT follower_id, COUNT(*) FROM follows GROUP BY follower_id")
+        for user_id, count in cursor.fetchall():
+            signatures[user_id][5] = count
 
-        if not all_texts:
-            return np.zeros(self.vector_dim)
+        cursor.execute("SELECT followed_id, COUNT(*) FROM follows GROUP BY followed_id")
+        for user_id, count in cursor.fetchall():
+            signatures[user_id][6] = count
 
-        # 计算所有文本embedding的平均
-        vectors = [self._get_text_vector(text) for text in all_texts]
-        return np.mean(vectors, axis=0)
+        return {user_id: tuple(values) for user_id, values in signatures.items()}
 
-    def _generate_social_pattern_vector(
+    def _build_user_vectors(
         self,
-        user_id: str,
-        conn: sqlite3.Connection
-    ) -> np.ndarray:
-        """生成社交模式 embedding
-
-        基于用户的关注网络
+        user_ids: List[str],
+        conn: sqlite3.Connection,
+        cache: "_UserVectorCache"
+    ) -> Dict[str, UserVector]:
+        """批量生成用户的综合 embedding
+
+        组合内容偏好、社交模式、立场倾向、活跃度四个维度：
+        - 内容偏好：发布的帖子（前20条）+ 评论过的帖子（前20条）的文本向量平均
+        - 社交模式：关注的人（前50个，权重1.0）+ 粉丝（前50个，权重0.5）的哈希向量
+        - 立场倾向：[支持强度, 反对强度, 中立强度, 情绪极化程度]，基于前50条评论
+        - 活跃度：[发帖频率, 评论频率, 获赞频率, 时段偏好]
         """
+        user_ids = list(dict.fromkeys(user_ids))
+        index = {user_id: i for i, user_id in enumerate(user_ids)}
+        n, dim = len(user_ids), self.vector_dim
         cursor = conn.cursor()
 
-        # 获取关注的人
-        cursor.execute("""
-            SELECT followed_id FROM follows
-            WHERE follower_id = ?
-            LIMIT 50
-        """, (user_id,))
-        following = [row[0] for row in cursor.fetchall()]
-
-        # 获取粉丝
-        cursor.execute("""
-            SELECT follower_id FROM follows
-            WHERE followed_id = ?
-            LIMIT 50
-        """, (user_id,))
-        followers = [row[0] for row in cursor.fetchall()]
-
-        if not following and not followers:
-            return np.zeros(self.vector_dim)
-
-        # 基于用户ID生成社交向量
-        embedding = np.zeros(self.vector_dim)
-
-        for user in following:
-            idx = hash(user) % self.vector_dim
-            embedding[idx] += 1.0
+        cursor.execute("SELECT user_id FROM users")
+        registered = np.array([False] * n)
+        for (user_id,) in cursor.fetchall():
+            if user_id in index:
+                registered[index[user_id]] = True
+
+        # ---------- 帖子：内容偏好 + 发帖数 + 获赞数 ----------
+        post_counts = np.zeros(n)
+        received_likes = np.zeros(n)
+        own_texts: Dict[int, List[str]] = defaultdict(list)
+        cursor.execute("SELECT author_id, content, num_likes FROM posts ORDER BY rowid")
+        for author_id, content, num_likes in cursor.fetchall():
+            i = index.get(author_id)
+            if i is None:
+                continue
+            post_counts[i] += 1
+            received_likes[i] += num_likes or 0
+            if len(own_texts[i]) < 20:
+                own_texts[i].append(content)
+
+        # ---------- 评论：评论过的帖子 + 评论立场 + 评论数 ----------
+        comment_counts = np.zeros(n)
+        commented_texts: Dict[int, List[str]] = defaultdict(list)
+        stance_rows, stance_codes, stance_intensity = [], [], []
+        new_stances = []
+        per_user_comments = np.zeros(n, dtype=int)
+        persist = self._has_comment_stance_table(conn)
+        cursor.execute(f"""
+            SELECT c.comment_id, c.author_id, c.content, p.post_id IS NOT NULL, p.content,
+                   {self._stance_columns(persist)}
+            FROM comments c
+            LEFT JOIN posts p ON p.post_id = c.post_id
+            {self._stance_join(persist)}
+            ORDER BY c.rowid
+        """, [_STANCE_RULES_VERSION] if persist else [])
+        for comment_id, author_id, comment_content, has_post, post_content, *cached in cursor.fetchall():
+            i = index.get(author_id)
+            if i is None:
+                continue
+            comment_counts[i] += 1
+            if has_post and len(commented_texts[i]) < 20:
+                commented_texts[i].append(post_content)
+            if per_user_comments[i] < 50:
+                per_user_comments[i] += 1
+                stance, intensity = self._comment_stance(comment_id, comment_content, *cached, new_stances)
+                stance_rows.append(i)
+                stance_codes.append(_STANCE_CODES[stance])
+                stance_intensity.append(intensity)
+        if persist:
+            self._store_comment_stances(conn, new_stances)
+
+        # ---------- 关注关系：社交模式 ----------
+        social_rows, social_cols, social_weights = [], [], []
+        following_counts = np.zeros(n, dtype=int)
+        follower_counts = np.zeros(n, dtype=int)
+        cursor.execute("SELECT follower_id, followed_id FROM follows ORDER BY rowid")
+        for follower_id, followed_id in cursor.fetchall():
+            i = index.get(follower_id)
+            if i is not None and following_counts[i] < 50:
+                following_counts[i] += 1
+                social_rows.append(i)
+                social_cols.append(hash(followed_id) % dim)
+                social_weights.append(1.0)
+            j = index.get(followed_id)
+            if j is not None and follower_counts[j] < 50:
+                follower_counts[j] += 1
+                social_rows.append(j)
+                social_cols.append(hash(follower_id) % dim)
+                social_weights.append(0.5)  # 粉丝权重稍低
+
+        # ---------- 组装矩阵 ----------
+        text_rows, texts = [], []
+        for i in range(n):
+            for text in own_texts.get(i, []) + commented_texts.get(i, []):
+                text_rows.append(i)
+                texts.append(text)
+        content_pref = np.zeros((n, dim))
+        if texts:
+            np.add.at(content_pref, np.array(text_rows), self._text_vector_matrix(texts, cache))
+            text_counts = np.bincount(text_rows, minlength=n)
+            has_texts = text_counts > 0
+            content_pref[has_texts] /= text_counts[has_texts, None]
+
+        social_pattern = np.zeros((n, dim))
+        if social_rows:
+            np.add.at(social_pattern, (np.array(social_rows), np.array(social_cols)), np.array(social_weights))
+        social_pattern = _normalize_rows(social_pattern)
+
+        stance_bias = np.tile([0.33, 0.33, 0.34, 0.0], (n, 1))
+        if stance_rows:
+            rows = np.array(stance_rows)
+            counts = np.bincount(rows * 3 + np.array(stance_codes), minlength=n * 3).reshape(n, 3)
+            totals = counts.sum(axis=1)
+            has_comments = totals > 0
+            intensity_sums = np.bincount(rows, weights=np.array(stance_intensity), minlength=n)
+            stance_bias[has_comments, :3] = counts[has_comments] / totals[has_comments, None]
+            stance_bias[has_comments, 3] = intensity_sums[has_comments] / totals[has_comments]
+
+        # 活跃度（发帖/评论数只统计 users 表中的用户，与原单用户查询一致）
+        activity_pattern = np.column_stack([
+            np.minimum(np.where(registered, post_counts, 0) / 100.0, 1.0),
+            np.minimum(np.where(registered, comment_counts, 0) / 500.0, 1.0),
+            np.minimum(received_likes / 1000.0, 1.0),
+            np.full(n, 0.5)  # 时段偏好（可以进一步细化）
+        ])
 
-        for user in followers:
-            idx = hash(user) % self.vector_dim
-            embedding[idx] += 0.5  # 粉丝权重稍低
+        # 拼接成综合向量，填充/截断到指定维度后归一化
+        combined = np.hstack([content_pref, social_pattern, stance_bias, activity_pattern])
+        if combined.shape[1] < dim:
+            combined = np.pad(combined, ((0, 0), (0, dim - combined.shape[1])))
+        else:
+            combined = combined[:, :dim]
+        combined = _normalize_rows(combined)
 
-        # 归一化
-        if np.linalg.norm(embedding) > 0:
-            embedding = embedding / np.linalg.norm(embedding)
+        # 茧房指数（批量计算）
+        bubble_indexes = np.full(n, 0.5)
+        try:
+            try:
+                from src.filter_bubble_analyzer import FilterBubbleAnalyzer
+            except ImportError:
+                from filter_bubble_analyzer import FilterBubbleAnalyzer
+            metrics = FilterBubbleAnalyzer(self.db_path).analyze_users(user_ids)
+            for i, user_id in enumerate(user_ids):
+                bubble_indexes[i] = metrics[user_id].echo_chamber_index
+        except Exception:
+            pass
 
-        return embedding
+        return {
+            user_id: UserVector(
+                user_id=user_id,
+                content_preference=content_pref[i],
+                social_pattern=social_pattern[i],
+                stance_bias=stance_bias[i],
+                activity_pattern=activity_pattern[i],
+                combined=combined[i],
+                total_posts=int(post_counts[i]),
+                total_comments=int(comment_counts[i]),
+                total_likes=0,
+                bubble_index=float(bubble_indexes[i])
+            )
+            for user_id, i in index.items()
+        }
 
-    def _generate_stance_bias_vector(
+    def _ensure_user_vectors(
         self,
-        user_id: str,
-        conn: sqlite3.Connection
-    ) -> np.ndarray:
-        """生成立场倾向 embedding
-
-        [支持强度, 反对强度, 中立强度, 情绪极化程度]
-        """
-        cursor = conn.cursor()
-
-        # 获取用户的所有评论
-        cursor.execute("""
-            SELECT content FROM comments
-            WHERE author_id = ?
-            LIMIT 50
-        """, (user_id,))
-        comments = [row[0] for row in cursor.fetchall()]
-
-        if not comments:
-            return np.array([0.33, 0.33, 0.34, 0.0])
+        conn: sqlite3.Connection,
+        user_ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """确保 user_ids（默认所有用户）的 embedding 已生成
 
-        # 分析每条评论的立场
-        support_count = 0
-        oppose_count = 0
-        neutral_count = 0
-        emotional_intensity = []
-
-        for comment in comments:
-            stance, intensity = self._analyze_stance_with_intensity(comment)
-            if stance == 'support':
-                support_count += 1
-            elif stance == 'oppose':
-                oppose_count += 1
-            else:
-                neutral_count += 1
-            emotional_intensity.append(intensity)
-
-        total = len(comments)
-        stance_vector = np.array([
-            support_count / total,
-            oppose_count / total,
-            neutral_count / total,
-            np.mean(emotional_intensity) if emotional_intensity else 0
-        ])
+        复用缓存中签名未变化的向量，只为新用户和有新活动的用户批量重新计算。
 
-        return stance_vector
-
-    def _generate_activity_pattern_vector(
-        self,
-        user_id: str,
-        conn: sqlite3.Connection
-    ) -> np.ndarray:
-        """生成活跃度模式 embedding
-
-        [发帖频率, 评论频率, 点赞频率, 时段偏好]
+        Returns:
+            user_ids
         """
         cursor = conn.cursor()
+        if user_ids is None:
+            cursor.execute("SELECT user_id FROM users")
+            user_ids = [row[0] for row in cursor.fetchall()]
+
+        cache = _get_user_vector_cache(self.db_path, self.vector_dim)
+        with cache.lock:
+            tick = self._current_tick(cursor)
+            if tick != cache.tick:
+                cache.vectors.clear()
+                cache.signatures.clear()
+                cache.text_vectors.clear()
+                cache.tick = tick
+
+            signatures = self._activity_signatures(cursor)
+            stale = [
+                user_id for user_id in dict.fromkeys(user_ids)
+                if user_id not in cache.vectors or cache.signatures.get(user_id) != signatures.get(user_id, ())
+            ]
+            if stale:
+                print(f"正在为 {len(stale)} 个用户生成 embedding...")
+                for user_id, vector in self._build_user_vectors(stale, conn, cache).items():
+                    cache.vectors[user_id] = vector
+                    cache.signatures[user_id] = signatures.get(user_id, ())
 
-        # 统计活动
-        cursor.execute("""
-            SELECT
-                COUNT(DISTINCT p.post_id) as post_count,
-                COUNT(DISTINCT c.comment_id) as comment_count
-            FROM users u
-            LEFT JOIN posts p ON u.user_id = p.author_id
-            LEFT JOIN comments c ON u.user_id = c.author_id
-            WHERE u.user_id = ?
-        """, (user_id,))
-        result = cursor.fetchone()
-        post_count = result[0] if result else 0
-        comment_count = result[1] if result else 0
-
-        # 估算点赞数（从帖子表）
-        cursor.execute("""
-            SELECT SUM(num_likes) FROM posts
-            WHERE author_id = ?
-        """, (user_id,))
-        received_likes = cursor.fetchone()[0] or 0
-
-        # 归一化到 [0, 1]
-        activity_vector = np.array([
-            min(post_count / 100.0, 1.0),
-            min(comment_count / 500.0, 1.0),
-            min(received_likes / 1000.0, 1.0),
-            0.5  # 时段偏好（可以进一步细化）
-        ])
-
-        return activity_vector
+            for user_id in user_ids:
+                self.user_vectors[user_id] = cache.vectors[user_id]
+        return user_ids
 
     def _generate_user_vector(
         self,
         user_id: str,
         conn: sqlite3.Connection
     ) -> UserVector:
-        """生成用户的综合 embedding
-
-        组合内容偏好、社交模式、立场倾向、活跃度四个维度
-        """
-        # 生成各维度向量
-        content_pref = self._generate_content_preference_vector(user_id, conn)
-        social_pattern = self._generate_social_pattern_vector(user_id, conn)
-        stance_bias = self._generate_stance_bias_vector(user_id, conn)
-        activity_pattern = self._generate_activity_pattern_vector(user_id, conn)
-
-        # 拼接成综合向量
-        combined = np.concatenate([
-            content_pref,
-            social_pattern,
-            stance_bias,
-            activity_pattern
-        ])
-
-        # 确保维度正确
-        if len(combined) < self.vector_dim:
-            # 填充到指定维度
-            combined = np.pad(combined, (0, self.vector_dim - len(combined)))
-        elif len(combined) > self.vector_dim:
-            # 截断
-            combined = combined[:self.vector_dim]
-
-        # 归一化
-        if np.linalg.norm(combined) > 0:
-            combined = combined / np.linalg.norm(combined)
-
-        # 获取元数据
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                (SELECT COUNT(*) FROM posts WHERE author_id = ?) as post_count,
-                (SELECT COUNT(*) FROM comments WHERE author_id = ?) as comment_count
-        """, (user_id, user_id))
-        row = cursor.fetchone()
-        total_posts = row[0] if row else 0
-        total_comments = row[1] if row else 0
-
-        # 获取茧房指数
-        try:
-            from src.filter_bubble_analyzer import FilterBubbleAnalyzer
-            analyzer = FilterBubbleAnalyzer(self.db_path)
-            metrics = analyzer.analyze_user_bubble(user_id)
-            bubble_index = metrics.echo_chamber_index
-        except:
-            bubble_index = 0.5
-
-        return UserVector(
-            user_id=user_id,
-            content_preference=content_pref,
-            social_pattern=social_pattern,
-            stance_bias=stance_bias,
-            activity_pattern=activity_pattern,
-            combined=combined,
-            total_posts=total_posts,
-            total_comments=total_comments,
-            total_likes=0,
-            bubble_index=bubble_index
-        )
+        """生成单个用户的综合 embedding（走批量路径和缓存）"""
+        self._ensure_user_vectors(conn, [user_id])
+        return self.user_vectors[user_id]
 
     # ==================== 立场分析 ====================
 
@@ -598,29 +688,18 @@ class CommunityDetector:
             社区列表
         """
         conn = self._get_connection()
-        cursor = conn.cursor()
 
         try:
-            # 获取所有用户
-            cursor.execute("SELECT user_id FROM users")
-            users = [row[0] for row in cursor.fetchall()]
+            # 批量生成（或从缓存复用）所有用户的embedding
+            users = self._ensure_user_vectors(conn)
 
             if not users:
                 return []
 
-            # 生成所有用户的embedding
-            print(f"正在为 {len(users)} 个用户生成 embedding...")
-            user_vectors = []
-            user_ids = []
-
-            for user_id in users:
-                vector = self._generate_user_vector(user_id, conn)
-                user_vectors.append(vector)
-                user_ids.append(user_id)
-                self.user_vectors[user_id] = vector
+            user_ids = users
 
             # 转换为矩阵
-            X = np.array([e.combined for e in user_vectors])
+            X = np.array([self.user_vectors[user_id].combined for user_id in user_ids])
 
             # 标准化
             X_scaled = self.scaler.fit_transform(X)
@@ -805,51 +884,39 @@ class CommunityDetector:
         1. 选取15条帖子，涵盖支持多、中立多、反对多的不同类型
         2. 单独标记最火帖子（按总互动数）
 
-        使用交互用户的embedding相似度来判断立场
+        所有候选帖子的立场计数由批量立场引擎一次算出（见 _batch_post_stances）；
+        embedding 相关的重计算（交互中心、影响力、茧房支持率）只对最终选中的帖子进行
         """
         conn = self._get_connection()
-        cursor = conn.cursor()
 
         try:
-            # 获取所有有足够评论的帖子
-            cursor.execute("""
-                SELECT post_id, num_comments, num_likes, num_shares
-                FROM posts
-                WHERE num_comments >= ?
-                ORDER BY num_comments DESC
-            """, (min_comments,))
-
-            all_posts = cursor.fetchall()
+            # 第一步：批量统计所有有足够评论的帖子的立场（按评论数降序）
+            all_posts = self._batch_post_stances(conn, min_comments=min_comments)
 
             if not all_posts:
                 return []
 
-            # 第一步：对所有帖子进行快速立场分析
-            post_analysis_cache = {}
             support_dominant = []
             neutral_dominant = []
             oppose_dominant = []
 
-            for post_id, num_comments, num_likes, num_shares in all_posts:
-                result = self._analyze_single_post_stance(post_id, conn)
-                if result:
-                    post_analysis_cache[post_id] = result
-                    total_interactions = num_comments + num_likes + num_shares
-                    result.total_interactions = total_interactions
-
-                    # 按主导立场分类（使用相对主导，而非绝对阈值）
-                    # 策略：找到最高的比例，且该比例至少达到30%
-                    max_ratio = max(result.support_ratio, result.neutral_ratio, result.oppose_ratio)
-
-                    if max_ratio < 0.30:
-                        # 如果没有明显主导，归为中立
-                        neutral_dominant.append((post_id, result, total_interactions))
-                    elif result.support_ratio == max_ratio:
-                        support_dominant.append((post_id, result, total_interactions))
-                    elif result.oppose_ratio == max_ratio:
-                        oppose_dominant.append((post_id, result, total_interactions))
-                    else:
-                        neutral_dominant.append((post_id, result, total_interactions))
+            for result in all_posts:
+                post_id = result.post_id
+                total_interactions = result.total_interactions
+
+                # 按主导立场分类（使用相对主导，而非绝对阈值）
+                # 策略：找到最高的比例，且该比例至少达到30%
+                max_ratio = max(result.support_ratio, result.neutral_ratio, result.oppose_ratio)
+
+                if max_ratio < 0.30:
+                    # 如果没有明显主导，归为中立
+                    neutral_dominant.append((post_id, result, total_interactions))
+                elif result.support_ratio == max_ratio:
+                    support_dominant.append((post_id, result, total_interactions))
+                elif result.oppose_ratio == max_ratio:
+                    oppose_dominant.append((post_id, result, total_interactions))
+                else:
+                    neutral_dominant.append((post_id, result, total_interactions))
 
             # 第二步：从每个类别中选择代表性帖子
             selected_posts = []
@@ -904,7 +971,13 @@ class CommunityDetector:
                 selected_posts.extend([r for _, r, _ in neutral_dominant[:neutral_quota]])
                 selected_posts.extend([r for _, r, _ in oppose_dominant[:oppose_quota]])
 
-            # 第三步：找出最火的帖子并标记
+            # 第三步：只为选中的帖子计算 embedding 相关指标
+            self._ensure_user_vectors(
+                conn, [author_id for counts in selected_posts for author_id, _, _ in counts.comments]
+            )
+            selected_posts = [self._build_post_stance_analysis(counts) for counts in selected_posts]
+
+            # 第四步：找出最火的帖子并标记
             if selected_posts:
                 hottest_post = max(selected_posts, key=lambda p: p.total_interactions)
                 hottest_post.is_hottest = True  # 添加标记
@@ -923,133 +996,268 @@ class CommunityDetector:
 
         优化：综合考虑评论内容、点赞行为、关注关系来判定立场
         """
-        cursor = conn.cursor()
-
-        # 获取帖子内容
-        cursor.execute("SELECT content, author_id, created_at FROM posts WHERE post_id = ?", (post_id,))
-        post_data = cursor.fetchone()
-        if not post_data:
+        counts = self._batch_post_stances(conn, post_ids=[post_id])
+        if not counts:
             return None
+        self._ensure_user_vectors(conn, [author_id for author_id, _, _ in counts[0].comments])
+        return self._build_post_stance_analysis(counts[0])
+
+    # ==================== 批量立场引擎 ====================
+
+    @staticmethod
+    def _has_comment_stance_table(conn: sqlite3.Connection) -> bool:
+        """评论立场缓存表是否存在（由 DatabaseManager 建表；旧数据库没有时退化为不持久化）"""
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'comment_stances'"
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _stance_join(persist: bool) -> str:
+        return (
+            "LEFT JOIN comment_stances s ON s.comment_id = c.comment_id AND s.rules_version = ?"
+            if persist else ""
+        )
 
-        post_content, post_author, post_created_at = post_data
+    @staticmethod
+    def _stance_columns(persist: bool) -> str:
+        return "s.content_hash, s.stance, s.intensity" if persist else "NULL, NULL, NULL"
 
-        # 生成帖子的embedding
-        post_vector = self._get_text_vector(post_content)
+    def _comment_stance(
+        self,
+        comment_id: str,
+        content: Optional[str],
+        cached_hash: Optional[str],
+        cached_stance: Optional[str],
+        cached_intensity: Optional[float],
+        new_stances: List[tuple]
+    ) -> Tuple[str, float]:
+        """评论的基础立场：命中 comment_stances 缓存（内容未变）直接复用，否则重新分析并记入 new_stances"""
+        content_hash = hashlib.blake2b((content or '').encode('utf-8'), digest_size=8).hexdigest()
+        if cached_stance is not None and cached_hash == content_hash:
+            return cached_stance, cached_intensity
+        stance, intensity = self._analyze_stance_with_intensity(content)
+        new_stances.append((comment_id, content_hash, _STANCE_RULES_VERSION, stance, intensity))
+        return stance, intensity
+
+    @staticmethod
+    def _store_comment_stances(conn: sqlite3.Connection, new_stances: List[tuple]):
+        """尽力写回 comment_stances（写失败时下次请求再补写）"""
+        if not new_stances:
+            return
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO comment_stances "
+                "(comment_id, content_hash, rules_version, stance, intensity) VALUES (?, ?, ?, ?, ?)",
+                new_stances
+            )
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            # 模拟正在写库等情况：下次请求再补写
+            conn.rollback()
+            print(f"⚠️ 评论立场缓存写入失败: {e}")
 
-        # 获取所有评论
-        cursor.execute("""
-            SELECT author_id, content, created_at FROM comments
-            WHERE post_id = ?
-            ORDER BY created_at
-        """, (post_id,))
+    def _batch_post_stances(
+        self,
+        conn: sqlite3.Connection,
+        min_comments: int = 0,
+        post_ids: Optional[List[str]] = None
+    ) -> List[_PostStanceCounts]:
+        """批量统计帖子的立场分布
+
+        - 一次查询取出所有候选帖子的评论（附带 comment_stances 中已缓存的立场）
+        - 只对未缓存（或内容/规则已变化）的评论运行 _analyze_stance_with_intensity，
+          结果按 comment_id 写回 comment_stances
+        - 点赞、关注关系各用一次查询取出，再逐评论调整立场
+        - 用 np.bincount 按帖子分组汇总立场计数
 
-        comments = cursor.fetchall()
+        Args:
+            min_comments: 只统计 num_comments >= min_comments 的帖子
+            post_ids: 只统计指定帖子
 
-        if not comments:
-            return None
+        Returns:
+            按 num_comments 降序的帖子立场统计（没有评论的帖子不返回）
+        """
+        cursor = conn.cursor()
 
-        # 分析每条评论的立场和embedding
-        user_vectors = []
-        stance_scores = []
+        filters, params = ["p.num_comments >= ?"], [min_comments]
+        if post_ids is not None:
+            if not post_ids:
+                return []
+            filters.append(f"p.post_id IN ({','.join('?' for _ in post_ids)})")
+            params.extend(post_ids)
+        where = " AND ".join(filters)
 
-        for author_id, content, comment_created_at in comments:
-            # 1. 基于评论内容的初始立场分析
-            stance, intensity = self._analyze_stance_with_intensity(content)
+        cursor.execute(f"""
+            SELECT p.post_id, p.content, p.author_id, p.created_at,
+                   p.num_comments, p.num_likes, p.num_shares
+            FROM posts p
+            WHERE {where}
+            ORDER BY p.num_comments DESC
+        """, params)
+        posts = cursor.fetchall()
+        if not posts:
+            return []
+
+        # 评论 + 已缓存的立场
+        persist = self._has_comment_stance_table(conn)
+        cursor.execute(f"""
+            SELECT c.comment_id, c.post_id, c.author_id, c.content, {self._stance_columns(persist)}
+            FROM comments c
+            JOIN posts p ON p.post_id = c.post_id
+            {self._stance_join(persist)}
+            WHERE {where}
+            ORDER BY c.created_at
+        """, ([_STANCE_RULES_VERSION] if persist else []) + params)
+        comments = cursor.fetchall()
 
-            # 2. 获取点赞行为（如果likes表存在）
-            has_liked = False
-            try:
-                cursor.execute("""
-                    SELECT COUNT(*) FROM likes
-                    WHERE user_id = ? AND post_id = ?
-                """, (author_id, post_id))
-                has_liked = cursor.fetchone()[0] > 0
-            except sqlite3.OperationalError:
-                # likes表不存在，跳过点赞检测
-                pass
-
-            # 3. 获取关注关系及时间
-            cursor.execute("""
-                SELECT created_at FROM follows
-                WHERE follower_id = ? AND followed_id = ?
-                ORDER BY created_at ASC
-                LIMIT 1
-            """, (author_id, post_author))
-            follow_result = cursor.fetchone()
-
-            # 4. 综合行为加权调整立场
-            if has_liked:
-                # 点赞：强烈支持信号，大幅加权
-                if stance == 'support':
-                    intensity = min(1.0, intensity + 0.4)  # 提升情绪强度
-                elif stance == 'neutral':
-                    stance = 'support'  # 中立转支持
-                    intensity = 0.6
-                elif stance == 'oppose':
-                    # 反对但点赞，转为中立
-                    stance = 'neutral'
-                    intensity = intensity * 0.5
-
-            if follow_result:
-                follow_created_at = follow_result[0]
-
-                # 判断关注时间与帖子创建时间的关系
-                if follow_created_at and post_created_at:
-                    try:
-                        follow_time = datetime.fromisoformat(follow_created_at.replace('Z', '+00:00'))
-                        post_time = datetime.fromisoformat(post_created_at.replace('Z', '+00:00'))
-
-                        if follow_time > post_time:
-                            # 帖子发布后才关注：通过帖子关注，高支持权重
-                            if stance == 'support':
-                                intensity = min(1.0, intensity + 0.3)
-                            elif stance == 'neutral':
-                                stance = 'support'
-                                intensity = 0.5
-                            elif stance == 'oppose':
-                                # 反对但关注了，转为中立
-                                stance = 'neutral'
-                                intensity = intensity * 0.6
-                        else:
-                            # 帖子发布前就关注：已有关系，少量支持权重
-                            if stance == 'neutral':
-                                stance = 'support'
-                                intensity = 0.3
-                            elif stance == 'support':
-                                intensity = min(1.0, intensity + 0.1)
-                    except:
-                        # 时间解析失败，忽略时间因素
-                        pass
-                else:
-                    # 无法判断时间，给予少量支持权重
-                    if stance == 'neutral':
-                        stance = 'support'
-                        intensity = 0.2
-
-            # 生成用户的embedding（如果还没生成）
-            if author_id not in self.user_vectors:
-                user_vec = self._generate_user_vector(author_id, conn)
-                self.user_vectors[author_id] = user_vec
+        # 点赞行为（如果likes表存在）
+        liked = set()
+        try:
+            cursor.execute(f"""
+                SELECT DISTINCT l.user_id, l.post_id FROM likes l
+                JOIN posts p ON p.post_id = l.post_id
+                WHERE {where}
+            """, params)
+            liked = set(cursor.fetchall())
+        except sqlite3.OperationalError:
+            # likes表不存在，跳过点赞检测
+            pass
+
+        # 关注关系：每对 (评论者, 帖子作者) 最早的关注时间
+        follows = {}
+        cursor.execute(f"""
+            SELECT follower_id, followed_id, created_at FROM follows
+            WHERE followed_id IN (SELECT p.author_id FROM posts p WHERE {where})
+            ORDER BY created_at ASC
+        """, params)
+        for follower_id, followed_id, created_at in cursor.fetchall():
+            follows.setdefault((follower_id, followed_id), created_at)
+
+        post_info = {row[0]: row for row in posts}
+        post_index = {row[0]: i for i, row in enumerate(posts)}
+        per_post: List[List[Tuple[str, str, float]]] = [[] for _ in posts]
+        rows, codes, new_stances = [], [], []
+
+        for comment_id, post_id, author_id, content, *cached in comments:
+            # 1. 基于评论内容的初始立场分析（comment_stances 缓存）
+            stance, intensity = self._comment_stance(comment_id, content, *cached, new_stances)
+
+            # 2-4. 综合点赞、关注行为加权调整立场
+            _, _, post_author, post_created_at = post_info[post_id][:4]
+            follow_key = (author_id, post_author)
+            stance, intensity = self._adjust_stance_by_behavior(
+                stance, intensity,
+                has_liked=(author_id, post_id) in liked,
+                has_followed=follow_key in follows,
+                follow_created_at=follows.get(follow_key),
+                post_created_at=post_created_at
+            )
+
+            i = post_index[post_id]
+            per_post[i].append((author_id, stance, intensity))
+            rows.append(i)
+            codes.append(_STANCE_CODES[stance])
+
+        if persist:
+            self._store_comment_stances(conn, new_stances)
+
+        # 按帖子分组汇总 [support, oppose, neutral] 计数
+        counts = np.zeros((len(posts), 3), dtype=int)
+        if rows:
+            counts = np.bincount(
+                np.array(rows) * 3 + np.array(codes), minlength=len(posts) * 3
+            ).reshape(len(posts), 3)
+
+        results = []
+        for i, (post_id, content, _, _, num_comments, num_likes, num_shares) in enumerate(posts):
+            if not per_post[i]:
+                continue
+            support_count, oppose_count, neutral_count = (int(v) for v in counts[i])
+            results.append(_PostStanceCounts(
+                post_id=post_id,
+                content=content,
+                comments=per_post[i],
+                support_count=support_count,
+                neutral_count=neutral_count,
+                oppose_count=oppose_count,
+                total_interactions=(num_comments or 0) + (num_likes or 0) + (num_shares or 0)
+            ))
+        return results
+
+    @staticmethod
+    def _adjust_stance_by_behavior(
+        stance: str,
+        intensity: float,
+        has_liked: bool,
+        has_followed: bool,
+        follow_created_at: Optional[str],
+        post_created_at: Optional[str]
+    ) -> Tuple[str, float]:
+        """综合点赞行为和关注关系（及关注时间）调整评论立场"""
+        if has_liked:
+            # 点赞：强烈支持信号，大幅加权
+            if stance == 'support':
+                intensity = min(1.0, intensity + 0.4)  # 提升情绪强度
+            elif stance == 'neutral':
+                stance = 'support'  # 中立转支持
+                intensity = 0.6
+            elif stance == 'oppose':
+                # 反对但点赞，转为中立
+                stance = 'neutral'
+                intensity = intensity * 0.5
+
+        if has_followed:
+            # 判断关注时间与帖子创建时间的关系
+            if follow_created_at and post_created_at:
+                try:
+                    follow_time = datetime.fromisoformat(follow_created_at.replace('Z', '+00:00'))
+                    post_time = datetime.fromisoformat(post_created_at.replace('Z', '+00:00'))
+
+                    if follow_time > post_time:
+                        # 帖子发布后才关注：通过帖子关注，高支持权重
+                        if stance == 'support':
+                            intensity = min(1.0, intensity + 0.3)
+                        elif stance == 'neutral':
+                            stance = 'support'
+                            intensity = 0.5
+                        elif stance == 'oppose':
+                            # 反对但关注了，转为中立
+                            stance = 'neutral'
+                            intensity = intensity * 0.6
+                    else:
+                        # 帖子发布前就关注：已有关系，少量支持权重
+                        if stance == 'neutral':
+                            stance = 'support'
+                            intensity = 0.3
+                        elif stance == 'support':
+                            intensity = min(1.0, intensity + 0.1)
+                except:
+                    # 时间解析失败，忽略时间因素
+                    pass
             else:
-                user_vec = self.user_vectors[author_id]
+                # 无法判断时间，给予少量支持权重
+                if stance == 'neutral':
+                    stance = 'support'
+                    intensity = 0.2
 
-            user_vectors.append((author_id, user_vec, stance, intensity))
-            stance_scores.append(stance)
+        return stance, intensity
+
+    def _build_post_stance_analysis(self, counts: _PostStanceCounts) -> PostStanceAnalysis:
+        """在立场计数基础上计算 embedding 相关指标（调用前需已生成评论者的 embedding）"""
+        # 生成帖子的embedding
+        post_vector = self._get_text_vector(counts.content)
 
-        # 计算立场分布
-        total = len(stance_scores)
-        support_count = stance_scores.count('support')
-        oppose_count = stance_scores.count('oppose')
-        neutral_count = stance_scores.count('neutral')
+        user_vectors = [
+            (author_id, self.user_vectors[author_id], stance, intensity)
+            for author_id, stance, intensity in counts.comments
+        ]
 
         # 计算交互中心向量
-        interaction_vectors = [emb.combined for _, emb, _, _ in user_vectors]
-        interaction_centroid = np.mean(interaction_vectors, axis=0)
+        interaction_centroid = np.mean([emb.combined for _, emb, _, _ in user_vectors], axis=0)
 
         # 计算影响力
-        high_influence = self._calculate_influence_by_vector(
-            post_vector, user_vectors
-        )
+        high_influence = self._calculate_influence_by_vector(post_vector, user_vectors)
 
         # 计算高茧房用户支持比例
         high_bubble_users = [
@@ -1063,14 +1271,14 @@ class CommunityDetector:
         )
 
         return PostStanceAnalysis(
-            post_id=post_id,
-            total_interactions=total,
-            support_ratio=support_count / total,
-            neutral_ratio=neutral_count / total,
-            oppose_ratio=oppose_count / total,
-            support_count=support_count,
-            neutral_count=neutral_count,
-            oppose_count=oppose_count,
+            post_id=counts.post_id,
+            total_interactions=counts.total_interactions,
+            support_ratio=counts.support_ratio,
+            neutral_ratio=counts.neutral_ratio,
+            oppose_ratio=counts.oppose_ratio,
+            support_count=counts.support_count,
+            neutral_count=counts.neutral_count,
+            oppose_count=counts.oppose_count,
             interaction_centroid=interaction_centroid,
             high_influence_users=high_influence,
             high_bubble_support_ratio=high_bubble_support
@@ -1131,10 +1339,9 @@ class CommunityDetector:
 
         try:
             # 获取或生成embedding
-            if user_id1 not in self.user_vectors:
-                self.user_vectors[user_id1] = self._generate_user_vector(user_id1, conn)
-            if user_id2 not in self.user_vectors:
-                self.user_vectors[user_id2] = self._generate_user_vector(user_id2, conn)
+            missing = [u for u in (user_id1, user_id2) if u not in self.user_vectors]
+            if missing:
+                self._ensure_user_vectors(conn, missing)
 
             emb1 = self.user_vectors[user_id1].combined
             emb2 = self.user_vectors[user_id2].combined
@@ -1163,32 +1370,29 @@ class CommunityDetector:
         cursor = conn.cursor()
 
         try:
-            # 生成目标用户的embedding
-            if user_id not in self.user_vectors:
-                self.user_vectors[user_id] = self._generate_user_vector(user_id, conn)
-
-            target_emb = self.user_vectors[user_id].combined
-
             # 获取所有其他用户
             cursor.execute("SELECT user_id FROM users WHERE user_id != ?", (user_id,))
             other_users = [row[0] for row in cursor.fetchall()]
 
-            similarities = []
-            for other_id in other_users:
-                if other_id not in self.user_vectors:
-                    self.user_vectors[other_id] = self._generate_user_vector(other_id, conn)
+            # 批量生成目标用户和其他用户的embedding
+            self._ensure_user_vectors(conn, [user_id] + other_users)
 
-                other_emb = self.user_vectors[other_id].combined
+            k = min(top_k, len(other_users))
+            if k <= 0:
+                return []
 
-                sim = np.dot(target_emb, other_emb) / (
-                    np.linalg.norm(target_emb) * np.linalg.norm(other_emb) + 1e-8
-                )
+            target_emb = self.user_vectors[user_id].combined
+            X = np.array([self.user_vectors[other_id].combined for other_id in other_users])
 
-                similarities.append((other_id, float(sim)))
+            # 一次矩阵乘法计算余弦相似度
+            sims = X @ target_emb / (
+                np.linalg.norm(X, axis=1) * np.linalg.norm(target_emb) + 1e-8
+            )
 
-            # 排序并返回top-k
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            return similarities[:top_k]
+            # argpartition 取 top-k 后再排序
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.argsort(-sims[top], kind='stable')]
+            return [(other_users[i], float(sims[i])) for i in top]
 
         finally:
             conn.close()
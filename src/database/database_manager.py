@@ -17,8 +17,15 @@ from pathlib import Path
 import json
 from datetime import datetime
 import asyncio
+import sys
 from functools import wraps
 
+try:
+    from database_pipeline import QueryPipeline, get_service_session, post_pipeline
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from database_pipeline import QueryPipeline, get_service_session, post_pipeline
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -65,6 +72,9 @@ class DatabaseManager:
         # Database service config
         self.use_service = True
         self.service_url = "http://127.0.0.1:5000"
+
+        # Tick-scoped pipeline for fire-and-forget writes; flushed before any read
+        self._deferred_pipeline = QueryPipeline(self.execute_batch)
         
         # Do not start worker thread by default (service mode)
         logger.info("Database service mode - skip worker thread startup")
@@ -72,7 +82,7 @@ class DatabaseManager:
     def _make_service_request(self, query: str, params: tuple = ()) -> Dict[str, Any]:
         """Send a request to the database service"""
         try:
-            response = requests.post(f"{self.service_url}/execute", json={
+            response = get_service_session().post(f"{self.service_url}/execute", json={
                 'query': query,
                 'params': list(params)
             }, timeout=30)
@@ -176,6 +186,8 @@ class DatabaseManager:
                 return self._fetch_data(operation)
             elif operation_type == 'transaction':
                 return self._execute_transaction(operation)
+            elif operation_type == 'pipeline':
+                return self._execute_pipeline(operation)
             elif operation_type == 'close':
                 return self._close_connection()
             else:
@@ -335,6 +347,61 @@ class DatabaseManager:
             self.connection.rollback()
             raise e
     
+    def _execute_pipeline(self, operation: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute a batch of statements inside one transaction (same semantics as
+        the service's /pipeline endpoint)
+
+        A params_list statement runs as one executemany and yields one result.
+        In atomic mode the first failure rolls back the whole batch; otherwise
+        failed statements are reported individually and the rest are committed.
+        """
+        statements = operation.get('statements', [])
+        atomic = operation.get('atomic', False)
+
+        try:
+            self.connection.execute("BEGIN")
+            cursor = self.connection.cursor()
+            results = []
+            for statement in statements:
+                query = statement.get('query')
+                try:
+                    if not query:
+                        raise ValueError("Query cannot be empty")
+                    if 'params_list' in statement:
+                        cursor.executemany(query, [tuple(p) for p in statement['params_list']])
+                    else:
+                        cursor.execute(query, tuple(statement.get('params', ())))
+
+                    if cursor.description:
+                        results.append({
+                            'success': True,
+                            'columns': [description[0] for description in cursor.description],
+                            'rows': [list(row) for row in cursor.fetchall()]
+                        })
+                    else:
+                        results.append({
+                            'success': True,
+                            'affected_rows': cursor.rowcount,
+                            'lastrowid': cursor.lastrowid
+                        })
+                except Exception as e:
+                    if atomic:
+                        raise
+                    results.append({'success': False, 'error': str(e), 'type': type(e).__name__})
+
+            self.connection.commit()
+
+            return {
+                'success': True,
+                'result': results,
+                'operation_id': operation.get('operation_id')
+            }
+
+        except Exception as e:
+            self.connection.rollback()
+            raise e
+
     def _close_connection(self) -> Dict[str, Any]:
         """Close database connection"""
         try:
@@ -462,8 +529,61 @@ class DatabaseManager:
             logger.error(f"Temporary connection fetch failed: {e}")
             return []
     
+    def execute_batch(self, statements: List[Dict[str, Any]], atomic: bool = False) -> List[Dict[str, Any]]:
+        """
+        Execute a batch of statements in a single round-trip
+
+        Args:
+            statements: List of {'query', 'params'} or {'query', 'params_list'} dicts
+            atomic: Roll back the whole batch if any statement fails
+
+        Returns:
+            One raw result per statement ({'success', 'columns', 'rows'} for queries,
+            {'success', 'affected_rows', 'lastrowid'} for writes)
+        """
+        if self.use_service:
+            return post_pipeline(self.service_url, statements, atomic=atomic)
+
+        result = self._submit_operation({'type': 'pipeline', 'statements': statements, 'atomic': atomic})
+        if not result.get('success'):
+            raise Exception(result.get('error', 'Unknown error'))
+        return result.get('result') or []
+
+    def pipeline(self, atomic: bool = False) -> QueryPipeline:
+        """Create a pipeline that sends its queued statements in one request"""
+        self.flush_deferred()
+        return QueryPipeline(self.execute_batch, atomic=atomic)
+
+    def execute_deferred(self, query: str, params: tuple = ()):
+        """
+        Queue a write whose result the caller does not need
+
+        Deferred writes are sent together on the next read or explicit
+        flush_deferred(), so callers always read their own writes.
+        """
+        return self._deferred_pipeline.execute(query, params)
+
+    def flush_deferred(self) -> int:
+        """Send all deferred writes; returns the number of statements sent"""
+        if not len(self._deferred_pipeline):
+            return 0
+        return self._deferred_pipeline.flush()
+
+    def executemany(self, query: str, params_list: List[tuple]) -> bool:
+        """Execute one statement for each parameter set in a single round-trip"""
+        if not params_list:
+            return True
+        self.flush_deferred()
+        try:
+            results = self.execute_batch([{'query': query, 'params_list': [list(p) for p in params_list]}])
+            return bool(results) and all(result.get('success') for result in results)
+        except Exception as e:
+            logger.error(f"Database batch execution failed: {e}")
+            return False
+
     def execute(self, query: str, params: tuple = ()) -> bool:
         """Execute SQL statement"""
+        self.flush_deferred()
         if self.use_service:
             result = self._make_service_request(query, params)
             return result.get('success', False)
@@ -478,6 +598,7 @@ class DatabaseManager:
     
     def fetch_one(self, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
         """Fetch one record"""
+        self.flush_deferred()
         if self.use_service:
             result = self._make_service_request(query, params)
             if result.get('success') and result.get('result'):
@@ -500,6 +621,7 @@ class DatabaseManager:
     
     def fetch_many(self, query: str, params: tuple = (), count: int = 1) -> List[Dict[str, Any]]:
         """Fetch multiple records"""
+        self.flush_deferred()
         if self.use_service:
             result = self._make_service_request(query, params)
             if result.get('success') and result.get('result'):
@@ -522,6 +644,7 @@ class DatabaseManager:
     
     def fetch_all(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
         """Fetch all records"""
+        self.flush_deferred()
         if self.use_service:
             result = self._make_service_request(query, params)
             if result.get('success') and result.get('result'):
@@ -559,6 +682,7 @@ class DatabaseManager:
 
         try:
             self._closed = True
+            self.flush_deferred()
 
             # If using database service mode, no need to close queue
             if self.use_service:
@@ -641,6 +765,26 @@ def execute_transaction(operations: List[Dict[str, Any]]) -> List[Any]:
     return db_manager.execute_transaction(operations)
 
 
+def execute_many(query: str, params_list: List[tuple]) -> bool:
+    """Execute one statement for each parameter set in a single round-trip"""
+    return db_manager.executemany(query, params_list)
+
+
+def execute_deferred(query: str, params: tuple = ()):
+    """Queue a write to be sent with the next batch"""
+    return db_manager.execute_deferred(query, params)
+
+
+def flush_deferred() -> int:
+    """Send all deferred writes"""
+    return db_manager.flush_deferred()
+
+
+def pipeline(atomic: bool = False) -> QueryPipeline:
+    """Create a pipeline that sends its queued statements in one request"""
+    return db_manager.pipeline(atomic=atomic)
+
+
 # Temporary connection convenience functions
 def execute_with_temp_connection(db_path: str, query: str, params: tuple = ()) -> bool:
     """Execute SQL query using a temporary connection"""
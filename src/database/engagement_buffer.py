@@ -0,0 +1,225 @@
+"""
+Write-behind buffer for agent engagement writes
+
+During the reaction phase of a tick, likes, shares, follows and the
+user_actions log are accumulated in memory instead of being written one
+statement at a time. Counter updates are aggregated per target, duplicate
+engagements are dropped, and everything is flushed as a handful of
+executemany statements in a single pipelined request.
+
+Outside an active phase every record is written through immediately, so
+callers do not need to know whether buffering is enabled.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .database_manager import get_db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class EngagementBuffer:
+    """
+    Per-tick write-behind buffer for engagement deltas
+
+    Usage:
+        buffer = get_engagement_buffer()
+        buffer.begin()
+        ...  # agents call AgentUser.like_post / share_post / follow_user ...
+        buffer.end()  # flushes everything in one batch
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.active = False
+        self._reset()
+        self.stats = {"flushes": 0, "recorded": 0, "deduplicated": 0, "statements": 0}
+
+    def _reset(self):
+        self._actions: List[Tuple[Any, ...]] = []
+        self._action_keys = set()
+        self._post_deltas: Dict[str, List[int]] = defaultdict(lambda: [0, 0])  # [likes, shares]
+        self._comment_likes: Dict[str, int] = defaultdict(int)
+        self._shares_received: Dict[str, int] = defaultdict(int)
+        self._follow_state: Dict[Tuple[str, str], bool] = {}
+        self._follow_delta: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    # ========== Phase control ==========
+
+    def begin(self):
+        """Start buffering writes until end() is called"""
+        with self._lock:
+            self.active = True
+
+    def end(self) -> int:
+        """Flush buffered writes and return to write-through mode"""
+        with self._lock:
+            try:
+                return self.flush()
+            finally:
+                self.active = False
+
+    # ========== Read-your-own-writes ==========
+
+    def has_action(self, user_id: str, action_type: str, target_id: Optional[str]) -> bool:
+        """Whether this user already performed the action in the buffered phase"""
+        with self._lock:
+            return (user_id, action_type, target_id) in self._action_keys
+
+    def is_following(self, follower_id: str, followed_id: str) -> Optional[bool]:
+        """Buffered follow state, or None if the database must be consulted"""
+        with self._lock:
+            return self._follow_state.get((follower_id, followed_id))
+
+    # ========== Recording ==========
+
+    def record_action(self, user_id: str, action_type: str, target_id: Optional[str] = None,
+                      content: Optional[str] = None, reasoning: Optional[str] = None):
+        """Append a row to the user_actions log"""
+        with self._lock:
+            self._actions.append((user_id, action_type, target_id, content, reasoning))
+            self._action_keys.add((user_id, action_type, target_id))
+            self._after_record()
+
+    def add_post_like(self, user_id: str, post_id: str) -> bool:
+        """Count a like on a post and its author; returns False for a duplicate"""
+        with self._lock:
+            if not self._claim(user_id, 'like_post', post_id):
+                return False
+            self._post_deltas[post_id][0] += 1
+            self._after_record()
+            return True
+
+    def add_comment_like(self, user_id: str, comment_id: str) -> bool:
+        """Count a like on a comment and its author; returns False for a duplicate"""
+        with self._lock:
+            if not self._claim(user_id, 'like_comment', comment_id):
+                return False
+            self._comment_likes[comment_id] += 1
+            self._after_record()
+            return True
+
+    def add_post_share(self, user_id: str, post_id: str, author_id: str) -> bool:
+        """Count a share on a post and its author; returns False for a duplicate"""
+        with self._lock:
+            if not self._claim(user_id, 'share_post', post_id):
+                return False
+            self._post_deltas[post_id][1] += 1
+            self._shares_received[author_id] += 1
+            self._after_record()
+            return True
+
+    def set_following(self, follower_id: str, followed_id: str, following: bool):
+        """Follow (True) or unfollow (False); the caller has already checked the current state"""
+        with self._lock:
+            key = (follower_id, followed_id)
+            self._follow_state[key] = following
+            self._follow_delta[key] += 1 if following else -1
+            self._after_record()
+
+    def _claim(self, user_id: str, action_type: str, target_id: str) -> bool:
+        key = (user_id, f"{action_type}:counted", target_id)
+        if key in self._action_keys:
+            self.stats["deduplicated"] += 1
+            return False
+        self._action_keys.add(key)
+        return True
+
+    def _after_record(self):
+        self.stats["recorded"] += 1
+        if not self.active:
+            self.flush()
+
+    # ========== Flush ==========
+
+    def _build_statements(self) -> List[Dict[str, Any]]:
+        statements = []
+
+        def add(query: str, params_list: List[Tuple[Any, ...]]):
+            if params_list:
+                statements.append({'query': query, 'params_list': [list(p) for p in params_list]})
+
+        add('''
+            INSERT INTO user_actions (user_id, action_type, target_id, content, reasoning)
+            VALUES (?, ?, ?, ?, ?)
+        ''', self._actions)
+        add('''
+            UPDATE posts
+            SET num_likes = num_likes + ?, num_shares = num_shares + ?
+            WHERE post_id = ?
+        ''', [(likes, shares, post_id) for post_id, (likes, shares) in self._post_deltas.items()])
+        add('''
+            UPDATE users
+            SET total_likes_received = total_likes_received + ?
+            WHERE user_id = (SELECT author_id FROM posts WHERE post_id = ?)
+        ''', [(likes, post_id) for post_id, (likes, _) in self._post_deltas.items() if likes])
+        add('''
+            UPDATE comments
+            SET num_likes = num_likes + ?
+            WHERE comment_id = ?
+        ''', [(likes, comment_id) for comment_id, likes in self._comment_likes.items()])
+        add('''
+            UPDATE users
+            SET total_likes_received = total_likes_received + ?
+            WHERE user_id = (SELECT author_id FROM comments WHERE comment_id = ?)
+        ''', [(likes, comment_id) for comment_id, likes in self._comment_likes.items()])
+        add('''
+            UPDATE users
+            SET total_shares_received = total_shares_received + ?
+            WHERE user_id = ?
+        ''', [(shares, author_id) for author_id, shares in self._shares_received.items()])
+
+        # Net follow changes; a follow and unfollow in the same phase cancel out
+        follows = [key for key, delta in self._follow_delta.items() if delta > 0]
+        unfollows = [key for key, delta in self._follow_delta.items() if delta < 0]
+        add('''
+            INSERT OR IGNORE INTO follows (follower_id, followed_id)
+            SELECT ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE user_id = ?)
+        ''', [(follower, followed, followed) for follower, followed in follows])
+        add('''
+            DELETE FROM follows
+            WHERE follower_id = ? AND followed_id = ?
+        ''', unfollows)
+        follower_deltas: Dict[str, int] = defaultdict(int)
+        for (_, followed), delta in self._follow_delta.items():
+            if delta:
+                follower_deltas[followed] += 1 if delta > 0 else -1
+        add('''
+            UPDATE users
+            SET follower_count = follower_count + ?
+            WHERE user_id = ?
+        ''', [(delta, user_id) for user_id, delta in follower_deltas.items() if delta])
+
+        return statements
+
+    def flush(self) -> int:
+        """Write all buffered engagement in one batch; returns the number of statements sent"""
+        with self._lock:
+            statements = self._build_statements()
+            self._reset()
+            if not statements:
+                return 0
+
+            try:
+                results = get_db_manager().execute_batch(statements)
+                for statement, result in zip(statements, results):
+                    if not result.get('success'):
+                        logger.error(f"Engagement flush statement failed: {result.get('error')} "
+                                     f"({len(statement['params_list'])} rows)")
+            except Exception as e:
+                logger.error(f"Engagement flush failed ({len(statements)} statements): {e}")
+
+            self.stats["flushes"] += 1
+            self.stats["statements"] += len(statements)
+            return len(statements)
+
+
+_engagement_buffer = EngagementBuffer()
+
+
+def get_engagement_buffer() -> EngagementBuffer:
+    """Get the global engagement buffer"""
+    return _engagement_buffer
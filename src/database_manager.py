@@ -4,9 +4,11 @@ import sqlite3
 import time
 import shutil
 import json
-from typing import Dict, List
+from typing import Any, Dict, List
 import requests
 
+from database_pipeline import get_service_session, post_pipeline
+
 
 class ServiceConnection:
     """Simulate sqlite3 connection via HTTP requests to the database service"""
@@ -20,7 +22,7 @@ class ServiceConnection:
     def execute(self, query: str, params: tuple = ()):
         """Execute SQL query"""
         try:
-            response = requests.post(f"{self.service_url}/execute", json={
+            response = get_service_session().post(f"{self.service_url}/execute", json={
                 'query': query,
                 'params': list(params)
             }, timeout=30)
@@ -53,6 +55,10 @@ class ServiceConnection:
         """Return cursor object (compatibility method)"""
         # Return a ServiceCursor object that can execute via execute()
         return ServiceCursor([], [], self.service_url)
+
+    def execute_batch(self, statements: List[Dict[str, Any]], atomic: bool = False) -> List[Dict[str, Any]]:
+        """Execute a batch of statements in a single round-trip via /pipeline"""
+        return post_pipeline(self.service_url, statements, atomic=atomic)
     
     def fetchone(self):
         """Fetch one row (compatibility method)"""
@@ -94,8 +100,7 @@ class ServiceCursor:
     def execute(self, query: str, params: tuple = ()):
         """Execute SQL query"""
         try:
-            import requests
-            response = requests.post(f"{self.service_url}/execute", json={
+            response = get_service_session().post(f"{self.service_url}/execute", json={
                 'query': query,
                 'params': list(params)
             }, timeout=30)
@@ -153,8 +158,7 @@ class ServiceCursor:
     def executemany(self, query: str, params_list: List[tuple]):
         """Execute batch SQL queries"""
         try:
-            import requests
-            response = requests.post(f"{self.service_url}/executemany", json={
+            response = get_service_session().post(f"{self.service_url}/executemany", json={
                 'query': query,
                 'params_list': [list(params) for params in params_list]
             }, timeout=30)
@@ -220,6 +224,67 @@ class ServiceRow:
         """Return number of columns"""
         return len(self.row_data)
 
+# Persona patterns behind the user_roles side table (see DatabaseManager._apply_account_roles)
+_PERSONA_MALICIOUS = (
+    "({persona} LIKE '%\"type\": \"negative\"%'"
+    " OR {persona} LIKE '%''type'': ''negative''%'"
+    " OR {persona} LIKE '%\"type\": \"malicious\"%'"
+    " OR {persona} LIKE '%''type'': ''malicious''%')"
+)
+_PERSONA_DEFENSE = "({persona} LIKE '%amplifier%' OR {persona} LIKE '%defense%')"
+_PERSONA_NEWS_ORG = (
+    "({persona} LIKE '%\"type\": \"news_org\"%'"
+    " OR {persona} LIKE '%''type'': ''news_org''%')"
+)
+
+
+def account_role_select(row: str) -> str:
+    """
+    SELECT list classifying the users row `row` (a table name or trigger NEW):
+    user_id, role, malicious, defense, news_org.
+    """
+    persona = f"{row}.persona"
+    malicious = _PERSONA_MALICIOUS.format(persona=persona)
+    defense = _PERSONA_DEFENSE.format(persona=persona)
+    news_org = _PERSONA_NEWS_ORG.format(persona=persona)
+    return (
+        f"SELECT {row}.user_id AS user_id, "
+        f"CASE WHEN {persona} IS NULL THEN NULL "
+        f"WHEN {news_org} THEN 'news_org' "
+        f"WHEN {malicious} THEN 'malicious' "
+        f"WHEN {defense} THEN 'defense' "
+        f"ELSE 'neutral' END AS role, "
+        f"{malicious} AS malicious, {defense} AS defense, {news_org} AS news_org"
+    )
+
+
+# Versioned secondary index plan applied by DatabaseManager._migrate_database.
+# Each entry is (version, description, [(index_name, table, columns), ...]);
+# append new versions instead of editing applied ones.
+INDEX_MIGRATIONS = [
+    (1, "Secondary indexes for hot simulation queries", [
+        ('idx_user_actions_user_type_target', 'user_actions', 'user_id, action_type, target_id'),
+        ('idx_user_actions_target_type', 'user_actions', 'target_id, action_type'),
+        ('idx_follows_followed', 'follows', 'followed_id'),
+        ('idx_comments_post_created', 'comments', 'post_id, created_at'),
+        ('idx_comments_author', 'comments', 'author_id'),
+        ('idx_posts_author_status_news', 'posts', 'author_id, status, is_news'),
+        ('idx_posts_news_status', 'posts', 'is_news, status'),
+        ('idx_posts_original', 'posts', 'original_post_id'),
+        ('idx_agent_memories_user_type', 'agent_memories', 'user_id, memory_type'),
+        ('idx_feed_exposures_post_step', 'feed_exposures', 'post_id, time_step'),
+        ('idx_post_timesteps_step', 'post_timesteps', 'time_step'),
+        ('idx_comment_timesteps_post', 'comment_timesteps', 'post_id'),
+        ('idx_community_notes_post', 'community_notes', 'post_id'),
+        ('idx_malicious_comments_comment', 'malicious_comments', 'comment_id'),
+        ('idx_malicious_attacks_target_post', 'malicious_attacks', 'target_post_id'),
+    ]),
+    (2, "Recency index for ranked out-network retrieval", [
+        ('idx_posts_news_created', 'posts', 'is_news, created_at'),
+    ]),
+]
+
+
 class DatabaseManager:
     def __init__(self, db_path: str, reset_db: bool = True, use_service: bool = True, service_url: str = "http://127.0.0.1:5000"):
         self.db_path = db_path
@@ -370,27 +435,33 @@ class DatabaseManager:
             # Disable foreign key constraints
             cursor.execute("PRAGMA foreign_keys = OFF")
             
-            # Drop tables in reverse order of dependencies
-            cursor.execute("DROP TABLE IF EXISTS agent_responses")
-            cursor.execute("DROP TABLE IF EXISTS opinion_interventions")
-            cursor.execute("DROP TABLE IF EXISTS opinion_monitoring")
-            cursor.execute("DROP TABLE IF EXISTS malicious_comments")
-            cursor.execute("DROP TABLE IF EXISTS malicious_attacks")
-            cursor.execute("DROP TABLE IF EXISTS spread_metrics")
-            cursor.execute("DROP TABLE IF EXISTS feed_exposures")
-            cursor.execute("DROP TABLE IF EXISTS note_ratings")
-            cursor.execute("DROP TABLE IF EXISTS community_notes")
-            cursor.execute("DROP TABLE IF EXISTS moderation_logs")
-            cursor.execute("DROP TABLE IF EXISTS fact_checks")
-            cursor.execute("DROP TABLE IF EXISTS comments")
-            cursor.execute("DROP TABLE IF EXISTS agent_memories")
-            cursor.execute("DROP TABLE IF EXISTS user_actions")
-            cursor.execute("DROP TABLE IF EXISTS follows")
-            cursor.execute("DROP TABLE IF EXISTS posts")
-            cursor.execute("DROP TABLE IF EXISTS users")
-            
-            # Re-enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
+            try:
+                # Drop tables in reverse order of dependencies
+                cursor.execute("DROP TABLE IF EXISTS schema_migrations")
+                cursor.execute("DROP TABLE IF EXISTS post_changes")
+                cursor.execute("DROP TABLE IF EXISTS comment_changes")
+                cursor.execute("DROP TABLE IF EXISTS user_roles")
+                cursor.execute("DROP TABLE IF EXISTS comment_stances")
+                cursor.execute("DROP TABLE IF EXISTS agent_responses")
+                cursor.execute("DROP TABLE IF EXISTS opinion_interventions")
+                cursor.execute("DROP TABLE IF EXISTS opinion_monitoring")
+                cursor.execute("DROP TABLE IF EXISTS malicious_comments")
+                cursor.execute("DROP TABLE IF EXISTS malicious_attacks")
+                cursor.execute("DROP TABLE IF EXISTS spread_metrics")
+                cursor.execute("DROP TABLE IF EXISTS feed_exposures")
+                cursor.execute("DROP TABLE IF EXISTS note_ratings")
+                cursor.execute("DROP TABLE IF EXISTS community_notes")
+                cursor.execute("DROP TABLE IF EXISTS moderation_logs")
+                cursor.execute("DROP TABLE IF EXISTS fact_checks")
+                cursor.execute("DROP TABLE IF EXISTS comments")
+                cursor.execute("DROP TABLE IF EXISTS agent_memories")
+                cursor.execute("DROP TABLE IF EXISTS user_actions")
+                cursor.execute("DROP TABLE IF EXISTS follows")
+                cursor.execute("DROP TABLE IF EXISTS posts")
+                cursor.execute("DROP TABLE IF EXISTS users")
+            finally:
+                # Re-enable foreign key constraints even if a DROP failed
+                cursor.execute("PRAGMA foreign_keys = ON")
 
         # Create tables
         tables = {
@@ -652,6 +723,16 @@ class DatabaseManager:
                     authenticity_score REAL,
                     response_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
+            ''',
+            # Per-comment stance cache written by CommunityDetector's batch stance engine
+            'comment_stances': '''
+                CREATE TABLE IF NOT EXISTS comment_stances (
+                    comment_id TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    rules_version INTEGER NOT NULL,
+                    stance TEXT NOT NULL,
+                    intensity REAL NOT NULL
+                )
             '''
         }
 
@@ -661,8 +742,8 @@ class DatabaseManager:
         # Ensure newly introduced moderation-related columns exist on old databases.
         self._ensure_comment_moderation_columns(cursor)
 
-        # Optional database migration: add new fields only when needed
-        # self._migrate_database(cursor)  # Temporarily disable forced migration
+        # Database migration: add new fields and apply the versioned index plan
+        self._migrate_database(cursor)
 
         self.conn.commit()
         logging.info("Database tables created successfully.")
@@ -733,6 +814,127 @@ class DatabaseManager:
                 cursor.execute(f"ALTER TABLE {migration['table']} ADD COLUMN {migration['column']} {migration['definition']}")
                 print(f"✅ Column {migration['column']} added successfully")
 
+        self._apply_index_migrations(cursor)
+        self._apply_change_log(cursor)
+        self._apply_account_roles(cursor)
+
+    def _apply_change_log(self, cursor):
+        """
+        Create the post_changes / comment_changes logs read by in-process indexes.
+
+        Triggers on posts and post_timesteps (comments) stamp the touched
+        post_id (comment_id) with the next sequence number, so readers such as
+        PostIndex and the defense monitoring center fetch only rows changed
+        since their last sync. One row per post or comment: a log never grows
+        beyond its table.
+        """
+        logs = [
+            ('post_changes', 'post_id', [
+                ('trg_posts_insert_log', 'AFTER INSERT ON posts', 'NEW'),
+                ('trg_posts_update_log', 'AFTER UPDATE ON posts', 'NEW'),
+                ('trg_posts_delete_log', 'AFTER DELETE ON posts', 'OLD'),
+                ('trg_post_timesteps_insert_log', 'AFTER INSERT ON post_timesteps', 'NEW'),
+                ('trg_post_timesteps_update_log', 'AFTER UPDATE ON post_timesteps', 'NEW'),
+            ]),
+            ('comment_changes', 'comment_id', [
+                ('trg_comments_insert_log', 'AFTER INSERT ON comments', 'NEW'),
+                ('trg_comments_update_log', 'AFTER UPDATE ON comments', 'NEW'),
+                ('trg_comments_delete_log', 'AFTER DELETE ON comments', 'OLD'),
+            ]),
+        ]
+        for log, key, triggers in logs:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {log} (
+                    {key} TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL
+                )
+            ''')
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{log}_seq ON {log}(seq)")
+
+            stamp = (
+                f"INSERT OR REPLACE INTO {log} ({key}, seq) "
+                f"VALUES ({{row}}.{key}, (SELECT COALESCE(MAX(seq), 0) + 1 FROM {log}));"
+            )
+            for name, event, row in triggers:
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {stamp.format(row=row)} END"
+                )
+
+    def _apply_account_roles(self, cursor):
+        """
+        Materialize each account's role into the user_roles side table.
+
+        The persona patterns are evaluated once, by triggers, when a user is
+        created or its persona changes, instead of by every monitoring query.
+        The malicious/defense/news_org flags keep SQL semantics (NULL for a
+        NULL persona); role is news_org, malicious, defense or neutral, in that
+        order of precedence, and NULL for a NULL persona.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_roles (
+                user_id TEXT PRIMARY KEY,
+                role TEXT,
+                malicious INTEGER,
+                defense INTEGER,
+                news_org INTEGER
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_roles_role ON user_roles(role)")
+
+        classify = account_role_select('{row}')
+        cursor.execute(
+            f"INSERT OR REPLACE INTO user_roles (user_id, role, malicious, defense, news_org) "
+            f"{classify.format(row='users')} FROM users "
+            f"WHERE user_id NOT IN (SELECT user_id FROM user_roles)"
+        )
+        upsert = (
+            "INSERT OR REPLACE INTO user_roles (user_id, role, malicious, defense, news_org) "
+            f"{classify.format(row='NEW')};"
+        )
+        triggers = [
+            ('trg_users_insert_role', 'AFTER INSERT ON users', upsert),
+            ('trg_users_persona_role', 'AFTER UPDATE OF persona ON users', upsert),
+            ('trg_users_delete_role', 'AFTER DELETE ON users',
+             "DELETE FROM user_roles WHERE user_id = OLD.user_id;"),
+        ]
+        for name, event, body in triggers:
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+    def _apply_index_migrations(self, cursor):
+        """
+        Apply INDEX_MIGRATIONS idempotently.
+
+        Applied versions are recorded in schema_migrations. A recorded version is
+        re-checked against sqlite_master so indexes lost when a table was dropped
+        and recreated are rebuilt.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        applied = {row[0] for row in cursor.execute("SELECT version FROM schema_migrations").fetchall()}
+        existing = {row[0] for row in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        ).fetchall()}
+
+        for version, description, indexes in INDEX_MIGRATIONS:
+            missing = [index for index in indexes if index[0] not in existing]
+            if version in applied and not missing:
+                continue
+
+            for index_name, table, columns in missing:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table}({columns})")
+
+            if version not in applied:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO schema_migrations (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                logging.info(f"Applied index migration v{version}: {description} ({len(missing)} indexes)")
+
     def save_simulation_db(self, timestamp: str):
         """Save a timestamped copy of the simulation database."""
         if not self.use_service:
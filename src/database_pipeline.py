@@ -0,0 +1,233 @@
+"""
+Batched wire protocol for the database service
+
+Instead of one HTTP POST per SQL statement, clients collect statements into a
+QueryPipeline and send them to the service's /pipeline endpoint in a single
+request over a shared keep-alive session. Result sets use a compact encoding
+(column names once, rows as positional arrays) and are msgpack-framed when
+msgpack is installed, falling back to JSON otherwise.
+"""
+
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+JSON_CONTENT_TYPE = "application/json"
+
+# Keep-alive pool shared by every thread talking to the database service
+_session = None
+_session_lock = threading.Lock()
+_POOL_CONNECTIONS = 4
+_POOL_MAXSIZE = 64
+
+
+def get_service_session() -> requests.Session:
+    """Get the process-wide keep-alive session used for database service requests"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=_POOL_CONNECTIONS, pool_maxsize=_POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def close_service_session():
+    """Close the shared session and drop its pooled connections"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            try:
+                _session.close()
+            finally:
+                _session = None
+
+
+def encode_payload(payload: Dict[str, Any], binary: bool = True) -> Tuple[bytes, str]:
+    """Encode a wire payload, preferring msgpack when available"""
+    if binary and MSGPACK_AVAILABLE:
+        return msgpack.packb(payload, use_bin_type=True, default=str), MSGPACK_CONTENT_TYPE
+    return json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8"), JSON_CONTENT_TYPE
+
+
+def decode_payload(body: bytes, content_type: Optional[str]) -> Dict[str, Any]:
+    """Decode a wire payload according to its content type"""
+    if content_type and content_type.startswith(MSGPACK_CONTENT_TYPE):
+        if not MSGPACK_AVAILABLE:
+            raise ValueError("msgpack payload received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body.decode("utf-8") if isinstance(body, (bytes, bytearray)) else body)
+
+
+def post_pipeline(service_url: str, statements: List[Dict[str, Any]], atomic: bool = False,
+                  timeout: float = 30) -> List[Dict[str, Any]]:
+    """
+    Send a batch of statements to the database service in one request
+
+    Args:
+        service_url: Database service base URL
+        statements: List of {'query', 'params'} or {'query', 'params_list'} dicts
+        atomic: Roll back the whole batch if any statement fails
+
+    Returns:
+        One raw result dict per statement, in order
+    """
+    body, content_type = encode_payload({"statements": statements, "atomic": atomic})
+    response = get_service_session().post(
+        f"{service_url}/pipeline",
+        data=body,
+        headers={"Content-Type": content_type, "Accept": content_type},
+        timeout=timeout,
+    )
+    if response.status_code != 200:
+        raise Exception(f"HTTP {response.status_code}: {response.text[:500]}")
+
+    result = decode_payload(response.content, response.headers.get("Content-Type"))
+    if not result.get("success"):
+        raise Exception(result.get("error", "Unknown error"))
+    return result.get("results", [])
+
+
+def rows_to_dicts(rows: Sequence[Sequence[Any]], columns: Sequence[str]) -> List[Dict[str, Any]]:
+    """Expand compact positional rows into dicts keyed by column name"""
+    if not columns:
+        return []
+    return [dict(zip(columns, row)) for row in rows]
+
+
+class PendingResult:
+    """Handle to a pipelined statement; resolves once its pipeline is flushed"""
+
+    def __init__(self, pipeline: "QueryPipeline", kind: str):
+        self._pipeline = pipeline
+        self._kind = kind
+        self._raw = None
+        self._resolved = False
+
+    def _resolve(self, raw: Dict[str, Any]):
+        self._raw = raw
+        self._resolved = True
+
+    @property
+    def success(self) -> bool:
+        return bool(self.raw().get("success"))
+
+    def raw(self) -> Dict[str, Any]:
+        """Raw wire result, flushing the pipeline if needed"""
+        if not self._resolved:
+            self._pipeline.flush()
+        return self._raw or {"success": False, "error": "Statement was not executed"}
+
+    def result(self) -> Any:
+        """Decoded result: rows for fetch_all, a row or None for fetch_one, success flag otherwise"""
+        raw = self.raw()
+        if not raw.get("success"):
+            if self._kind == "fetch_all":
+                return []
+            if self._kind == "fetch_one":
+                return None
+            return False
+        if self._kind == "fetch_all":
+            return rows_to_dicts(raw.get("rows", []), raw.get("columns", []))
+        if self._kind == "fetch_one":
+            rows = rows_to_dicts(raw.get("rows", [])[:1], raw.get("columns", []))
+            return rows[0] if rows else None
+        return True
+
+
+class QueryPipeline:
+    """
+    Collect statements and send them to the database in a single round-trip
+
+    Usage:
+        with db_manager.pipeline() as pipe:
+            posts = pipe.fetch_all("SELECT ...", (post_id,))
+            pipe.execute("INSERT ...", params)
+        rows = posts.result()
+    """
+
+    def __init__(self, transport: Callable[[List[Dict[str, Any]], bool], List[Dict[str, Any]]],
+                 atomic: bool = False, max_batch: int = 500):
+        self._transport = transport
+        self.atomic = atomic
+        self.max_batch = max_batch
+        self._statements: List[Dict[str, Any]] = []
+        self._handles: List[PendingResult] = []
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def _add(self, statement: Dict[str, Any], kind: str) -> PendingResult:
+        handle = PendingResult(self, kind)
+        with self._lock:
+            self._statements.append(statement)
+            self._handles.append(handle)
+            should_flush = len(self._statements) >= self.max_batch
+        if should_flush:
+            self.flush()
+        return handle
+
+    def execute(self, query: str, params: Sequence[Any] = ()) -> PendingResult:
+        """Queue a statement whose rows are not needed"""
+        return self._add({"query": query, "params": list(params)}, "execute")
+
+    def executemany(self, query: str, params_list: Sequence[Sequence[Any]]) -> Optional[PendingResult]:
+        """Queue a statement executed once per parameter set"""
+        if not params_list:
+            return None
+        return self._add({"query": query, "params_list": [list(p) for p in params_list]}, "executemany")
+
+    def fetch_all(self, query: str, params: Sequence[Any] = ()) -> PendingResult:
+        """Queue a query whose rows are returned as a list of dicts"""
+        return self._add({"query": query, "params": list(params)}, "fetch_all")
+
+    def fetch_one(self, query: str, params: Sequence[Any] = ()) -> PendingResult:
+        """Queue a query whose first row is returned as a dict"""
+        return self._add({"query": query, "params": list(params)}, "fetch_one")
+
+    def flush(self) -> int:
+        """Send all queued statements; returns the number of statements sent"""
+        with self._lock:
+            statements, handles = self._statements, self._handles
+            self._statements, self._handles = [], []
+            if not statements:
+                return 0
+
+            try:
+                results = self._transport(statements, self.atomic)
+            except Exception as e:
+                logging.error(f"Database pipeline flush failed ({len(statements)} statements): {e}")
+                results = [{"success": False, "error": str(e)}] * len(statements)
+
+            for handle, raw in zip(handles, results):
+                handle._resolve(raw)
+            for handle in handles[len(results):]:
+                handle._resolve({"success": False, "error": "Missing pipeline result"})
+            return len(statements)
+
+    def __enter__(self) -> "QueryPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            with self._lock:
+                self._statements, self._handles = [], []
+        return False
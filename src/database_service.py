@@ -7,12 +7,13 @@ Avoid multi-process file lock conflicts
 import os
 import sys
 import json
+import queue
 import sqlite3
 import threading
 import time
 from datetime import datetime
 from typing import Dict, Any, List, Optional
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import logging
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -25,6 +26,218 @@ class DateTimeEncoder(json.JSONEncoder):
 # Add src directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from database_pipeline import (
+    JSON_CONTENT_TYPE,
+    MSGPACK_CONTENT_TYPE,
+    decode_payload,
+    encode_payload,
+)
+
+class PooledConnection:
+    """Pooled SQLite connection; close() returns it to the pool instead of closing it"""
+
+    def __init__(self, pool: "SQLiteConnectionPool", conn: sqlite3.Connection, is_writer: bool):
+        self._pool = pool
+        self._conn = conn
+        self.is_writer = is_writer
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Release the connection back to the pool"""
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self)
+
+
+class SQLiteConnectionPool:
+    """
+    Bounded SQLite connection pool for the database service
+
+    One dedicated writer connection serializes all writes; a bounded set of
+    reader connections serves SELECTs concurrently (WAL allows readers to run
+    alongside the writer). Connections are opened once, configured with the
+    service PRAGMAs once, and keep their prepared-statement cache for reuse.
+    """
+
+    def __init__(self, db_path: str, reader_count: int = 8, statement_cache_size: int = 256,
+                 acquire_timeout: float = 60.0):
+        self.db_path = db_path
+        self.reader_count = max(1, reader_count)
+        self.statement_cache_size = statement_cache_size
+        self.acquire_timeout = acquire_timeout
+
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._readers = queue.LifoQueue(maxsize=self.reader_count)
+        self._readers_created = 0
+        self._create_lock = threading.Lock()
+        self._closed = False
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "reader_acquisitions": 0,
+            "writer_acquisitions": 0,
+            "reader_waits": 0,
+            "writer_waits": 0,
+            "total_wait_ms": 0.0,
+            "readers_in_use": 0,
+            "writer_in_use": False,
+        }
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=60.0,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA busy_timeout = 30000")  # 30s busy wait timeout
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        self._record(connections_created=1)
+        return conn
+
+    def _record(self, **deltas):
+        with self._metrics_lock:
+            for key, value in deltas.items():
+                self._metrics[key] += value
+
+    def acquire(self, write: bool = True) -> PooledConnection:
+        """Acquire the writer connection or one of the reader connections"""
+        if self._closed:
+            raise sqlite3.OperationalError("Connection pool is closed")
+        return self._acquire_writer() if write else self._acquire_reader()
+
+    def _acquire_writer(self) -> PooledConnection:
+        started = time.perf_counter()
+        if not self._writer_lock.acquire(blocking=False):
+            self._record(writer_waits=1)
+            if not self._writer_lock.acquire(timeout=self.acquire_timeout):
+                raise sqlite3.OperationalError("database is locked: timed out waiting for writer connection")
+        try:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+        except Exception:
+            self._writer_lock.release()
+            raise
+        with self._metrics_lock:
+            self._metrics["writer_acquisitions"] += 1
+            self._metrics["writer_in_use"] = True
+            self._metrics["total_wait_ms"] += (time.perf_counter() - started) * 1000
+        return PooledConnection(self, self._writer, is_writer=True)
+
+    def _acquire_reader(self) -> PooledConnection:
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._create_lock:
+                if self._readers_created < self.reader_count:
+                    self._readers_created += 1
+                    try:
+                        conn = self._connect(read_only=True)
+                    except Exception:
+                        self._readers_created -= 1
+                        raise
+            if conn is None:
+                self._record(reader_waits=1)
+                try:
+                    conn = self._readers.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("database is locked: timed out waiting for reader connection")
+        with self._metrics_lock:
+            self._metrics["reader_acquisitions"] += 1
+            self._metrics["readers_in_use"] += 1
+            self._metrics["total_wait_ms"] += (time.perf_counter() - started) * 1000
+        return PooledConnection(self, conn, is_writer=False)
+
+    def release(self, pooled: PooledConnection):
+        """Return a connection to the pool, rolling back any unfinished transaction"""
+        conn = pooled._conn
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+
+        if pooled.is_writer:
+            with self._metrics_lock:
+                self._metrics["writer_in_use"] = False
+            if not healthy or self._closed:
+                self._discard(conn)
+                self._writer = None
+            self._writer_lock.release()
+            return
+
+        with self._metrics_lock:
+            self._metrics["readers_in_use"] -= 1
+        if not healthy or self._closed:
+            self._discard(conn)
+            with self._create_lock:
+                self._readers_created -= 1
+            return
+        self._readers.put(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._record(connections_discarded=1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool metrics for the /health endpoint"""
+        with self._metrics_lock:
+            stats = dict(self._metrics)
+        stats["total_wait_ms"] = round(stats["total_wait_ms"], 3)
+        stats["reader_pool_size"] = self.reader_count
+        stats["readers_open"] = self._readers_created
+        stats["readers_idle"] = self._readers.qsize()
+        stats["writer_open"] = self._writer is not None
+        stats["statement_cache_size"] = self.statement_cache_size
+        return stats
+
+    def close(self):
+        """Close all idle connections; busy ones are closed when released"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+            with self._create_lock:
+                self._readers_created -= 1
+        if self._writer_lock.acquire(timeout=5):
+            try:
+                if self._writer is not None:
+                    self._discard(self._writer)
+                    self._writer = None
+            finally:
+                self._writer_lock.release()
+
+
+def is_read_query(query: str) -> bool:
+    """Whether a statement only reads and can run on a reader connection"""
+    query_upper = query.strip().upper()
+    if query_upper.startswith('SELECT') or query_upper.startswith('EXPLAIN'):
+        return True
+    if query_upper.startswith('WITH'):
+        return not any(keyword in query_upper for keyword in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE'))
+    return False
+
+
 class DatabaseService:
     """Database service class"""
     
@@ -65,13 +278,14 @@ class DatabaseService:
             print(f"❌ Log recording failed: {log_error}")
             print(f"❌ Original error: {error_msg}: {str(exception)}")
     
-    def __init__(self, db_path: str = None, port: int = 5000):
+    def __init__(self, db_path: str = None, port: int = 5000, reader_pool_size: int = 8):
         """
         Initialize database service
         
         Args:
             db_path: Database file path
             port: Service port
+            reader_pool_size: Number of pooled reader connections
         """
         self.db_path = db_path or os.path.join(
             os.path.dirname(os.path.dirname(__file__)), 
@@ -82,6 +296,7 @@ class DatabaseService:
         
         # Initialize database connection
         self._init_database()
+        self.pool = SQLiteConnectionPool(self.db_path, reader_count=reader_pool_size)
         
         # Create Flask app
         self.app = Flask(__name__)
@@ -149,25 +364,75 @@ class DatabaseService:
             print(f"❌ Database connection failed: {e}")
             raise
     
-    def _get_connection(self):
-        """Get database connection (thread-safe)"""
-        max_retries = 3
-        retry_delay = 0.1
-        
-        for attempt in range(max_retries):
-            try:
-                conn = sqlite3.connect(self.db_path, timeout=60.0)
-                conn.execute("PRAGMA journal_mode=WAL")
-                conn.execute("PRAGMA synchronous=NORMAL")
-                conn.execute("PRAGMA foreign_keys = ON")
-                conn.execute("PRAGMA busy_timeout = 30000")  # 30s busy wait timeout
-                return conn
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e).lower() and attempt < max_retries - 1:
-                    time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
-                    continue
-                raise
+    def _get_connection(self, write: bool = True):
+        """Get a pooled database connection (thread-safe); close() returns it to the pool"""
+        return self.pool.acquire(write=write)
     
+    @staticmethod
+    def _clean_params(params) -> List[Any]:
+        """Remove extra quotes wrapped around string params (e.g. "'value'")"""
+        cleaned_params = []
+        for param in params:
+            if isinstance(param, str):
+                cleaned_param = param.strip()
+                if (cleaned_param.startswith("'") and cleaned_param.endswith("'")) or \
+                   (cleaned_param.startswith('"') and cleaned_param.endswith('"')):
+                    # Remove surrounding quotes without touching internal quotes
+                    if len(cleaned_param) >= 2:
+                        cleaned_param = cleaned_param[1:-1]
+                cleaned_params.append(cleaned_param)
+            else:
+                cleaned_params.append(param)
+        return cleaned_params
+
+    def _run_pipeline(self, statements: List[Dict[str, Any]], atomic: bool) -> List[Dict[str, Any]]:
+        """
+        Execute a batch of statements on one connection inside one transaction
+
+        In atomic mode the first failure rolls back the whole batch; otherwise
+        failed statements are reported individually and the rest are committed.
+        """
+        write = not all(is_read_query(statement.get('query') or '') and 'params_list' not in statement
+                        for statement in statements)
+        conn = self._get_connection(write=write)
+        try:
+            cursor = conn.cursor()
+            results = []
+            for index, statement in enumerate(statements):
+                query = statement.get('query')
+                try:
+                    if not query:
+                        raise ValueError("Query cannot be empty")
+                    if 'params_list' in statement:
+                        cursor.executemany(query, [self._clean_params(p) for p in statement['params_list']])
+                    else:
+                        cursor.execute(query, self._clean_params(statement.get('params', [])))
+
+                    if cursor.description:
+                        results.append({
+                            "success": True,
+                            "columns": [description[0] for description in cursor.description],
+                            "rows": [list(row) for row in cursor.fetchall()]
+                        })
+                    else:
+                        results.append({
+                            "success": True,
+                            "affected_rows": cursor.rowcount,
+                            "lastrowid": cursor.lastrowid
+                        })
+                except Exception as e:
+                    self._log_error("Pipeline statement failed", e, Index=index, Query=query)
+                    if atomic:
+                        conn.rollback()
+                        raise
+                    results.append({"success": False, "error": str(e), "type": type(e).__name__})
+
+            if write:
+                conn.commit()
+            return results
+        finally:
+            conn.close()
+
     def _setup_routes(self):
         """Set up API routes"""
         
@@ -176,18 +441,22 @@ class DatabaseService:
             """Health check"""
             try:
                 # Test database connection
-                conn = self._get_connection()
-                conn.execute("SELECT 1").fetchone()
-                conn.close()
+                conn = self._get_connection(write=False)
+                try:
+                    conn.execute("SELECT 1").fetchone()
+                finally:
+                    conn.close()
                 return jsonify({
                     "status": "healthy",
                     "database": self.db_path,
+                    "pool": self.pool.stats(),
                     "timestamp": datetime.now().isoformat()
                 })
             except Exception as e:
                 return jsonify({
                     "status": "unhealthy",
                     "error": str(e),
+                    "pool": self.pool.stats(),
                     "timestamp": datetime.now().isoformat()
                 }), 500
         
@@ -204,22 +473,9 @@ class DatabaseService:
                     return jsonify({"error": "Query cannot be empty"}), 400
                 
                 # Clean params: remove extra quotes from string params
-                cleaned_params = []
-                for param in params:
-                    if isinstance(param, str):
-                        # If string is wrapped by extra quotes (e.g. "'value'"), remove them
-                        cleaned_param = param.strip()
-                        if (cleaned_param.startswith("'") and cleaned_param.endswith("'")) or \
-                           (cleaned_param.startswith('"') and cleaned_param.endswith('"')):
-                            # Remove surrounding quotes without touching internal quotes
-                            if len(cleaned_param) >= 2:
-                                cleaned_param = cleaned_param[1:-1]
-                        cleaned_params.append(cleaned_param)
-                    else:
-                        cleaned_params.append(param)
-                params = cleaned_params
+                params = self._clean_params(params)
                 
-                conn = self._get_connection()
+                conn = self._get_connection(write=not is_read_query(query))
                 cursor = conn.cursor()
                 cursor.execute(query, params)
                 
@@ -288,23 +544,7 @@ class DatabaseService:
                     return jsonify({"error": "Params list cannot be empty"}), 400
                 
                 # Clean params list: remove extra quotes from string params
-                cleaned_params_list = []
-                for params in params_list:
-                    cleaned_params = []
-                    for param in params:
-                        if isinstance(param, str):
-                            # If string is wrapped by extra quotes (e.g. "'value'"), remove them
-                            cleaned_param = param.strip()
-                            if (cleaned_param.startswith("'") and cleaned_param.endswith("'")) or \
-                               (cleaned_param.startswith('"') and cleaned_param.endswith('"')):
-                                # Remove surrounding quotes
-                                if len(cleaned_param) >= 2:
-                                    cleaned_param = cleaned_param[1:-1]
-                            cleaned_params.append(cleaned_param)
-                        else:
-                            cleaned_params.append(param)
-                    cleaned_params_list.append(cleaned_params)
-                params_list = cleaned_params_list
+                params_list = [self._clean_params(params) for params in params_list]
                 
                 conn = self._get_connection()
                 cursor = conn.cursor()
@@ -355,6 +595,36 @@ class DatabaseService:
                 if conn:
                     conn.close()
         
+        @self.app.route('/pipeline', methods=['POST'])
+        def execute_pipeline():
+            """Execute a batch of SQL statements in one request"""
+            content_type = request.headers.get('Content-Type', JSON_CONTENT_TYPE)
+            binary = (request.headers.get('Accept') or content_type).startswith(MSGPACK_CONTENT_TYPE)
+
+            def respond(payload, status=200):
+                body, response_type = encode_payload(payload, binary=binary)
+                return Response(body, status=status, content_type=response_type)
+
+            try:
+                data = decode_payload(request.get_data(), content_type)
+                statements = data.get('statements') or []
+                if not statements:
+                    return respond({"success": False, "error": "Statements cannot be empty"}, 400)
+
+                results = self._run_pipeline(statements, bool(data.get('atomic', False)))
+                self._log_success("Pipeline executed successfully", StatementCount=len(statements))
+                return respond({"success": True, "results": results})
+
+            except sqlite3.OperationalError as e:
+                error_msg = str(e)
+                if "database is locked" in error_msg.lower():
+                    error_msg = f"Database is locked, please retry later. Original error: {error_msg}"
+                self._log_error("Pipeline execution failed", e)
+                return respond({"success": False, "error": error_msg, "type": "OperationalError"}, 500)
+            except Exception as e:
+                self._log_error("Pipeline execution failed", e)
+                return respond({"success": False, "error": str(e), "type": type(e).__name__}, 500)
+
         @self.app.route('/posts', methods=['GET'])
         def get_posts():
             """Get post list"""
@@ -363,7 +633,7 @@ class DatabaseService:
                 limit = request.args.get('limit', 10, type=int)
                 offset = request.args.get('offset', 0, type=int)
                 
-                conn = self._get_connection()
+                conn = self._get_connection(write=False)
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT post_id, content, author_id, num_comments, num_likes, num_shares, created_at
@@ -393,11 +663,12 @@ class DatabaseService:
         @self.app.route('/posts/trending', methods=['GET'])
         def get_trending_posts():
             """Get trending posts"""
+            conn = None
             try:
                 min_engagement = request.args.get('min_engagement', 50, type=int)
                 limit = request.args.get('limit', 10, type=int)
                 
-                conn = self._get_connection()
+                conn = self._get_connection(write=False)
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT p.post_id, p.content, p.author_id, p.num_comments, p.num_likes, p.num_shares, p.created_at,
@@ -421,6 +692,9 @@ class DatabaseService:
                 # Log detailed error info
                 self._log_error("Failed to fetch trending posts", e)
                 return jsonify({"error": str(e)}), 500
+            finally:
+                if conn:
+                    conn.close()
         
         @self.app.route('/reset_database', methods=['POST'])
         def reset_database():
@@ -447,21 +721,26 @@ class DatabaseService:
                     cursor = conn.cursor()
 
                     cursor.execute("PRAGMA foreign_keys = OFF")
-                    cursor.execute(
-                        "SELECT name, type FROM sqlite_master "
-                        "WHERE (type='table' OR type='view') AND name NOT LIKE 'sqlite_%'"
-                    )
-                    objects = cursor.fetchall()
-
-                    for name, obj_type in objects:
-                        safe_name = str(name).replace('"', '""')
-                        if obj_type == "view":
-                            cursor.execute(f'DROP VIEW IF EXISTS "{safe_name}"')
-                        else:
-                            cursor.execute(f'DROP TABLE IF EXISTS "{safe_name}"')
-
-                    cursor.execute("PRAGMA foreign_keys = ON")
-                    conn.commit()
+                    try:
+                        cursor.execute(
+                            "SELECT name, type FROM sqlite_master "
+                            "WHERE (type='table' OR type='view') AND name NOT LIKE 'sqlite_%'"
+                        )
+                        objects = cursor.fetchall()
+
+                        for name, obj_type in objects:
+                            safe_name = str(name).replace('"', '""')
+                            if obj_type == "view":
+                                cursor.execute(f'DROP VIEW IF EXISTS "{safe_name}"')
+                            else:
+                                cursor.execute(f'DROP TABLE IF EXISTS "{safe_name}"')
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    finally:
+                        # The pooled connection must never go back without FK enforcement
+                        cursor.execute("PRAGMA foreign_keys = ON")
 
                     return jsonify({
                         "success": True,
@@ -492,8 +771,9 @@ class DatabaseService:
         @self.app.route('/opinion_balance/stats', methods=['GET'])
         def get_opinion_balance_stats():
             """Get opinion balance system stats"""
+            conn = None
             try:
-                conn = self._get_connection()
+                conn = self._get_connection(write=False)
                 cursor = conn.cursor()
                 
                 # Check if tables exist
@@ -546,6 +826,9 @@ class DatabaseService:
                 # Log detailed error info
                 self._log_error("Failed to fetch opinion balance stats", e)
                 return jsonify({"error": str(e)}), 500
+            finally:
+                if conn:
+                    conn.close()
     
     def start(self):
         """Start database service"""
@@ -587,13 +870,13 @@ class DatabaseService:
     def cleanup(self):
         """Clean up resources"""
         self.stop()
-        # Note: using thread-safe connections, no global connection to close
+        self.pool.close()
         print("🧹 Database service cleanup complete")
 
 
-def start_database_service(db_path: str = None, port: int = 5000):
+def start_database_service(db_path: str = None, port: int = 5000, reader_pool_size: int = 8):
     """Start database service"""
-    service = DatabaseService(db_path, port)
+    service = DatabaseService(db_path, port, reader_pool_size)
     service.start()
     return service
 
@@ -604,11 +887,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Database service')
     parser.add_argument('--db', type=str, help='Database file path')
     parser.add_argument('--port', type=int, default=5000, help='Service port')
+    parser.add_argument('--readers', type=int, default=8, help='Number of pooled reader connections')
     
     args = parser.parse_args()
     
     # Start database service
-    service = start_database_service(args.db, args.port)
+    service = start_database_service(args.db, args.port, args.readers)
     
     try:
         print("📊 Database service running... Press Ctrl+C to stop")
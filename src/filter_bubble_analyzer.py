@@ -16,7 +16,8 @@
 """
 
 import sqlite3
-from typing import Dict, List, Optional, Tuple
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from dataclasses import dataclass
 import numpy as np
 import networkx as nx
@@ -139,52 +140,131 @@ class SimpleBubbleIndexCalculator:
             return "severe"
 
 
+class _BubbleNetwork:
+    """一次加载的关注网络与活动数据，供批量计算所有指标"""
+
+    def __init__(self):
+        # follower_id -> 关注的 followed_id 列表（按行，保持原始重复）
+        self.following: Dict[str, List[str]] = defaultdict(list)
+        self.following_sets: Dict[str, Set[str]] = {}
+        self.post_counts: Dict[str, int] = {}
+        self.comment_counts: Dict[str, int] = {}
+        self.timestamps: Dict[str, List] = defaultdict(list)
+        self.total_follows = 0
+
+
 class FilterBubbleAnalyzer:
-    """信息茧房分析器 - 使用多参数优化公式"""
+    """信息茧房分析器 - 使用多参数优化公式
+
+    所有指标由批量引擎 analyze_users 计算：关注网络和活动表各加载一次，
+    同质化、互动倾向性用集合运算，活跃广度、时间集中度用分组统计，
+    网络中心性（PageRank）全网只计算一次。
+    """
+
+    # 用户数不超过该值时用 IN (...) 只取这些用户的活动，否则整表分组
+    _MAX_IN_PARAMS = 500
 
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.calculator = SimpleBubbleIndexCalculator()
-        self._network_cache = None  # 缓存网络结构
+        self._network_cache = None  # 缓存网络结构（PageRank 结果）
 
     def _get_connection(self):
         return sqlite3.connect(self.db_path)
 
     def analyze_user_bubble(self, user_id: str) -> UserBubbleMetrics:
         """分析单个用户的信息茧房指标"""
+        return self.analyze_users([user_id])[user_id]
+
+    def analyze_users(self, user_ids: Iterable[str]) -> Dict[str, UserBubbleMetrics]:
+        """批量计算一组用户的信息茧房指标
+
+        Args:
+            user_ids: 任意用户子集
+
+        Returns:
+            {user_id: UserBubbleMetrics}，顺序与 user_ids 一致
+        """
+        user_ids = list(dict.fromkeys(user_ids))
         conn = self._get_connection()
         cursor = conn.cursor()
 
         try:
-            # 获取关注列表
-            cursor.execute("SELECT followed_id FROM follows WHERE follower_id = ?", (user_id,))
-            following = [row[0] for row in cursor.fetchall()]
-
-            # 计算显示参数
-            homogeneity = self._calculate_homogeneity(cursor, user_id, following)
-            activity_breadth = self._calculate_activity_breadth(cursor, user_id)
-
-            # 计算隐藏参数
-            network_centrality = self._calculate_network_centrality(cursor, user_id)
-            interaction_bias = self._calculate_interaction_bias(cursor, user_id, following)
-            temporal_concentration = self._calculate_temporal_concentration(cursor, user_id)
-
-            # 使用多参数公式计算茧房指数
-            metrics = self.calculator.calculate(
-                homogeneity=homogeneity,
-                activity_breadth=activity_breadth,
-                network_centrality=network_centrality,
-                interaction_bias=interaction_bias,
-                temporal_concentration=temporal_concentration
-            )
+            network = self._load_network(cursor, user_ids)
+            centrality = self._calculate_network_centrality(cursor)
+
+            results = {}
+            for user_id in user_ids:
+                following = network.following.get(user_id, [])
+
+                # 计算显示参数
+                homogeneity = self._calculate_homogeneity(network, following)
+                activity_breadth = self._calculate_activity_breadth(network, user_id)
+
+                # 计算隐藏参数
+                network_centrality = centrality.get(user_id, 0.0) if centrality is not None else 0.5
+                interaction_bias = self._calculate_interaction_bias(network, following)
+                temporal_concentration = self._calculate_temporal_concentration(network.timestamps.get(user_id, []))
+
+                # 使用多参数公式计算茧房指数
+                metrics = self.calculator.calculate(
+                    homogeneity=homogeneity,
+                    activity_breadth=activity_breadth,
+                    network_centrality=network_centrality,
+                    interaction_bias=interaction_bias,
+                    temporal_concentration=temporal_concentration
+                )
+
+                metrics.user_id = user_id
+                results[user_id] = metrics
 
-            metrics.user_id = user_id
-            return metrics
+            return results
 
         finally:
             conn.close()
 
-    def _calculate_homogeneity(self, cursor, user_id: str, following: List[str]) -> float:
+    # ==================== 数据加载 ====================
+
+    def _load_network(self, cursor, user_ids: List[str]) -> _BubbleNetwork:
+        """加载关注网络（整表一次）和目标用户的活动数据（分组查询）"""
+        network = _BubbleNetwork()
+
+        cursor.execute("SELECT follower_id, followed_id FROM follows")
+        for follower_id, followed_id in cursor.fetchall():
+            network.following[follower_id].append(followed_id)
+            network.total_follows += 1
+        network.following_sets = {
+            follower_id: set(followed) for follower_id, followed in network.following.items()
+        }
+
+        targets = set(user_ids)
+        if len(user_ids) <= self._MAX_IN_PARAMS:
+            placeholders = ','.join('?' for _ in user_ids) or 'NULL'
+            where, params = f"WHERE author_id IN ({placeholders})", list(user_ids)
+        else:
+            where, params = "", []
+
+        cursor.execute(f"SELECT author_id, COUNT(*) FROM posts {where} GROUP BY author_id", params)
+        network.post_counts = {user_id: count for user_id, count in cursor.fetchall() if user_id in targets}
+
+        cursor.execute(f"SELECT author_id, COUNT(*) FROM comments {where} GROUP BY author_id", params)
+        network.comment_counts = {user_id: count for user_id, count in cursor.fetchall() if user_id in targets}
+
+        # 所有活动的时间戳
+        cursor.execute(f"""
+            SELECT author_id, created_at FROM posts {where}
+            UNION ALL
+            SELECT author_id, created_at FROM comments {where}
+        """, params + params)
+        for user_id, created_at in cursor.fetchall():
+            if user_id in targets:
+                network.timestamps[user_id].append(created_at)
+
+        return network
+
+    # ==================== 指标计算 ====================
+
+    def _calculate_homogeneity(self, network: _BubbleNetwork, following: List[str]) -> float:
         """
         计算同质化指数：关注的人之间的相似程度
 
@@ -198,15 +278,14 @@ class FilterBubbleAnalyzer:
         if len(following) == 1:
             return 0.3
 
-        # 计算关注人之间的互相关注比例
-        placeholders = ','.join(['?' for _ in following])
-        cursor.execute(f"""
-            SELECT followed_id FROM follows
-            WHERE follower_id IN ({placeholders})
-            AND followed_id IN ({placeholders})
-        """, following + following)
-
-        mutual_follows = len(cursor.fetchall())
+        # 计算关注人之间的互相关注比例（关注的人之间的关注边数）
+        following_set = set(following)
+        mutual_follows = sum(
+            1
+            for member in following_set
+            for followed_id in network.following.get(member, ())
+            if followed_id in following_set
+        )
 
         # 可能的互相关注对数
         possible_pairs = len(following) * (len(following) - 1)
@@ -218,21 +297,16 @@ class FilterBubbleAnalyzer:
         homogeneity = mutual_follows / possible_pairs
         return float(np.clip(homogeneity, 0.0, 1.0))
 
-    def _calculate_activity_breadth(self, cursor, user_id: str) -> float:
+    def _calculate_activity_breadth(self, network: _BubbleNetwork, user_id: str) -> float:
         """
         计算活跃广度：用户在不同类型活动上的参与程度
 
         基于发帖、评论、关注数量综合计算
         """
         # 获取各类活动数量
-        cursor.execute("SELECT COUNT(*) FROM posts WHERE author_id = ?", (user_id,))
-        post_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM comments WHERE author_id = ?", (user_id,))
-        comment_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM follows WHERE follower_id = ?", (user_id,))
-        follow_count = cursor.fetchone()[0]
+        post_count = network.post_counts.get(user_id, 0)
+        comment_count = network.comment_counts.get(user_id, 0)
+        follow_count = len(network.following.get(user_id, ()))
 
         # 计算活动类型的多样性
         activity_types = 0
@@ -256,12 +330,17 @@ class FilterBubbleAnalyzer:
         # 确保最小值不为0
         return float(np.clip(breadth, 0.1, 1.0))
 
-    def _calculate_network_centrality(self, cursor, user_id: str) -> float:
+    def _calculate_network_centrality(self, cursor) -> Optional[Dict[str, float]]:
         """
         计算网络中心性（隐藏参数）：用户在社交网络中的位置
 
-        值越低，说明用户越边缘，越容易茧房化
+        值越低，说明用户越边缘，越容易茧房化。
+        返回 {user_id: 归一化到 [0, 1] 的 PageRank}，同一分析器实例内只计算一次；
+        计算失败时返回 None（所有用户取中等值 0.5）
         """
+        if self._network_cache is not None:
+            return self._network_cache
+
         try:
             import networkx as nx
 
@@ -279,21 +358,22 @@ class FilterBubbleAnalyzer:
             # 计算PageRank中心性
             centrality_dict = nx.pagerank(G, alpha=0.85)
 
-            # 获取当前用户的中心性
-            centrality = centrality_dict.get(user_id, 0.0)
-
             # 归一化到 [0, 1]
             max_centrality = max(centrality_dict.values()) if centrality_dict else 1.0
             if max_centrality > 0:
-                centrality = centrality / max_centrality
+                centrality_dict = {
+                    user_id: float(np.clip(value / max_centrality, 0.0, 1.0))
+                    for user_id, value in centrality_dict.items()
+                }
 
-            return float(np.clip(centrality, 0.0, 1.0))
+            self._network_cache = centrality_dict
+            return centrality_dict
 
         except Exception:
             # 如果计算失败，返回中等值
-            return 0.5
+            return None
 
-    def _calculate_interaction_bias(self, cursor, user_id: str, following: List[str]) -> float:
+    def _calculate_interaction_bias(self, network: _BubbleNetwork, following: List[str]) -> float:
         """
         计算互动倾向性（隐藏参数）：用户与同质人群vs异质人群的互动比例
 
@@ -303,21 +383,18 @@ class FilterBubbleAnalyzer:
             return 0.5
 
         # 获取用户关注的人的关注列表（二级网络）
-        placeholders = ','.join(['?' for _ in following])
-        cursor.execute(f"""
-            SELECT followed_id FROM follows
-            WHERE follower_id IN ({placeholders})
-        """, following)
-
-        friends_of_friends = [row[0] for row in cursor.fetchall()]
+        following_set = set(following)
+        friends_of_friends = set()
+        for member in following_set:
+            friends_of_friends |= network.following_sets.get(member, set())
 
         if len(friends_of_friends) == 0:
             return 0.5
 
         # 计算重合度：用户关注的人之间互相关注的比例
         # 这反映了用户是否处于紧密的圈子中
-        overlap = len(set(friends_of_friends) & set(following))
-        total_unique = len(set(friends_of_friends) | set(following))
+        overlap = len(friends_of_friends & following_set)
+        total_unique = len(friends_of_friends | following_set)
 
         if total_unique == 0:
             return 0.5
@@ -330,22 +407,12 @@ class FilterBubbleAnalyzer:
 
         return float(np.clip(bias, 0.0, 1.0))
 
-    def _calculate_temporal_concentration(self, cursor, user_id: str) -> float:
+    def _calculate_temporal_concentration(self, timestamps: List) -> float:
         """
         计算时间集中度（隐藏参数）：用户活动的时间分布
 
         值越高，说明活动越集中在短期，茧房风险越高
         """
-        # 获取用户所有活动的时间戳
-        cursor.execute("""
-            SELECT created_at FROM posts WHERE author_id = ?
-            UNION ALL
-            SELECT created_at FROM comments WHERE author_id = ?
-            ORDER BY created_at
-        """, (user_id, user_id))
-
-        timestamps = [row[0] for row in cursor.fetchall()]
-
         if len(timestamps) < 2:
             return 0.5
 
@@ -385,20 +452,37 @@ class FilterBubbleAnalyzer:
         except Exception:
             return 0.5
 
-    def get_global_stats(self) -> GlobalBubbleStats:
-        """获取全局信息茧房统计"""
+    # ==================== 汇总 ====================
+
+    def _population(self, cursor, limit: Optional[int] = None) -> List[str]:
+        """默认统计人群：普通用户（按创建时间排序，排除Agent）"""
+        query = """
+            SELECT user_id FROM users
+            WHERE user_id NOT LIKE 'agent%'
+            ORDER BY creation_time
+        """
+        if limit is not None:
+            cursor.execute(query + " LIMIT ?", (int(limit),))
+        else:
+            cursor.execute(query)
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_global_stats(
+        self,
+        user_ids: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> GlobalBubbleStats:
+        """获取全局信息茧房统计
+
+        Args:
+            user_ids: 统计的用户子集（默认所有普通用户）
+            limit: 默认人群时只取按创建时间排序的前 limit 个
+        """
         conn = self._get_connection()
         cursor = conn.cursor()
 
         try:
-            # 只获取前20个初始普通用户（按创建时间排序，排除Agent和后来添加的角色用户）
-            cursor.execute("""
-                SELECT user_id FROM users
-                WHERE user_id NOT LIKE 'agent%'
-                ORDER BY creation_time
-                LIMIT 20
-            """)
-            all_users = [row[0] for row in cursor.fetchall()]
+            all_users = list(user_ids) if user_ids is not None else self._population(cursor, limit)
 
             if not all_users:
                 return GlobalBubbleStats(
@@ -411,29 +495,16 @@ class FilterBubbleAnalyzer:
                     network_density=0.0
                 )
 
-            # 计算每个用户的指标
-            homogeneity_list = []
-            echo_index_list = []
-            severe_count = 0
-            moderate_count = 0
-            mild_count = 0
-
-            for user_id in all_users:
-                metrics = self.analyze_user_bubble(user_id)
-                homogeneity_list.append(metrics.homogeneity_index)
-                echo_index_list.append(metrics.echo_chamber_index)
-
-                if metrics.bubble_severity == "severe":
-                    severe_count += 1
-                elif metrics.bubble_severity == "moderate":
-                    moderate_count += 1
-                elif metrics.bubble_severity == "mild":
-                    mild_count += 1
+            # 批量计算每个用户的指标
+            all_metrics = self.analyze_users(all_users)
+            homogeneity_list = [m.homogeneity_index for m in all_metrics.values()]
+            echo_index_list = [m.echo_chamber_index for m in all_metrics.values()]
+            severities = [m.bubble_severity for m in all_metrics.values()]
 
             # 计算网络密度
             cursor.execute("SELECT COUNT(*) FROM follows")
             total_follows = cursor.fetchone()[0]
-            total_users = len(all_users)
+            total_users = len(all_metrics)
             possible_connections = total_users * (total_users - 1)
             network_density = total_follows / possible_connections if possible_connections > 0 else 0.0
 
@@ -441,31 +512,27 @@ class FilterBubbleAnalyzer:
                 total_users=total_users,
                 avg_homogeneity=np.mean(homogeneity_list),
                 avg_echo_index=np.mean(echo_index_list),
-                severe_bubble_users=severe_count,
-                moderate_bubble_users=moderate_count,
-                mild_bubble_users=mild_count,
+                severe_bubble_users=severities.count("severe"),
+                moderate_bubble_users=severities.count("moderate"),
+                mild_bubble_users=severities.count("mild"),
                 network_density=network_density
             )
 
         finally:
             conn.close()
 
-    def get_all_user_metrics(self) -> List[UserBubbleMetrics]:
-        """获取所有用户的指标"""
+    def get_all_user_metrics(
+        self,
+        user_ids: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> List[UserBubbleMetrics]:
+        """获取用户的指标（默认所有普通用户，可指定子集或数量上限）"""
         conn = self._get_connection()
         cursor = conn.cursor()
 
         try:
-            # 只获取前20个初始普通用户（按创建时间排序）
-            cursor.execute("""
-                SELECT user_id FROM users
-                WHERE user_id NOT LIKE 'agent%'
-                ORDER BY creation_time
-                LIMIT 20
-            """)
-            all_users = [row[0] for row in cursor.fetchall()]
-
-            return [self.analyze_user_bubble(user_id) for user_id in all_users]
-
+            all_users = list(user_ids) if user_ids is not None else self._population(cursor, limit)
         finally:
             conn.close()
+
+        return list(self.analyze_users(all_users).values())
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Pluggable inference backends for the shared LLM clients.
+
+By default requests go to the remote OpenAI-compatible API. A local backend
+answers the same requests in-process instead: the HTTP transport of every
+client handed out by llm_client_registry routes /chat/completions and
+/embeddings to the backend and returns OpenAI-shaped JSON. Because the contract
+is the HTTP API itself, Utils.generate_llm_response, the gateway, structured
+parsing (response_model) and JSON mode all work unchanged, without network.
+
+Backends (`inference_backend` config section or LLM_BACKEND):
+- "remote":       the configured API (default)
+- "stub":         deterministic rule-based responses driven by persona fields and
+                  the feed; fills any response_model schema with valid values
+- "transformers": a small local causal LM for free text (e.g. distilgpt2);
+                  structured outputs use the stub's schema filler with model text
+"""
+
+from __future__ import annotations
+
+import ast
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import httpx
+
+try:
+    from transformers import pipeline as hf_pipeline
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+BACKEND_REMOTE = "remote"
+BACKEND_STUB = "stub"
+BACKEND_TRANSFORMERS = "transformers"
+
+_SCHEMA_MARKER = "according to this schema:\n"
+_ID_PATTERNS = {
+    "post": re.compile(r"post_id:\s*([\w-]+)"),
+    "comment": re.compile(r"comment_id:\s*([\w-]+)"),
+    "note": re.compile(r"note_id:\s*([\w-]+)"),
+    "user": re.compile(r"by User\s+([\w-]+)"),
+}
+_POST_LINE = re.compile(r"post_id:\s*([\w-]+)\s*\|\s*content:\s*(.+)")
+_STOPWORDS = {
+    "about", "after", "again", "their", "there", "these", "those", "which", "while", "would", "could",
+    "should", "where", "being", "other", "every", "still", "because", "through", "people", "really",
+}
+
+# Base action weights for feed reactions; persona tone shifts them
+_ACTION_WEIGHTS = {
+    "like-post": 4.0, "comment-post": 2.0, "share-post": 1.0, "like-comment": 1.0,
+    "follow-user": 0.5, "ignore": 1.0,
+}
+# Optional FeedAction fields and the actions that use them
+_ACTION_FIELDS = {
+    "target": {"like-post", "share-post", "flag-post", "follow-user", "unfollow-user", "comment-post",
+               "like-comment", "add-note", "rate-note"},
+    "content": {"comment-post", "add-note"},
+    "note_rating": {"rate-note"},
+}
+_TONE_OPENERS = {
+    "positive": ["Really glad to see this.", "This is encouraging.", "Love seeing this kind of thing."],
+    "negative": ["I'm not convinced by this.", "Something about this doesn't add up.", "I have serious doubts here."],
+    "neutral": ["Interesting point.", "Worth thinking about.", "Hard to say without more details."],
+}
+_TONE_CLOSERS = {
+    "positive": ["Hope more people notice.", "Keep it coming.", "Good news for everyone."],
+    "negative": ["We need better sources.", "Let's be careful before sharing.", "Who benefits from this?"],
+    "neutral": ["Curious what others think.", "Let's see how it develops.", "Would like to read more."],
+}
+
+
+@dataclass
+class InferenceBackendConfig:
+    type: str = BACKEND_REMOTE
+    # transformers: local model name or path
+    model_path: Optional[str] = "distilgpt2"
+    max_new_tokens: int = 64
+    # Must match the embedding model used by persisted indexes (text-embedding-3-large: 3072)
+    embedding_dim: int = 3072
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "InferenceBackendConfig":
+        known = {f.name for f in fields(cls)}
+        config = cls(**{k: v for k, v in (data or {}).items() if k in known})
+        config.type = os.environ.get("LLM_BACKEND", config.type or BACKEND_REMOTE).strip().lower()
+        return config
+
+
+class InferenceBackend:
+    """Backend interface: OpenAI-compatible request payload in, response JSON out."""
+
+    name = BACKEND_REMOTE
+    # Local backends answer requests in-process; remote ones go over HTTP
+    local = False
+    # Blocking backends are run off the event loop for async clients
+    blocking = False
+
+    @property
+    def cache_tag(self) -> str:
+        """What the response cache keys this backend's answers by."""
+        return self.name
+
+    def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def embed(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class RemoteBackend(InferenceBackend):
+    """Requests go to the configured API (the transport passes them through)."""
+
+
+class StubBackend(InferenceBackend):
+    """
+    Deterministic rule-based backend.
+
+    Responses are seeded from the request (model, messages, temperature), so the
+    same request always yields the same answer. Persona fields in the system
+    prompt pick the tone; ids in the feed give valid action targets.
+    """
+
+    name = BACKEND_STUB
+    local = True
+
+    def __init__(self, config: Optional[InferenceBackendConfig] = None):
+        self.config = config or InferenceBackendConfig(type=BACKEND_STUB)
+        self.requests = 0
+
+    # ========== API ==========
+
+    def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self.requests += 1
+        messages = payload.get("messages") or []
+        rng = random.Random(self._seed(payload))
+        context = _PromptContext(messages)
+
+        schema = self._requested_schema(payload, context.user_text)
+        if schema is not None:
+            filler = _SchemaFiller(schema, rng, context, self.generate_text)
+            content = json.dumps(filler.fill(), ensure_ascii=False)
+        else:
+            content = self._free_text(rng, context)
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-local-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", self.name),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def embed(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = payload.get("input")
+        texts = [inputs] if isinstance(inputs, str) else list(inputs or [])
+        dim = int(payload.get("dimensions") or self.config.embedding_dim)
+        data = []
+        for index, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(str(text).encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            # The SDK asks for base64 unless the caller picked an encoding
+            if payload.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(str(text)) for text in texts) // 4
+        return {
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", self.name),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    # ========== generation ==========
+
+    def generate_text(self, rng: random.Random, context: "_PromptContext", about: Optional[str] = None) -> str:
+        """A short persona-toned sentence, optionally about a piece of feed content."""
+        tone = context.tone
+        keyword = _keyword(about or context.topic_text, rng)
+        middle = f"The part about {keyword} stands out to me." if keyword else ""
+        return " ".join(p for p in (rng.choice(_TONE_OPENERS[tone]), middle, rng.choice(_TONE_CLOSERS[tone])) if p)
+
+    def _free_text(self, rng: random.Random, context: "_PromptContext") -> str:
+        text = context.user_text
+        if re.search(r"single number|between 0(\.0)? and 1(\.0)?", text, re.IGNORECASE):
+            return f"{rng.uniform(0.4, 0.9):.2f}"
+
+        keys = re.search(r"JSON with keys? ((?:'[\w-]+'(?:,\s*|\s+and\s+)?)+)", text)
+        if keys:
+            return json.dumps({key: self.generate_text(rng, context) for key in re.findall(r"'([\w-]+)'", keys.group(1))})
+
+        count = re.search(r"list of (\d+) strings", text)
+        if count:
+            return json.dumps([self.generate_text(rng, context) for _ in range(int(count.group(1)))])
+
+        return self.generate_text(rng, context)
+
+    @staticmethod
+    def _requested_schema(payload: Dict[str, Any], user_text: str) -> Optional[Dict[str, Any]]:
+        response_format = payload.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            return (response_format.get("json_schema") or {}).get("schema") or {}
+        if response_format.get("type") == "json_object":
+            # Utils embeds the pydantic schema (as a Python literal) in the prompt for JSON mode
+            start = user_text.rfind(_SCHEMA_MARKER)
+            if start != -1:
+                literal = user_text[start + len(_SCHEMA_MARKER):].split("\n\n", 1)[0]
+                try:
+                    return ast.literal_eval(literal)
+                except (ValueError, SyntaxError):
+                    pass
+            return {"type": "object", "properties": {}}
+        return None
+
+    @staticmethod
+    def _seed(payload: Dict[str, Any]) -> int:
+        key = json.dumps([payload.get("model"), payload.get("messages"), payload.get("temperature")],
+                         sort_keys=True, ensure_ascii=False, default=str)
+        return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "little")
+
+
+class TransformersBackend(StubBackend):
+    """Small local causal LM for free text; structured outputs reuse the stub's schema filler."""
+
+    name = BACKEND_TRANSFORMERS
+    blocking = True
+
+    def __init__(self, config: Optional[InferenceBackendConfig] = None):
+        super().__init__(config)
+        if not TRANSFORMERS_AVAILABLE:
+            raise ImportError("transformers is not installed; use the 'stub' backend or install transformers")
+        self._generator = hf_pipeline("text-generation", model=self.config.model_path, device=-1)
+        self._lock = threading.Lock()
+
+    @property
+    def cache_tag(self) -> str:
+        return f"{self.name}:{self.config.model_path}"
+
+    def generate_text(self, rng: random.Random, context: "_PromptContext", about: Optional[str] = None) -> str:
+        prompt = (about or context.user_text)[-1000:]
+        with self._lock:
+            output = self._generator(
+                prompt,
+                max_new_tokens=self.config.max_new_tokens,
+                do_sample=True,
+                return_full_text=False,
+                pad_token_id=self._generator.tokenizer.eos_token_id,
+            )
+        text = " ".join(output[0]["generated_text"].split())
+        return text or super().generate_text(rng, context, about)
+
+
+class _PromptContext:
+    """What the stub knows about a request: persona tone and the ids visible in the prompt."""
+
+    def __init__(self, messages: List[Dict[str, Any]]):
+        self.system_text = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+        self.user_text = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") != "system")
+        self.ids = {kind: list(dict.fromkeys(pattern.findall(self.user_text))) for kind, pattern in _ID_PATTERNS.items()}
+        self.post_content = {pid: content.strip() for pid, content in _POST_LINE.findall(self.user_text)}
+        # Text to draw topics from: the feed if there is one, otherwise the prompt minus format instructions
+        self.topic_text = " ".join(self.post_content.values()) or " ".join(
+            sentence for sentence in re.split(r"(?<=[.!?])\s+|\n", self.user_text.split(_SCHEMA_MARKER)[0])
+            if "JSON" not in sentence
+        )
+        self.persona = self._parse_persona(self.system_text + "\n" + self.user_text)
+        self.tone = self._tone(self.persona, self.system_text)
+
+    @staticmethod
+    def _parse_persona(text: str) -> Dict[str, Any]:
+        marker = text.find("YOUR PERSONA:")
+        if marker == -1:
+            return {}
+        start = text.find("{", marker)
+        try:
+            persona, _ = json.JSONDecoder().raw_decode(text[start:])
+            return persona if isinstance(persona, dict) else {}
+        except (json.JSONDecodeError, ValueError):
+            return {}
+
+    @staticmethod
+    def _tone(persona: Dict[str, Any], system_text: str) -> str:
+        descriptors = " ".join(
+            str(persona.get(key, "")) for key in ("type", "personality_traits", "communication_style", "background")
+        ).lower() or system_text.lower()[:2000]
+        if any(word in descriptors for word in ("negative", "skeptic", "cynical", "critical", "distrust", "angry")):
+            return "negative"
+        if any(word in descriptors for word in ("positive", "optimis", "cheerful", "enthusias", "friendly", "supportive")):
+            return "positive"
+        return "neutral"
+
+    def action_weights(self) -> Dict[str, float]:
+        weights = dict(_ACTION_WEIGHTS)
+        if self.tone == "negative":
+            weights["comment-post"] *= 1.5
+            weights["share-post"] *= 0.5
+        elif self.tone == "positive":
+            weights["like-post"] *= 1.5
+            weights["share-post"] *= 1.5
+        traits = str(self.persona.get("personality_traits", "")).lower()
+        if any(word in traits for word in ("introvert", "reserved", "quiet", "shy")):
+            weights["ignore"] *= 3.0
+        if any(word in traits for word in ("extrovert", "outgoing", "social", "active")):
+            weights["comment-post"] *= 1.5
+        # Actions without anything to act on are never chosen
+        if not self.ids["post"]:
+            for action in ("like-post", "comment-post", "share-post"):
+                weights[action] = 0.0
+        if not self.ids["comment"]:
+            weights["like-comment"] = 0.0
+        if not self.ids["user"]:
+            weights["follow-user"] = 0.0
+        return weights
+
+
+class _SchemaFiller:
+    """Builds a value that validates against a JSON schema (pydantic model_json_schema / strict schemas)."""
+
+    def __init__(self, schema: Dict[str, Any], rng: random.Random, context: _PromptContext,
+                 text_fn: Callable[..., str]):
+        self.schema = schema
+        self.defs = {**schema.get("definitions", {}), **schema.get("$defs", {})}
+        self.rng = rng
+        self.context = context
+        self.text_fn = text_fn
+
+    def fill(self) -> Any:
+        return self._fill(self.schema, None, {})
+
+    def _resolve(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        while "$ref" in schema:
+            schema = self.defs.get(schema["$ref"].split("/")[-1], {})
+        return schema
+
+    def _fill(self, schema: Dict[str, Any], name: Optional[str], parent: Dict[str, Any]) -> Any:
+        schema = self._resolve(schema)
+        if "const" in schema:
+            return schema["const"]
+        options = schema.get("anyOf") or schema.get("oneOf")
+        if options:
+            non_null = [o for o in options if self._resolve(o).get("type") != "null"]
+            if len(non_null) < len(options) and self._unused_field(name, parent):
+                return None
+            return self._fill(non_null[0] if non_null else options[0], name, parent)
+        if "allOf" in schema:
+            return self._fill(schema["allOf"][0], name, parent)
+        if "enum" in schema:
+            return self._choose_enum(schema["enum"], name)
+
+        kind = schema.get("type")
+        if isinstance(kind, list):
+            kind = next((k for k in kind if k != "null"), "null")
+        if kind == "object" or "properties" in schema:
+            result: Dict[str, Any] = {}
+            for prop, prop_schema in schema.get("properties", {}).items():
+                result[prop] = self._fill(prop_schema, prop, result)
+            return result
+        if kind == "array":
+            low = schema.get("minItems", 1)
+            high = max(low, min(schema.get("maxItems", 3), 3))
+            return [self._fill(schema.get("items", {}), name, {}) for _ in range(self.rng.randint(low, high))]
+        if kind == "string":
+            return self._string(name, parent)
+        if kind == "integer":
+            return self.rng.randint(int(schema.get("minimum", 0)), int(schema.get("maximum", 10)))
+        if kind == "number":
+            return round(self.rng.uniform(float(schema.get("minimum", 0.0)), float(schema.get("maximum", 1.0))), 3)
+        if kind == "boolean":
+            return self.rng.random() < 0.5
+        return None
+
+    @staticmethod
+    def _unused_field(name: Optional[str], parent: Dict[str, Any]) -> bool:
+        """Optional action fields that the chosen action does not use stay null."""
+        action = parent.get("action")
+        if action is None or name not in _ACTION_FIELDS:
+            return False
+        return action not in _ACTION_FIELDS[name]
+
+    def _choose_enum(self, values: List[Any], name: Optional[str]) -> Any:
+        if name == "action":
+            weights = self.context.action_weights()
+            candidates = [v for v in values if weights.get(v, 0.0) > 0]
+            if candidates:
+                return self.rng.choices(candidates, weights=[weights[v] for v in candidates])[0]
+        if name in ("stance", "sentiment") and self.context.tone in values:
+            return self.context.tone
+        return self.rng.choice(values)
+
+    def _string(self, name: Optional[str], parent: Dict[str, Any]) -> str:
+        ids = self.context.ids
+        action = parent.get("action", "")
+        if name == "target":
+            if action == "like-comment":
+                pool = ids["comment"]
+            elif action.endswith("-user"):
+                pool = ids["user"]
+            elif action == "rate-note":
+                pool = ids["note"]
+            else:
+                pool = ids["post"]
+            return self.rng.choice(pool) if pool else ""
+        if name in ("post_id", "comment_id", "user_id", "note_id"):
+            pool = ids[name.split("_")[0]]
+            return self.rng.choice(pool) if pool else ""
+        about = self.context.post_content.get(parent.get("target") or "") if action else None
+        return self.text_fn(self.rng, self.context, about)
+
+
+def _keyword(text: str, rng: random.Random) -> str:
+    words = [w.strip(".,!?\"'()[]:;").lower() for w in text.split()]
+    words = [w for w in words if len(w) > 4 and w.isalpha() and w not in _STOPWORDS]
+    return rng.choice(words[:200]) if words else ""
+
+
+class LocalBackendTransport(httpx.BaseTransport):
+    """Sync transport that serves requests from the active local backend, else passes them on."""
+
+    def __init__(self, inner: httpx.BaseTransport):
+        self.inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        backend = get_inference_backend()
+        if not backend.local:
+            return self.inner.handle_request(request)
+        return _local_response(backend, request)
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncLocalBackendTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of LocalBackendTransport."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        backend = get_inference_backend()
+        if not backend.local:
+            return await self.inner.handle_async_request(request)
+        if backend.blocking:
+            return await asyncio.to_thread(_local_response, backend, request)
+        return _local_response(backend, request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def _local_response(backend: InferenceBackend, request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    try:
+        payload = json.loads(request.content or b"{}")
+        if path.endswith("/chat/completions"):
+            return httpx.Response(200, json=backend.chat(payload), request=request)
+        if path.endswith("/embeddings"):
+            return httpx.Response(200, json=backend.embed(payload), request=request)
+    except Exception as e:
+        logging.error(f"❌ Local backend {backend.name} failed on {path}: {e}")
+        return httpx.Response(500, json={"error": {"message": str(e), "type": "local_backend_error"}}, request=request)
+    return httpx.Response(
+        404, json={"error": {"message": f"{path} is not served by the {backend.name} backend"}}, request=request
+    )
+
+
+def create_backend(config: InferenceBackendConfig) -> InferenceBackend:
+    if config.type == BACKEND_STUB:
+        return StubBackend(config)
+    if config.type == BACKEND_TRANSFORMERS:
+        return TransformersBackend(config)
+    if config.type != BACKEND_REMOTE:
+        logging.warning(f"⚠️ Unknown inference backend {config.type!r}, using the remote API")
+    return RemoteBackend()
+
+
+_backend: Optional[InferenceBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_inference_backend() -> InferenceBackend:
+    """Get the active backend (configured from LLM_BACKEND until configure_inference_backend)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(InferenceBackendConfig.from_dict(None))
+    return _backend
+
+
+def configure_inference_backend(config: Optional[Dict[str, Any]]) -> InferenceBackend:
+    """Apply the `inference_backend` config section and return the active backend."""
+    global _backend
+    backend = create_backend(InferenceBackendConfig.from_dict(config))
+    with _backend_lock:
+        _backend = backend
+    if backend.local:
+        logging.info(f"🧪 Inference backend: {backend.name} (in-process, no network)")
+    return backend
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk cache for LLM responses.
+
+The cache sits in the HTTP transport of the shared clients handed out by
+llm_client_registry, so every chat completion (plain, JSON mode or structured
+parse) and embedding request is covered without touching call sites.
+
+Entries are keyed by a hash of the request body (model, messages, temperature,
+response_format schema, ...) and stored in SQLite with TTL and size eviction.
+
+Modes:
+- "off":    pass-through
+- "cache":  serve hits, record misses
+- "replay": serve hits only; a miss raises LLMReplayMissError instead of calling
+            the model, so a recorded simulation can be re-run at full speed
+
+Requests sampled above `deterministic_max_temperature` are not deduplicated:
+the n-th identical request of a run maps to the n-th recorded response, so
+repeated creative prompts keep their variety.
+
+Replay only hits when a run sends the same prompts as the recorded one. Prompts
+embed sampled users and feeds, randomly chosen models and generated ids, so
+set `seed` (LLM_CACHE_SEED) for both the recording and the replay: Simulation
+then seeds `random`, `numpy` and Utils.generate_formatted_id before agents are
+built. Replay remains best-effort: wall-clock timestamps, string hashing (set
+PYTHONHASHSEED as well) and the completion order of concurrent requests can
+still change a prompt or its occurrence slot, and such a request misses.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+try:
+    from openai import OpenAIError as _SDKError
+except ImportError:
+    _SDKError = Exception
+
+try:
+    from inference_backends import get_inference_backend
+except ImportError:
+    from src.inference_backends import get_inference_backend
+
+MODE_OFF = "off"
+MODE_CACHE = "cache"
+MODE_REPLAY = "replay"
+MODES = (MODE_OFF, MODE_CACHE, MODE_REPLAY)
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "llm", "responses.sqlite"
+)
+
+# Endpoints whose responses are a pure function of the request body
+_CACHEABLE_ENDPOINTS = ("/chat/completions", "/embeddings")
+# Body fields that do not change the answer
+_IGNORED_FIELDS = ("stream_options", "user", "metadata")
+# Eviction runs once per this many writes
+_PRUNE_EVERY = 500
+
+
+class LLMReplayMissError(_SDKError, RuntimeError):
+    """
+    Raised in replay mode when a request has no recorded response.
+
+    It derives from the SDK's base error so recent OpenAI clients propagate it
+    from the transport as-is; older ones wrap it in APIConnectionError (see
+    replay_miss_from). Replay clients are built without retries either way.
+    """
+
+
+def replay_miss_from(error: BaseException) -> Optional[LLMReplayMissError]:
+    """The replay miss behind an SDK error (e.g. APIConnectionError), if any."""
+    while error is not None:
+        if isinstance(error, LLMReplayMissError):
+            return error
+        error = error.__cause__ or error.__context__
+    return None
+
+
+@dataclass
+class LLMCacheConfig:
+    """`llm_cache` config section (LLM_CACHE_MODE / LLM_CACHE_PATH / LLM_CACHE_SEED override it)."""
+
+    mode: str = MODE_OFF
+    path: Optional[str] = None
+    ttl_days: Optional[float] = 30.0
+    max_entries: Optional[int] = 200000
+    deterministic_max_temperature: float = 0.2
+    # Seed for the simulation's RNGs and ids while the cache is on (None: unseeded)
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "LLMCacheConfig":
+        known = {f.name for f in fields(cls)}
+        config = cls(**{k: v for k, v in (data or {}).items() if k in known})
+        config.mode = os.environ.get("LLM_CACHE_MODE", config.mode or MODE_OFF).strip().lower()
+        config.path = os.environ.get("LLM_CACHE_PATH", config.path)
+        seed = os.environ.get("LLM_CACHE_SEED", config.seed)
+        config.seed = int(seed) if seed not in (None, "") else None
+        if config.mode not in MODES:
+            logging.warning(f"⚠️ Unknown llm_cache mode {config.mode!r}, cache disabled")
+            config.mode = MODE_OFF
+        return config
+
+
+class LLMResponseCache:
+    """SQLite-backed response store shared by all clients of the process."""
+
+    def __init__(self, config: Optional[LLMCacheConfig] = None):
+        self.config = config or LLMCacheConfig()
+        self.path = self.config.path or DEFAULT_CACHE_PATH
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # Occurrence counters for sampled (non-deterministic) requests
+        self._occurrences: Dict[str, int] = defaultdict(int)
+        self._writes = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "replay_misses": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.mode != MODE_OFF
+
+    @property
+    def replay(self) -> bool:
+        return self.config.mode == MODE_REPLAY
+
+    # ========== storage ==========
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    model TEXT,
+                    status INTEGER NOT NULL,
+                    content_type TEXT,
+                    body BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _slot_key(self, digest: str, sampled: bool) -> str:
+        return f"{digest}:{self._occurrences[digest]}" if sampled else digest
+
+    def lookup(self, digest: str, sampled: bool = False) -> Optional[Tuple[int, str, bytes]]:
+        """Return (status, content_type, body) for a request digest, or None."""
+        with self._lock:
+            conn = self._connection()
+            key = self._slot_key(digest, sampled)
+            row = conn.execute(
+                "SELECT status, content_type, body, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            status, content_type, body, created_at = row
+            # Expired entries are still replayed; they only stop serving live runs
+            if not self.replay and self._expired(created_at):
+                return None
+            conn.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            conn.commit()
+            if sampled:
+                self._occurrences[digest] += 1
+        return status, content_type, bytes(body)
+
+    def store(self, digest: str, sampled: bool, endpoint: str, model: Optional[str],
+              status: int, content_type: str, body: bytes):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, model, status, content_type, body, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._slot_key(digest, sampled), endpoint, model, status, content_type, sqlite3.Binary(body), now, now),
+            )
+            conn.commit()
+            if sampled:
+                self._occurrences[digest] += 1
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 1:
+                self._prune(conn)
+
+    def _expired(self, created_at: float) -> bool:
+        ttl_days = self.config.ttl_days
+        return bool(ttl_days) and created_at < time.time() - ttl_days * 86400
+
+    def _prune(self, conn: sqlite3.Connection):
+        """Drop expired entries, then the least recently used ones above max_entries."""
+        removed = 0
+        if self.config.ttl_days:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.config.ttl_days * 86400,)
+            ).rowcount
+        if self.config.max_entries:
+            count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            overflow = count - int(self.config.max_entries)
+            if overflow > 0:
+                removed += conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+        conn.commit()
+        if removed:
+            logging.info(f"🧹 LLM cache evicted {removed} entries")
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+            self._occurrences.clear()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ========== keys ==========
+
+    def request_digest(self, endpoint: str, payload: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Content hash of a request and whether it is sampled.
+
+        Sampled requests are stored per occurrence: the n-th identical request of a
+        run reads and writes slot n (slots only advance on a hit or a stored response,
+        so failed attempts and retries do not shift the sequence).
+
+        Answers of an in-process backend are keyed by its cache tag as well, so they never
+        replay as (or get replaced by) provider responses for the same request.
+        """
+        canonical = {k: v for k, v in payload.items() if k not in _IGNORED_FIELDS}
+        key = [endpoint, canonical]
+        backend = get_inference_backend()
+        if backend.local:
+            key.append(backend.cache_tag)
+        digest = hashlib.sha256(
+            json.dumps(key, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        ).hexdigest()
+        sampled = not endpoint.endswith("/embeddings") and not self._deterministic(payload)
+        return digest, sampled
+
+    def _deterministic(self, payload: Dict[str, Any]) -> bool:
+        temperature = payload.get("temperature", 1.0)
+        try:
+            return float(temperature) <= self.config.deterministic_max_temperature
+        except (TypeError, ValueError):
+            return False
+
+    # ========== transport hooks ==========
+
+    def match(self, request: httpx.Request) -> Optional[Tuple[str, bool, str, Dict[str, Any]]]:
+        """Return (digest, sampled, endpoint, payload) if the request is cacheable."""
+        if not self.enabled or request.method != "POST":
+            return None
+        endpoint = next((e for e in _CACHEABLE_ENDPOINTS if request.url.path.endswith(e)), None)
+        if endpoint is None:
+            return None
+        try:
+            payload = json.loads(request.content or b"{}")
+        except (ValueError, httpx.RequestNotRead):
+            return None
+        if not isinstance(payload, dict) or payload.get("stream"):
+            return None
+        return (*self.request_digest(endpoint, payload), endpoint, payload)
+
+    def cached_response(self, request: httpx.Request, digest: str, sampled: bool) -> Optional[httpx.Response]:
+        hit = self.lookup(digest, sampled)
+        if hit is None:
+            self.stats["misses"] += 1
+            if self.replay:
+                self.stats["replay_misses"] += 1
+                raise LLMReplayMissError(
+                    f"LLM replay: no recorded response for {request.url.path} ({digest[:16]}…)"
+                )
+            return None
+        self.stats["hits"] += 1
+        status, content_type, body = hit
+        return httpx.Response(
+            status,
+            headers={"content-type": content_type or "application/json", "x-llm-cache": "hit"},
+            content=body,
+            request=request,
+        )
+
+    def record(self, digest: str, sampled: bool, endpoint: str, payload: Dict[str, Any], response: httpx.Response):
+        if response.status_code != 200:
+            return
+        try:
+            self.store(digest, sampled, endpoint, payload.get("model"), response.status_code,
+                       response.headers.get("content-type", "application/json"), response.content)
+            self.stats["stores"] += 1
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ LLM cache write failed: {e}")
+
+    def summary(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "mode": self.config.mode,
+            "path": self.path,
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+class CachingTransport(httpx.BaseTransport):
+    """Sync httpx transport that answers cacheable requests from the response cache."""
+
+    def __init__(self, inner: httpx.BaseTransport):
+        self.inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        cache = get_llm_cache()
+        matched = cache.match(request)
+        if matched is None:
+            return self.inner.handle_request(request)
+        digest, sampled, endpoint, payload = matched
+        cached = cache.cached_response(request, digest, sampled)
+        if cached is not None:
+            return cached
+        response = self.inner.handle_request(request)
+        response.read()
+        cache.record(digest, sampled, endpoint, payload, response)
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncCachingTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of CachingTransport (SQLite lookups and writes run in a worker thread)."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        cache = get_llm_cache()
+        matched = cache.match(request)
+        if matched is None:
+            return await self.inner.handle_async_request(request)
+        digest, sampled, endpoint, payload = matched
+        cached = await asyncio.to_thread(cache.cached_response, request, digest, sampled)
+        if cached is not None:
+            return cached
+        response = await self.inner.handle_async_request(request)
+        await response.aread()
+        await asyncio.to_thread(cache.record, digest, sampled, endpoint, payload, response)
+        return response
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Get the process-wide response cache (configured from the environment until configure_llm_cache)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache(LLMCacheConfig.from_dict(None))
+    return _cache
+
+
+def configure_llm_cache(config: Optional[Dict[str, Any]]) -> LLMResponseCache:
+    """Apply the `llm_cache` config section and return the process-wide cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = LLMResponseCache(LLMCacheConfig.from_dict(config))
+    if _cache.enabled:
+        logging.info(f"💾 LLM response cache: mode={_cache.config.mode}, path={_cache.path}")
+    return _cache
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Process-wide registry of long-lived OpenAI clients.
+
+Clients are keyed by (base_url, api_key, role). Every caller with the same key
+gets the same OpenAI / AsyncOpenAI instance backed by one shared httpx keep-alive
+pool, so TLS/TCP connections are reused across the thousands of LLM calls per
+run instead of a new pool (and its file descriptors) being created per call.
+The pools' transports also serve the on-disk response cache (llm_cache) and
+route requests to an in-process backend when one is active (inference_backends).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+try:
+    from inference_backends import AsyncLocalBackendTransport, LocalBackendTransport, get_inference_backend
+    from llm_cache import AsyncCachingTransport, CachingTransport, get_llm_cache
+except ImportError:
+    from src.inference_backends import AsyncLocalBackendTransport, LocalBackendTransport, get_inference_backend
+    from src.llm_cache import AsyncCachingTransport, CachingTransport, get_llm_cache
+
+ClientKey = Tuple[str, str, str]
+
+DEFAULT_TIMEOUT = 120
+DEFAULT_MAX_RETRIES = 1
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_MAX_KEEPALIVE = 32
+
+
+@dataclass
+class _ClientEntry:
+    key: ClientKey
+    http_client: httpx.Client
+    client: OpenAI
+    created_at: float = field(default_factory=time.time)
+    handouts: int = 0
+
+
+@dataclass
+class _AsyncClientEntry:
+    key: ClientKey
+    http_client: httpx.AsyncClient
+    client: AsyncOpenAI
+    loop: asyncio.AbstractEventLoop
+    created_at: float = field(default_factory=time.time)
+    handouts: int = 0
+
+
+def _pool_connection_count(http_client: Any) -> Optional[int]:
+    """Best-effort number of pooled connections (httpcore internals, may change)."""
+    transport = getattr(http_client, "_transport", None)
+    while hasattr(transport, "inner"):  # unwrap the response cache / local backend
+        transport = transport.inner
+    pool = getattr(transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return len(connections) if connections is not None else None
+
+
+def _close_orphaned_pool(http_client: Any) -> int:
+    """
+    Close the sockets of an async pool whose event loop is already closed.
+
+    aclose() cannot run once the loop is gone, so the pooled connections are
+    shut at the socket level instead (httpcore internals, best effort).
+    Returns the number of sockets closed.
+    """
+    transport = getattr(http_client, "_transport", None)
+    while hasattr(transport, "inner"):
+        transport = transport.inner
+    pool = getattr(transport, "_pool", None)
+    closed = 0
+    for connection in list(getattr(pool, "connections", None) or []):
+        stream = getattr(getattr(connection, "_connection", None), "_network_stream", None)
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        # asyncio hands out a TransportSocket view whose close() is a no-op; close the real socket
+        sock = getattr(sock, "_sock", sock)
+        if sock is not None and sock.fileno() != -1:
+            sock.close()
+            closed += 1
+    return closed
+
+
+class LLMClientRegistry:
+    """Hands out shared sync and async OpenAI clients per (base_url, api_key, role)."""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS, max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._clients: Dict[ClientKey, _ClientEntry] = {}
+        # Async clients are bound to the event loop that created their connections
+        self._async_clients: Dict[Tuple[ClientKey, int], _AsyncClientEntry] = {}
+        # id(sync client) -> key, so the async twin of a handed-out client can be found
+        self._client_keys: Dict[int, ClientKey] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(base_url: Optional[str], api_key: str, role: str = "regular") -> ClientKey:
+        if not api_key and get_inference_backend().local:
+            api_key = "local"  # the SDK insists on a key; local backends never send it anywhere
+        return (str(base_url or ""), api_key or "", role or "regular")
+
+    def _client_retries(self) -> int:
+        # A replay miss is deterministic; retrying it only delays the error
+        return 0 if get_llm_cache().replay else self.max_retries
+
+    # ========== sync ==========
+
+    def get_http_client(self, base_url: Optional[str], api_key: str, role: str = "regular") -> httpx.Client:
+        """Shared httpx pool for a key (for SDKs that accept an http_client, e.g. LangChain)."""
+        return self._sync_entry(self.make_key(base_url, api_key, role)).http_client
+
+    def get_client(self, base_url: Optional[str], api_key: str, role: str = "regular") -> OpenAI:
+        """Long-lived OpenAI client for a key."""
+        entry = self._sync_entry(self.make_key(base_url, api_key, role))
+        entry.handouts += 1
+        return entry.client
+
+    def _sync_entry(self, key: ClientKey) -> _ClientEntry:
+        entry = self._clients.get(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                base_url, api_key, _ = key
+                http_client = httpx.Client(
+                    timeout=self.timeout,
+                    transport=CachingTransport(LocalBackendTransport(httpx.HTTPTransport(limits=self.limits))),
+                )
+                client_kwargs = dict(
+                    api_key=api_key,
+                    timeout=self.timeout,
+                    max_retries=self._client_retries(),
+                    http_client=http_client,
+                )
+                if base_url:  # otherwise the SDK uses https://api.openai.com/v1
+                    client_kwargs["base_url"] = base_url
+                entry = _ClientEntry(key=key, http_client=http_client, client=OpenAI(**client_kwargs))
+                self._clients[key] = entry
+                self._client_keys[id(entry.client)] = key
+        return entry
+
+    # ========== async ==========
+
+    def get_async_client(self, base_url: Optional[str], api_key: str, role: str = "regular") -> AsyncOpenAI:
+        """Long-lived AsyncOpenAI client for a key on the running event loop."""
+        return self._async_entry(self.make_key(base_url, api_key, role)).client
+
+    def async_client_for(self, client: Any) -> AsyncOpenAI:
+        """AsyncOpenAI twin of a sync client (same endpoint, key and role pool)."""
+        if isinstance(client, AsyncOpenAI):
+            return client
+        key = self._client_keys.get(id(client))
+        if key is None:
+            key = self.make_key(str(client.base_url), client.api_key, "external")
+        return self._async_entry(key).client
+
+    def _async_entry(self, key: ClientKey) -> _AsyncClientEntry:
+        loop = asyncio.get_running_loop()
+        slot = (key, id(loop))
+        entry = self._async_clients.get(slot)
+        if entry is None or entry.loop is not loop:
+            with self._lock:
+                # Drop clients whose loop has been closed (e.g. a previous asyncio.run)
+                self._discard_closed_loops()
+                base_url, api_key, _ = key
+                http_client = httpx.AsyncClient(
+                    timeout=self.timeout,
+                    transport=AsyncCachingTransport(
+                        AsyncLocalBackendTransport(httpx.AsyncHTTPTransport(limits=self.limits))
+                    ),
+                )
+                client_kwargs = dict(
+                    api_key=api_key,
+                    timeout=self.timeout,
+                    max_retries=self._client_retries(),
+                    http_client=http_client,
+                )
+                if base_url:
+                    client_kwargs["base_url"] = base_url
+                entry = _AsyncClientEntry(key=key, http_client=http_client,
+                                          client=AsyncOpenAI(**client_kwargs), loop=loop)
+                self._async_clients[slot] = entry
+        entry.handouts += 1
+        return entry
+
+    # ========== lifecycle ==========
+
+    def _discard_closed_loops(self):
+        """Remove (and close the pools of) async clients whose loop has been closed; caller holds the lock."""
+        for slot in [s for s, e in self._async_clients.items() if e.loop.is_closed()]:
+            entry = self._async_clients.pop(slot)
+            try:
+                _close_orphaned_pool(entry.http_client)
+            except Exception as e:
+                logging.debug(f"Closing orphaned async pool for {entry.key[0] or 'default'} failed: {e}")
+
+    def close(self):
+        """Close all sync pools and the async pools left behind by closed loops (live ones are closed by aclose)."""
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+            self._client_keys.clear()
+            self._discard_closed_loops()
+        for entry in entries:
+            try:
+                entry.http_client.close()
+            except Exception as e:
+                logging.debug(f"Closing HTTP pool for {entry.key[0] or 'default'} failed: {e}")
+
+    async def aclose(self):
+        """
+        Close the async pools created on the running loop.
+
+        Sync pools are shared by long-lived clients outside the loop (and by
+        later runs in the same process); they are closed by the atexit hook.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = [slot for slot, entry in self._async_clients.items() if entry.loop is loop]
+            entries = [self._async_clients.pop(slot) for slot in slots]
+        for entry in entries:
+            try:
+                await entry.http_client.aclose()
+            except Exception as e:
+                logging.debug(f"Closing async HTTP pool for {entry.key[0] or 'default'} failed: {e}")
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Per-pool statistics (api keys are not included)."""
+        def describe(entry, kind: str) -> Dict[str, Any]:
+            base_url, _, role = entry.key
+            return {
+                "kind": kind,
+                "base_url": base_url or "default",
+                "role": role,
+                "handouts": entry.handouts,
+                "pooled_connections": _pool_connection_count(entry.http_client),
+                "age_seconds": round(time.time() - entry.created_at, 1),
+            }
+
+        pools = [describe(entry, "sync") for entry in self._clients.values()]
+        pools += [describe(entry, "async") for entry in self._async_clients.values()]
+        return {
+            "sync_clients": len(self._clients),
+            "async_clients": len(self._async_clients),
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "pools": pools,
+        }
+
+
+_registry: Optional[LLMClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> LLMClientRegistry:
+    """Get the process-wide client registry (sync pools are closed at exit)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LLMClientRegistry()
+                atexit.register(_registry.close)
+    return _registry
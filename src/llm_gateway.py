@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Asyncio-native LLM gateway.
+
+Every LLM request from agents, malicious bots, the coordination system and
+moderation is admitted through one gateway that enforces per-model limits:
+- token buckets for requests/minute and tokens/minute
+- a bounded number of in-flight requests per model
+- priority classes (moderation before coordination before agent chatter)
+- fair queuing between callers within the same priority class
+
+Waiting happens with asyncio.sleep on the event loop instead of time.sleep in
+worker threads, so throughput is bounded by the configured limits rather than
+by the default thread pool. Synchronous call sites share the same buckets via
+chat_completion_blocking.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from openai import AsyncOpenAI, OpenAI
+
+try:
+    from inference_backends import get_inference_backend
+    from llm_cache import get_llm_cache, replay_miss_from
+    from llm_client_registry import get_client_registry
+except ImportError:
+    from src.inference_backends import get_inference_backend
+    from src.llm_cache import get_llm_cache, replay_miss_from
+    from src.llm_client_registry import get_client_registry
+
+# Priority classes (lower value is served first)
+PRIORITY_MODERATION = 0
+PRIORITY_COORDINATION = 1
+PRIORITY_AGENT = 2
+
+# Output budget assumed for token accounting when a request sets no max_tokens
+_DEFAULT_COMPLETION_TOKENS = 512
+
+
+@dataclass
+class ModelLimits:
+    """Per-model admission limits (None disables a limit)."""
+
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    # In-flight requests per model (counted per event loop)
+    max_concurrency: int = 32
+    # Seconds the model is paused for after the provider answers 429
+    rate_limit_cooldown: float = 5.0
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], base: Optional["ModelLimits"] = None) -> "ModelLimits":
+        values = dict(vars(base)) if base else {}
+        known = {f.name for f in fields(cls)}
+        values.update({k: v for k, v in (data or {}).items() if k in known})
+        return cls(**values)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket based on reservations.
+
+    reserve() always succeeds immediately and returns how long the caller must
+    wait before using the reservation; the bucket may go into debt, so requests
+    larger than the burst capacity are still admitted at the configured rate.
+    """
+
+    def __init__(self, rate_per_minute: Optional[float], burst_seconds: float = 10.0):
+        self.rate = rate_per_minute / 60.0 if rate_per_minute else None
+        self.capacity = max(1.0, self.rate * burst_seconds) if self.rate else 0.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens; returns the delay in seconds before they are available."""
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, delta: float):
+        """Charge (positive) or refund (negative) tokens after the actual cost is known."""
+        if self.rate is None or not delta:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+    def penalize(self, seconds: float):
+        """Push the bucket into debt so that nothing is admitted for `seconds`."""
+        if self.rate is None:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class _ModelLane:
+    """Admission queue for one model on one event loop."""
+
+    def __init__(self, gateway: "LLMGateway", model: str):
+        self.gateway = gateway
+        self.model = model
+        self.in_flight = 0
+        self._heap: List[Tuple[int, float, int, asyncio.Future, float]] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._caller_tags: Dict[Any, float] = {}
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: int, caller: Any, cost: float):
+        """Wait until the request is admitted (caller must call release())."""
+        # Start-time fair queuing: a caller's next request is tagged after its previous one,
+        # so a chatty caller cannot starve others in the same priority class
+        if caller is None:
+            tag = self._virtual_time + 1.0
+        else:
+            tag = max(self._virtual_time, self._caller_tags.get(caller, 0.0)) + 1.0
+            self._caller_tags[caller] = tag
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, tag, next(self._seq), future, cost))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Admitted just before the cancellation arrived: give the slot back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        limits = self.gateway.limits_for(self.model)
+        while True:
+            while not self._heap or self.in_flight >= limits.max_concurrency:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                limits = self.gateway.limits_for(self.model)
+
+            _, tag, _, future, cost = heapq.heappop(self._heap)
+            if future.done():  # waiter was cancelled
+                continue
+            self._virtual_time = tag
+            if not self._heap:
+                self._caller_tags.clear()
+
+            delay = self.gateway.reserve(self.model, cost)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+
+class LLMGateway:
+    """Shared admission control for all LLM calls."""
+
+    def __init__(self, default_limits: Optional[ModelLimits] = None,
+                 model_limits: Optional[Dict[str, ModelLimits]] = None):
+        self.default_limits = default_limits or ModelLimits()
+        self.model_limits: Dict[str, ModelLimits] = dict(model_limits or {})
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        # Lanes (queues, events, in-flight counts) belong to one event loop; buckets are shared.
+        # Worker-thread loops (e.g. comment regeneration) get their own lanes instead of
+        # replacing the main loop's.
+        self._lanes: Dict[asyncio.AbstractEventLoop, Dict[str, _ModelLane]] = {}
+        self._lock = threading.Lock()
+
+    # ========== configuration ==========
+
+    def configure(self, config: Optional[Dict[str, Any]]):
+        """
+        Apply limits from the `llm_gateway` config section:
+
+            {"default": {"requests_per_minute": 600, "max_concurrency": 64},
+             "models": {"deepseek-chat": {"requests_per_minute": 120, "tokens_per_minute": 200000}}}
+        """
+        if not config:
+            return
+        with self._lock:
+            self.default_limits = ModelLimits.from_dict(config.get("default"), self.default_limits)
+            self.model_limits = {
+                model: ModelLimits.from_dict(values, self.default_limits)
+                for model, values in (config.get("models") or {}).items()
+            }
+            # Buckets are rebuilt lazily with the new rates
+            self._buckets.clear()
+            loop_lanes = [(loop, list(lanes.values())) for loop, lanes in self._lanes.items()]
+        for loop, lanes in loop_lanes:
+            for lane in lanes:
+                try:
+                    loop.call_soon_threadsafe(lane._wakeup.set)
+                except RuntimeError:  # loop already closed
+                    break
+
+    def limits_for(self, model: str) -> ModelLimits:
+        return self.model_limits.get(model, self.default_limits)
+
+    def _model_buckets(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            with self._lock:
+                buckets = self._buckets.get(model)
+                if buckets is None:
+                    limits = self.limits_for(model)
+                    buckets = (TokenBucket(limits.requests_per_minute), TokenBucket(limits.tokens_per_minute))
+                    self._buckets[model] = buckets
+        return buckets
+
+    # ========== admission ==========
+
+    def reserve(self, model: str, cost: float = 0.0) -> float:
+        """Reserve one request and `cost` tokens for `model`; returns the required delay."""
+        if get_llm_cache().replay or get_inference_backend().local:  # nothing reaches a provider
+            return 0.0
+        requests, tokens = self._model_buckets(model)
+        return max(requests.reserve(1.0), tokens.reserve(cost))
+
+    def reserve_blocking(self, model: str, cost: float = 0.0):
+        """Reserve capacity from a synchronous call site, sleeping the calling thread if needed."""
+        delay = self.reserve(model, cost)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _lane(self, model: str) -> _ModelLane:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            lanes = self._lanes.get(loop)
+            if lanes is None:
+                # Drop lanes of loops that have been closed (e.g. a previous asyncio.run)
+                for stale in [other for other in self._lanes if other.is_closed()]:
+                    del self._lanes[stale]
+                lanes = self._lanes[loop] = {}
+            lane = lanes.get(model)
+            if lane is None:
+                lane = lanes[model] = _ModelLane(self, model)
+        return lane
+
+    @staticmethod
+    def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> float:
+        """Rough prompt + completion token estimate used for tokens/minute accounting."""
+        prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+        return prompt_chars / 4.0 + (max_tokens or _DEFAULT_COMPLETION_TOKENS)
+
+    def _settle(self, model: str, estimated: float, completion: Any):
+        """Correct the tokens/minute bucket with the usage reported by the provider."""
+        usage = getattr(completion, "usage", None)
+        total = getattr(usage, "total_tokens", None) if usage is not None else None
+        if total:
+            self._model_buckets(model)[1].adjust(total - estimated)
+
+    def _on_error(self, model: str, error: Exception):
+        miss = replay_miss_from(error)
+        if miss is not None and miss is not error:
+            raise miss from None  # report the replay miss, not the SDK's connection error
+        status = getattr(error, "status_code", None)
+        if status == 429 or "429" in str(error) or "rate_limit" in str(error).lower():
+            cooldown = self.limits_for(model).rate_limit_cooldown
+            self._model_buckets(model)[0].penalize(cooldown)
+            logging.warning(f"⏳ Model {model} rate limited; pausing admissions for {cooldown:.1f}s")
+
+    # ========== clients ==========
+
+    def async_client(self, client: Any) -> AsyncOpenAI:
+        """Return the shared AsyncOpenAI twin of `client` (same endpoint, key and role pool)."""
+        return get_client_registry().async_client_for(client)
+
+    # ========== requests ==========
+
+    async def chat_completion(self, client: Any, *, model: str, messages: List[Dict[str, Any]],
+                              priority: int = PRIORITY_AGENT, caller: Any = None,
+                              parse: bool = False, **kwargs) -> Any:
+        """
+        Issue a chat completion through the gateway.
+
+        Args:
+            client: OpenAI or AsyncOpenAI client (its endpoint and key are reused)
+            model: model name
+            messages: chat messages
+            priority: PRIORITY_* class
+            caller: fairness key (e.g. user id); None for no per-caller fairness
+            parse: use structured-output parsing (response_format is a pydantic model)
+            **kwargs: forwarded to the OpenAI API
+
+        Returns:
+            The completion object
+        """
+        estimated = self.estimate_tokens(messages, kwargs.get("max_tokens"))
+        lane = self._lane(model)
+        await lane.acquire(priority, caller, estimated)
+        try:
+            completions = self.async_client(client).chat.completions
+            if parse:
+                completion = await completions.parse(model=model, messages=messages, **kwargs)
+            else:
+                completion = await completions.create(model=model, messages=messages, **kwargs)
+        except Exception as e:
+            self._on_error(model, e)
+            raise
+        finally:
+            lane.release()
+        self._settle(model, estimated, completion)
+        return completion
+
+    def chat_completion_blocking(self, client: OpenAI, *, model: str, messages: List[Dict[str, Any]],
+                                 priority: int = PRIORITY_MODERATION, **kwargs) -> Any:
+        """
+        Synchronous variant for call sites that cannot await (shares the same buckets).
+
+        Reservations are taken immediately, so synchronous callers are effectively
+        served ahead of queued asynchronous requests; `priority` is kept for symmetry.
+        """
+        estimated = self.estimate_tokens(messages, kwargs.get("max_tokens"))
+        self.reserve_blocking(model, estimated)
+        try:
+            completion = client.chat.completions.create(model=model, messages=messages, **kwargs)
+        except Exception as e:
+            self._on_error(model, e)
+            raise
+        self._settle(model, estimated, completion)
+        return completion
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Get the process-wide LLM gateway."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
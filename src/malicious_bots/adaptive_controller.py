@@ -33,11 +33,12 @@ AdaptiveController — 根据平台审核压力自动调整恶意水军攻击策
     HIGH   (> 0.20)      : 策略切换 + 规避提示词 + 集群缩减 50% + LLM 定期反思
 """
 
-import asyncio
 import logging
 from enum import Enum
 from typing import Dict, Optional, Any
 
+from llm_gateway import PRIORITY_AGENT, get_llm_gateway
+
 logger = logging.getLogger(__name__)
 
 
@@ -392,16 +393,15 @@ class AdaptiveController:
         )
 
         try:
-            def _sync_call():
-                client, model_name = self.model_selector.create_openai_client(role="malicious")
-                response = client.chat.completions.create(
-                    model=model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=300,
-                )
-                return response.choices[0].message.content.strip()
-
-            reflection = await asyncio.to_thread(_sync_call)
+            client, model_name = self.model_selector.create_openai_client(role="malicious")
+            response = await get_llm_gateway().chat_completion(
+                client,
+                priority=PRIORITY_AGENT,
+                model=model_name,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=300,
+            )
+            reflection = response.choices[0].message.content.strip()
             if reflection:
                 AdaptiveController._shared_reflection = reflection
                 logger.info(
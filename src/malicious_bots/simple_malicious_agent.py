@@ -12,6 +12,7 @@ from datetime import datetime
 from dataclasses import dataclass, field
 
 from multi_model_selector import MultiModelSelector
+from llm_gateway import PRIORITY_AGENT, get_llm_gateway
 
 logger = logging.getLogger(__name__)
 
@@ -835,9 +836,9 @@ Response:"""
         """
         persona = agent["persona"]
         try:
-            # Use asyncio.to_thread to run the synchronous LLM call and grab model info
-            content, model_used = await asyncio.to_thread(
-                self._sync_llm_call_with_model_info, persona, target_content, role_overlay
+            # Issue the LLM call through the async gateway and grab model info
+            content, model_used = await self._async_llm_call_with_model_info(
+                persona, target_content, role_overlay
             )
 
             if content and len(content.strip()) > 3:
@@ -978,6 +979,30 @@ Response:"""
                 pass
             return ""
 
+    @staticmethod
+    def _tidy_generated_comment(content: str) -> str:
+        """Trim an over-long generated comment at a sentence boundary and clean its formatting."""
+        # Ensure content completeness; truncate only when excessively long
+        words = content.split()
+
+        # If the content exceeds 50 words, truncate at a reasonable sentence boundary
+        if len(words) > 50:
+            # Look for a sentence end between word positions 30 and 45
+            for i in range(min(45, len(words)), min(30, len(words)) - 1, -1):
+                if words[i-1].endswith(('.', '!', '?')):
+                    content = ' '.join(words[:i])
+                    break
+            else:
+                # If no suitable boundary is found, cut to 40 words and add a period
+                content = ' '.join(words[:40])
+                if not content.endswith(('.', '!', '?')):
+                    content += '.'
+
+        # Clean formatting while maintaining natural expression
+        content = content.replace('"', '').replace(''', '').replace(''', '')
+        content = content.replace('*', '').replace('—', '-')
+        return content
+
     def _sync_llm_call_with_model_info(self, persona: MaliciousPersona, target_content: str, role_overlay=None) -> tuple[str, str]:
         """Synchronous LLM call that returns both content and model name.
 
@@ -1012,25 +1037,68 @@ Response:"""
             content = response.choices[0].message.content.strip() if response and response.choices else ""
 
             if content:
-                # Ensure content completeness; truncate only when excessively long
-                words = content.split()
+                content = self._tidy_generated_comment(content)
 
-                # If the content exceeds 50 words, truncate at a reasonable sentence boundary
-                if len(words) > 50:
-                    # Look for a sentence end between word positions 30 and 45
-                    for i in range(min(45, len(words)), min(30, len(words)) - 1, -1):
-                        if words[i-1].endswith(('.', '!', '?')):
-                            content = ' '.join(words[:i])
-                            break
-                    else:
-                        # If no suitable boundary is found, cut to 40 words and add a period
-                        content = ' '.join(words[:40])
-                        if not content.endswith(('.', '!', '?')):
-                            content += '.'
+                # Record successful usage
+                try:
+                    self.model_selector.record_usage(model_name, success=True)
+                except:
+                    pass
 
-                # Clean formatting while maintaining natural expression
-                content = content.replace('"', '').replace(''', '').replace(''', '')
-                content = content.replace('*', '').replace('—', '-')
+                return content, model_name
+            else:
+                logger.warning(f"⚠️ Persona {persona.name} LLM returned an empty response")
+                return "", "unknown"
+
+        except Exception as e:
+            logger.warning(f"⚠️ Persona {persona.name} LLM call exception: {str(e)[:50]}")
+            try:
+                self.model_selector.record_usage(model_name if 'model_name' in locals() else "unknown", success=False)
+            except:
+                pass
+            return "", "unknown"
+
+    async def _async_llm_call_with_model_info(self, persona: MaliciousPersona, target_content: str, role_overlay=None) -> tuple[str, str]:
+        """LLM call through the async gateway that returns both content and model name.
+
+        Args:
+            role_overlay: 可选的 RoleOverlay 实例，若提供则传入提示词构建函数以替换战术段落。
+        """
+        try:
+            # Obtain the model client
+            client, model_name = self.model_selector.create_openai_client(role="malicious")
+
+            # Dynamically craft the prompt（支持战术角色覆盖）
+            prompt = self._build_malicious_comment_prompt(persona, target_content, role_overlay)
+
+            # Call the LLM directly with parameters tuned for complete generation
+            try:
+                response = await get_llm_gateway().chat_completion(
+                    client,
+                    priority=PRIORITY_AGENT,
+                    caller=persona.persona_id,
+                    model=model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=100
+                )
+            except Exception as e:
+                # If the call fails, retry with more conservative parameters
+                if "max_tokens" in str(e).lower():
+                    response = await get_llm_gateway().chat_completion(
+                        client,
+                        priority=PRIORITY_AGENT,
+                        caller=persona.persona_id,
+                        model=model_name,
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=60
+                    )
+                else:
+                    raise e
+
+            content = response.choices[0].message.content.strip() if response and response.choices else ""
+
+            if content:
+                content = self._tidy_generated_comment(content)
 
                 # Record successful usage
                 try:
@@ -4,7 +4,7 @@ LLM 审核提供者
 使用与仿真主体相同的 LLM 端点（Gemini via OpenAI-compatible proxy）
 进行语义级内容审核，能够识别仇恨言论、暴力内容等关键词无法覆盖的内容。
 
-通过 multi_model_selector 统一管理 LLM 客户端（与其他 Agent 共享 API 配置和限速）。
+通过 multi_model_selector 统一管理 LLM 客户端，请求经 llm_gateway 限速（与其他 Agent 共享 API 配置和限速）。
 """
 
 import json
@@ -73,9 +73,13 @@ class LLMProvider:
         """调用 LLM 获取审核结果（通过 multi_model_selector 统一管理客户端）"""
         try:
             from multi_model_selector import multi_model_selector
+            from llm_gateway import PRIORITY_MODERATION, get_llm_gateway
             client, model_name = multi_model_selector.create_openai_client(role="moderation")
             logger.info(f"[LLM_CALL] Calling model={model_name} for content length={len(content)}")
-            response = client.chat.completions.create(
+            # 审核请求走网关的最高优先级，与其他 Agent 共享同一组限速令牌桶
+            response = get_llm_gateway().chat_completion_blocking(
+                client,
+                priority=PRIORITY_MODERATION,
                 model=model_name,
                 messages=[
                     {"role": "system", "content": _SYSTEM_PROMPT},
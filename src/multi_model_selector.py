@@ -12,7 +12,8 @@ import time
 import asyncio
 from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
 from openai import OpenAI
-import httpx
+from inference_backends import InferenceBackend, configure_inference_backend, get_inference_backend
+from llm_client_registry import get_client_registry
 from keys import OPENAI_API_KEY, OPENAI_BASE_URL, EMBEDDING_API_KEY, EMBEDDING_BASE_URL
 
 if TYPE_CHECKING:
@@ -79,60 +80,22 @@ class MultiModelSelector:
             "timeout": 120,  # Increased timeout to match utils.py
             "max_retries": 1,  # Fewer retries to fail fast into fallback
             "retry_delay": 2,  # Retry delay
-            "connection_pool_size": 20,  # Increased connection pool size to handle concurrent requests
-            "max_keepalive_connections": 10  # Increased keep-alive count
         }
 
-        # New: request pacing control matching utils.py
-        self.last_request_time = {model: 0 for model in self.ALL_MODELS}
-        # Extended intervals to address persistent API errors
-        self.min_request_interval = {
-            "deepseek-chat": 10.0,    # DeepSeek can be rate-limited on some gateways
-            "gemini-2.0-flash": 8.0,  # Gemini interval 8 seconds (increased)
-            "gpt-4.1-nano": 6.0,      # GPT interval 6 seconds
-            "default": 8.0            # Others 8 seconds (increased)
-        }
-        self.request_lock = {model: False for model in self.ALL_MODELS}  # Add per-model lock
-
-        # New: connection pool management
-        self._http_client = None
-        
-    def _wait_for_request_interval(self, model: str):
-        """等待请求间隔，避免过于频繁的请求"""
-        # check模型是否被锁定
-        max_wait_attempts = 10
-        wait_attempts = 0
-
-        while self.request_lock.get(model, False) and wait_attempts < max_wait_attempts:
-            time.sleep(0.1)
-            wait_attempts += 1
-
-        # 锁定模型
-        self.request_lock[model] = True
-
-        try:
-            current_time = time.time()
-            last_request = self.last_request_time.get(model, 0)
-            time_since_last = current_time - last_request
+        # Shared long-lived clients and keep-alive pools (one per base_url/api_key/role)
+        self.client_registry = get_client_registry()
 
-            # 根据failed次数dynamicadjust间隔
-            failure_count = self.failure_stats.get(model, 0)
-            # get模型特定的间隔时间
-            base_interval = self.min_request_interval.get(model, self.min_request_interval["default"])
-            dynamic_interval = base_interval
+    @property
+    def inference_backend(self) -> InferenceBackend:
+        """Backend that serves this selector's clients (remote API, or an in-process stub/local model)."""
+        return get_inference_backend()
 
-            if failure_count >= 3:
-                dynamic_interval = base_interval * (1 + failure_count * 0.5)
-
-            if time_since_last < dynamic_interval:
-                wait_time = dynamic_interval - time_since_last
-                if wait_time > 0.1:  # 只有等待时间超过0.1秒才等待
-                    time.sleep(wait_time)
-
-            self.last_request_time[model] = time.time()
-        finally:
-            # 释放锁
-            self.request_lock[model] = False
+    def configure_inference_backend(self, config: Optional[Dict[str, Any]]) -> InferenceBackend:
+        """
+        Switch every client handed out by the selector to another backend, e.g.
+        {"type": "stub"} for network-free load tests. Existing clients follow the switch.
+        """
+        return configure_inference_backend(config)
 
     @staticmethod
     def _normalize_role(role: Optional[str]) -> str:
@@ -300,31 +263,11 @@ class MultiModelSelector:
         return selected
 
     def create_openai_client(self, model_name: str = None, role: str = "regular") -> Tuple[OpenAI, str]:
-        """createoptimize的OpenAIclient"""
+        """获取共享连接池的OpenAI client（按角色复用，不再每次新建）"""
         if model_name is None:
             model_name = self.select_random_model(role=role)
 
-        # 请求间隔控制
-        self._wait_for_request_interval(model_name)
-
-        # createoptimize的HTTPclient
-        http_client = httpx.Client(
-            timeout=self.request_config["timeout"],
-            limits=httpx.Limits(
-                max_connections=self.request_config["connection_pool_size"],
-                max_keepalive_connections=self.request_config["max_keepalive_connections"]
-            )
-        )
-
-        client_kwargs = dict(
-            api_key=OPENAI_API_KEY,
-            timeout=self.request_config["timeout"],
-            http_client=http_client,
-        )
-        if OPENAI_BASE_URL:  # only set if non-empty, otherwise SDK uses https://api.openai.com/v1
-            client_kwargs["base_url"] = OPENAI_BASE_URL
-        client = OpenAI(**client_kwargs)
-
+        client = self.client_registry.get_client(OPENAI_BASE_URL, OPENAI_API_KEY, role=self._normalize_role(role))
         return client, model_name
 
     def create_openai_client_with_base_url(
@@ -334,28 +277,11 @@ class MultiModelSelector:
         model_name: str = None,
         role: str = "regular",
     ) -> Tuple[OpenAI, str]:
-        """Create OpenAI client with a custom base_url (e.g., local/ollama)."""
+        """Get a shared OpenAI client for a custom base_url (e.g., local/ollama)."""
         if model_name is None:
             model_name = self.select_random_model(role=role)
 
-        # 请求间隔控制
-        self._wait_for_request_interval(model_name)
-
-        http_client = httpx.Client(
-            timeout=self.request_config["timeout"],
-            limits=httpx.Limits(
-                max_connections=self.request_config["connection_pool_size"],
-                max_keepalive_connections=self.request_config["max_keepalive_connections"]
-            )
-        )
-
-        client = OpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            timeout=self.request_config["timeout"],
-            http_client=http_client
-        )
-
+        client = self.client_registry.get_client(base_url, api_key, role=self._normalize_role(role))
         return client, model_name
 
     def create_embedding_client(self, model_name: str = None) -> Tuple[OpenAI, str]:
@@ -381,9 +307,6 @@ class MultiModelSelector:
         if model_name is None:
             model_name = self.select_random_model(role=role)
 
-        # 请求间隔控制
-        self._wait_for_request_interval(model_name)
-
         # getsecure的模型configure（避免不支持的parameter）
         model_config = self.get_safe_model_config(model_name)
 
@@ -391,13 +314,9 @@ class MultiModelSelector:
         final_config = model_config.copy()
         final_config.update(kwargs)
 
-        # createoptimize的HTTPclient
-        http_client = httpx.Client(
-            timeout=self.request_config["timeout"],
-            limits=httpx.Limits(
-                max_connections=self.request_config["connection_pool_size"],
-                max_keepalive_connections=self.request_config["max_keepalive_connections"]
-            )
+        # 复用共享的HTTP连接池
+        http_client = self.client_registry.get_http_client(
+            OPENAI_BASE_URL, OPENAI_API_KEY, role=self._normalize_role(role)
         )
 
         client = ChatOpenAI(
@@ -519,7 +438,8 @@ class MultiModelSelector:
             "model_success_rates": {
                 model: (self.usage_stats[model] - self.failure_stats[model]) / max(self.usage_stats[model], 1)
                 for model in self.AVAILABLE_MODELS
-            }
+            },
+            "client_pools": self.client_registry.pool_stats(),
         }
     
     def print_stats(self):
@@ -535,6 +455,11 @@ class MultiModelSelector:
             failures = stats['model_failures'][model]
             success_rate = stats['model_success_rates'][model]
             print(f"   {model}: {usage}次使用, {failures}次失败, {success_rate:.1%}成功率")
+        pools = stats['client_pools']
+        print(f"\n🔌 共享客户端: {pools['sync_clients']} 同步, {pools['async_clients']} 异步")
+        for pool in pools['pools']:
+            print(f"   [{pool['kind']}] {pool['base_url']} ({pool['role']}): "
+                  f"{pool['handouts']}次复用, {pool['pooled_connections']}个连接")
 
     def record_usage(self, model_name: str, success: bool = True):
         """record模型using情况"""
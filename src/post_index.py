@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+In-process post index shared by all feed paths.
+
+Posts and their time steps are loaded once. After that the index only applies
+deltas: SQLite triggers record every insert/update/delete on posts and
+post_timesteps in the post_changes log (see DatabaseManager._apply_change_log),
+and sync() fetches just the log entries newer than the last one it applied.
+Every writer (agents, bots, the news manager, moderation takedowns and
+restores) is picked up this way without hooking individual call sites.
+
+The index provides:
+- O(1) lookups by post id, by author and by time step
+- per-tick score views: active news / non-news posts kept sorted by the feed
+  score, so ranking windows are slices instead of full sorts
+
+Rows are plain dicts shaped like `SELECT p.* FROM posts p`. They are replaced,
+never mutated, when a post changes, so callers must not modify them either.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from database.database_manager import fetch_all
+
+NEWS = "news"
+NON_NEWS = "non_news"
+
+_POST_QUERY = '''
+    SELECT p.*, t.time_step AS _time_step
+    FROM posts p
+    LEFT JOIN post_timesteps t ON t.post_id = p.post_id
+'''
+
+# The newest log entry is always returned as well, so a reset or restored
+# database (log sequence went backwards) is detected and triggers a full reload
+_CHANGES_QUERY = '''
+    SELECT c.seq AS _seq, c.post_id AS _changed_id, p.*, t.time_step AS _time_step
+    FROM post_changes c
+    LEFT JOIN posts p ON p.post_id = c.post_id
+    LEFT JOIN post_timesteps t ON t.post_id = c.post_id
+    WHERE c.seq > ? OR c.seq = (SELECT MAX(seq) FROM post_changes)
+    ORDER BY c.seq
+'''
+
+_MAX_SEQ_QUERY = 'SELECT COALESCE(MAX(seq), 0) AS seq FROM post_changes'
+
+# Feed score defaults: (engagement + beta) x max(0.1, 1 - lambda x age_steps)
+DEFAULT_LAMBDA_DECAY = 0.1
+DEFAULT_BETA_BIAS = 180
+
+
+def is_active(row: Dict[str, Any]) -> bool:
+    status = row.get('status')
+    return status is None or status != 'taken_down'
+
+
+def post_kind(row: Dict[str, Any]) -> str:
+    return NEWS if row.get('is_news') in (1, True) else NON_NEWS
+
+
+class ScoreView:
+    """
+    Active posts of one kind, sorted by feed score for one time step.
+
+    Entries are kept in ascending (score, created_at, post_id) order and read
+    from the end, matching a descending sort by (score, created_at).
+    """
+
+    def __init__(self, index: "PostIndex", kind: str, time_step: int,
+                 lambda_decay: float, beta_bias: float):
+        self.index = index
+        self.kind = kind
+        self.time_step = time_step
+        self.lambda_decay = lambda_decay
+        self.beta_bias = beta_bias
+        self._keys: Dict[str, Tuple[float, str, str]] = {}
+        self._entries: List[Tuple[float, str, str]] = []
+        self.rebuild()
+
+    def score(self, row: Dict[str, Any]) -> float:
+        engagement = (row.get('num_comments') or 0) + (row.get('num_shares') or 0) + (row.get('num_likes') or 0)
+        post_step = self.index.timestep_of(row['post_id'])
+        age = max(0, self.time_step - post_step) if post_step is not None else 0
+        freshness = max(0.1, 1.0 - self.lambda_decay * age)
+        return (engagement + self.beta_bias) * freshness
+
+    def _key(self, row: Dict[str, Any]) -> Tuple[float, str, str]:
+        return (self.score(row), str(row.get('created_at') or ''), str(row['post_id']))
+
+    def rebuild(self):
+        rows = self.index.active_posts(self.kind)
+        self._keys = {str(row['post_id']): self._key(row) for row in rows}
+        self._entries = sorted(self._keys.values())
+
+    def update(self, post_id: str, row: Optional[Dict[str, Any]]):
+        """Re-position one post (row None, taken down or of another kind removes it)."""
+        old = self._keys.pop(post_id, None)
+        if old is not None:
+            position = bisect.bisect_left(self._entries, old)
+            if position < len(self._entries) and self._entries[position] == old:
+                del self._entries[position]
+        if row is not None and is_active(row) and post_kind(row) == self.kind:
+            key = self._key(row)
+            self._keys[post_id] = key
+            bisect.insort(self._entries, key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def window(self, offset: int = 0, top_k: int = 10, include_ties: bool = False) -> List[Dict[str, Any]]:
+        """
+        Rows ranked [offset, offset + top_k) by descending score.
+
+        With include_ties, posts tied with the last row of the window are
+        appended as well.
+        """
+        with self.index._lock:
+            total = len(self._entries)
+            start = max(0, int(offset))
+            end = min(total, max(start, start + int(top_k)))
+            if start >= end:
+                return []
+
+            keys = [self._entries[total - 1 - i] for i in range(start, end)]
+            if include_ties:
+                last_score = keys[-1][0]
+                i = end
+                while i < total and self._entries[total - 1 - i][0] == last_score:
+                    keys.append(self._entries[total - 1 - i])
+                    i += 1
+            return [self.index.get(key[2]) for key in keys]
+
+
+class PostIndex:
+    """Posts kept in memory and updated from the post_changes log."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._posts: Dict[str, Dict[str, Any]] = {}
+        self._by_author: Dict[str, Set[str]] = {}
+        self._by_timestep: Dict[int, Set[str]] = {}
+        self._timesteps: Dict[str, int] = {}
+        # Load/creation order, so multi-post lookups come back in database order
+        self._ordinals: Dict[str, int] = {}
+        self._next_ordinal = 0
+        self._views: Dict[Tuple[str, int, float, float], ScoreView] = {}
+        self._seq = 0
+        self._loaded = False
+        self._change_log = True
+        self.stats = {"full_loads": 0, "syncs": 0, "changes_applied": 0}
+
+    # ========== loading ==========
+
+    def reset(self):
+        """Drop everything; the next sync() reloads from the database."""
+        with self._lock:
+            self._posts.clear()
+            self._by_author.clear()
+            self._by_timestep.clear()
+            self._timesteps.clear()
+            self._ordinals.clear()
+            self._views.clear()
+            self._seq = 0
+            self._loaded = False
+
+    def sync(self) -> int:
+        """
+        Bring the index up to date with the database.
+
+        Returns:
+            Number of changed posts applied (all posts on a full load)
+        """
+        with self._lock:
+            if not self._loaded or not self._change_log:
+                return self._full_load()
+
+            rows = fetch_all(_CHANGES_QUERY, (self._seq,)) or []
+            self.stats["syncs"] += 1
+            latest = rows[-1]['_seq'] if rows else 0
+            if latest < self._seq:
+                logging.info("🔄 Post change log went backwards (database reset or restored); reloading posts")
+                self.reset()
+                return self._full_load()
+
+            applied = 0
+            for row in rows:
+                if row['_seq'] <= self._seq:
+                    continue
+                row = dict(row)
+                self._seq = row.pop('_seq')
+                post_id = str(row.pop('_changed_id'))
+                self._apply(post_id, row if row.get('post_id') is not None else None)
+                applied += 1
+            self.stats["changes_applied"] += applied
+            return applied
+
+    def _full_load(self) -> int:
+        try:
+            # Read the log position first: changes racing with the load are re-applied later
+            seq_rows = fetch_all(_MAX_SEQ_QUERY)
+            self._change_log = True
+        except Exception as e:
+            if "no such table" not in str(e):
+                raise
+            if self._change_log:
+                logging.warning("⚠️ post_changes log missing; the post index will reload fully on every sync")
+            self._change_log = False
+            seq_rows = None
+
+        rows = fetch_all(_POST_QUERY) or []
+        self._posts.clear()
+        self._by_author.clear()
+        self._by_timestep.clear()
+        self._timesteps.clear()
+        self._ordinals.clear()
+        for row in rows:
+            row = dict(row)
+            self._insert(str(row['post_id']), row)
+
+        self._seq = seq_rows[0]['seq'] if seq_rows else 0
+        self._views.clear()
+        self._loaded = True
+        self.stats["full_loads"] += 1
+        return len(rows)
+
+    # ========== deltas ==========
+
+    def _insert(self, post_id: str, row: Dict[str, Any]):
+        time_step = row.pop('_time_step', None)
+        if post_id not in self._ordinals:
+            self._ordinals[post_id] = self._next_ordinal
+            self._next_ordinal += 1
+        self._posts[post_id] = row
+        self._by_author.setdefault(str(row.get('author_id')), set()).add(post_id)
+        if time_step is not None:
+            self._timesteps[post_id] = time_step
+            self._by_timestep.setdefault(time_step, set()).add(post_id)
+
+    def _unlink(self, post_id: str):
+        """Remove a post from the author / time step maps (its row stays in place)."""
+        row = self._posts.get(post_id)
+        if row is not None:
+            authored = self._by_author.get(str(row.get('author_id')))
+            if authored is not None:
+                authored.discard(post_id)
+                if not authored:
+                    del self._by_author[str(row.get('author_id'))]
+        time_step = self._timesteps.pop(post_id, None)
+        if time_step is not None:
+            members = self._by_timestep.get(time_step)
+            if members is not None:
+                members.discard(post_id)
+                if not members:
+                    del self._by_timestep[time_step]
+
+    def _apply(self, post_id: str, row: Optional[Dict[str, Any]]):
+        self._unlink(post_id)
+        if row is not None:
+            # Re-assigning an existing key keeps the post's position in database order
+            self._insert(post_id, row)
+        else:
+            self._posts.pop(post_id, None)
+            self._ordinals.pop(post_id, None)
+        for view in self._views.values():
+            view.update(post_id, self._posts.get(post_id))
+
+    # ========== lookups ==========
+
+    def get(self, post_id: str) -> Optional[Dict[str, Any]]:
+        return self._posts.get(str(post_id))
+
+    def _rows(self, post_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        return [self._posts[post_id] for post_id in sorted(post_ids, key=self._ordinals.__getitem__)]
+
+    def by_author(self, author_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._rows(self._by_author.get(str(author_id), ()))
+
+    def by_authors(self, author_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        with self._lock:
+            post_ids = set()
+            for author_id in author_ids:
+                post_ids.update(self._by_author.get(str(author_id), ()))
+            return self._rows(post_ids)
+
+    def by_timestep(self, time_step: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._rows(self._by_timestep.get(time_step, ()))
+
+    def timestep_of(self, post_id: str) -> Optional[int]:
+        return self._timesteps.get(str(post_id))
+
+    def post_timesteps(self) -> Dict[str, int]:
+        """{post_id: time_step} snapshot."""
+        with self._lock:
+            return dict(self._timesteps)
+
+    def active_posts(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Active (not taken down) posts, optionally only NEWS or NON_NEWS."""
+        with self._lock:
+            return [
+                row for row in self._posts.values()
+                if is_active(row) and (kind is None or post_kind(row) == kind)
+            ]
+
+    def score_view(self, kind: str, time_step: int, lambda_decay: float = DEFAULT_LAMBDA_DECAY,
+                   beta_bias: float = DEFAULT_BETA_BIAS) -> ScoreView:
+        """
+        Sorted feed-score view for one kind and time step.
+
+        Views are built once per time step and then maintained incrementally
+        by sync(); views of other time steps are dropped.
+        """
+        key = (kind, time_step, lambda_decay, beta_bias)
+        with self._lock:
+            view = self._views.get(key)
+            if view is None:
+                for stale in [k for k in self._views if k[1] != time_step]:
+                    del self._views[stale]
+                view = ScoreView(self, kind, time_step, lambda_decay, beta_bias)
+                self._views[key] = view
+            return view
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+
+_post_index: Optional[PostIndex] = None
+_post_index_lock = threading.Lock()
+
+
+def get_post_index() -> PostIndex:
+    """Get the process-wide post index."""
+    global _post_index
+    if _post_index is None:
+        with _post_index_lock:
+            if _post_index is None:
+                _post_index = PostIndex()
+    return _post_index
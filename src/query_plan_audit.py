@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN QUERY PLAN audit for hot simulation queries
+
+Runs EXPLAIN QUERY PLAN for the queries issued on every tick and reports any
+that still scan a whole table instead of searching an index.
+
+Usage:
+    python src/query_plan_audit.py --db database/simulation.db
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from typing import Any, Dict, List, Tuple
+
+# Queries issued per agent or per post on every tick, with representative parameters
+HOT_QUERIES: List[Tuple[str, str, Tuple[Any, ...]]] = [
+    ("like_post duplicate check", '''
+        SELECT COUNT(*) as count FROM user_actions
+        WHERE user_id = ? AND action_type IN (?, ?) AND target_id = ?
+    ''', ('user', 'like_post', 'like', 'post')),
+    ("follow existence check", '''
+        SELECT 1 FROM follows
+        WHERE follower_id = ? AND followed_id = ?
+    ''', ('user', 'user')),
+    ("followers of user", '''
+        SELECT follower_id FROM follows WHERE followed_id = ?
+    ''', ('user',)),
+    ("followed authors", '''
+        SELECT followed_id FROM follows WHERE follower_id = ?
+    ''', ('user',)),
+    ("post author lookup", '''
+        UPDATE users
+        SET total_likes_received = total_likes_received + 1
+        WHERE user_id = (SELECT author_id FROM posts WHERE post_id = ?)
+    ''', ('post',)),
+    ("hot comments for post", '''
+        SELECT c.comment_id, c.content, c.post_id, c.author_id, c.created_at, c.num_likes
+        FROM comments c
+        WHERE c.post_id = ?
+        ORDER BY c.num_likes DESC, c.created_at DESC
+        LIMIT 2
+    ''', ('post',)),
+    ("recent comments for post", '''
+        SELECT c.comment_id, c.content, c.post_id, c.author_id, c.created_at, c.num_likes
+        FROM comments c
+        WHERE c.post_id = ?
+        ORDER BY c.created_at DESC
+        LIMIT 2
+    ''', ('post',)),
+    ("community notes for post", '''
+        SELECT note_id, content, author_id, helpful_ratings, not_helpful_ratings
+        FROM community_notes
+        WHERE post_id = ?
+        ORDER BY helpful_ratings DESC
+    ''', ('post',)),
+    ("in-network posts by authors", '''
+        SELECT p.post_id FROM posts p
+        WHERE p.author_id IN (?, ?)
+        AND (p.status IS NULL OR p.status != 'taken_down')
+    ''', ('user', 'user')),
+    ("active news pool", '''
+        SELECT p.post_id FROM posts p
+        WHERE p.is_news = TRUE AND (p.status IS NULL OR p.status != 'taken_down')
+    ''', ()),
+    ("active non-news pool", '''
+        SELECT p.post_id FROM posts p
+        WHERE (p.is_news IS NULL OR p.is_news != TRUE)
+        AND (p.status IS NULL OR p.status != 'taken_down')
+    ''', ()),
+    ("author post count", '''
+        SELECT COUNT(*) FROM posts WHERE author_id = ? AND is_news = 0
+    ''', ('user',)),
+    ("agent memories by type", '''
+        SELECT memory_id, content FROM agent_memories
+        WHERE user_id = ? AND importance_score * decay_factor >= ? AND memory_type = ?
+    ''', ('user', 0.3, 'reflection')),
+    ("recent user actions", '''
+        SELECT action_type, target_id, content FROM user_actions
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+        LIMIT 10
+    ''', ('user',)),
+    ("post exposures", '''
+        SELECT COUNT(DISTINCT user_id) FROM feed_exposures WHERE post_id = ?
+    ''', ('post',)),
+    ("posts created at timestep", '''
+        SELECT post_id FROM post_timesteps WHERE time_step = ?
+    ''', (1,)),
+    ("malicious comment authors", '''
+        SELECT COUNT(DISTINCT c.author_id)
+        FROM comments c
+        JOIN malicious_comments mc ON c.comment_id = mc.comment_id
+    ''', ()),
+]
+
+
+def _is_full_scan(detail: str) -> bool:
+    """Whether an EXPLAIN QUERY PLAN detail line is a whole-table scan"""
+    detail = detail.strip().upper()
+    if not detail.startswith("SCAN "):
+        return False
+    # Scanning a covering index or a constant row is not a table scan
+    return "USING COVERING INDEX" not in detail and "CONSTANT ROW" not in detail
+
+
+def audit_query_plans(db_path: str) -> List[Dict[str, Any]]:
+    """
+    Run EXPLAIN QUERY PLAN for every hot query
+
+    Returns:
+        One entry per query: name, plan detail lines, full-scan lines, and error (if any)
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        report = []
+        for name, query, params in HOT_QUERIES:
+            entry = {"name": name, "plan": [], "full_scans": [], "error": None}
+            try:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+                entry["plan"] = [row[-1] for row in rows]
+                entry["full_scans"] = [detail for detail in entry["plan"] if _is_full_scan(detail)]
+            except sqlite3.Error as e:
+                entry["error"] = str(e)
+            report.append(entry)
+        return report
+    finally:
+        conn.close()
+
+
+def print_audit_report(report: List[Dict[str, Any]], verbose: bool = False) -> int:
+    """Print the audit report; returns the number of queries still doing full scans"""
+    offenders = 0
+    for entry in report:
+        if entry["error"]:
+            print(f"⚠️  {entry['name']}: {entry['error']}")
+            continue
+        if entry["full_scans"]:
+            offenders += 1
+            print(f"❌ {entry['name']}")
+            for detail in entry["full_scans"]:
+                print(f"     {detail}")
+        elif verbose:
+            print(f"✅ {entry['name']}")
+        if verbose:
+            for detail in entry["plan"]:
+                print(f"     · {detail}")
+
+    print(f"\n{offenders}/{len(report)} hot queries still perform full table scans")
+    return offenders
+
+
+def main() -> int:
+    default_db = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'simulation.db')
+    parser = argparse.ArgumentParser(description='Audit query plans of hot simulation queries')
+    parser.add_argument('--db', type=str, default=default_db, help='Database file path')
+    parser.add_argument('--verbose', action='store_true', help='Print the full plan of every query')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        return 2
+
+    offenders = print_audit_report(audit_query_plans(args.db), verbose=args.verbose)
+    return 1 if offenders else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,11 +12,14 @@ X-Algorithm 推荐系统模块
 """
 
 from .feed_pipeline import FeedPipeline
+from .feed_service import FeedService, get_feed_service
 from .config import RecommenderConfig
 from .types import FeedRequest, FeedResponse, PostCandidate, UserContext, FeedSource
 
 __all__ = [
     'FeedPipeline',
+    'FeedService',
+    'get_feed_service',
     'RecommenderConfig',
     'FeedRequest',
     'FeedResponse',
@@ -66,6 +66,8 @@ class EmbeddingConfig:
     cache_embeddings: bool = True                # 缓存帖子 embedding
     embedding_weight: float = 0.3                # embedding 分数权重
     max_cache_size: int = 10000                  # 最大缓存条目数
+    persistent_cache: bool = True                # 磁盘缓存 (按内容哈希，跨运行/进程共享)
+    persistent_cache_dir: Optional[str] = None   # 磁盘缓存目录 (None 使用 <repo>/cache/embeddings)
 
 
 @dataclass
@@ -78,6 +80,8 @@ class SourceConfig:
     in_network_ratio: float = 0.5    # 关注流占比
     out_network_ratio: float = 0.5   # 热点流占比
     max_candidates_per_source: int = 100
+    # 热点流排序: "ranked" 按互动分/发布时间取前 K（SQL 排序截断）; "database_order" 旧行为
+    out_network_ranking: str = "ranked"
 
 
 @dataclass
@@ -1,5 +1,6 @@
 """Embedding 管理模块"""
 
 from .embedding_manager import EmbeddingManager
+from .embedding_store import EmbeddingStore
 
-__all__ = ['EmbeddingManager']
+__all__ = ['EmbeddingManager', 'EmbeddingStore']
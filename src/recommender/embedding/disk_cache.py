@@ -0,0 +1,215 @@
+"""
+持久化 Embedding 磁盘缓存
+
+以内容哈希为键、按模型名分目录的只追加向量文件，读取时通过 np.memmap 映射，
+跨进程、跨运行共享。快照恢复或重新启动模拟时，已编码过的帖子无需再次编码。
+
+目录结构:
+    <cache_dir>/<model_key>/
+        meta.json     模型名与向量维度
+        keys.txt      每行一个内容哈希（行号即向量行号）
+        vectors.f32   float32 行主序向量
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows: 仅进程内加锁
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    'cache', 'embeddings'
+)
+
+
+def content_hash(text: str) -> str:
+    """帖子内容的哈希键"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class DiskEmbeddingCache:
+    """
+    内容哈希 → embedding 的持久化缓存
+
+    - 只追加写入：先写向量再写键，读者只会看到完整的行
+    - 写入时持有文件锁（POSIX fcntl），多个模拟进程可共享同一目录
+    - 读取时按需刷新索引并重新映射 memmap
+    """
+
+    def __init__(self, model_key: str, cache_dir: Optional[str] = None):
+        """
+        Args:
+            model_key: 模型标识（不同模型的向量互不兼容，分目录存放）
+            cache_dir: 缓存根目录，None 使用 <repo>/cache/embeddings
+        """
+        self.model_key = model_key
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_key)
+        self.directory = os.path.join(cache_dir or DEFAULT_CACHE_DIR, safe_name)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._meta_path = os.path.join(self.directory, 'meta.json')
+        self._keys_path = os.path.join(self.directory, 'keys.txt')
+        self._vectors_path = os.path.join(self.directory, 'vectors.f32')
+        self._lock_path = os.path.join(self.directory, '.lock')
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._rows = 0
+        self._keys_offset = 0
+        self._vectors: Optional[np.memmap] = None
+        self.dim: Optional[int] = self._read_dim()
+
+    # ========== 元数据 ==========
+
+    def _read_dim(self) -> Optional[int]:
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            return int(meta['dim'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_meta(self, dim: int):
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_key, 'dim': dim}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程写锁"""
+        with open(self._lock_path, 'a') as lock_file:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    # ========== 索引与映射 ==========
+
+    def _refresh(self):
+        """读取其他进程新追加的键，并在行数增加时重新映射向量文件（调用者持有 _lock）"""
+        if self.dim is None:
+            self.dim = self._read_dim()
+            if self.dim is None:
+                return
+
+        try:
+            keys_size = os.path.getsize(self._keys_path)
+        except OSError:
+            return
+
+        if keys_size > self._keys_offset:
+            with open(self._keys_path, 'rb') as f:
+                f.seek(self._keys_offset)
+                chunk = f.read(keys_size - self._keys_offset)
+            # 只消费完整的行
+            complete = chunk[:chunk.rfind(b'\n') + 1]
+            for line in complete.splitlines():
+                key = line.decode('ascii').strip()
+                if key:
+                    self._index.setdefault(key, self._rows)
+                    self._rows += 1
+            self._keys_offset += len(complete)
+            self._vectors = None
+
+        if self._vectors is None and self._rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(self._rows, self.dim))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    # ========== 读写 ==========
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量查询
+
+        Returns:
+            (matrix, found): (n, dim) float32 矩阵与命中标记
+        """
+        keys = [content_hash(text) for text in texts]
+        with self._lock:
+            self._refresh()
+            dim = self.dim or 0
+            matrix = np.zeros((len(texts), dim), dtype=np.float32)
+            found = np.zeros(len(texts), dtype=bool)
+            if self._vectors is None:
+                return matrix, found
+
+            positions, rows = [], []
+            for position, key in enumerate(keys):
+                row = self._index.get(key)
+                if row is not None:
+                    positions.append(position)
+                    rows.append(row)
+            if rows:
+                matrix[positions] = self._vectors[rows]
+                found[positions] = True
+        return matrix, found
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """
+        追加一批向量（已存在的内容会被跳过）
+
+        Args:
+            texts: 原始文本
+            vectors: (n, dim) 向量
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not texts or vectors.ndim != 2:
+            return
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_meta(self.dim)
+            elif vectors.shape[1] != self.dim:
+                logger.warning(
+                    f"Embedding cache {self.directory}: dimension {vectors.shape[1]} != {self.dim}, skip write"
+                )
+                return
+
+            new_keys, new_rows, seen = [], [], set()
+            for text, vector in zip(texts, vectors):
+                key = content_hash(text)
+                if key in self._index or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+
+            # 对齐到已写入的完整行，丢弃其他进程中断写入留下的残片
+            start_row = self._rows
+            with open(self._vectors_path, 'ab') as f:
+                f.truncate(start_row * self.dim * 4)
+                f.write(np.stack(new_rows).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys_path, 'ab') as f:
+                f.truncate(self._keys_offset)
+                f.write(''.join(f"{key}\n" for key in new_keys).encode('ascii'))
+
+            # 由 _refresh 读回刚写入的键并重新映射
+            self._refresh()
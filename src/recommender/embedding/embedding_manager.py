@@ -10,9 +10,13 @@ Embedding 管理器
 
 from typing import Dict, List, Optional, Tuple
 from threading import Lock
-from collections import OrderedDict
 import logging
 
+import numpy as np
+
+from .disk_cache import DiskEmbeddingCache
+from .embedding_store import EmbeddingStore
+
 logger = logging.getLogger(__name__)
 
 # 全局单例缓存和锁（按配置键缓存）
@@ -31,7 +35,9 @@ def get_embedding_manager(**kwargs) -> 'EmbeddingManager':
         bool(kwargs.get('cache_embeddings', True)),
         int(kwargs.get('max_cache_size', 10000)),
         bool(kwargs.get('use_openai_embedding', False)),
-        kwargs.get('openai_model_name')
+        kwargs.get('openai_model_name'),
+        bool(kwargs.get('persistent_cache', True)),
+        kwargs.get('persistent_cache_dir')
     )
     with _embedding_manager_lock:
         manager = _embedding_manager_instances.get(key)
@@ -61,7 +67,9 @@ class EmbeddingManager:
         cache_embeddings: bool = True,
         max_cache_size: int = 10000,
         use_openai_embedding: bool = False,
-        openai_model_name: str = None
+        openai_model_name: str = None,
+        persistent_cache: bool = True,
+        persistent_cache_dir: Optional[str] = None
     ):
         """
         初始化 EmbeddingManager
@@ -72,20 +80,25 @@ class EmbeddingManager:
             max_cache_size: 最大缓存条目数
             use_openai_embedding: 是否使用 OpenAI Embedding API
             openai_model_name: OpenAI embedding 模型名称 (None 则使用默认)
+            persistent_cache: 是否使用跨运行共享的磁盘缓存（按内容哈希）
+            persistent_cache_dir: 磁盘缓存根目录 (None 则使用 <repo>/cache/embeddings)
         """
         self.model_name = model_name
         self.cache_embeddings = cache_embeddings
         self.max_cache_size = max_cache_size
         self.use_openai_embedding = use_openai_embedding
         self.openai_model_name = openai_model_name
+        self.persistent_cache = persistent_cache
+        self.persistent_cache_dir = persistent_cache_dir
 
         self._local_model = None
         self._openai_client = None
         self._openai_model = None
-        self._cache: OrderedDict[str, List[float]] = OrderedDict()
+        self._store = EmbeddingStore(max_size=max_cache_size)  # 归一化 float32 矩阵缓存
         self._cache_lock = Lock()  # 缓存线程安全锁
         self._init_lock = Lock()   # 初始化线程安全锁
         self._initialized = False
+        self._disk_cache: Optional[DiskEmbeddingCache] = None
 
     def _ensure_initialized(self):
         """延迟初始化模型（线程安全）"""
@@ -102,8 +115,20 @@ class EmbeddingManager:
             else:
                 self._init_local_embedding()
 
+            if self.persistent_cache:
+                self._init_disk_cache()
+
             self._initialized = True
 
+    def _init_disk_cache(self):
+        """初始化磁盘缓存（按实际使用的模型分目录；失败时仅使用内存缓存）"""
+        try:
+            self._disk_cache = DiskEmbeddingCache(self.embedding_mode, self.persistent_cache_dir)
+            logger.info(f"Persistent embedding cache: {self._disk_cache.directory}")
+        except OSError as e:
+            logger.warning(f"Persistent embedding cache unavailable, using memory cache only: {e}")
+            self._disk_cache = None
+
     def _init_local_embedding(self):
         """初始化本地 sentence-transformers 模型"""
         import os
@@ -162,6 +187,118 @@ class EmbeddingManager:
         )
         return response.data[0].embedding
 
+    def encode_texts(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """
+        批量编码文本（一次模型调用 / 一次 API 请求处理一批）
+
+        Args:
+            texts: 非空文本列表
+            batch_size: 每批文本数
+
+        Returns:
+            (len(texts), dim) float32 矩阵
+        """
+        self._ensure_initialized()
+
+        if not texts:
+            return np.zeros((0, self._store.dim or 0), dtype=np.float32)
+
+        if self.use_openai_embedding:
+            if not self._openai_client:
+                raise RuntimeError("OpenAI embedding client not initialized")
+            vectors = []
+            for start in range(0, len(texts), batch_size):
+                response = self._openai_client.embeddings.create(
+                    input=texts[start:start + batch_size],
+                    model=self._openai_model
+                )
+                batch = sorted(response.data, key=lambda item: item.index)
+                vectors.extend(item.embedding for item in batch)
+            return np.asarray(vectors, dtype=np.float32)
+
+        if not self._local_model:
+            raise RuntimeError("Local embedding model not initialized")
+        return np.asarray(
+            self._local_model.encode(texts, batch_size=batch_size, convert_to_numpy=True),
+            dtype=np.float32
+        )
+
+    def get_embedding_matrix(
+        self,
+        post_ids: List[str],
+        contents: List[str]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量获取帖子的归一化 embedding 矩阵（线程安全）
+
+        缓存命中的行直接从连续矩阵取出，未命中的帖子合并成一次批量编码。
+
+        Args:
+            post_ids: 帖子 ID 列表
+            contents: 与 post_ids 对应的帖子内容
+
+        Returns:
+            (matrix, found): matrix 为 (n, dim) float32 归一化矩阵，
+            found 为布尔数组，内容为空而无法编码的行为 False（对应行全零）
+        """
+        n = len(post_ids)
+        hit_positions, hit_rows, hits = [], [], None
+        if self.cache_embeddings:
+            with self._cache_lock:
+                hit_positions, hit_rows = self._store.lookup(post_ids)
+                hits = self._store.gather(hit_rows)
+
+        hit_set = set(hit_positions)
+        miss_positions = [i for i in range(n) if i not in hit_set and contents[i]]
+
+        encoded = None
+        if miss_positions:
+            # 同一批内重复的帖子只编码一次
+            unique_ids = list(dict.fromkeys(post_ids[i] for i in miss_positions))
+            content_of = {post_ids[i]: contents[i] for i in miss_positions}
+            raw = self._load_or_encode([content_of[pid] for pid in unique_ids])
+            if self.cache_embeddings:
+                with self._cache_lock:
+                    normalized = self._store.put_many(unique_ids, raw)
+            else:
+                normalized = EmbeddingStore.normalize(raw)
+            row_of = {pid: row for row, pid in enumerate(unique_ids)}
+            encoded = normalized[[row_of[post_ids[i]] for i in miss_positions]]
+
+        dim = (
+            hits.shape[1] if hits is not None and len(hit_positions)
+            else encoded.shape[1] if encoded is not None
+            else self._store.dim or 0
+        )
+        matrix = np.zeros((n, dim), dtype=np.float32)
+        found = np.zeros(n, dtype=bool)
+        if hit_positions:
+            matrix[hit_positions] = hits
+            found[hit_positions] = True
+        if encoded is not None:
+            matrix[miss_positions] = encoded
+            found[miss_positions] = True
+        return matrix, found
+
+    def _load_or_encode(self, texts: List[str]) -> np.ndarray:
+        """先查磁盘缓存，只对未命中的文本批量编码并写回磁盘"""
+        self._ensure_initialized()
+        if self._disk_cache is None:
+            return self.encode_texts(texts)
+
+        vectors, found = self._disk_cache.get_many(texts)
+        missing = [i for i in range(len(texts)) if not found[i]]
+        if not missing:
+            return vectors
+
+        encoded = self.encode_texts([texts[i] for i in missing])
+        self._disk_cache.put_many([texts[i] for i in missing], encoded)
+        if vectors.shape[1] != encoded.shape[1]:
+            # 磁盘缓存为空时尚不知道维度，此时不会有命中
+            vectors = np.zeros((len(texts), encoded.shape[1]), dtype=np.float32)
+        vectors[missing] = encoded
+        return vectors
+
     def get_or_compute_embedding(
         self,
         post_id: str,
@@ -170,7 +307,7 @@ class EmbeddingManager:
         """
         获取或计算帖子 embedding（线程安全）
 
-        优先从缓存获取，缓存未命中则计算并缓存
+        优先从缓存获取，缓存未命中则计算并缓存（返回归一化向量）
 
         Args:
             post_id: 帖子 ID
@@ -179,40 +316,10 @@ class EmbeddingManager:
         Returns:
             embedding 向量
         """
-        # 线程安全：检查缓存
-        if self.cache_embeddings:
-            with self._cache_lock:
-                if post_id in self._cache:
-                    # LRU 更新：移动到末尾
-                    self._cache.move_to_end(post_id)
-                    return self._cache[post_id]
-
-        # 计算 embedding（在锁外执行，避免阻塞其他线程）
-        embedding = self.encode_text(content)
-
-        # 线程安全：缓存结果
-        if embedding and self.cache_embeddings:
-            with self._cache_lock:
-                # 双重检查：可能其他线程已经缓存了
-                if post_id not in self._cache:
-                    self._add_to_cache(post_id, embedding)
-
-        return embedding
-
-    def _add_to_cache(self, key: str, embedding: List[float]):
-        """
-        添加到缓存（调用者需持有 _cache_lock）
-
-        使用 LRU 策略：超出限制时删除最旧的条目
-        """
-        if len(self._cache) >= self.max_cache_size:
-            # LRU 策略：删除最旧的一半条目（OrderedDict 的首部）
-            num_to_remove = self.max_cache_size // 2
-            for _ in range(num_to_remove):
-                self._cache.popitem(last=False)
-
-        self._cache[key] = embedding
-        self._cache.move_to_end(key)  # 确保新条目在末尾
+        matrix, found = self.get_embedding_matrix([post_id], [content])
+        if not found[0]:
+            return None
+        return matrix[0].tolist()
 
     def precompute_embeddings(self, posts: List[Dict]) -> int:
         """
@@ -226,41 +333,33 @@ class EmbeddingManager:
         """
         self._ensure_initialized()
 
-        if not self.is_available:
+        if not self.is_available or not self.cache_embeddings:
             return 0
 
-        count = 0
-        for post in posts:
-            post_id = str(post.get('post_id', ''))
-            content = post.get('content', '')
-
-            # 线程安全：检查是否已缓存
-            if self.cache_embeddings:
-                with self._cache_lock:
-                    if post_id in self._cache:
-                        continue
+        with self._cache_lock:
+            pending = {
+                str(post.get('post_id', '')): post.get('content', '')
+                for post in posts
+                if post.get('post_id') and post.get('content')
+                and str(post.get('post_id')) not in self._store
+            }
 
-            if post_id and content:
-                embedding = self.encode_text(content)
-                if embedding and self.cache_embeddings:
-                    with self._cache_lock:
-                        if post_id not in self._cache:
-                            self._add_to_cache(post_id, embedding)
-                            count += 1
+        if pending:
+            self.get_embedding_matrix(list(pending), list(pending.values()))
 
-        logger.info(f"Precomputed {count} embeddings")
-        return count
+        logger.info(f"Precomputed {len(pending)} embeddings")
+        return len(pending)
 
     def clear_cache(self):
         """清空缓存（线程安全）"""
         with self._cache_lock:
-            self._cache.clear()
+            self._store.clear()
 
     @property
     def cache_size(self) -> int:
         """当前缓存大小（线程安全）"""
         with self._cache_lock:
-            return len(self._cache)
+            return len(self._store)
 
     @property
     def is_available(self) -> bool:
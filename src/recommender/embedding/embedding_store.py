@@ -0,0 +1,136 @@
+"""
+Embedding 矩阵存储
+
+以 post_id 为键的连续 float32 矩阵，每行预先做 L2 归一化，
+对一组帖子打分只需一次矩阵-向量乘法。
+"""
+
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    连续 float32 embedding 存储（非线程安全，由调用者加锁）
+
+    - 行向量预先 L2 归一化，点积即余弦相似度
+    - 容量按需倍增，被淘汰的行进入空闲列表复用
+    - LRU 淘汰: 超出 max_size 时删除最旧的一半条目（与原 OrderedDict 缓存一致）
+    """
+
+    def __init__(self, max_size: int = 10000, initial_capacity: int = 256):
+        self.max_size = max(1, int(max_size))
+        self.dim: Optional[int] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._initial_capacity = max(1, int(initial_capacity))
+        self._rows: "OrderedDict[str, int]" = OrderedDict()
+        self._free_rows: List[int] = []
+        self._next_row = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """按行 L2 归一化（零向量保持为零）"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """获取单个归一化向量（副本），并更新 LRU 顺序"""
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        self._rows.move_to_end(key)
+        return self._matrix[row].copy()
+
+    def lookup(self, keys: Iterable[str]) -> Tuple[List[int], List[int]]:
+        """
+        查找一组键
+
+        Returns:
+            (命中键在输入中的位置, 对应的矩阵行号)
+        """
+        positions, rows = [], []
+        for position, key in enumerate(keys):
+            row = self._rows.get(key)
+            if row is not None:
+                self._rows.move_to_end(key)
+                positions.append(position)
+                rows.append(row)
+        return positions, rows
+
+    def gather(self, rows: List[int]) -> np.ndarray:
+        """按行号取出矩阵（副本）"""
+        if self._matrix is None or not rows:
+            return np.zeros((len(rows), self.dim or 0), dtype=np.float32)
+        return self._matrix[rows]
+
+    def put_many(self, keys: List[str], vectors: np.ndarray) -> np.ndarray:
+        """
+        批量写入向量
+
+        Args:
+            keys: post_id 列表
+            vectors: (n, dim) 原始向量
+
+        Returns:
+            归一化后的向量 (n, dim)
+        """
+        normalized = self.normalize(vectors)
+        if not keys:
+            return normalized
+        if self.dim is None:
+            self.dim = normalized.shape[1]
+        elif normalized.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension mismatch: store={self.dim}, got={normalized.shape[1]}")
+
+        for key, vector in zip(keys, normalized):
+            row = self._rows.get(key)
+            if row is None:
+                if len(self._rows) >= self.max_size:
+                    self._evict(self.max_size // 2 or 1)
+                row = self._allocate_row()
+                self._rows[key] = row
+            else:
+                self._rows.move_to_end(key)
+            self._matrix[row] = vector
+
+        return normalized
+
+    def put(self, key: str, vector) -> np.ndarray:
+        """写入单个向量，返回归一化后的向量"""
+        return self.put_many([key], np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+
+    def clear(self):
+        """清空存储（保留已分配的矩阵）"""
+        self._rows.clear()
+        self._free_rows.clear()
+        self._next_row = 0
+
+    def _allocate_row(self) -> int:
+        if self._free_rows:
+            return self._free_rows.pop()
+        if self._matrix is None:
+            capacity = min(self._initial_capacity, self.max_size)
+            self._matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        elif self._next_row >= self._matrix.shape[0]:
+            capacity = min(self._matrix.shape[0] * 2, self.max_size)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:self._next_row] = self._matrix[:self._next_row]
+            self._matrix = grown
+        row = self._next_row
+        self._next_row += 1
+        return row
+
+    def _evict(self, count: int):
+        """删除最旧的 count 个条目，行号放回空闲列表"""
+        for _ in range(min(count, len(self._rows))):
+            _, row = self._rows.popitem(last=False)
+            self._free_rows.append(row)
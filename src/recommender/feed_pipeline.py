@@ -188,7 +188,7 @@ class FeedPipeline:
 
         # Stage 2: Sources
         self.in_network_source = InNetworkSource()
-        self.out_network_source = OutNetworkSource()
+        self.out_network_source = OutNetworkSource(self.config.source.out_network_ranking)
 
         # Stage 3: Hydrators
         self.core_data_hydrator = CoreDataHydrator()
@@ -400,22 +400,9 @@ class FeedPipeline:
             out_ratio_raw=source_cfg.out_network_ratio
         )
 
-        if self._stage2_parallel:
-            # 并行召回
-            in_network, out_network = self._stage2_parallel_retrieve(
-                ctx.user_context, total_budget, ctx.request.time_step
-            )
-        else:
-            # 串行召回
-            in_network = self.in_network_source.retrieve(
-                ctx.user_context,
-                max_candidates=total_budget
-            )
-            out_network = self.out_network_source.retrieve(
-                ctx.user_context,
-                max_candidates=total_budget,
-                time_step=ctx.request.time_step
-            )
+        in_network, out_network = self._retrieve_sources(
+            ctx.user_context, total_budget, ctx.request.time_step
+        )
 
         selected_in, selected_out = self._apply_source_ratio_budget(
             in_candidates=in_network,
@@ -440,6 +427,29 @@ class FeedPipeline:
 
         return ctx
 
+    def _retrieve_sources(
+        self,
+        user_context: UserContext,
+        max_candidates: int,
+        time_step: int
+    ) -> tuple:
+        """双轨召回，返回 (in_network_candidates, out_network_candidates)"""
+        if self._stage2_parallel:
+            # 并行召回
+            return self._stage2_parallel_retrieve(user_context, max_candidates, time_step)
+
+        # 串行召回
+        in_network = self.in_network_source.retrieve(
+            user_context,
+            max_candidates=max_candidates
+        )
+        out_network = self.out_network_source.retrieve(
+            user_context,
+            max_candidates=max_candidates,
+            time_step=time_step
+        )
+        return in_network, out_network
+
     @staticmethod
     def _compute_source_targets(
         total_budget: int,
@@ -611,18 +621,8 @@ class FeedPipeline:
         plog = self.pipeline_log
         uid = ctx.log_prefix
 
-        # 5.1 基础加权评分
-        ctx.candidates = self.weighted_scorer.score(
-            ctx.candidates,
-            self.config.freshness
-        )
-
-        # 5.2 Embedding 评分 (可选)
-        if self.embedding_scorer and ctx.request.include_embedding_score:
-            ctx.candidates = self.embedding_scorer.score(
-                ctx.candidates,
-                ctx.user_context
-            )
+        # 5.1 + 5.2 加权评分与 Embedding 评分
+        ctx = self._score_relevance(ctx)
 
         # 5.3 OON 评分
         ctx.candidates = self.oon_scorer.score(ctx.candidates)
@@ -654,6 +654,21 @@ class FeedPipeline:
 
         return ctx
 
+    def _score_relevance(self, ctx: PipelineContext) -> PipelineContext:
+        """阶段5.1/5.2: 基础加权评分 + Embedding 评分 (可选)"""
+        ctx.candidates = self.weighted_scorer.score(
+            ctx.candidates,
+            self.config.freshness
+        )
+
+        if self.embedding_scorer and ctx.request.include_embedding_score:
+            ctx.candidates = self.embedding_scorer.score(
+                ctx.candidates,
+                ctx.user_context
+            )
+
+        return ctx
+
     def _stage6_selection(self, ctx: PipelineContext) -> PipelineContext:
         """阶段6: 选择（带每个入选帖子的日志和选择原因）"""
         plog = self.pipeline_log
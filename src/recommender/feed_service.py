@@ -0,0 +1,416 @@
+"""
+共享 Feed 服务
+
+整个模拟共用一个管道实例。与用户无关的工作（候选池召回、数据水合、
+加权特征）每个时间步只计算一次；每个用户只执行依赖用户的阶段
+（查询水合、过滤、个性化评分、选择）。
+
+execute_many() 批量处理一组请求: 并行完成所有用户的查询水合，
+再用一次矩阵乘法算出所有用户对候选帖子的 Embedding 相似度。
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import RecommenderConfig
+from .feed_pipeline import FeedPipeline
+from .repositories.post_repository import interleave_ranked
+from .types import (
+    FeedRequest, FeedResponse, FeedSource, PipelineContext, PostCandidate, UserContext
+)
+
+logger = logging.getLogger(__name__)
+
+# AuthorHydrator 单次 IN 查询的帖子数上限（避免超出 SQLite 变量数限制）
+_AUTHOR_HYDRATION_CHUNK = 500
+
+RequestKey = Tuple[str, int]
+
+
+@dataclass
+class TickCandidatePool:
+    """单个时间步的共享候选池（与用户无关的部分）"""
+    time_step: int
+    post_timesteps: Dict[str, int]
+    posts: List[PostCandidate]                   # 全部活跃帖子（数据库顺序），已水合并完成加权评分
+    news_positions: List[int] = field(default_factory=list)
+    non_news_positions: List[int] = field(default_factory=list)
+    author_positions: Dict[str, List[int]] = field(default_factory=dict)
+    out_positions: List[int] = field(default_factory=list)  # 热点流召回顺序（新闻优先）
+
+
+class FeedService(FeedPipeline):
+    """
+    共享 Feed 服务
+
+    与 FeedPipeline 接口一致（execute / execute_async），可直接替换每个
+    用户各自持有的管道实例。
+
+    用法:
+        service = get_feed_service(config)
+        service.prefetch(user_ids, time_step)   # 反应阶段开始前批量计算
+        service.execute(request)                # 命中预取结果，否则单独计算
+    """
+
+    def __init__(self, config: RecommenderConfig = None, hydration_workers: int = 8):
+        """
+        初始化服务
+
+        Args:
+            config: 推荐系统配置，为 None 时使用默认配置
+            hydration_workers: 批量查询水合时的并发线程数
+        """
+        super().__init__(config)
+        self.hydration_workers = max(1, hydration_workers)
+        self._pool: Optional[TickCandidatePool] = None
+        self._pool_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._prehydrated: Dict[RequestKey, UserContext] = {}
+        self._similarities: Dict[RequestKey, Tuple[Dict[str, int], object]] = {}
+        self._prefetched: Dict[RequestKey, FeedResponse] = {}
+
+    # ========== 时间步候选池 ==========
+
+    def prepare_tick(self, time_step: int) -> TickCandidatePool:
+        """
+        构建（或复用）当前时间步的共享候选池
+
+        每个时间步只查询一次数据库: 全部活跃帖子、帖子时间步映射、作者画像。
+
+        Args:
+            time_step: 当前时间步
+
+        Returns:
+            共享候选池
+        """
+        with self._pool_lock:
+            if self._pool is not None and self._pool.time_step == time_step:
+                return self._pool
+
+            rows = self.post_repo.get_all_active_posts()
+            post_timesteps = self.post_repo.get_post_timesteps()
+
+            posts = [PostCandidate.from_db_row(row) for row in rows]
+            posts = self.core_data_hydrator.hydrate(posts, post_timesteps, time_step)
+            for start in range(0, len(posts), _AUTHOR_HYDRATION_CHUNK):
+                self.author_hydrator.hydrate(posts[start:start + _AUTHOR_HYDRATION_CHUNK])
+            posts = self.weighted_scorer.score(posts, self.config.freshness)
+
+            pool = TickCandidatePool(time_step=time_step, post_timesteps=post_timesteps, posts=posts)
+            for position, post in enumerate(posts):
+                if post.is_news:
+                    pool.news_positions.append(position)
+                else:
+                    pool.non_news_positions.append(position)
+                pool.author_positions.setdefault(post.author_id, []).append(position)
+            pool.out_positions = self._out_network_order(pool)
+
+            self._pool = pool
+            self._drop_stale_state(time_step)
+
+        logger.debug(
+            f"FeedService: tick {time_step} pool built with {len(posts)} posts "
+            f"({len(pool.news_positions)} news)"
+        )
+        return pool
+
+    def _drop_stale_state(self, time_step: int):
+        """丢弃其他时间步遗留的预取结果"""
+        with self._state_lock:
+            for state in (self._prehydrated, self._similarities, self._prefetched):
+                for key in [k for k in state if k[1] != time_step]:
+                    del state[key]
+
+    def _out_network_order(self, pool: TickCandidatePool) -> List[int]:
+        """
+        热点流召回顺序，每个时间步计算一次
+
+        与 OutNetworkSource 规则一致: 新闻在前、非新闻在后；"ranked" 时各自按
+        互动分榜与最新榜交错合并，"database_order" 时保持数据库顺序。
+        """
+        if self.config.source.out_network_ranking == "database_order":
+            return pool.news_positions + pool.non_news_positions
+
+        def engagement(i: int):
+            post = pool.posts[i]
+            return (post.num_likes + 2 * post.num_shares + post.num_comments, post.created_at or '')
+
+        def recency(i: int):
+            return pool.posts[i].created_at or ''
+
+        order: List[int] = []
+        for positions in (pool.news_positions, pool.non_news_positions):
+            rankings = [sorted(positions, key=engagement, reverse=True), sorted(positions, key=recency, reverse=True)]
+            order.extend(interleave_ranked(rankings, len(positions), key=lambda i: i))
+        return order
+
+    @staticmethod
+    def _candidate_positions(
+        pool: TickCandidatePool,
+        followed_ids: Set[str],
+        max_candidates: int
+    ) -> Tuple[List[int], List[int]]:
+        """按 InNetworkSource / OutNetworkSource 的规则计算候选在池中的位置"""
+        in_positions: List[int] = []
+        if followed_ids:
+            in_positions = sorted(chain.from_iterable(
+                pool.author_positions.get(author_id, ()) for author_id in followed_ids
+            ))[:max_candidates]
+        out_positions = pool.out_positions[:max_candidates]
+        return in_positions, out_positions
+
+    # ========== 覆盖的管道阶段 ==========
+
+    def _create_context(self, request: FeedRequest) -> PipelineContext:
+        """创建管道上下文（帖子时间步映射取自共享候选池）"""
+        if request.time_step is None:
+            return super()._create_context(request)
+
+        pool = self.prepare_tick(request.time_step)
+        return PipelineContext(
+            request=request,
+            user_context=UserContext(user_id=request.user_id),
+            candidates=[],
+            post_timesteps=pool.post_timesteps,
+            log_prefix=f"[{request.user_id[:8]}]",
+        )
+
+    def _stage1_query_hydration(self, ctx: PipelineContext) -> PipelineContext:
+        """阶段1: 查询水合（优先使用批量预水合结果）"""
+        key = (ctx.request.user_id, ctx.request.time_step)
+        with self._state_lock:
+            user_context = self._prehydrated.pop(key, None)
+        if user_context is None:
+            return super()._stage1_query_hydration(ctx)
+        ctx.user_context = user_context
+        return ctx
+
+    def _retrieve_sources(
+        self,
+        user_context: UserContext,
+        max_candidates: int,
+        time_step: int
+    ) -> tuple:
+        """阶段2: 从共享候选池中按用户关注关系切分双轨候选"""
+        if time_step is None:
+            return super()._retrieve_sources(user_context, max_candidates, time_step)
+
+        pool = self.prepare_tick(time_step)
+        followed = user_context.followed_ids
+        in_positions, out_positions = self._candidate_positions(pool, followed, max_candidates)
+
+        in_network = [
+            self._copy_candidate(pool.posts[i], FeedSource.IN_NETWORK, True)
+            for i in in_positions
+        ]
+        out_network = []
+        for i in out_positions:
+            template = pool.posts[i]
+            is_followed = template.author_id in followed
+            source = FeedSource.IN_NETWORK if is_followed else FeedSource.OUT_NETWORK
+            out_network.append(self._copy_candidate(template, source, is_followed))
+
+        return in_network, out_network
+
+    @staticmethod
+    def _copy_candidate(template: PostCandidate, source: FeedSource, is_followed: bool) -> PostCandidate:
+        """复制共享候选（后续阶段会修改评分字段）"""
+        candidate = template.model_copy()
+        candidate.source = source
+        candidate.is_followed_author = is_followed
+        return candidate
+
+    def _stage3_data_hydration(self, ctx: PipelineContext) -> PipelineContext:
+        """阶段3: 共享候选池已完成水合"""
+        if ctx.request.time_step is None:
+            return super()._stage3_data_hydration(ctx)
+        return ctx
+
+    def _score_relevance(self, ctx: PipelineContext) -> PipelineContext:
+        """阶段5.1/5.2: 加权分数已在候选池中算好，只计算个性化 Embedding 分数"""
+        if ctx.request.time_step is None:
+            return super()._score_relevance(ctx)
+
+        if self.embedding_scorer and ctx.request.include_embedding_score:
+            key = (ctx.request.user_id, ctx.request.time_step)
+            with self._state_lock:
+                batch = self._similarities.pop(key, None)
+            if batch is None:
+                ctx.candidates = self.embedding_scorer.score(ctx.candidates, ctx.user_context)
+            else:
+                column_of, row = batch
+                similarities = {
+                    c.post_id: float(row[column_of[c.post_id]])
+                    for c in ctx.candidates if c.post_id in column_of
+                } if row is not None else {}
+                ctx.candidates = self.embedding_scorer.apply_similarities(ctx.candidates, similarities)
+
+        return ctx
+
+    # ========== 单个 / 批量执行 ==========
+
+    def execute(self, request: FeedRequest) -> FeedResponse:
+        """执行推荐管道（命中预取结果时直接返回）"""
+        with self._state_lock:
+            response = self._prefetched.pop((request.user_id, request.time_step), None)
+        if response is not None:
+            return response
+        return super().execute(request)
+
+    def execute_many(self, requests: List[FeedRequest]) -> List[Optional[FeedResponse]]:
+        """
+        批量执行推荐管道
+
+        1. 并行完成所有用户的查询水合
+        2. 一次矩阵乘法算出所有用户对其候选帖子的 Embedding 相似度
+        3. 逐用户执行过滤、评分、选择
+
+        Args:
+            requests: Feed 请求列表
+
+        Returns:
+            与 requests 一一对应的响应列表，单个用户失败时对应位置为 None
+        """
+        if not requests:
+            return []
+
+        workers = min(self.hydration_workers, len(requests))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            user_contexts = list(executor.map(self._hydrate_user, requests))
+            with self._state_lock:
+                for request, user_context in zip(requests, user_contexts):
+                    if user_context is not None:
+                        self._prehydrated[(request.user_id, request.time_step)] = user_context
+
+            if self.embedding_scorer:
+                self._batch_similarities(requests, user_contexts)
+
+            return list(executor.map(self._execute_safely, requests))
+
+    def prefetch(self, user_ids: List[str], time_step: int, feed_size: int = 10) -> int:
+        """
+        为一组用户预先计算 Feed，后续 execute() 直接返回结果
+
+        Args:
+            user_ids: 用户 ID 列表
+            time_step: 当前时间步
+            feed_size: Feed 大小
+
+        Returns:
+            成功预取的用户数
+        """
+        requests = [
+            FeedRequest(
+                user_id=user_id,
+                time_step=time_step,
+                feed_size=feed_size,
+                include_embedding_score=True,
+                cold_start=False
+            )
+            for user_id in user_ids
+        ]
+        responses = self.execute_many(requests)
+
+        with self._state_lock:
+            for request, response in zip(requests, responses):
+                if response is not None:
+                    self._prefetched[(request.user_id, request.time_step)] = response
+
+        prefetched = sum(1 for response in responses if response is not None)
+        logger.info(f"FeedService: prefetched {prefetched}/{len(requests)} feeds for time step {time_step}")
+        return prefetched
+
+    def _hydrate_user(self, request: FeedRequest) -> Optional[UserContext]:
+        """查询水合单个用户；失败时返回 None，由 execute() 重新水合"""
+        try:
+            user_context = self.user_action_hydrator.hydrate(request.user_id)
+            return self.user_features_hydrator.hydrate(user_context)
+        except Exception as e:
+            logger.warning(f"FeedService: query hydration failed for user {request.user_id}: {e}")
+            return None
+
+    def _execute_safely(self, request: FeedRequest) -> Optional[FeedResponse]:
+        try:
+            return super().execute(request)
+        except Exception as e:
+            logger.warning(f"FeedService: feed failed for user {request.user_id}: {e}")
+            return None
+
+    def _batch_similarities(
+        self,
+        requests: List[FeedRequest],
+        user_contexts: List[Optional[UserContext]]
+    ):
+        """为批量请求一次性计算用户 × 候选帖子的相似度矩阵"""
+        budget = max(1, int(self.config.source.max_candidates_per_source))
+        manager = self.embedding_scorer.embedding_manager
+
+        batch = [
+            (request, user_context)
+            for request, user_context in zip(requests, user_contexts)
+            if user_context is not None and request.include_embedding_score and request.time_step is not None
+        ]
+        for time_step in {request.time_step for request, _ in batch}:
+            pool = self.prepare_tick(time_step)
+            step_batch = [(r, uc) for r, uc in batch if r.time_step == time_step]
+
+            # 只为可能成为候选的帖子计算 embedding
+            positions = set()
+            for _, user_context in step_batch:
+                in_positions, out_positions = self._candidate_positions(
+                    pool, user_context.followed_ids, budget
+                )
+                positions.update(in_positions)
+                positions.update(out_positions)
+
+            posts = [pool.posts[position] for position in sorted(positions)]
+            post_matrix, found = manager.get_embedding_matrix(
+                [post.post_id for post in posts], [post.content for post in posts]
+            )
+            column_of: Dict[str, int] = {}
+            for post, ok in zip(posts, found):
+                if ok:
+                    column_of[post.post_id] = len(column_of)
+            post_matrix = post_matrix[found]
+
+            users = [(r, uc) for r, uc in step_batch if uc.persona_embedding is not None]
+            rows = []
+            if users and column_of:
+                rows = self.embedding_scorer.similarity_matrix(
+                    [uc.persona_embedding for _, uc in users], post_matrix
+                )
+
+            with self._state_lock:
+                # 没有 persona embedding 的用户不做 Embedding 调整（与 EmbeddingScorer.score 一致）
+                for request, _ in step_batch:
+                    self._similarities[(request.user_id, time_step)] = (column_of, None)
+                for (request, _), row in zip(users, rows):
+                    self._similarities[(request.user_id, time_step)] = (column_of, row)
+
+
+_feed_services: Dict[str, FeedService] = {}
+_feed_services_lock = threading.Lock()
+
+
+def get_feed_service(config: RecommenderConfig = None) -> FeedService:
+    """
+    获取共享 Feed 服务（相同配置共用一个实例）
+
+    Args:
+        config: 推荐系统配置
+
+    Returns:
+        FeedService 实例
+    """
+    config = config or RecommenderConfig()
+    key = repr(config)
+    with _feed_services_lock:
+        service = _feed_services.get(key)
+        if service is None:
+            service = FeedService(config)
+            _feed_services[key] = service
+    return service
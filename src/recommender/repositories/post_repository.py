@@ -6,13 +6,51 @@
 
 import sys
 import os
-from typing import List, Dict, Any, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 from threading import Lock
 
 # 添加 src 目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from database.database_manager import fetch_all, fetch_one
+from post_index import NEWS, NON_NEWS, get_post_index, is_active
+
+# 热点流排序: 互动分 (Likes + Shares×2 + Comments) 与发布时间两条榜单交错合并
+ENGAGEMENT_ORDER = (
+    '(COALESCE(p.num_likes, 0) + 2 * COALESCE(p.num_shares, 0) + COALESCE(p.num_comments, 0)) DESC, '
+    'p.created_at DESC'
+)
+RECENCY_ORDER = 'p.created_at DESC'
+
+
+def interleave_ranked(rankings: Iterable[List[Any]], limit: int, key: Callable[[Any], Any]) -> List[Any]:
+    """
+    交错合并多条已排序榜单并去重，最多返回 limit 项
+
+    Args:
+        rankings: 已排序的榜单（如按互动分、按时间）
+        limit: 返回数量上限
+        key: 去重键
+
+    Returns:
+        合并后的列表（各榜单轮流取下一项）
+    """
+    iterators = [iter(ranking) for ranking in rankings]
+    merged, seen = [], set()
+    while iterators and len(merged) < limit:
+        for iterator in list(iterators):
+            for item in iterator:
+                item_key = key(item)
+                if item_key not in seen:
+                    seen.add(item_key)
+                    merged.append(item)
+                    break
+            else:
+                iterators.remove(iterator)
+                continue
+            if len(merged) >= limit:
+                break
+    return merged
 
 
 class PostRepository:
@@ -22,12 +60,15 @@ class PostRepository:
     提供帖子相关的数据库查询方法
 
     支持时间步级别的缓存，避免同一时间步内重复查询全局帖子
+
+    全量帖子列表和时间步映射由进程内 PostIndex 提供（增量同步，不再整表查询）
     """
 
     # 类级别缓存（所有实例共享）
     _news_cache: Dict[int, List[Dict[str, Any]]] = {}
     _non_news_cache: Dict[int, List[Dict[str, Any]]] = {}
     _timesteps_cache: Dict[int, Dict[str, int]] = {}
+    _ranked_cache: Dict[Tuple[int, bool, int], List[Dict[str, Any]]] = {}
     _cache_lock = Lock()
     _current_time_step: int = -1
 
@@ -41,27 +82,52 @@ class PostRepository:
         FROM posts p
     '''
 
+    @staticmethod
+    def _synced_index():
+        """同步并返回共享帖子索引"""
+        index = get_post_index()
+        # NO FALLBACK: Propagate database errors instead of returning empty results
+        index.sync()
+        return index
+
     def get_active_news_posts(self) -> List[Dict[str, Any]]:
         """获取所有活跃新闻帖子"""
-        query = f'''
-            {self.BASE_SELECT}
-            WHERE p.is_news = TRUE
-            AND (p.status IS NULL OR p.status != 'taken_down')
-        '''
-        # NO FALLBACK: Propagate database errors instead of returning empty list
-        result = fetch_all(query)
-        return result if result else []
+        return [dict(row) for row in self._synced_index().active_posts(NEWS)]
 
     def get_active_non_news_posts(self) -> List[Dict[str, Any]]:
         """获取所有活跃非新闻帖子"""
-        query = f'''
-            {self.BASE_SELECT}
-            WHERE (p.is_news IS NULL OR p.is_news != TRUE)
-            AND (p.status IS NULL OR p.status != 'taken_down')
-        '''
-        # NO FALLBACK: Propagate database errors instead of returning empty list
-        result = fetch_all(query)
-        return result if result else []
+        return [dict(row) for row in self._synced_index().active_posts(NON_NEWS)]
+
+    def get_ranked_active_posts(self, is_news: bool, limit: int) -> List[Dict[str, Any]]:
+        """
+        获取排序后的前 limit 个活跃帖子 (Out-Network 召回)
+
+        排序和截断在 SQL 中完成: 按互动分、按发布时间各取前 limit 条，
+        再交错合并去重，新帖子不会被高互动老帖完全挤出。
+
+        Args:
+            is_news: True 取新闻帖子，False 取非新闻帖子
+            limit: 返回数量上限
+
+        Returns:
+            帖子列表（按排名顺序）
+        """
+        if limit <= 0:
+            return []
+
+        news_clause = 'p.is_news = TRUE' if is_news else '(p.is_news IS NULL OR p.is_news != TRUE)'
+        rankings = []
+        for order in (ENGAGEMENT_ORDER, RECENCY_ORDER):
+            query = f'''
+                {self.BASE_SELECT}
+                WHERE {news_clause}
+                AND (p.status IS NULL OR p.status != 'taken_down')
+                ORDER BY {order}
+                LIMIT ?
+            '''
+            # NO FALLBACK: Propagate database errors instead of returning empty list
+            rankings.append(fetch_all(query, (limit,)) or [])
+        return interleave_ranked(rankings, limit, key=lambda row: str(row['post_id']))
 
     def get_posts_by_authors(self, author_ids: List[str]) -> List[Dict[str, Any]]:
         """
@@ -76,25 +142,12 @@ class PostRepository:
         if not author_ids:
             return []
 
-        placeholders = ','.join(['?' for _ in author_ids])
-        query = f'''
-            {self.BASE_SELECT}
-            WHERE p.author_id IN ({placeholders})
-            AND (p.status IS NULL OR p.status != 'taken_down')
-        '''
-        # NO FALLBACK: Propagate database errors instead of returning empty list
-        result = fetch_all(query, tuple(author_ids))
-        return result if result else []
+        rows = self._synced_index().by_authors(author_ids)
+        return [dict(row) for row in rows if is_active(row)]
 
     def get_all_active_posts(self) -> List[Dict[str, Any]]:
         """获取所有活跃帖子"""
-        query = f'''
-            {self.BASE_SELECT}
-            WHERE (p.status IS NULL OR p.status != 'taken_down')
-        '''
-        # NO FALLBACK: Propagate database errors instead of returning empty list
-        result = fetch_all(query)
-        return result if result else []
+        return [dict(row) for row in self._synced_index().active_posts()]
 
     def get_post_timesteps(self) -> Dict[str, int]:
         """
@@ -103,9 +156,7 @@ class PostRepository:
         Returns:
             {post_id: time_step} 字典
         """
-        # NO FALLBACK: Propagate database errors instead of returning empty dict
-        rows = fetch_all('SELECT post_id, time_step FROM post_timesteps')
-        return {str(r['post_id']): r['time_step'] for r in rows if r}
+        return self._synced_index().post_timesteps()
 
     def get_post_by_id(self, post_id: str) -> Optional[Dict[str, Any]]:
         """获取单个帖子"""
@@ -131,6 +182,7 @@ class PostRepository:
                 self._news_cache.clear()
                 self._non_news_cache.clear()
                 self._timesteps_cache.clear()
+                self._ranked_cache.clear()
                 self._current_time_step = time_step
 
     def get_active_news_posts_cached(self, time_step: int = None) -> List[Dict[str, Any]]:
@@ -155,6 +207,7 @@ class PostRepository:
                 self._news_cache.clear()
                 self._non_news_cache.clear()
                 self._timesteps_cache.clear()
+                self._ranked_cache.clear()
                 self._current_time_step = time_step
 
             if time_step in self._news_cache:
@@ -191,6 +244,7 @@ class PostRepository:
                 self._news_cache.clear()
                 self._non_news_cache.clear()
                 self._timesteps_cache.clear()
+                self._ranked_cache.clear()
                 self._current_time_step = time_step
 
             if time_step in self._non_news_cache:
@@ -205,6 +259,47 @@ class PostRepository:
 
         return result
 
+    def get_ranked_active_posts_cached(
+        self,
+        is_news: bool,
+        limit: int,
+        time_step: int = None
+    ) -> List[Dict[str, Any]]:
+        """
+        获取排序后的前 limit 个活跃帖子（带时间步缓存）
+
+        Args:
+            is_news: True 取新闻帖子，False 取非新闻帖子
+            limit: 返回数量上限
+            time_step: 当前时间步（用于缓存键，None 则不缓存）
+
+        Returns:
+            帖子列表（按排名顺序）
+        """
+        if time_step is None:
+            return self.get_ranked_active_posts(is_news, limit)
+
+        cache_key = (time_step, bool(is_news), limit)
+        with self._cache_lock:
+            if time_step != self._current_time_step:
+                self._news_cache.clear()
+                self._non_news_cache.clear()
+                self._timesteps_cache.clear()
+                self._ranked_cache.clear()
+                self._current_time_step = time_step
+
+            if cache_key in self._ranked_cache:
+                return self._ranked_cache[cache_key]
+
+        # 在锁外查询数据库
+        result = self.get_ranked_active_posts(is_news, limit)
+
+        # 缓存结果
+        with self._cache_lock:
+            self._ranked_cache[cache_key] = result
+
+        return result
+
     def get_post_timesteps_cached(self, time_step: int = None) -> Dict[str, int]:
         """
         获取帖子时间步映射（带缓存）
@@ -223,6 +318,7 @@ class PostRepository:
                 self._news_cache.clear()
                 self._non_news_cache.clear()
                 self._timesteps_cache.clear()
+                self._ranked_cache.clear()
                 self._current_time_step = time_step
 
             if time_step in self._timesteps_cache:
@@ -243,4 +339,5 @@ class PostRepository:
             self._news_cache.clear()
             self._non_news_cache.clear()
             self._timesteps_cache.clear()
+            self._ranked_cache.clear()
             self._current_time_step = -1
@@ -9,10 +9,14 @@ Embedding 评分器
 - OpenAI Embedding API (可选)
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+import numpy as np
+
 from ..types import PostCandidate, UserContext
 from ..config import EmbeddingConfig
 from ..embedding.embedding_manager import get_embedding_manager
+from ..embedding.embedding_store import EmbeddingStore
 
 
 class EmbeddingScorer:
@@ -40,7 +44,9 @@ class EmbeddingScorer:
             cache_embeddings=self.config.cache_embeddings,
             max_cache_size=self.config.max_cache_size,
             use_openai_embedding=self.config.use_openai_embedding,
-            openai_model_name=self.config.openai_model_name
+            openai_model_name=self.config.openai_model_name,
+            persistent_cache=self.config.persistent_cache,
+            persistent_cache_dir=self.config.persistent_cache_dir
         )
 
     def score(
@@ -69,26 +75,70 @@ class EmbeddingScorer:
         if user_embedding is None:
             return candidates
 
+        if not candidates:
+            return candidates
+
+        # 一次批量取出（或编码）所有候选的归一化向量，单次矩阵-向量乘法得到相似度
+        post_matrix, found = self.embedding_manager.get_embedding_matrix(
+            [c.post_id for c in candidates],
+            [c.content for c in candidates]
+        )
+        if post_matrix.shape[1] == 0:
+            return candidates
+        scores = self.similarity_matrix([user_embedding], post_matrix)[0]
+        similarities = {
+            c.post_id: float(score)
+            for c, score, ok in zip(candidates, scores, found) if ok
+        }
+
+        return self.apply_similarities(candidates, similarities)
+
+    def apply_similarities(
+        self,
+        candidates: List[PostCandidate],
+        similarities: Dict[str, float]
+    ) -> List[PostCandidate]:
+        """
+        将预先算好的相似度融合到候选分数
+
+        Args:
+            candidates: 候选帖子列表（已由 WeightedScorer 计算 weighted_score）
+            similarities: {post_id: 余弦相似度}，缺失的帖子保持原分数
+
+        Returns:
+            填充了 embedding_score 的候选帖子列表
+        """
+        weight = self.config.embedding_weight
         for c in candidates:
-            # 获取帖子 embedding
-            post_embedding = self.embedding_manager.get_or_compute_embedding(
-                c.post_id,
-                c.content
+            similarity = similarities.get(c.post_id)
+            if similarity is None:
+                continue
+            c.embedding_score = similarity
+
+            # 融合到最终分数
+            # final_score = weighted_score × (1 - weight) + similarity × weight × weighted_score
+            c.final_score = (
+                c.weighted_score * (1 - weight) +
+                similarity * weight * c.weighted_score
             )
 
-            if post_embedding is not None:
-                # 计算余弦相似度
-                similarity = self._cosine_similarity(user_embedding, post_embedding)
-                c.embedding_score = similarity
+        return candidates
+
+    @staticmethod
+    def similarity_matrix(user_embeddings, post_embeddings) -> np.ndarray:
+        """
+        批量计算余弦相似度矩阵
 
-                # 融合到最终分数
-                # final_score = weighted_score × (1 - weight) + similarity × weight × weighted_score
-                c.final_score = (
-                    c.weighted_score * (1 - self.config.embedding_weight) +
-                    similarity * self.config.embedding_weight * c.weighted_score
-                )
+        Args:
+            user_embeddings: (n_users, dim) 用户向量
+            post_embeddings: (n_posts, dim) 帖子向量（EmbeddingStore 中的行已归一化）
 
-        return candidates
+        Returns:
+            (n_users, n_posts) 相似度矩阵，零向量对应的相似度为 0
+        """
+        users = EmbeddingStore.normalize(user_embeddings)
+        posts = EmbeddingStore.normalize(post_embeddings)
+        return users @ posts.T
 
     def _cosine_similarity(
         self,
@@ -105,12 +155,4 @@ class EmbeddingScorer:
         Returns:
             相似度 [-1, 1]
         """
-        import numpy as np
-        a_arr = np.array(a)
-        b_arr = np.array(b)
-        dot_product = np.dot(a_arr, b_arr)
-        norm_a = np.linalg.norm(a_arr)
-        norm_b = np.linalg.norm(b_arr)
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-        return float(dot_product / (norm_a * norm_b))
+        return float(self.similarity_matrix([a], [b])[0, 0])
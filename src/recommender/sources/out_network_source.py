@@ -2,8 +2,12 @@
 Out-of-Network 召回源
 
 阶段2: 热点流召回 - 获取全局热门帖子
+
+排序与截断下推到 SQL（互动分榜 + 最新榜交错合并），每次召回只构建
+max_candidates 个候选，不随帖子总数增长。
 """
 
+from itertools import chain, islice
 from typing import List
 from ..types import PostCandidate, UserContext, FeedSource
 from ..repositories.post_repository import PostRepository
@@ -17,8 +21,14 @@ class OutNetworkSource:
     打破信息茧房，进行跨生态位文化输出的唯一通道
     """
 
-    def __init__(self):
+    def __init__(self, ranking: str = "ranked"):
+        """
+        Args:
+            ranking: "ranked" 在 SQL 中按互动分/发布时间排序取前 K 个；
+                     "database_order" 全量读取后按数据库顺序截断（旧行为）
+        """
         self.post_repo = PostRepository()
+        self.ranking = ranking
 
     def retrieve(
         self,
@@ -37,38 +47,40 @@ class OutNetworkSource:
         Returns:
             标记为 OUT_NETWORK 的候选帖子列表
         """
-        candidates = []
-        followed_set = user_context.followed_ids
-
-        # 获取新闻帖子（使用时间步缓存）
-        news_rows = self.post_repo.get_active_news_posts_cached(time_step)
-        for row in news_rows:
-            candidate = PostCandidate.from_db_row(row)
-            author_id = str(row.get('author_id', ''))
+        if self.ranking == "database_order":
+            return self._retrieve_database_order(user_context, max_candidates, time_step)
 
-            # 如果是关注的作者，标记为 IN_NETWORK
-            if author_id in followed_set:
-                candidate.source = FeedSource.IN_NETWORK
-                candidate.is_followed_author = True
-            else:
-                candidate.source = FeedSource.OUT_NETWORK
-                candidate.is_followed_author = False
+        # 新闻优先: 先取排名靠前的新闻，不足部分由非新闻补齐
+        rows = self.post_repo.get_ranked_active_posts_cached(True, max_candidates, time_step)
+        remaining = max_candidates - len(rows)
+        if remaining > 0:
+            rows = rows + self.post_repo.get_ranked_active_posts_cached(False, remaining, time_step)
 
-            candidates.append(candidate)
+        return [self._to_candidate(row, user_context.followed_ids) for row in rows]
 
-        # 获取非新闻帖子（使用时间步缓存）
+    def _retrieve_database_order(
+        self,
+        user_context: UserContext,
+        max_candidates: int,
+        time_step: int = None
+    ) -> List[PostCandidate]:
+        """旧召回方式: 全量读取活跃帖子，按数据库顺序截断"""
+        followed_set = user_context.followed_ids
+        news_rows = self.post_repo.get_active_news_posts_cached(time_step)
         non_news_rows = self.post_repo.get_active_non_news_posts_cached(time_step)
-        for row in non_news_rows:
-            candidate = PostCandidate.from_db_row(row)
-            author_id = str(row.get('author_id', ''))
-
-            if author_id in followed_set:
-                candidate.source = FeedSource.IN_NETWORK
-                candidate.is_followed_author = True
-            else:
-                candidate.source = FeedSource.OUT_NETWORK
-                candidate.is_followed_author = False
-
-            candidates.append(candidate)
-
-        return candidates[:max_candidates]
+        return [
+            self._to_candidate(row, followed_set)
+            for row in islice(chain(news_rows, non_news_rows), max_candidates)
+        ]
+
+    @staticmethod
+    def _to_candidate(row, followed_set) -> PostCandidate:
+        """构建候选帖子；关注作者的帖子标记为 IN_NETWORK"""
+        candidate = PostCandidate.from_db_row(row)
+        if str(row.get('author_id', '')) in followed_set:
+            candidate.source = FeedSource.IN_NETWORK
+            candidate.is_followed_author = True
+        else:
+            candidate.source = FeedSource.OUT_NETWORK
+            candidate.is_followed_author = False
+        return candidate
@@ -3,6 +3,7 @@ import logging
 import os
 import random
 import time
+import numpy as np
 from utils import Utils, resolve_engine
 import json
 import csv
@@ -10,6 +11,13 @@ from homophily_analysis import HomophilyAnalysis
 from tqdm import tqdm
 from news_manager import NewsManager
 from database_manager import DatabaseManager
+from database.database_manager import get_db_manager
+from database.engagement_buffer import get_engagement_buffer
+from llm_gateway import get_llm_gateway
+from llm_client_registry import get_client_registry
+from llm_cache import configure_llm_cache, get_llm_cache
+from batched_reactions import BatchedFeedReactor
+from multi_model_selector import multi_model_selector
 from user_manager import UserManager
 from news_spread_analyzer import NewsSpreadAnalyzer
 from fact_checker import FactChecker, FactCheckVerdict
@@ -45,7 +53,23 @@ class Simulation:
         self.reset_db = config.get('reset_db', True)
         self.restore_from_snapshot = bool(config.get('restore_from_snapshot', False))
         self.num_users = config['num_users']
+
+        # On-disk response cache / replay (LLM_CACHE_MODE=replay re-runs without model calls).
+        # Configured before anything draws random numbers so a seeded run repeats its prompts.
+        llm_cache = configure_llm_cache(config.get('llm_cache'))
+        if llm_cache.enabled and llm_cache.config.seed is not None:
+            random.seed(llm_cache.config.seed)
+            np.random.seed(llm_cache.config.seed)
+            Utils.seed_ids(llm_cache.config.seed)
+            logging.info(f"🎲 Seeded random, numpy and generated ids with {llm_cache.config.seed}")
         self.engine = resolve_engine(config)
+
+        # Per-model LLM admission limits (requests/tokens per minute, in-flight concurrency)
+        get_llm_gateway().configure(config.get('llm_gateway'))
+        # In-process inference backend ("stub" / "transformers") for network-free runs
+        multi_model_selector.configure_inference_backend(config.get('inference_backend'))
+        # Optional batched feed-reaction prompting (several agents per LLM request)
+        self.batched_reactor = BatchedFeedReactor(config.get('batched_reactions'))
         self.generate_own_post = config.get('generate_own_post', True)  # New parameter with default True
 
         # Generate timestamp for this run
@@ -440,12 +464,28 @@ class Simulation:
                     setattr(user, 'current_time_step', step)
                 except Exception:
                     pass
-                task = self._async_user_reaction(user, step)
-                reaction_tasks.append(task)
+                if not self.batched_reactor.enabled:
+                    reaction_tasks.append(self._async_user_reaction(user, step))
+            if self.batched_reactor.enabled and self.users:
+                # One packed request serves several agents with the same model/temperature
+                reaction_tasks.append(self._batched_user_reactions(self.users, step))
             
-            # Run all user reaction tasks in parallel
-            if reaction_tasks:
-                await asyncio.gather(*reaction_tasks, return_exceptions=True)
+            # Score all recommender feeds in one batch before users react
+            if step > 0 and reaction_tasks:
+                await self._prefetch_recommender_feeds(step)
+
+            # Run all user reaction tasks in parallel; likes, shares and follows are
+            # buffered for the whole phase and flushed together afterwards
+            engagement_buffer = get_engagement_buffer()
+            engagement_buffer.begin()
+            try:
+                if reaction_tasks:
+                    await asyncio.gather(*reaction_tasks, return_exceptions=True)
+            finally:
+                engagement_buffer.end()
+
+            # Send any writes the reaction phase deferred into one batch
+            get_db_manager().flush_deferred()
 
             # Clear timestep context
             for user in self.users:
@@ -533,58 +573,27 @@ class Simulation:
             except Exception as _monitor_err:
                 logging.debug(f"Defense monitoring skipped: {_monitor_err}")
 
-            # 保存tick快照（在tick结束时）
+            # 保存tick快照（在tick结束时）：固定时间点视图后交给后台写入，统计在快照副本上计算
             if self.snapshot_enabled:
-                try:
-                    # 获取详细用户统计
-                    cursor = self.conn.cursor()
-                    # 总用户数
-                    cursor.execute("SELECT COUNT(*) FROM users WHERE status IS NULL OR status != 'banned'")
-                    total_users = cursor.fetchone()[0]
-
-                    # 领袖用户数 (is_influencer)
-                    cursor.execute("SELECT COUNT(*) FROM users WHERE is_influencer = 1 AND (status IS NULL OR status != 'banned')")
-                    leader_users = cursor.fetchone()[0]
-
-                    # 恶意用户数（通过恶意评论关联）
-                    cursor.execute("""
-                        SELECT COUNT(DISTINCT c.author_id)
-                        FROM comments c
-                        JOIN malicious_comments mc ON c.comment_id = mc.comment_id
-                    """)
-                    malicious_users = cursor.fetchone()[0]
-
-                    # 附和群组用户（amplifiers）- 通过攻击记录中的参与用户
-                    cursor.execute("""
-                        SELECT COUNT(DISTINCT c.author_id)
-                        FROM comments c
-                        JOIN malicious_attacks ma ON c.post_id = ma.target_post_id
-                        WHERE ma.cluster_size > 1
-                    """)
-                    amplifier_users = cursor.fetchone()[0]
-
-                    # 普通用户 = 总用户 - 领袖 - 恶意
-                    normal_users = total_users - leader_users - malicious_users
-
-                    absolute_tick = step + 1
-                    snapshot_tick = get_session_tick_number(start_tick, absolute_tick)
-                    additional_info = {
-                        "tick": snapshot_tick,
-                        "absolute_tick": absolute_tick,
-                        "timestamp": datetime.now().isoformat(),
-                        "user_count": total_users,
-                        "post_count": current_post_count,
-                        "normal_users": normal_users,
-                        "leader_users": leader_users,
-                        "malicious_users": malicious_users,
-                        "amplifier_users": amplifier_users
-                    }
-                    self.snapshot_manager.save_tick_snapshot(snapshot_tick, additional_info)
-                except Exception as e:
-                    logging.warning(f"Failed to save snapshot for tick {snapshot_tick}: {e}")
+                absolute_tick = step + 1
+                snapshot_tick = get_session_tick_number(start_tick, absolute_tick)
+                additional_info = {
+                    "tick": snapshot_tick,
+                    "absolute_tick": absolute_tick,
+                    "timestamp": datetime.now().isoformat(),
+                    "post_count": current_post_count
+                }
+                if not await self.snapshot_manager.asave_tick_snapshot(
+                    snapshot_tick, additional_info, info_builder=self._collect_snapshot_stats
+                ):
+                    logging.warning(f"Failed to save snapshot for tick {snapshot_tick}")
 
             logging.info("")  # Add a newline for readability between time steps
 
+        # 等待后台快照写完（在线程中等待，不阻塞事件循环）
+        if self.snapshot_enabled:
+            await asyncio.to_thread(self.snapshot_manager.close)
+
         # Stop the opinion balance background monitoring task
         if opinion_balance_task and not opinion_balance_task.done():
             opinion_balance_task.cancel()
@@ -598,6 +607,19 @@ class Simulation:
             self.config.get('opinion_balance_system', {}).get('feedback_system_enabled', False)):
             await self._wait_for_monitoring_completion()
 
+        # Release the keep-alive pools created on this event loop
+        pool_stats = get_client_registry().pool_stats()
+        logging.info(f"🔌 LLM client pools: {pool_stats['sync_clients']} sync, {pool_stats['async_clients']} async")
+        for pool in pool_stats['pools']:
+            logging.info(f"   [{pool['kind']}] {pool['base_url']} ({pool['role']}): "
+                         f"{pool['handouts']} handouts, {pool['pooled_connections']} pooled connections")
+        await get_client_registry().aclose()
+        cache = get_llm_cache()
+        if cache.enabled:
+            cache_stats = cache.summary()
+            logging.info(f"💾 LLM cache ({cache_stats['mode']}): {cache_stats['hits']} hits, "
+                         f"{cache_stats['misses']} misses, {cache_stats['hit_rate']:.1%} hit rate")
+
         # Print the simulation statistics
         logging.info("\nSimulation complete. Printing statistics...")
         Utils.print_simulation_stats(self.conn)
@@ -609,6 +631,46 @@ class Simulation:
         homophily_analyzer = HomophilyAnalysis(self.db_path)
         homophily_analyzer.run_analysis(output_dir=f"experiment_outputs/homophily_analysis/{self.timestamp}")
 
+    @staticmethod
+    def _collect_snapshot_stats(conn) -> dict:
+        """在 tick 快照副本上统计用户构成（由后台快照线程调用）"""
+        cursor = conn.cursor()
+        # 总用户数
+        cursor.execute("SELECT COUNT(*) FROM users WHERE status IS NULL OR status != 'banned'")
+        total_users = cursor.fetchone()[0]
+
+        # 领袖用户数 (is_influencer)
+        cursor.execute("SELECT COUNT(*) FROM users WHERE is_influencer = 1 AND (status IS NULL OR status != 'banned')")
+        leader_users = cursor.fetchone()[0]
+
+        # 恶意用户数（通过恶意评论关联）
+        cursor.execute("""
+            SELECT COUNT(DISTINCT c.author_id)
+            FROM comments c
+            JOIN malicious_comments mc ON c.comment_id = mc.comment_id
+        """)
+        malicious_users = cursor.fetchone()[0]
+
+        # 附和群组用户（amplifiers）- 通过攻击记录中的参与用户
+        cursor.execute("""
+            SELECT COUNT(DISTINCT c.author_id)
+            FROM comments c
+            JOIN malicious_attacks ma ON c.post_id = ma.target_post_id
+            WHERE ma.cluster_size > 1
+        """)
+        amplifier_users = cursor.fetchone()[0]
+
+        # 普通用户 = 总用户 - 领袖 - 恶意
+        normal_users = total_users - leader_users - malicious_users
+
+        return {
+            "user_count": total_users,
+            "normal_users": normal_users,
+            "leader_users": leader_users,
+            "malicious_users": malicious_users,
+            "amplifier_users": amplifier_users
+        }
+
     async def _run_malicious_batch_attack(self, step: int):
         """Run malicious bot batch attack around the middle of each timestep."""
         if (not hasattr(self, 'malicious_bot_manager') or
@@ -982,21 +1044,39 @@ class Simulation:
         cursor.execute("SELECT COUNT(*) FROM posts WHERE original_post_id IS NULL")
         return cursor.fetchone()[0]
 
+    async def _prefetch_recommender_feeds(self, step):
+        """Batch-compute recommender feeds for every user that uses the shared feed service"""
+        services = {}
+        for user in self.users:
+            service = getattr(user, '_feed_pipeline', None)
+            if service is not None and hasattr(service, 'prefetch'):
+                services.setdefault(id(service), (service, []))[1].append(user.user_id)
+
+        for service, user_ids in services.values():
+            try:
+                await asyncio.to_thread(service.prefetch, user_ids, step)
+            except Exception as e:
+                logging.warning(f"Feed prefetch failed, users will build their own feeds: {e}")
+
+    async def _load_user_feed(self, user, step):
+        """Build a user's feed for the reaction phase"""
+        # User reacts to their feed — even in fact-check mode, show the full feed (including user posts)
+        # 使用 asyncio.to_thread 包装同步调用，避免阻塞事件循环
+        feed = await asyncio.to_thread(
+            user.get_feed,
+            experiment_config=self.config,
+            time_step=step
+        )
+
+        # 真相拼接机制：到达规定时间步后无条件执行，不受 aftercare_enabled 控制
+        if step >= 4 and self.news_manager:
+            feed = self._append_truth_to_fake_news_posts_with_delay(feed, step)
+        return feed
+
     async def _async_user_reaction(self, user, step):
         """Async user reaction handler"""
         try:
-            # User reacts to their feed — even in fact-check mode, show the full feed (including user posts)
-            # 使用 asyncio.to_thread 包装同步调用，避免阻塞事件循环
-            feed = await asyncio.to_thread(
-                user.get_feed,
-                experiment_config=self.config,
-                time_step=step
-            )
-
-            # 真相拼接机制：到达规定时间步后无条件执行，不受 aftercare_enabled 控制
-            if step >= 4 and self.news_manager:
-                feed = self._append_truth_to_fake_news_posts_with_delay(feed, step)
-
+            feed = await self._load_user_feed(user, step)
             await user.react_to_feed(self.openai_client, self.engine, feed)
 
             # ========== Deprecated: replaced the real-time check mechanism with batch attacks at the end of the timestep ==========
@@ -1005,6 +1085,20 @@ class Simulation:
         except Exception as e:
             logging.error(f"User {user.user_id} async reaction failed: {e}")
 
+    async def _batched_user_reactions(self, users, step):
+        """Reaction phase with several agents packed into each LLM request"""
+        async def load(user):
+            try:
+                return user, await self._load_user_feed(user, step)
+            except Exception as e:
+                logging.error(f"User {user.user_id} feed loading failed: {e}")
+                return user, None
+
+        loaded = await asyncio.gather(*(load(user) for user in users))
+        await self.batched_reactor.run(
+            [(user, feed) for user, feed in loaded if feed is not None], self.openai_client, self.engine
+        )
+
     async def _wait_for_monitoring_completion(self):
         """Wait for the opinion balance monitoring cycle to finish"""
         try:
@@ -7,14 +7,23 @@
 3. 管理快照存储空间
 """
 
+import asyncio
 import os
 import shutil
 import sqlite3
+import atexit
 import json
 import logging
+import queue
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
+
+from snapshot_store import (
+    MANIFEST_FILE, PageStore, backup_database, is_paged_snapshot, open_page_store, open_read_snapshot,
+    restore_database
+)
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +52,13 @@ class SnapshotManager:
         # 当前会话ID
         self.session_id = None
 
+        # 各会话的页仓库（会话ID -> PageStore）
+        self._page_stores: Dict[str, PageStore] = {}
+
+        # 后台快照写入线程（首次异步保存时创建）与元数据文件锁
+        self._writer: Optional["SnapshotWriter"] = None
+        self._metadata_lock = threading.RLock()
+
     def create_session(self, parent_session_id: Optional[str] = None, parent_tick: Optional[int] = None) -> str:
         """
         创建新的快照会话
@@ -88,7 +104,7 @@ class SnapshotManager:
 
     def save_tick_snapshot(self, tick: int, additional_info: Optional[Dict[str, Any]] = None) -> bool:
         """
-        保存指定tick的快照
+        保存指定tick的快照（同步）
 
         Args:
             tick: 时间步编号
@@ -102,31 +118,143 @@ class SnapshotManager:
             return False
 
         try:
-            # 创建tick快照目录
-            tick_dir = os.path.join(self.snapshots_dir, self.session_id, f"tick_{tick}")
-            os.makedirs(tick_dir, exist_ok=True)
+            source = self._open_source_snapshot()
+            if source is None:
+                return False
+            return self._write_tick_snapshot(self.session_id, tick, source, additional_info)
+        except Exception as e:
+            logger.error(f"❌ 保存 tick {tick} 快照失败: {e}")
+            return False
+
+    def save_tick_snapshot_async(self, tick: int, additional_info: Optional[Dict[str, Any]] = None,
+                                 info_builder: Optional[Callable[[sqlite3.Connection], Dict[str, Any]]] = None) -> bool:
+        """
+        提交指定tick的快照到后台写入线程
+
+        调用线程只负责固定当前时间点的读事务视图，备份、统计、页去重和元数据写入
+        都在后台完成；待写快照超过上限时阻塞等待（背压）。
+
+        Args:
+            tick: 时间步编号
+            additional_info: 额外信息
+            info_builder: 在快照副本上计算额外统计信息的函数，结果合并进 additional_info
+
+        Returns:
+            是否提交成功
+        """
+        if not self.session_id:
+            logger.error("❌ 快照会话未初始化，请先调用 create_session()")
+            return False
+
+        try:
+            source = self._open_source_snapshot()
+            if source is None:
+                return False
+            self._get_writer().submit(self.session_id, tick, source, additional_info, info_builder)
+            return True
+        except Exception as e:
+            logger.error(f"❌ 提交 tick {tick} 快照失败: {e}")
+            return False
 
-            # 复制数据库文件
-            snapshot_db_path = os.path.join(tick_dir, "simulation.db")
+    async def asave_tick_snapshot(self, tick: int, additional_info: Optional[Dict[str, Any]] = None,
+                                  info_builder: Optional[Callable[[sqlite3.Connection], Dict[str, Any]]] = None) -> bool:
+        """
+        save_tick_snapshot_async 的协程版本，供事件循环中的 tick 循环调用
+
+        时间点视图仍在调用线程上立即固定（后续 tick 的写入不会混入快照）；
+        只有可能因背压阻塞的入队操作放到线程中等待，不会卡住事件循环。
+        """
+        if not self.session_id:
+            logger.error("❌ 快照会话未初始化，请先调用 create_session()")
+            return False
 
-            # 确保源文件存在
-            if not os.path.exists(self.simulation_db_path):
-                logger.error(f"❌ 源数据库不存在: {self.simulation_db_path}")
+        try:
+            source = self._open_source_snapshot()
+            if source is None:
                 return False
+            await asyncio.to_thread(
+                self._get_writer().submit, self.session_id, tick, source, additional_info, info_builder
+            )
+            return True
+        except Exception as e:
+            logger.error(f"❌ 提交 tick {tick} 快照失败: {e}")
+            return False
+
+    def _get_writer(self) -> "SnapshotWriter":
+        if self._writer is None:
+            self._writer = SnapshotWriter(self)
+        return self._writer
+
+    def flush_snapshots(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待后台写入线程完成所有待写快照
+
+        Returns:
+            是否在超时前全部完成
+        """
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+
+    def close(self) -> None:
+        """写完待写快照并停止后台写入线程"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _open_source_snapshot(self) -> Optional[sqlite3.Connection]:
+        """打开源数据库的时间点读视图"""
+        if not os.path.exists(self.simulation_db_path):
+            logger.error(f"❌ 源数据库不存在: {self.simulation_db_path}")
+            return None
+        return open_read_snapshot(self.simulation_db_path)
+
+    def _write_tick_snapshot(self, session_id: str, tick: int, source: sqlite3.Connection,
+                             additional_info: Optional[Dict[str, Any]] = None,
+                             info_builder: Optional[Callable[[sqlite3.Connection], Dict[str, Any]]] = None) -> bool:
+        """
+        将源数据库的时间点视图写成 tick 快照（会关闭 source）
+
+        Args:
+            session_id: 快照所属会话
+            tick: 时间步编号
+            source: open_read_snapshot 返回的连接
+            additional_info: 额外信息
+            info_builder: 在快照副本上计算额外统计信息的函数
+
+        Returns:
+            是否保存成功
+        """
+        try:
+            # 创建tick快照目录
+            session_dir = os.path.join(self.snapshots_dir, session_id)
+            tick_dir = os.path.join(session_dir, f"tick_{tick}")
+            os.makedirs(tick_dir, exist_ok=True)
 
-            # 执行 WAL checkpoint，确保所有数据写入主数据库文件
+            # 在线备份得到一致副本（包含 WAL 中的已提交数据），再按页去重写入会话页仓库，
+            # 只有相对之前 tick 变化过的页才会真正占用磁盘
+            backup_path = os.path.join(session_dir, f".tick_{tick}.backup")
             try:
-                import sqlite3
-                conn = sqlite3.connect(self.simulation_db_path)
-                cursor = conn.cursor()
-                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-                conn.close()
-                logger.debug(f"✅ 已执行 WAL checkpoint")
-            except Exception as checkpoint_err:
-                logger.warning(f"WAL checkpoint 失败（继续复制）: {checkpoint_err}")
-
-            # 复制数据库
-            shutil.copy2(self.simulation_db_path, snapshot_db_path)
+                try:
+                    backup_database(source, backup_path)
+                finally:
+                    source.close()
+
+                if info_builder:
+                    backup_conn = sqlite3.connect(backup_path)
+                    try:
+                        additional_info = {**(additional_info or {}), **info_builder(backup_conn)}
+                    finally:
+                        backup_conn.close()
+
+                manifest = self._get_page_store(session_id).write_database(backup_path, tick_dir)
+            finally:
+                if os.path.exists(backup_path):
+                    os.remove(backup_path)
+            snapshot_db_path = os.path.join(tick_dir, MANIFEST_FILE)
+            logger.debug(
+                f"tick {tick} 快照: {manifest['page_count']} 页，新增 {manifest['new_pages']} 页"
+            )
 
             # 保存额外信息
             if additional_info:
@@ -134,27 +262,25 @@ class SnapshotManager:
                 with open(info_file, 'w', encoding='utf-8') as f:
                     json.dump(additional_info, f, ensure_ascii=False, indent=2)
 
-            # 更新全局元数据
-            metadata = self._load_metadata()
-            metadata["ticks"][str(tick)] = {
+            tick_entry = {
                 "tick": tick,
                 "timestamp": datetime.now().isoformat(),
                 "db_path": snapshot_db_path,
+                "format": "paged",
                 "info_file": info_file if additional_info else None
             }
-            self._save_metadata(metadata)
+            with self._metadata_lock:
+                # 更新全局元数据
+                metadata = self._load_metadata()
+                metadata["ticks"][str(tick)] = tick_entry
+                self._save_metadata(metadata)
 
-            # 同时更新会话目录下的元数据（用于list_sessions读取）
-            session_metadata_path = os.path.join(self.snapshots_dir, self.session_id, "metadata.json")
-            session_metadata = self._load_session_metadata(self.session_id)
-            session_metadata["ticks"][str(tick)] = {
-                "tick": tick,
-                "timestamp": datetime.now().isoformat(),
-                "db_path": snapshot_db_path,
-                "info_file": info_file if additional_info else None
-            }
-            with open(session_metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(session_metadata, f, ensure_ascii=False, indent=2)
+                # 同时更新会话目录下的元数据（用于list_sessions读取）
+                session_metadata_path = os.path.join(session_dir, "metadata.json")
+                session_metadata = self._load_session_metadata(session_id)
+                session_metadata["ticks"][str(tick)] = tick_entry
+                with open(session_metadata_path, 'w', encoding='utf-8') as f:
+                    json.dump(session_metadata, f, ensure_ascii=False, indent=2)
 
             logger.info(f"✅ 已保存 tick {tick} 的快照")
             return True
@@ -163,6 +289,14 @@ class SnapshotManager:
             logger.error(f"❌ 保存 tick {tick} 快照失败: {e}")
             return False
 
+    def _get_page_store(self, session_id: str) -> PageStore:
+        """获取会话的增量快照页仓库"""
+        store = self._page_stores.get(session_id)
+        if store is None:
+            store = open_page_store(os.path.join(self.snapshots_dir, session_id))
+            self._page_stores[session_id] = store
+        return store
+
     def restore_from_tick(self, tick: int, session_id: Optional[str] = None) -> Optional[str]:
         """
         从指定tick恢复数据库
@@ -175,35 +309,42 @@ class SnapshotManager:
             恢复的数据库路径，失败返回None
         """
         try:
+            # 等待仍在后台写入的快照
+            self.flush_snapshots()
+
             # 确定使用的会话
             target_session = session_id or self.session_id
             if not target_session:
                 logger.error("❌ 未指定会话ID且当前没有活动会话")
                 return None
 
-            # 查找快照路径
-            snapshot_db_path = os.path.join(
-                self.snapshots_dir,
-                target_session,
-                f"tick_{tick}",
-                "simulation.db"
-            )
+            # 查找快照路径（增量清单优先，兼容旧版整库复制的快照）
+            tick_dir = os.path.join(self.snapshots_dir, target_session, f"tick_{tick}")
+            legacy_db_path = os.path.join(tick_dir, "simulation.db")
+            paged = is_paged_snapshot(tick_dir)
 
-            if not os.path.exists(snapshot_db_path):
-                logger.error(f"❌ 快照不存在: {snapshot_db_path}")
+            if not paged and not os.path.exists(legacy_db_path):
+                logger.error(f"❌ 快照不存在: {tick_dir}")
                 return None
 
-            # 关闭当前数据库连接（如果需要）
-            # 注意：调用者需要确保没有打开的数据库连接
-
-            # 备份当前数据库
+            # 备份当前数据库（在线备份，包含 WAL 中已提交的数据）
             if os.path.exists(self.simulation_db_path):
                 backup_path = f"{self.simulation_db_path}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                shutil.copy2(self.simulation_db_path, backup_path)
+                backup_database(self.simulation_db_path, backup_path)
                 logger.info(f"📋 已备份当前数据库到: {backup_path}")
 
-            # 恢复快照
-            shutil.copy2(snapshot_db_path, self.simulation_db_path)
+            # 恢复快照：先拼出完整副本，再通过备份 API 原地写回，
+            # 仍然打开着的数据库连接（连接池、排行榜物化视图等）无需关闭即可看到恢复结果
+            staged_path = f"{self.simulation_db_path}.restoring.db"
+            try:
+                if paged:
+                    self._get_page_store(target_session).materialize(tick_dir, staged_path)
+                else:
+                    shutil.copy2(legacy_db_path, staged_path)
+                restore_database(staged_path, self.simulation_db_path)
+            finally:
+                if os.path.exists(staged_path):
+                    os.remove(staged_path)
 
             logger.info(f"✅ 成功从 tick {tick} 恢复数据库")
             return self.simulation_db_path
@@ -869,6 +1010,72 @@ class SnapshotManager:
             }
 
 
+class SnapshotWriter:
+    """
+    后台快照写入线程
+
+    - 提交时已固定读事务视图，后台线程完成备份与写盘，模拟循环无需等待
+    - 待写队列有上限，写入落后时 submit 阻塞（背压）
+    - flush 等待所有待写快照完成，进程退出前自动 flush
+    """
+
+    def __init__(self, manager: SnapshotManager, max_pending: int = 2):
+        """
+        Args:
+            manager: 执行实际写入的快照管理器
+            max_pending: 允许排队的快照数量
+        """
+        self.manager = manager
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_pending))
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, session_id: str, tick: int, source: sqlite3.Connection,
+               additional_info: Optional[Dict[str, Any]] = None,
+               info_builder: Optional[Callable[[sqlite3.Connection], Dict[str, Any]]] = None) -> None:
+        """提交一个已固定时间点视图的快照任务（队列满时阻塞）"""
+        if self._closed:
+            source.close()
+            raise RuntimeError("Snapshot writer is closed")
+        job = (session_id, tick, source, additional_info, info_builder)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            logger.warning(f"⏳ 快照写入落后，等待后台写入完成后再提交 tick {tick}")
+            self._queue.put(job)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中的快照全部写完"""
+        if timeout is None:
+            self._queue.join()
+            return True
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: self._queue.unfinished_tasks == 0, timeout)
+
+    def close(self) -> None:
+        """写完剩余快照并停止线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self.manager._write_tick_snapshot(*job)
+            except Exception as e:
+                logger.error(f"❌ 后台快照写入失败: {e}")
+            finally:
+                self._queue.task_done()
+
+
 def create_snapshot_manager(project_root: str, simulation_db_path: str) -> SnapshotManager:
     """
     创建快照管理器实例
@@ -0,0 +1,250 @@
+"""
+增量快照页存储
+
+把 SQLite 数据库按页切分后做内容寻址去重：
+- 每个会话一个页仓库（按页大小分文件），只追加写入从未出现过的页
+- 每个 tick 只保存一份页引用清单（manifest），恢复时按清单拼回完整数据库
+
+相邻 tick 之间只有少量页发生变化，因此磁盘占用随变化量增长，而不是随 tick 数 × 数据库大小增长。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, Tuple, Union
+
+MANIFEST_FILE = "manifest.json"
+PAGE_REFS_FILE = "pages.bin"
+
+_DIGEST_SIZE = 16
+_READ_BATCH_PAGES = 256
+
+
+def _page_digest(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=_DIGEST_SIZE).digest()
+
+
+def _read_page_size(db_path: str) -> int:
+    """从数据库文件头读取页大小（偏移 16，大端 2 字节，1 表示 65536）"""
+    with open(db_path, 'rb') as f:
+        header = f.read(100)
+    if len(header) < 100 or not header.startswith(b"SQLite format 3\x00"):
+        raise ValueError(f"Not a SQLite database: {db_path}")
+    page_size = int.from_bytes(header[16:18], 'big')
+    return 65536 if page_size == 1 else page_size
+
+
+class PageStore:
+    """
+    会话级内容寻址页仓库
+
+    目录结构:
+        <store_dir>/pages_<page_size>.pack   定长页记录（只追加）
+        <store_dir>/pages_<page_size>.idx    与 pack 同序的页摘要，用于启动时重建去重索引
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._indexes: Dict[int, Dict[bytes, int]] = {}
+
+    def _paths(self, page_size: int) -> Tuple[str, str]:
+        base = os.path.join(self.store_dir, f"pages_{page_size}")
+        return f"{base}.pack", f"{base}.idx"
+
+    def _load_index(self, page_size: int) -> Dict[bytes, int]:
+        """加载（或重建）某个页大小的摘要索引，丢弃中断写入留下的不完整记录"""
+        index = self._indexes.get(page_size)
+        if index is not None:
+            return index
+
+        pack_path, idx_path = self._paths(page_size)
+        digests = b""
+        if os.path.exists(idx_path):
+            with open(idx_path, 'rb') as f:
+                digests = f.read()
+        pack_records = os.path.getsize(pack_path) // page_size if os.path.exists(pack_path) else 0
+        records = min(len(digests) // _DIGEST_SIZE, pack_records)
+
+        index = {}
+        for record in range(records):
+            index.setdefault(digests[record * _DIGEST_SIZE:(record + 1) * _DIGEST_SIZE], record)
+
+        # 截断到两边一致的记录数
+        if os.path.exists(pack_path):
+            with open(pack_path, 'ab') as f:
+                f.truncate(records * page_size)
+        if os.path.exists(idx_path):
+            with open(idx_path, 'ab') as f:
+                f.truncate(records * _DIGEST_SIZE)
+
+        self._indexes[page_size] = index
+        return index
+
+    def write_database(self, db_path: str, tick_dir: str) -> Dict[str, int]:
+        """
+        将一个（静止的）数据库文件写入页仓库，并在 tick_dir 生成清单
+
+        Args:
+            db_path: 数据库文件（通常是在线备份得到的临时副本）
+            tick_dir: tick 快照目录
+
+        Returns:
+            统计信息: page_size, page_count, new_pages
+        """
+        page_size = _read_page_size(db_path)
+        refs = array('q')
+        new_pages = 0
+
+        with self._lock:
+            index = self._load_index(page_size)
+            pack_path, idx_path = self._paths(page_size)
+            next_record = len(index)
+
+            with open(db_path, 'rb') as src, open(pack_path, 'ab') as pack, open(idx_path, 'ab') as idx:
+                while True:
+                    chunk = src.read(page_size * _READ_BATCH_PAGES)
+                    if not chunk:
+                        break
+                    for offset in range(0, len(chunk), page_size):
+                        page = chunk[offset:offset + page_size]
+                        if len(page) < page_size:
+                            page = page.ljust(page_size, b"\x00")
+                        digest = _page_digest(page)
+                        record = index.get(digest)
+                        if record is None:
+                            record = next_record
+                            next_record += 1
+                            pack.write(page)
+                            idx.write(digest)
+                            index[digest] = record
+                            new_pages += 1
+                        refs.append(record)
+                pack.flush()
+                os.fsync(pack.fileno())
+                idx.flush()
+
+        os.makedirs(tick_dir, exist_ok=True)
+        with open(os.path.join(tick_dir, PAGE_REFS_FILE), 'wb') as f:
+            refs.tofile(f)
+        manifest = {"format": "paged", "page_size": page_size, "page_count": len(refs), "new_pages": new_pages}
+        with open(os.path.join(tick_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        return manifest
+
+    def materialize(self, tick_dir: str, dest_path: str) -> str:
+        """
+        按 tick 清单重建完整数据库文件
+
+        Args:
+            tick_dir: tick 快照目录
+            dest_path: 输出数据库路径
+
+        Returns:
+            dest_path
+        """
+        with open(os.path.join(tick_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        page_size = int(manifest["page_size"])
+
+        refs = array('q')
+        with open(os.path.join(tick_dir, PAGE_REFS_FILE), 'rb') as f:
+            refs.frombytes(f.read())
+        if len(refs) != manifest["page_count"]:
+            raise ValueError(f"Corrupted snapshot manifest in {tick_dir}")
+
+        pack_path, _ = self._paths(page_size)
+        tmp_path = f"{dest_path}.restoring"
+        with open(pack_path, 'rb') as pack, open(tmp_path, 'wb') as out:
+            for record in refs:
+                pack.seek(record * page_size)
+                page = pack.read(page_size)
+                if len(page) != page_size:
+                    raise ValueError(f"Snapshot page {record} missing from {pack_path}")
+                out.write(page)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, dest_path)
+        return dest_path
+
+    def disk_usage(self) -> int:
+        """页仓库占用的字节数"""
+        total = 0
+        for name in os.listdir(self.store_dir):
+            total += os.path.getsize(os.path.join(self.store_dir, name))
+        return total
+
+
+def open_read_snapshot(source_path: str) -> sqlite3.Connection:
+    """
+    打开源数据库并立即开始一个读事务，固定当前时间点的数据视图
+
+    WAL 模式下后续写入不会影响该视图，返回的连接可以交给其他线程完成备份。
+    """
+    conn = sqlite3.connect(source_path, timeout=60.0, isolation_level=None, check_same_thread=False)
+    try:
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def backup_database(source: Union[str, sqlite3.Connection], dest_path: str) -> None:
+    """
+    使用 SQLite 在线备份 API 得到一致的数据库副本（包含 WAL 中已提交的数据）
+
+    Args:
+        source: 源数据库路径，或 open_read_snapshot 返回的连接（备份其固定的时间点视图）
+        dest_path: 副本路径
+    """
+    src = sqlite3.connect(source, timeout=60.0) if isinstance(source, str) else source
+    try:
+        dst = sqlite3.connect(dest_path)
+        try:
+            src.backup(dst)
+            # 备份副本不需要 WAL，保证页内容只取决于数据
+            dst.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dst.close()
+    finally:
+        if isinstance(source, str):
+            src.close()
+
+
+def restore_database(source_path: str, dest_path: str) -> None:
+    """
+    把 source_path 的内容写回 dest_path（原地恢复）
+
+    通过 SQLite 备份 API 在目标库自己的连接上逐页写入，而不是替换文件：
+    目标文件的 inode 和 -wal/-shm 保持一致，连接池、物化视图等仍打开着的连接
+    在下一次读事务中就能看到恢复后的数据；Windows 上也不会因为文件被占用而失败。
+    目标库不存在时直接移动文件即可。
+    """
+    if not os.path.exists(dest_path):
+        os.replace(source_path, dest_path)
+        return
+
+    src = sqlite3.connect(source_path)
+    try:
+        dst = sqlite3.connect(dest_path, timeout=60.0)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+def is_paged_snapshot(tick_dir: str) -> bool:
+    """tick 目录是否为增量（分页）格式"""
+    return os.path.exists(os.path.join(tick_dir, MANIFEST_FILE))
+
+
+def open_page_store(session_dir: str) -> PageStore:
+    return PageStore(os.path.join(session_dir, "pages"))
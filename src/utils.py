@@ -1,5 +1,7 @@
 from datetime import datetime
 import json
+import random
+import re
 import time
 
 import uuid
@@ -8,6 +10,7 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import sqlite3
 import os
+import numpy as np
 import pandas as pd
 from typing import Optional, Type, Union, Dict
 from openai import OpenAI
@@ -15,6 +18,10 @@ from pydantic import BaseModel
 import matplotlib
 from tenacity import retry, stop_after_attempt, wait_exponential
 from deprecated import deprecated
+try:
+    from llm_gateway import PRIORITY_AGENT, get_llm_gateway
+except ImportError:
+    from src.llm_gateway import PRIORITY_AGENT, get_llm_gateway
 
 def resolve_engine(config: dict | None = None, selector=None) -> str:
     """Resolve the model name to use when config does not specify an engine."""
@@ -40,41 +47,12 @@ def resolve_engine(config: dict | None = None, selector=None) -> str:
     except Exception as exc:
         raise RuntimeError("Unable to resolve default model via multi_model_selector") from exc
 
-# Global rate limiting controls
-_last_request_time = {}
 # Model failure counters
 _model_failure_count = {}
-_min_request_interval = {
-    "grok-3-mini": 5.0,      # grok models have a 5-second interval
-    "DeepSeek-V3": 30.0,     # DeepSeek has a 30-second interval (increase to avoid rate limits)
-    "default": 2.0           # Default models have a 2-second interval (more conservative)
-}
 
 def _wait_for_rate_limit(engine: str):
-    """Smart request delay control to avoid 502 errors"""
-    global _last_request_time, _min_request_interval, _model_failure_count
-
-    current_time = time.time()
-    base_interval = _min_request_interval.get(engine, _min_request_interval["default"])
-
-    # Adjust the interval dynamically based on failure count
-    failure_count = _model_failure_count.get(engine, 0)
-    if failure_count > 0:
-        # More failures lead to a longer wait (up to 5x the base interval)
-        multiplier = min(1 + failure_count * 0.8, 5.0)
-        interval = base_interval * multiplier
-        logging.info(f"⚠️ Model {engine} had {failure_count} failures; adjusting interval to {interval:.1f} seconds")
-    else:
-        interval = base_interval
-
-    if engine in _last_request_time:
-        time_since_last = current_time - _last_request_time[engine]
-        if time_since_last < interval:
-            sleep_time = interval - time_since_last
-            # Removed verbose model wait logging
-            time.sleep(sleep_time)
-
-    _last_request_time[engine] = time.time()
+    """Reserve a request slot for engine in the shared LLM gateway token buckets"""
+    get_llm_gateway().reserve_blocking(engine)
 
 def _record_model_failure(engine: str):
     """Record that the model failed"""
@@ -88,7 +66,23 @@ def _record_model_success(engine: str):
     if engine in _model_failure_count:
         _model_failure_count[engine] = 0
 
+# Source of generated ids when seeded (see Utils.seed_ids); None uses uuid4
+_id_rng: Optional[random.Random] = None
+
+
 class Utils:
+    @staticmethod
+    def seed_ids(seed: Optional[int]):
+        """Derive generated ids from a seeded RNG (None restores uuid4), so a seeded run repeats its ids."""
+        global _id_rng
+        _id_rng = random.Random(seed) if seed is not None else None
+
+    @staticmethod
+    def _new_uuid() -> uuid.UUID:
+        if _id_rng is None:
+            return uuid.uuid4()
+        return uuid.UUID(int=_id_rng.getrandbits(128), version=4)
+
     @staticmethod
     def configure_logging(engine: str):
         """Configure logging for the simulation."""
@@ -126,7 +120,8 @@ class Utils:
     @staticmethod
     def generate_formatted_id(prefix: str, conn: Optional[sqlite3.Connection] = None) -> str:
         """Generate a formatted ID with the given prefix and last 6 digits of a UUID.
-        Handles UUID collisions if a database connection is provided."""
+        Handles UUID collisions if a database connection is provided.
+        UUIDs come from the seeded id RNG when Utils.seed_ids was called."""
 
         # Map of prefixes to their corresponding tables
         prefix_table_map = {
@@ -139,7 +134,7 @@ class Utils:
 
         if conn is None:
             # If no connection provided, just return a new ID (original behavior)
-            full_uuid = uuid.uuid4()
+            full_uuid = Utils._new_uuid()
             last_6_digits = str(full_uuid)[-6:]
             return f"{prefix}-{last_6_digits}"
 
@@ -147,13 +142,13 @@ class Utils:
         table_name = prefix_table_map.get(prefix)
         if not table_name:
             logging.warning(f"Unknown prefix '{prefix}', collision detection disabled")
-            full_uuid = uuid.uuid4()
+            full_uuid = Utils._new_uuid()
             last_6_digits = str(full_uuid)[-6:]
             return f"{prefix}-{last_6_digits}"
 
         # Keep trying until we find a unique ID
         while True:
-            full_uuid = uuid.uuid4()
+            full_uuid = Utils._new_uuid()
             last_6_digits = str(full_uuid)[-6:]
             new_id = f"{prefix}-{last_6_digits}"
 
@@ -277,29 +272,8 @@ class Utils:
 
 
     @staticmethod
-    @retry(
-        stop=stop_after_attempt(2),  # Retry twice to give rate limits another chance
-        wait=wait_exponential(multiplier=5, min=15, max=120),  # Longer waits, especially for rate limits
-        reraise=True,
-        before_sleep=lambda retry_state: logging.warning(
-            f"Retry attempt {retry_state.attempt_number} after error: {retry_state.outcome.exception()}"
-        )
-    )
-    def generate_llm_response(
-        openai_client: OpenAI,
-        engine: str,
-        prompt: str,
-        system_message: str,
-        temperature: float,
-        response_model: Optional[Type[BaseModel]] = None,
-        max_tokens: int = 4096,
-        # stop: list[str] = ['\n']
-    ) -> Union[str, BaseModel]:
-        """Generate a response from the LLM."""
-        # Smart rate limit control
-        _wait_for_rate_limit(engine)
-
-        # Force English output by enhancing system message
+    def _build_llm_messages(prompt: str, system_message: str) -> list:
+        """Build the chat messages, forcing English output via the system message."""
         enhanced_system_message = system_message + """
 
 CRITICAL LANGUAGE REQUIREMENT:
@@ -312,342 +286,429 @@ CRITICAL LANGUAGE REQUIREMENT:
 - If you accidentally use non-English, you FAIL the task
 - Every single word must be in English"""
 
-        messages = [
+        return [
             {"role": "system", "content": enhanced_system_message},
             {"role": "user", "content": prompt}
         ]
 
-        # Use parse for structured output if model is provided
-        if response_model:
-            if "gpt" in engine: # Only GPT models support structured output reliably
-                # Build parameters; some models do not support penalty parameters
-                # Smart timeout settings - adjust based on model and request size
-                request_size = sum(len(str(msg)) for msg in messages)
-                if request_size > 5000:  # Large request
-                    timeout_seconds = 180
-                else:
-                    timeout_seconds = 60
+    @staticmethod
+    def _llm_backend(engine: str, structured: bool) -> str:
+        """
+        Pick the request style for an engine.
 
-                params = {
-                    "model": engine,
-                    "messages": messages,
-                    "response_format": response_model,
-                    "temperature": temperature,
-                    "timeout": timeout_seconds,
-                }
+        Returns:
+            "gpt" (structured parse), "json" (DeepSeek/Grok JSON mode), "gemini" (Gemini JSON mode)
+            or "text" (plain completion)
+        """
+        if structured:
+            if "gpt" in engine:  # Only GPT models support structured output reliably
+                return "gpt"
+            if "deepseek" in engine.lower() or "grok" in engine.lower():
+                return "json"
+            if "gemini" in engine:
+                return "gemini"
+        elif "gpt" in engine or "gemini" in engine or "deepseek" in engine.lower() or "grok" in engine.lower():
+            return "text"
+        # ollama (disabled at import to avoid SSL client init)
+        raise RuntimeError(
+            "Ollama backend is disabled to avoid SSL client initialization errors. "
+            "Please use OpenAI-compatible models (gpt-*, gemini-*) or configure Ollama separately."
+        )
 
-                # Only add penalty parameters for supported models
-                if "gpt-4" in engine or "gpt-3.5" in engine:
-                    params["frequency_penalty"] = 1.6
-                    params["presence_penalty"] = 1.6
+    @staticmethod
+    def _build_llm_request(
+        backend: str,
+        engine: str,
+        messages: list,
+        temperature: float,
+        response_model: Optional[Type[BaseModel]],
+        max_tokens: int,
+    ) -> dict:
+        """Build chat completion parameters for the selected backend."""
+        if backend == "gpt":
+            # Smart timeout settings - adjust based on model and request size
+            request_size = sum(len(str(msg)) for msg in messages)
+            params = {
+                "model": engine,
+                "messages": messages,
+                "response_format": response_model,
+                "temperature": temperature,
+                "timeout": 180 if request_size > 5000 else 60,
+            }
+            # Only add penalty parameters for supported models
+            if "gpt-4" in engine or "gpt-3.5" in engine:
+                params["frequency_penalty"] = 1.6
+                params["presence_penalty"] = 1.6
+            return params
+
+        if backend in ("json", "gemini"):
+            # Add JSON format instruction to the prompt
+            json_instruction = f"\n\nPlease respond in valid JSON format according to this schema:\n{response_model.model_json_schema()}\n\nIMPORTANT: Return ONLY the JSON object, without any markdown formatting, code blocks, or ```json``` tags. Just the raw JSON."
+            modified_messages = messages.copy()
+            modified_messages[-1] = {**modified_messages[-1], "content": modified_messages[-1]["content"] + json_instruction}
+
+            if backend == "gemini":
+                timeout_seconds = 180  # 180 seconds timeout for proxy services (increased)
+            elif sum(len(str(msg)) for msg in modified_messages) > 5000:  # Large request
+                timeout_seconds = 180
+            else:  # DeepSeek and Grok are prone to issues
+                timeout_seconds = 90
 
-                try:
-                    completion = openai_client.beta.chat.completions.parse(**params)
-                    _record_model_success(engine)  # recordsuccessful
-
-                    # Check if parsing failed due to validation errors
-                    if completion.choices[0].message.parsed is None:
-                        # Parse failed, try manual parsing with cleaning
-                        logging.warning("OpenAI structured output parsing failed (parsed=None), trying manual parsing with cleaning")
-                        raw_content = completion.choices[0].message.content
-                        if raw_content:
-                            json_response = json.loads(raw_content)
-                            json_response = Utils._clean_llm_response(json_response, response_model)
-                            return response_model.model_validate(json_response)
-                        else:
-                            raise ValueError("No content to parse")
-
-                    return completion.choices[0].message.parsed
-
-                except Exception as parse_error:
-                    # If structured parsing fails entirely, try manual parsing
-                    logging.warning(f"OpenAI structured output parsing failed with error: {parse_error}")
-                    logging.warning("Attempting manual parsing with cleaning...")
+            return {
+                "model": engine,
+                "messages": modified_messages,
+                "temperature": temperature,
+                "timeout": timeout_seconds,
+                "response_format": {"type": "json_object"},  # Use simple JSON format
+            }
 
-                    try:
-                        # Try to make a regular completion call to get raw content
-                        regular_params = params.copy()
-                        regular_params.pop('response_format', None)  # Remove structured output format
-
-                        regular_completion = openai_client.chat.completions.create(**regular_params)
-                        raw_content = regular_completion.choices[0].message.content
-
-                        if raw_content:
-                            import json
-                            import re
-                            # Try to extract JSON from the raw content
-                            json_match = re.search(r'\{.*\}', raw_content, re.DOTALL)
-                            if json_match:
-                                json_response = json.loads(json_match.group())
-                                json_response = Utils._clean_llm_response(json_response, response_model)
-                                return response_model.model_validate(json_response)
-                            else:
-                                raise ValueError("No JSON found in raw content")
-                        else:
-                            raise ValueError("No content in regular completion")
-
-                    except Exception as manual_error:
-                        logging.error(f"Manual parsing also failed: {manual_error}")
-                        raise parse_error  # Re-raise the original error
-            elif "deepseek" in engine.lower() or "grok" in engine.lower(): # DeepSeek and Grok - use JSON format
-                # Add JSON format instruction to the prompt
-                json_instruction = f"\n\nPlease respond in valid JSON format according to this schema:\n{response_model.model_json_schema()}\n\nIMPORTANT: Return ONLY the JSON object, without any markdown formatting, code blocks, or ```json``` tags. Just the raw JSON."
-                modified_messages = messages.copy()
-                modified_messages[-1]["content"] += json_instruction
-
-                # Smart timeout settings
-                request_size = sum(len(str(msg)) for msg in modified_messages)
-                if request_size > 5000:  # Large request
-                    timeout_seconds = 180
-                elif "grok" in engine.lower() or "deepseek" in engine.lower():  # Models prone to issues
-                    timeout_seconds = 90
-                else:
-                    timeout_seconds = 60
+        # Regular completion without response format - for Post generation
+        return {
+            "model": engine,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "timeout": 180,  # 180 seconds timeout for proxy services (increased)
+        }
 
-                completion = openai_client.chat.completions.create(
-                    model=engine,
-                    messages=modified_messages,
-                    temperature=temperature,
-                    timeout=timeout_seconds,
-                    response_format={"type": "json_object"}  # Use simple JSON format
-                )
+    @staticmethod
+    def _parse_structured_completion(completion, response_model):
+        """Return the parsed structured output, falling back to cleaning the raw JSON."""
+        if completion.choices[0].message.parsed is None:
+            # Parse failed, try manual parsing with cleaning
+            logging.warning("OpenAI structured output parsing failed (parsed=None), trying manual parsing with cleaning")
+            raw_content = completion.choices[0].message.content
+            if raw_content:
+                json_response = json.loads(raw_content)
+                json_response = Utils._clean_llm_response(json_response, response_model)
+                return response_model.model_validate(json_response)
+            else:
+                raise ValueError("No content to parse")
 
-                # Parse the JSON response into the response model
-                try:
-                    import json
-                    content = completion.choices[0].message.content.strip()
+        return completion.choices[0].message.parsed
 
-                    # Clean up markdown formatting if present
-                    if content.startswith('```json'):
-                        content = content[7:]  # Remove ```json
-                    if content.endswith('```'):
-                        content = content[:-3]  # Remove ```
-                    content = content.strip()
+    @staticmethod
+    def _extract_json_response(raw_content: str, response_model):
+        """Extract the first JSON object from free-form content and validate it."""
+        if not raw_content:
+            raise ValueError("No content in regular completion")
+        json_match = re.search(r'\{.*\}', raw_content, re.DOTALL)
+        if not json_match:
+            raise ValueError("No JSON found in raw content")
+        json_response = json.loads(json_match.group())
+        json_response = Utils._clean_llm_response(json_response, response_model)
+        return response_model.model_validate(json_response)
 
-                    json_response = json.loads(content)
+    @staticmethod
+    def _parse_json_completion(backend: str, engine: str, raw_content: str, response_model):
+        """Parse a JSON-mode completion (DeepSeek/Grok/Gemini) into the response model."""
+        if backend == "json":
+            try:
+                content = raw_content.strip()
+                # Clean up markdown formatting if present
+                if content.startswith('```json'):
+                    content = content[7:]  # Remove ```json
+                if content.endswith('```'):
+                    content = content[:-3]  # Remove ```
+                content = content.strip()
+
+                json_response = json.loads(content)
+                json_response = Utils._clean_llm_response(json_response, response_model)
+                _record_model_success(engine)  # recordsuccessful
+                return response_model.model_validate(json_response)
+            except (json.JSONDecodeError, ValueError) as e:
+                # Fallback: try to extract JSON from the response
+                content = raw_content
+                json_match = re.search(r'\{.*\}', content, re.DOTALL)
+                if json_match:
+                    try:
+                        json_response = json.loads(json_match.group())
+                        json_response = Utils._clean_llm_response(json_response, response_model)
+                        return response_model.model_validate(json_response)
+                    except:
+                        pass
+                raise ValueError(f"Failed to parse JSON response from {engine}: {content}")
+
+        try:
+            content = raw_content.strip()
+
+            # Clean up markdown formatting if present
+            if content.startswith('```json'):
+                content = content[7:]  # Remove ```json
+            if content.endswith('```'):
+                content = content[:-3]  # Remove ```
+            content = content.strip()
+
+            # Remove any potential BOM or extra whitespace
+            content = content.replace('\ufeff', '').replace('\n', ' ').replace('\r', '')
+
+            json_response = json.loads(content)
+            json_response = Utils._clean_llm_response(json_response, response_model)
+            _record_model_success(engine)  # recordsuccessful
+            return response_model.model_validate(json_response)
+        except (json.JSONDecodeError, ValueError) as e:
+            # Enhanced fallback: try multiple cleanup strategies
+            content = raw_content
+
+            # Strategy 1: Extract JSON object
+            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            if json_match:
+                try:
+                    cleaned_content = json_match.group().strip()
+                    json_response = json.loads(cleaned_content)
                     json_response = Utils._clean_llm_response(json_response, response_model)
-                    _record_model_success(engine)  # recordsuccessful
                     return response_model.model_validate(json_response)
-                except (json.JSONDecodeError, ValueError) as e:
-                    # Fallback: try to extract JSON from the response
-                    content = completion.choices[0].message.content
-                    import re
-                    json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                    if json_match:
-                        try:
-                            json_response = json.loads(json_match.group())
-                            json_response = Utils._clean_llm_response(json_response, response_model)
-                            return response_model.model_validate(json_response)
-                        except:
-                            pass
-                    raise ValueError(f"Failed to parse JSON response from {engine}: {content}")
-            elif "gemini" in engine: # Gemini models - use JSON format instead of structured output
-                # Add JSON format instruction to the prompt
-                json_instruction = f"\n\nPlease respond in valid JSON format according to this schema:\n{response_model.model_json_schema()}\n\nIMPORTANT: Return ONLY the JSON object, without any markdown formatting, code blocks, or ```json``` tags. Just the raw JSON."
-                modified_messages = messages.copy()
-                modified_messages[-1]["content"] += json_instruction
-
-                completion = openai_client.chat.completions.create(
-                    model=engine,
-                    messages=modified_messages,
-                    temperature=temperature,
-                    timeout=180,  # 180 seconds timeout for proxy services (increased)
-                    response_format={"type": "json_object"}  # Use simple JSON format
-                )
+                except:
+                    pass
 
-                # Parse the JSON response into the response model
-                try:
-                    import json
-                    content = completion.choices[0].message.content.strip()
-                    
-                    # Clean up markdown formatting if present
-                    if content.startswith('```json'):
-                        content = content[7:]  # Remove ```json
-                    if content.endswith('```'):
-                        content = content[:-3]  # Remove ```
-                    content = content.strip()
-                    
-                    # Remove any potential BOM or extra whitespace
-                    content = content.replace('\ufeff', '').replace('\n', ' ').replace('\r', '')
-                    
-                    json_response = json.loads(content)
+            # Strategy 2: Try to fix common JSON issues including truncation
+            try:
+                # Fix trailing commas and other common issues
+                fixed_content = re.sub(r',\s*}', '}', content)
+                fixed_content = re.sub(r',\s*]', ']', fixed_content)
+                # Extract JSON from the fixed content
+                json_match = re.search(r'\{.*\}', fixed_content, re.DOTALL)
+                if json_match:
+                    json_response = json.loads(json_match.group())
                     json_response = Utils._clean_llm_response(json_response, response_model)
-                    _record_model_success(engine)  # recordsuccessful
                     return response_model.model_validate(json_response)
-                except (json.JSONDecodeError, ValueError) as e:
-                    # Enhanced fallback: try multiple cleanup strategies
-                    content = completion.choices[0].message.content
-                    import re
-                    
-                    # Strategy 1: Extract JSON object
-                    json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                    if json_match:
-                        try:
-                            cleaned_content = json_match.group().strip()
-                            json_response = json.loads(cleaned_content)
-                            json_response = Utils._clean_llm_response(json_response, response_model)
-                            return response_model.model_validate(json_response)
-                        except:
-                            pass
-                    
-                    # Strategy 2: Try to fix common JSON issues including truncation
-                    try:
-                        # Fix trailing commas and other common issues
-                        fixed_content = re.sub(r',\s*}', '}', content)
-                        fixed_content = re.sub(r',\s*]', ']', fixed_content)
-                        # Extract JSON from the fixed content
-                        json_match = re.search(r'\{.*\}', fixed_content, re.DOTALL)
-                        if json_match:
-                            json_response = json.loads(json_match.group())
-                            json_response = Utils._clean_llm_response(json_response, response_model)
-                            return response_model.model_validate(json_response)
-                    except:
-                        pass
-                    
-                    # Strategy 3: Enhanced handling of truncated JSON
-                    try:
-                        # Look for truncated actions array
-                        if '"actions"' in content and '[' in content:
-                            # Extract the actions array part, even if truncated
-                            actions_start = content.find('"actions":')
-                            if actions_start != -1:
-                                # Find the opening bracket of the actions array
-                                bracket_start = content.find('[', actions_start)
-                                if bracket_start != -1:
-                                    # Extract everything after the opening bracket
-                                    actions_content = content[bracket_start+1:]
-                                    
-                                    # Try to parse individual complete action objects
-                                    action_objects = []
-                                    current_pos = 0
-                                    brace_count = 0
-                                    current_action = ""
-                                    in_string = False
-                                    escape_next = False
-                                    
-                                    for char in actions_content:
-                                        if escape_next:
-                                            current_action += char
-                                            escape_next = False
-                                            continue
-                                            
-                                        if char == '\\':
-                                            escape_next = True
-                                            current_action += char
-                                            continue
-                                            
-                                        if char == '"' and not escape_next:
-                                            in_string = not in_string
-                                            
-                                        if not in_string:
-                                            if char == '{':
-                                                brace_count += 1
-                                            elif char == '}':
-                                                brace_count -= 1
-                                                
-                                        current_action += char
-                                        
-                                        # If we found a complete action object
-                                        if brace_count == 0 and current_action.strip() and not in_string:
-                                            try:
-                                                # Clean and parse the action
-                                                clean_action = current_action.strip().rstrip(',')
-                                                if clean_action.startswith('{') and clean_action.endswith('}'):
-                                                    action_obj = json.loads(clean_action)
-                                                    action_objects.append(action_obj)
-                                                current_action = ""
-                                            except json.JSONDecodeError:
-                                                # Skip this malformed action
-                                                current_action = ""
-                                            except Exception:
-                                                current_action = ""
-                                                
-                                        # Stop if we hit array closing or truncation
-                                        if not in_string and char == ']':
-                                            break
-                                    
-                                    # If we successfully parsed at least one action, return it
-                                    if action_objects:
-                                        reconstructed = {"actions": action_objects}
-                                        reconstructed = Utils._clean_llm_response(reconstructed, response_model)
-                                        logging.info(f"Successfully reconstructed truncated JSON with {len(action_objects)} actions")
-                                        return response_model.model_validate(reconstructed)
-                                        
-                    except Exception as reconstruction_error:
-                        logging.debug(f"Enhanced JSON reconstruction failed: {reconstruction_error}")
-                    
-                    # Strategy 4: Simple truncation handling - extract complete actions only
-                    try:
-                        # Look for complete action objects using regex
-                        if '"actions"' in content:
-                            # Find all complete action objects (from { to matching })
-                            action_pattern = r'\{"action":\s*"[^"]+"\s*(?:,\s*"[^"]+"\s*:\s*(?:"[^"]*"|[^,}\]]+))*\s*\}'
-                            matches = re.findall(action_pattern, content, re.DOTALL)
-                            
+            except:
+                pass
+
+            # Strategy 3: Enhanced handling of truncated JSON
+            try:
+                # Look for truncated actions array
+                if '"actions"' in content and '[' in content:
+                    # Extract the actions array part, even if truncated
+                    actions_start = content.find('"actions":')
+                    if actions_start != -1:
+                        # Find the opening bracket of the actions array
+                        bracket_start = content.find('[', actions_start)
+                        if bracket_start != -1:
+                            # Extract everything after the opening bracket
+                            actions_content = content[bracket_start+1:]
+
+                            # Try to parse individual complete action objects
                             action_objects = []
-                            for match in matches:
-                                try:
-                                    action_obj = json.loads(match)
-                                    action_objects.append(action_obj)
-                                except:
+                            current_pos = 0
+                            brace_count = 0
+                            current_action = ""
+                            in_string = False
+                            escape_next = False
+
+                            for char in actions_content:
+                                if escape_next:
+                                    current_action += char
+                                    escape_next = False
+                                    continue
+
+                                if char == '\\':
+                                    escape_next = True
+                                    current_action += char
                                     continue
-                                    
+
+                                if char == '"' and not escape_next:
+                                    in_string = not in_string
+
+                                if not in_string:
+                                    if char == '{':
+                                        brace_count += 1
+                                    elif char == '}':
+                                        brace_count -= 1
+
+                                current_action += char
+
+                                # If we found a complete action object
+                                if brace_count == 0 and current_action.strip() and not in_string:
+                                    try:
+                                        # Clean and parse the action
+                                        clean_action = current_action.strip().rstrip(',')
+                                        if clean_action.startswith('{') and clean_action.endswith('}'):
+                                            action_obj = json.loads(clean_action)
+                                            action_objects.append(action_obj)
+                                        current_action = ""
+                                    except json.JSONDecodeError:
+                                        # Skip this malformed action
+                                        current_action = ""
+                                    except Exception:
+                                        current_action = ""
+
+                                # Stop if we hit array closing or truncation
+                                if not in_string and char == ']':
+                                    break
+
+                            # If we successfully parsed at least one action, return it
                             if action_objects:
                                 reconstructed = {"actions": action_objects}
                                 reconstructed = Utils._clean_llm_response(reconstructed, response_model)
-                                logging.info(f"Regex-extracted {len(action_objects)} complete actions from truncated JSON")
-                                try:
-                                    return response_model.model_validate(reconstructed)
-                                except Exception as validation_error:
-                                    logging.error(f"Model validation failed for reconstructed JSON: {validation_error}")
-                                    logging.error(f"Reconstructed data: {reconstructed}")
-                                    # Continue to next strategy instead of failing completely
-                                
-                    except Exception as regex_error:
-                        logging.debug(f"Regex JSON extraction failed: {regex_error}")
-                    
-                    # Strategy 5: Try to fix common JSON issues (original strategy)
-                    try:
-                        # Fix trailing commas and other common issues
-                        fixed_content = re.sub(r',\s*}', '}', content)
-                        fixed_content = re.sub(r',\s*]', ']', fixed_content)
-                        # Extract JSON from the fixed content
-                        json_match = re.search(r'\{.*\}', fixed_content, re.DOTALL)
-                        if json_match:
-                            json_response = json.loads(json_match.group())
-                            json_response = Utils._clean_llm_response(json_response, response_model)
-                            return response_model.model_validate(json_response)
-                    except:
-                        pass
-                    
-                    # If all strategies fail, provide better error message
-                    logging.error(f"Failed to parse Gemini JSON. Content length: {len(content)}, First 200 chars: {content[:200]}")
-                    raise ValueError(f"Failed to parse JSON response from Gemini: {content[:500]}...")
-            else: # ollama (disabled at import to avoid SSL client init)
-                raise RuntimeError(
-                    "Ollama backend is disabled to avoid SSL client initialization errors. "
-                    "Please use OpenAI-compatible models (gpt-*, gemini-*) or configure Ollama separately."
-                )
+                                logging.info(f"Successfully reconstructed truncated JSON with {len(action_objects)} actions")
+                                return response_model.model_validate(reconstructed)
 
-        # Regular completion without response format - for Post generation
-        else:
-            if "gpt" in engine or "gemini" in engine or "deepseek" in engine.lower() or "grok" in engine.lower(): # OpenAI-compatible api
-                completion = openai_client.chat.completions.create(
-                    model=engine,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    timeout=180,  # 180 seconds timeout for proxy services (increased)
-                    # frequency_penalty=1.6,
-                    # presence_penalty=1.6
-                )
+            except Exception as reconstruction_error:
+                logging.debug(f"Enhanced JSON reconstruction failed: {reconstruction_error}")
+
+            # Strategy 4: Simple truncation handling - extract complete actions only
+            try:
+                # Look for complete action objects using regex
+                if '"actions"' in content:
+                    # Find all complete action objects (from { to matching })
+                    action_pattern = r'\{"action":\s*"[^"]+"\s*(?:,\s*"[^"]+"\s*:\s*(?:"[^"]*"|[^,}\]]+))*\s*\}'
+                    matches = re.findall(action_pattern, content, re.DOTALL)
+
+                    action_objects = []
+                    for match in matches:
+                        try:
+                            action_obj = json.loads(match)
+                            action_objects.append(action_obj)
+                        except:
+                            continue
+
+                    if action_objects:
+                        reconstructed = {"actions": action_objects}
+                        reconstructed = Utils._clean_llm_response(reconstructed, response_model)
+                        logging.info(f"Regex-extracted {len(action_objects)} complete actions from truncated JSON")
+                        try:
+                            return response_model.model_validate(reconstructed)
+                        except Exception as validation_error:
+                            logging.error(f"Model validation failed for reconstructed JSON: {validation_error}")
+                            logging.error(f"Reconstructed data: {reconstructed}")
+                            # Continue to next strategy instead of failing completely
+
+            except Exception as regex_error:
+                logging.debug(f"Regex JSON extraction failed: {regex_error}")
+
+            # Strategy 5: Try to fix common JSON issues (original strategy)
+            try:
+                # Fix trailing commas and other common issues
+                fixed_content = re.sub(r',\s*}', '}', content)
+                fixed_content = re.sub(r',\s*]', ']', fixed_content)
+                # Extract JSON from the fixed content
+                json_match = re.search(r'\{.*\}', fixed_content, re.DOTALL)
+                if json_match:
+                    json_response = json.loads(json_match.group())
+                    json_response = Utils._clean_llm_response(json_response, response_model)
+                    return response_model.model_validate(json_response)
+            except:
+                pass
+
+            # If all strategies fail, provide better error message
+            logging.error(f"Failed to parse Gemini JSON. Content length: {len(content)}, First 200 chars: {content[:200]}")
+            raise ValueError(f"Failed to parse JSON response from Gemini: {content[:500]}...")
+
+    @staticmethod
+    @retry(
+        stop=stop_after_attempt(2),  # Retry twice to give rate limits another chance
+        wait=wait_exponential(multiplier=5, min=15, max=120),  # Longer waits, especially for rate limits
+        reraise=True,
+        before_sleep=lambda retry_state: logging.warning(
+            f"Retry attempt {retry_state.attempt_number} after error: {retry_state.outcome.exception()}"
+        )
+    )
+    def generate_llm_response(
+        openai_client: OpenAI,
+        engine: str,
+        prompt: str,
+        system_message: str,
+        temperature: float,
+        response_model: Optional[Type[BaseModel]] = None,
+        max_tokens: int = 4096,
+        # stop: list[str] = ['\n']
+    ) -> Union[str, BaseModel]:
+        """Generate a response from the LLM."""
+        # Rate limit control (shared token buckets with the async gateway)
+        _wait_for_rate_limit(engine)
+
+        messages = Utils._build_llm_messages(prompt, system_message)
+        backend = Utils._llm_backend(engine, structured=response_model is not None)
+        params = Utils._build_llm_request(backend, engine, messages, temperature, response_model, max_tokens)
+
+        if backend == "gpt":
+            try:
+                completion = openai_client.beta.chat.completions.parse(**params)
                 _record_model_success(engine)  # recordsuccessful
-                return completion.choices[0].message.content
-            else: # ollama (disabled at import to avoid SSL client init)
-                raise RuntimeError(
-                    "Ollama backend is disabled to avoid SSL client initialization errors. "
-                    "Please use OpenAI-compatible models (gpt-*, gemini-*) or configure Ollama separately."
+                return Utils._parse_structured_completion(completion, response_model)
+            except Exception as parse_error:
+                # If structured parsing fails entirely, try manual parsing
+                logging.warning(f"OpenAI structured output parsing failed with error: {parse_error}")
+                logging.warning("Attempting manual parsing with cleaning...")
+
+                try:
+                    # Try to make a regular completion call to get raw content
+                    regular_params = params.copy()
+                    regular_params.pop('response_format', None)  # Remove structured output format
+
+                    regular_completion = openai_client.chat.completions.create(**regular_params)
+                    return Utils._extract_json_response(regular_completion.choices[0].message.content, response_model)
+                except Exception as manual_error:
+                    logging.error(f"Manual parsing also failed: {manual_error}")
+                    raise parse_error  # Re-raise the original error
+
+        completion = openai_client.chat.completions.create(**params)
+        if backend == "text":
+            _record_model_success(engine)  # recordsuccessful
+            return completion.choices[0].message.content
+        return Utils._parse_json_completion(backend, engine, completion.choices[0].message.content, response_model)
+
+    @staticmethod
+    @retry(
+        stop=stop_after_attempt(2),  # Retry twice to give rate limits another chance
+        wait=wait_exponential(multiplier=5, min=15, max=120),  # Longer waits, especially for rate limits
+        reraise=True,
+        before_sleep=lambda retry_state: logging.warning(
+            f"Retry attempt {retry_state.attempt_number} after error: {retry_state.outcome.exception()}"
+        )
+    )
+    async def agenerate_llm_response(
+        openai_client: OpenAI,
+        engine: str,
+        prompt: str,
+        system_message: str,
+        temperature: float,
+        response_model: Optional[Type[BaseModel]] = None,
+        max_tokens: int = 4096,
+        priority: int = PRIORITY_AGENT,
+        caller=None,
+    ) -> Union[str, BaseModel]:
+        """
+        Async version of generate_llm_response that goes through the LLM gateway.
+
+        Args:
+            priority: Gateway priority class (PRIORITY_MODERATION / PRIORITY_COORDINATION / PRIORITY_AGENT)
+            caller: Fairness key for the gateway queue (e.g. the user id)
+        """
+        gateway = get_llm_gateway()
+        messages = Utils._build_llm_messages(prompt, system_message)
+        backend = Utils._llm_backend(engine, structured=response_model is not None)
+        params = Utils._build_llm_request(backend, engine, messages, temperature, response_model, max_tokens)
+
+        if backend == "gpt":
+            try:
+                completion = await gateway.chat_completion(
+                    openai_client, parse=True, priority=priority, caller=caller, **params
                 )
+                _record_model_success(engine)  # recordsuccessful
+                return Utils._parse_structured_completion(completion, response_model)
+            except Exception as parse_error:
+                logging.warning(f"OpenAI structured output parsing failed with error: {parse_error}")
+                logging.warning("Attempting manual parsing with cleaning...")
+
+                try:
+                    regular_params = params.copy()
+                    regular_params.pop('response_format', None)  # Remove structured output format
+
+                    regular_completion = await gateway.chat_completion(
+                        openai_client, priority=priority, caller=caller, **regular_params
+                    )
+                    return Utils._extract_json_response(regular_completion.choices[0].message.content, response_model)
+                except Exception as manual_error:
+                    logging.error(f"Manual parsing also failed: {manual_error}")
+                    raise parse_error  # Re-raise the original error
+
+        completion = await gateway.chat_completion(openai_client, priority=priority, caller=caller, **params)
+        if backend == "text":
+            _record_model_success(engine)  # recordsuccessful
+            return completion.choices[0].message.content
+        return Utils._parse_json_completion(backend, engine, completion.choices[0].message.content, response_model)
 
     @staticmethod
     def generate_llm_response_with_fallback(
@@ -754,7 +815,7 @@ CRITICAL LANGUAGE REQUIREMENT:
             actual_conn = conn
             use_temp_conn = False
         
-        # Get user metrics into a DataFrame
+        # Get user metrics (and the currently stored scores) into a DataFrame
         try:
             df = pd.read_sql_query('''
                 SELECT
@@ -762,7 +823,9 @@ CRITICAL LANGUAGE REQUIREMENT:
                     follower_count,
                     total_likes_received,
                     total_shares_received,
-                    total_comments_received
+                    total_comments_received,
+                    influence_score,
+                    is_influencer
                 FROM users
             ''', actual_conn)
         except (sqlite3.OperationalError, pd.errors.DatabaseError) as e:
@@ -774,58 +837,58 @@ CRITICAL LANGUAGE REQUIREMENT:
             else:
                 raise e
 
-        # Calculate normalized scores (handling division by zero)
-        metrics = {
-            'follower_count': 0.4,
-            'total_likes_received': 0.3,
-            'total_shares_received': 0.2,
-            'total_comments_received': 0.1
-        }
+        if use_temp_conn:
+            actual_conn.close()
+        if df.empty:
+            return
 
-        influence_scores = pd.Series(0.0, index=df.index)
+        # Calculate normalized scores in one pass (columns with a zero max contribute nothing)
+        metrics = ['follower_count', 'total_likes_received', 'total_shares_received', 'total_comments_received']
+        weights = np.array([0.4, 0.3, 0.2, 0.1])
 
-        for metric, weight in metrics.items():
-            max_val = df[metric].max()
-            if max_val > 0:  # Only normalize if we have non-zero values
-                influence_scores += (df[metric] / max_val) * weight
+        values = df[metrics].fillna(0).to_numpy(dtype=np.float64)
+        max_vals = values.max(axis=0)
+        scale = np.divide(weights, max_vals, out=np.zeros_like(weights), where=max_vals > 0)
+        influence_scores = np.round(values @ scale, 3)
+        is_influencer = influence_scores > 0.5
 
-        # Update the database with new scores
-        df['influence_score'] = influence_scores
-        df['is_influencer'] = influence_scores > 0.5
+        # Only write back users whose score or influencer flag actually changed
+        previous_scores = df['influence_score'].to_numpy(dtype=np.float64, na_value=np.nan)
+        previous_flags = df['is_influencer'].fillna(0).to_numpy(dtype=bool)
+        changed = ~np.isclose(influence_scores, previous_scores, atol=5e-4) | (is_influencer != previous_flags)
 
-        # Update the database
-        # If we used a temporary connection, close it before updating via the original connection
-        if use_temp_conn:
-            actual_conn.close()
-            # Update using the original ServiceConnection
-            from database.database_manager import execute_query
-            for _, row in df.iterrows():
-                execute_query('''
-                    UPDATE users
-                    SET influence_score = ?,
-                        is_influencer = ?,
-                        last_influence_update = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                ''', (round(float(row['influence_score']), 3), bool(row['is_influencer']), row['user_id']))
-        else:
-            # Using the standard connection
-            for _, row in df.iterrows():
-                actual_conn.execute('''
-                    UPDATE users
-                    SET influence_score = ?,
-                        is_influencer = ?,
-                        last_influence_update = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                ''', (round(float(row['influence_score']), 3), bool(row['is_influencer']), row['user_id']))
-            actual_conn.commit()
+        df['influence_score'] = influence_scores
+        df['is_influencer'] = is_influencer
+
+        updates = list(zip(
+            influence_scores[changed].tolist(),
+            is_influencer[changed].tolist(),
+            df['user_id'].to_numpy()[changed].tolist()
+        ))
+        if updates:
+            update_query = '''
+                UPDATE users
+                SET influence_score = ?,
+                    is_influencer = ?,
+                    last_influence_update = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            '''
+            if use_temp_conn:
+                # Service mode: send every update in a single executemany round-trip
+                from database.database_manager import execute_many
+                execute_many(update_query, updates)
+            else:
+                actual_conn.executemany(update_query, updates)
+                actual_conn.commit()
+        logging.debug(f"Influence scores updated for {len(updates)}/{len(df)} users")
 
         # Log influencer status changes
         influencers = df[df['is_influencer']][['user_id', 'influence_score']].sort_values('influence_score', ascending=False)
 
         if not influencers.empty:
             logging.info("\nCurrent Influencers:")
-            for _, row in influencers.iterrows():
-                logging.info(f"User {row['user_id']}: Influence Score = {row['influence_score']:.3f}")
+            for row in influencers.itertuples(index=False):
+                logging.info(f"User {row.user_id}: Influence Score = {row.influence_score:.3f}")
 
     @staticmethod
     def evaluate_fact_checker_performance(conn: sqlite3.Connection):